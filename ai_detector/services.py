@@ -2,7 +2,11 @@ import logging
 import math
 import re
 
+from asgiref.sync import sync_to_async
+
+from core import llm_transport
 from core.llm_client import LLMClient
+from core.llm_neardup import NearDuplicateCache
 
 logger = logging.getLogger('app')
 
@@ -135,14 +139,15 @@ class AIDetectorService:
             return {'ai_generated': 3, 'ai_generated_ai_refined': 7, 'human_written_ai_refined': 20, 'human_written': 70}
 
     @staticmethod
-    def detect(text, use_premium=False):
+    def detect(text, use_premium=False, tool='ai_detector'):
         """
         Analyze text for AI-generated content using DeBERTa classifier + heuristics.
         Returns 4-category classification with confidence for each category.
 
         Args:
             text: Text to analyze
-            use_premium: Whether to use premium tier (unused, kept for API compat)
+            use_premium: Whether to use premium tier (selects the admission lane)
+            tool: Tool tag for metrics and admission control
 
         Returns:
             tuple: (result_dict, error_string)
@@ -155,9 +160,56 @@ class AIDetectorService:
         # Get heuristic score
         heuristic_score = AIDetectorService._compute_perplexity_heuristics(text)
 
-        # Call DeBERTa model on GPU server
-        model_result, error = LLMClient.detect_ai_text(text)
+        # Call DeBERTa model on GPU server, unless a near-duplicate was scored recently
+        match = NearDuplicateCache.get('ai_detector', text)
+        if match is not None:
+            model_result, error = match[1], None
+        else:
+            model_result, error = LLMClient.detect_ai_text(text, use_premium=use_premium, tool=tool)
+            if not error:
+                NearDuplicateCache.set('ai_detector', text, model_result)
+
+        return AIDetectorService._build_result(sentences, heuristic_score, model_result, error)
+
+    @staticmethod
+    def detect_many(texts, use_premium=False, max_concurrency=None):
+        """
+        Run detect() on several texts concurrently.
+
+        Returns:
+            List of (result_dict, error_string) tuples in the order of ``texts``.
+        """
+        return llm_transport.run_concurrently(
+            [
+                ('detector', lambda text=text: AIDetectorService.detect(
+                    text, use_premium=use_premium, tool='ai_detector_bulk',
+                ))
+                for text in texts
+            ],
+            max_concurrency,
+        )
 
+    @staticmethod
+    async def adetect(text, use_premium=False):
+        """Async counterpart of detect() for ASGI views."""
+        sentences = AIDetectorService._split_sentences(text)
+        if not sentences:
+            return None, 'No sentences found in the provided text.'
+
+        heuristic_score = AIDetectorService._compute_perplexity_heuristics(text)
+        match = await sync_to_async(NearDuplicateCache.get)('ai_detector', text)
+        if match is not None:
+            model_result, error = match[1], None
+        else:
+            model_result, error = await LLMClient.adetect_ai_text(text, use_premium=use_premium)
+            if not error:
+                await sync_to_async(NearDuplicateCache.set)('ai_detector', text, model_result)
+
+        return AIDetectorService._build_result(sentences, heuristic_score, model_result, error)
+
+    @staticmethod
+    def _build_result(sentences, heuristic_score, model_result, error):
+        """Blend the model score with heuristics into the detect() result."""
         if error:
             # Fallback to heuristics-only if model unavailable
             logger.warning(f'AI detect model unavailable, falling back to heuristics: {error}')
@@ -1,8 +1,10 @@
 from django.urls import path
+
+from core.llm_views import llm_api_view
 from ai_detector.views import AIDetectorPage, AIDetectAPI, AIDetectBulkAPI
 
 urlpatterns = [
     path('ai-content-detector/', AIDetectorPage.as_view(), name='ai_detector'),
-    path('api/ai-detect/', AIDetectAPI.as_view(), name='ai_detect_api'),
+    path('api/ai-detect/', llm_api_view(AIDetectAPI), name='ai_detect_api'),
     path('api/ai-detect/bulk/', AIDetectBulkAPI.as_view(), name='ai_detect_bulk_api'),
 ]
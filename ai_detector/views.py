@@ -11,6 +11,7 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from accounts.views import GlobalVars
 from ai_detector.models import DetectionResult
 from ai_detector.services import AIDetectorService
+from core.llm_views import LLMAPIView
 import config
 
 logger = logging.getLogger('app')
@@ -35,13 +36,13 @@ class AIDetectorPage(View):
         )
 
 
-class AIDetectAPI(APIView):
-    def post(self, request):
+class AIDetectAPI(LLMAPIView):
+    def validate(self, request):
         data = request.data
         text = data.get('text', '').strip()
 
         if not text:
-            return Response(
+            return None, Response(
                 {'error': 'Please provide text to analyze.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
@@ -50,7 +51,7 @@ class AIDetectAPI(APIView):
 
         # Minimum word count
         if word_count < 80:
-            return Response(
+            return None, Response(
                 {'error': 'Please enter at least 80 words for accurate detection.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
@@ -61,7 +62,7 @@ class AIDetectAPI(APIView):
         )
 
         if not is_premium and word_count > 1200:
-            return Response(
+            return None, Response(
                 {
                     'error': 'Free users are limited to 1,200 words. Upgrade to Premium for unlimited detection.',
                     'limit_exceeded': True,
@@ -69,24 +70,24 @@ class AIDetectAPI(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Run detection
-        result, error = AIDetectorService.detect(text, use_premium=is_premium)
+        return {'text': text, 'word_count': word_count, 'use_premium': is_premium}, None
 
-        if error:
-            return Response(
-                {'error': error},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+    def call(self, params):
+        return AIDetectorService.detect(params['text'], use_premium=params['use_premium'])
+
+    async def acall(self, params):
+        return await AIDetectorService.adetect(params['text'], use_premium=params['use_premium'])
 
+    def respond(self, request, params, result):
         # Save result
         try:
             DetectionResult.objects.create(
                 user=request.user if request.user.is_authenticated else None,
-                input_text=text,
+                input_text=params['text'],
                 results={'sentences': result['sentences']},
                 overall_score=result['overall_score'],
                 classification=result['classification'],
-                word_count=word_count,
+                word_count=params['word_count'],
             )
         except Exception as e:
             logger.error(f'Failed to save detection result: {str(e)}')
@@ -98,7 +99,7 @@ class AIDetectAPI(APIView):
             'classification_description': result.get('classification_description', ''),
             'category_confidences': result.get('category_confidences', {}),
             'sentences': result['sentences'],
-            'word_count': word_count,
+            'word_count': params['word_count'],
         })
 
 
@@ -139,6 +140,7 @@ class AIDetectBulkAPI(APIView):
 
         results = []
         errors = []
+        pending = []
 
         for uploaded_file in files:
             filename = uploaded_file.name
@@ -186,9 +188,14 @@ class AIDetectBulkAPI(APIView):
                 })
                 continue
 
-            # Run detection
-            result, error = AIDetectorService.detect(text, use_premium=is_premium)
+            pending.append((filename, text, word_count))
+
+        # Run detection for all valid files concurrently
+        detections = AIDetectorService.detect_many(
+            [text for _, text, _ in pending], use_premium=is_premium,
+        )
 
+        for (filename, text, word_count), (result, error) in zip(pending, detections):
             if error:
                 errors.append({
                     'filename': filename,
@@ -3,6 +3,7 @@ import logging
 from django.conf import settings
 
 from core.llm_client import LLMClient
+from core.llm_prompt_cache import CachedPrompt
 
 logger = logging.getLogger('app')
 
@@ -38,8 +39,13 @@ class BaseGenerator:
 
         Replaces {field_name} placeholders in the system_prompt with values
         from the params dict. Missing keys are replaced with empty strings.
+        The template text before the first placeholder is the same for every
+        call and is marked as the cacheable prompt prefix.
         """
         prompt = self.system_prompt
+        static_end = prompt.find('{')
+        if static_end == -1:
+            static_end = len(prompt)
         for field in self.fields:
             key = field['name']
             value = params.get(key, '')
@@ -48,22 +54,10 @@ class BaseGenerator:
         for key in ('tone', 'style', 'language'):
             if '{' + key + '}' in prompt:
                 prompt = prompt.replace('{' + key + '}', str(params.get(key, '')))
-        return prompt
+        return CachedPrompt(prompt[:static_end], prompt[static_end:])
 
-    def generate(self, params, use_premium=False):
-        """
-        Build the prompt from params and call the LLM.
-
-        Args:
-            params: dict of user input values keyed by field name.
-            use_premium: If True, use Claude for premium users.
-
-        Returns:
-            Tuple of (output_text, error). On success error is None.
-        """
-        system_prompt = self.get_prompt(params)
-
-        # Build user message from all provided params
+    def get_user_message(self, params):
+        """Build the user message from all provided params."""
         user_parts = []
         for field in self.fields:
             key = field['name']
@@ -76,13 +70,47 @@ class BaseGenerator:
         if tone:
             user_parts.append(f"Tone: {tone}")
 
-        user_message = '\n'.join(user_parts) if user_parts else 'Generate content based on the system instructions.'
+        return '\n'.join(user_parts) if user_parts else 'Generate content based on the system instructions.'
+
+    def generate(self, params, use_premium=False):
+        """
+        Build the prompt from params and call the LLM.
 
+        Args:
+            params: dict of user input values keyed by field name.
+            use_premium: If True, use Claude for premium users.
+
+        Returns:
+            Tuple of (output_text, error). On success error is None.
+        """
         return LLMClient.generate(
-            system_prompt=system_prompt,
-            messages=[{'role': 'user', 'content': user_message}],
+            system_prompt=self.get_prompt(params),
+            messages=[{'role': 'user', 'content': self.get_user_message(params)}],
+            max_tokens=4096,
+            use_premium=use_premium,
+            tool='ai_tools',
+        )
+
+    async def agenerate(self, params, use_premium=False):
+        """Async counterpart of generate() for ASGI views."""
+        return await LLMClient.agenerate(
+            system_prompt=self.get_prompt(params),
+            messages=[{'role': 'user', 'content': self.get_user_message(params)}],
+            max_tokens=4096,
+            use_premium=use_premium,
+            tool='ai_tools',
+        )
+
+    def generate_stream(self, params, use_premium=False):
+        """
+        Stream the generation. Yields (delta, error) tuples from LLMClient.stream().
+        """
+        return LLMClient.stream(
+            system_prompt=self.get_prompt(params),
+            messages=[{'role': 'user', 'content': self.get_user_message(params)}],
             max_tokens=4096,
             use_premium=use_premium,
+            tool='ai_tools',
         )
 
     def to_dict(self):
@@ -1,6 +1,7 @@
 import hashlib
 import logging
 
+from asgiref.sync import sync_to_async
 from django.conf import settings as django_settings
 from django.utils import timezone
 
@@ -143,6 +144,69 @@ class AIToolsService:
 
         return output_text, None
 
+    @staticmethod
+    async def agenerate(slug, params, user=None, ip='', user_agent=''):
+        """Async counterpart of generate(). Database work runs in a thread."""
+        generator = GENERATOR_REGISTRY.get(slug)
+        if not generator:
+            return None, f'Unknown tool: {slug}'
+
+        allowed, remaining, limit = await sync_to_async(AIToolsService.check_daily_limit)(user, ip, user_agent)
+        if not allowed:
+            return None, f'Daily limit of {limit} free generations reached. Upgrade to Premium for unlimited access.'
+
+        use_premium = (
+            user and user.is_authenticated
+            and getattr(user, 'is_plan_active', False)
+        )
+        output_text, error = await generator.agenerate(params, use_premium=use_premium)
+
+        if error:
+            return None, error
+
+        await sync_to_async(AIToolsService.increment_usage)(user, ip, user_agent)
+        await sync_to_async(AIToolsService.save_history)(user, slug, params, output_text)
+
+        return output_text, None
+
+    @staticmethod
+    def generate_stream(slug, params, user=None, ip='', user_agent=''):
+        """
+        Streaming variant of generate().
+
+        Limits are checked up front. Usage and history are recorded only
+        after the stream completes successfully.
+
+        Returns:
+            Tuple of (deltas, error). deltas yields (delta, error) tuples.
+        """
+        generator = GENERATOR_REGISTRY.get(slug)
+        if not generator:
+            return None, f'Unknown tool: {slug}'
+
+        allowed, remaining, limit = AIToolsService.check_daily_limit(user, ip, user_agent)
+        if not allowed:
+            return None, f'Daily limit of {limit} free generations reached. Upgrade to Premium for unlimited access.'
+
+        use_premium = (
+            user and user.is_authenticated
+            and getattr(user, 'is_plan_active', False)
+        )
+
+        def deltas():
+            parts = []
+            for delta, error in generator.generate_stream(params, use_premium=use_premium):
+                if error:
+                    yield None, error
+                    return
+                parts.append(delta)
+                yield delta, None
+
+            AIToolsService.increment_usage(user, ip, user_agent)
+            AIToolsService.save_history(user, slug, params, ''.join(parts))
+
+        return deltas(), None
+
     @staticmethod
     def get_generators_by_category():
         """
@@ -1,13 +1,15 @@
 from django.urls import path
 
-from ai_tools.views import AIToolsIndexPage, AIToolPage, AIToolGenerateAPI
+from ai_tools.views import AIToolsIndexPage, AIToolPage, AIToolGenerateAPI, AIToolGenerateStreamAPI
+from core.llm_views import llm_api_view
 
 urlpatterns = [
     # Index page listing all AI tools
     path('ai-writing-tools/', AIToolsIndexPage.as_view(), name='ai_tools_index'),
 
     # API endpoint for generation
-    path('api/ai-tools/generate/', AIToolGenerateAPI.as_view(), name='ai_tools_generate_api'),
+    path('api/ai-tools/generate/', llm_api_view(AIToolGenerateAPI), name='ai_tools_generate_api'),
+    path('api/ai-tools/generate/stream/', AIToolGenerateStreamAPI.as_view(), name='ai_tools_generate_stream_api'),
 
     # Individual tool pages (must be last - catch-all slug pattern)
     path('ai-writing-tools/<slug:slug>/', AIToolPage.as_view(), name='ai_tool_page'),
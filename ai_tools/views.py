@@ -4,12 +4,13 @@ from django.shortcuts import render
 from django.views import View
 from rest_framework import status
 from rest_framework.response import Response
-from rest_framework.views import APIView
 
 from accounts.views import GlobalVars
 from ai_tools.generators import GENERATOR_REGISTRY, CATEGORY_NAMES
 from ai_tools.services import AIToolsService
 from app.utils import Utils
+from core.llm_views import LLMAPIView
+from core.streaming import sse_response, stream_events
 import config
 
 logger = logging.getLogger('app')
@@ -77,20 +78,26 @@ class AIToolPage(View):
         return render(request, 'ai-tools/generator.html', context)
 
 
-class AIToolGenerateAPI(APIView):
+class AIToolGenerateAPI(LLMAPIView):
     """POST /api/ai-tools/generate/ - Validates limit, generates content, returns JSON."""
 
-    def post(self, request):
+    def validate(self, request):
+        """
+        Resolve the generator and validate its fields.
+
+        Returns:
+            Tuple of (context, error_response). On success error_response is None.
+        """
         tool_slug = request.data.get('tool', '').strip()
         if not tool_slug:
-            return Response(
+            return None, Response(
                 {'error': 'The "tool" field is required.'},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
         generator = GENERATOR_REGISTRY.get(tool_slug)
         if not generator:
-            return Response(
+            return None, Response(
                 {'error': f'Unknown tool: {tool_slug}'},
                 status=status.HTTP_404_NOT_FOUND,
             )
@@ -101,7 +108,7 @@ class AIToolGenerateAPI(APIView):
             raw = request.data.get(field['name'], '')
             value = raw.strip() if isinstance(raw, str) else raw
             if field.get('required') and not value:
-                return Response(
+                return None, Response(
                     {'error': f'The "{field["label"]}" field is required.'},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
@@ -112,36 +119,77 @@ class AIToolGenerateAPI(APIView):
         if tone:
             params['tone'] = tone
 
-        ip = Utils.get_ip(request)
-        user_agent = request.META.get('HTTP_USER_AGENT', '')
-
-        output_text, error = AIToolsService.generate(
-            slug=tool_slug,
-            params=params,
-            user=request.user,
-            ip=ip,
-            user_agent=user_agent,
-        )
+        return {
+            'tool_slug': tool_slug,
+            'params': params,
+            'user': request.user,
+            'ip': Utils.get_ip(request),
+            'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+        }, None
+
+    @staticmethod
+    def service_kwargs(ctx):
+        return {
+            'slug': ctx['tool_slug'],
+            'params': ctx['params'],
+            'user': ctx['user'],
+            'ip': ctx['ip'],
+            'user_agent': ctx['user_agent'],
+        }
 
-        if error:
-            if 'Daily limit' in error:
-                return Response(
-                    {'error': error, 'upgrade': True},
-                    status=status.HTTP_403_FORBIDDEN,
-                )
+    @staticmethod
+    def error_response(error):
+        """Map a service error to a 403 (daily limit) or 500 response."""
+        if 'Daily limit' in error:
             return Response(
-                {'error': error},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                {'error': error, 'upgrade': True},
+                status=status.HTTP_403_FORBIDDEN,
             )
+        return Response(
+            {'error': error},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+    def call(self, ctx):
+        return AIToolsService.generate(**self.service_kwargs(ctx))
 
+    async def acall(self, ctx):
+        return await AIToolsService.agenerate(**self.service_kwargs(ctx))
+
+    def respond(self, request, ctx, output_text):
         # Return remaining count after generation
         allowed, remaining, limit = AIToolsService.check_daily_limit(
-            request.user, ip, user_agent,
+            request.user, ctx['ip'], ctx['user_agent'],
         )
 
         return Response({
             'output': output_text,
-            'tool': tool_slug,
+            'tool': ctx['tool_slug'],
             'remaining': remaining,
             'limit': limit,
         })
+
+
+class AIToolGenerateStreamAPI(AIToolGenerateAPI):
+    """
+    POST /api/ai-tools/generate/stream/ - Same input as AIToolGenerateAPI;
+    streams the output as server-sent events.
+    """
+
+    def post(self, request):
+        ctx, error_response = self.validate(request)
+        if error_response:
+            return error_response
+
+        deltas, error = AIToolsService.generate_stream(**self.service_kwargs(ctx))
+
+        if error:
+            return self.error_response(error)
+
+        def on_complete(output_text):
+            allowed, remaining, limit = AIToolsService.check_daily_limit(
+                request.user, ctx['ip'], ctx['user_agent'],
+            )
+            return {'output': output_text, 'tool': ctx['tool_slug'], 'remaining': remaining, 'limit': limit}
+
+        return sse_response(stream_events(deltas, on_complete))
@@ -3,9 +3,10 @@ from django.urls import path
 from api.views import (
     APIDocsPage,
     ValidateAPIKeyInternal,
-    ParaphraseAPIv1, GrammarAPIv1, SummarizeAPIv1,
+    ParaphraseAPIv1, ParaphraseStreamAPIv1, GrammarAPIv1, SummarizeAPIv1,
     AIDetectAPIv1, TranslateAPIv1,
 )
+from core.llm_views import llm_api_view
 
 urlpatterns = [
     # Documentation page
@@ -15,7 +16,8 @@ urlpatterns = [
     path('internal/validate/', ValidateAPIKeyInternal.as_view(), name='api_internal_validate'),
 
     # v1 API endpoints
-    path('v1/paraphrase/', ParaphraseAPIv1.as_view(), name='api_v1_paraphrase'),
+    path('v1/paraphrase/', llm_api_view(ParaphraseAPIv1), name='api_v1_paraphrase'),
+    path('v1/paraphrase/stream/', ParaphraseStreamAPIv1.as_view(), name='api_v1_paraphrase_stream'),
     path('v1/grammar/', GrammarAPIv1.as_view(), name='api_v1_grammar'),
     path('v1/summarize/', SummarizeAPIv1.as_view(), name='api_v1_summarize'),
     path('v1/ai-detect/', AIDetectAPIv1.as_view(), name='api_v1_ai_detect'),
@@ -16,6 +16,8 @@ from accounts.models import CustomUser
 from accounts.views import GlobalVars
 from api.authentication import APIKeyAuthentication
 from api.throttling import APIRateThrottle
+from core.llm_views import LLMAPIView
+from core.streaming import sse_response, stream_events
 import config
 
 logger = logging.getLogger('app')
@@ -140,13 +142,19 @@ class BasePublicAPIView(APIView):
         return False
 
 
-class ParaphraseAPIv1(BasePublicAPIView):
+class ParaphraseAPIv1(BasePublicAPIView, LLMAPIView):
     """
     POST /api/v1/paraphrase/
     Public API for paraphrasing text.
     """
 
-    def post(self, request):
+    def validate(self, request):
+        """
+        Parse and validate the request against the caller's plan.
+
+        Returns:
+            Tuple of (params, error_response). On success error_response is None.
+        """
         from paraphraser.services import AIParaphraseService
 
         text = request.data.get('text', '').strip()
@@ -155,7 +163,7 @@ class ParaphraseAPIv1(BasePublicAPIView):
         language = request.data.get('language', 'en')
 
         if not text:
-            return Response(
+            return None, Response(
                 {'error': 'The "text" field is required.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
@@ -165,7 +173,7 @@ class ParaphraseAPIv1(BasePublicAPIView):
         # Enforce limits
         word_count = AIParaphraseService.count_words(text)
         if not is_premium and word_count > 500:
-            return Response(
+            return None, Response(
                 {'error': 'Free API users are limited to 500 words per request.', 'upgrade': True},
                 status=status.HTTP_403_FORBIDDEN
             )
@@ -173,13 +181,13 @@ class ParaphraseAPIv1(BasePublicAPIView):
         valid_modes = ['standard', 'fluency', 'formal', 'academic', 'simple',
                        'creative', 'expand', 'shorten']
         if mode not in valid_modes:
-            return Response(
+            return None, Response(
                 {'error': f'Invalid mode. Valid modes: {", ".join(valid_modes)}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         if not is_premium and mode not in ['standard', 'fluency']:
-            return Response(
+            return None, Response(
                 {'error': f'The "{mode}" mode requires a premium API plan.', 'upgrade': True},
                 status=status.HTTP_403_FORBIDDEN
             )
@@ -189,21 +197,72 @@ class ParaphraseAPIv1(BasePublicAPIView):
         except (ValueError, TypeError):
             synonym_level = 3
 
-        output_text, error = AIParaphraseService.paraphrase(
-            text=text, mode=mode, synonym_level=synonym_level, language=language,
-        )
+        return {
+            'text': text,
+            'mode': mode,
+            'synonym_level': synonym_level,
+            'language': language,
+            'word_count': word_count,
+        }, None
+
+    @staticmethod
+    def service_kwargs(params):
+        return {
+            'text': params['text'],
+            'mode': params['mode'],
+            'synonym_level': params['synonym_level'],
+            'language': params['language'],
+        }
+
+    def call(self, params):
+        from paraphraser.services import AIParaphraseService
 
-        if error:
-            return Response({'error': error}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return AIParaphraseService.paraphrase(**self.service_kwargs(params))
+
+    async def acall(self, params):
+        from paraphraser.services import AIParaphraseService
+
+        return await AIParaphraseService.aparaphrase(**self.service_kwargs(params))
+
+    def respond(self, request, params, output_text):
+        from paraphraser.services import AIParaphraseService
 
         return Response({
             'output_text': output_text,
-            'input_word_count': word_count,
+            'input_word_count': params['word_count'],
             'output_word_count': AIParaphraseService.count_words(output_text),
-            'mode': mode,
+            'mode': params['mode'],
         })
 
 
+class ParaphraseStreamAPIv1(ParaphraseAPIv1):
+    """
+    POST /api/v1/paraphrase/stream/
+    Same input as /api/v1/paraphrase/; streams the output as server-sent
+    events ("data" deltas, then a "done" event with the final result).
+    """
+
+    def post(self, request):
+        from paraphraser.services import AIParaphraseService
+
+        params, error_response = self.validate(request)
+        if error_response:
+            return error_response
+
+        deltas = AIParaphraseService.paraphrase_stream(**self.service_kwargs(params))
+
+        def on_complete(raw_text):
+            output_text = AIParaphraseService._post_process(raw_text, [], {})
+            return {
+                'output_text': output_text,
+                'input_word_count': params['word_count'],
+                'output_word_count': AIParaphraseService.count_words(output_text),
+                'mode': params['mode'],
+            }
+
+        return sse_response(stream_events(deltas, on_complete))
+
+
 class GrammarAPIv1(BasePublicAPIView):
     """
     POST /api/v1/grammar/
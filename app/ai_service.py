@@ -16,64 +16,68 @@ class AIService:
 
     @staticmethod
     def get_client():
-        """Get Anthropic client instance."""
+        """Get the shared Anthropic client instance (see core.llm_transport)."""
+        from core import llm_transport
         try:
-            import anthropic
-            return anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+            return llm_transport.get_anthropic()
         except Exception as e:
             logger.error(f"Failed to initialize Anthropic client: {e}")
             raise
 
     @staticmethod
-    def call_claude(system_prompt, user_message, max_tokens=4096, temperature=0.7, json_mode=False):
+    def call_claude(system_prompt, user_message, max_tokens=4096, temperature=0.7, json_mode=False,
+                    tool='ai_service'):
         """
         Make a call to Claude API.
 
+        Goes through LLMClient, so the call gets the shared client, circuit
+        breaker, rate limits and metrics of every other tool. The call is
+        pinned to Claude: it never falls back to the open-source model.
+
         Args:
             system_prompt: System instructions for Claude
             user_message: The user's input text
             max_tokens: Maximum tokens in response
             temperature: Creativity level (0.0-1.0)
             json_mode: If True, instruct Claude to return valid JSON
+            tool: Tool tag for metrics and model routing
 
         Returns:
             str: Claude's response text
 
         Raises:
-            Exception: If API call fails
+            Exception: If API call fails or Claude is unavailable
         """
-        client = AIService.get_client()
-        model = getattr(settings, 'ANTHROPIC_MODEL', 'claude-sonnet-4-5-20250929')
+        from core.llm_client import LLMClient
 
         if json_mode:
             system_prompt += "\n\nIMPORTANT: You must respond with valid JSON only. No markdown, no code blocks, no explanation outside the JSON."
 
-        try:
-            message = client.messages.create(
-                model=model,
-                max_tokens=max_tokens,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": user_message}
-                ],
-                temperature=temperature,
-            )
-            response_text = message.content[0].text
-
-            if json_mode:
-                # Strip markdown code blocks if present
-                response_text = response_text.strip()
-                if response_text.startswith('```'):
-                    lines = response_text.split('\n')
-                    # Remove first and last lines (```json and ```)
-                    lines = [l for l in lines if not l.strip().startswith('```')]
-                    response_text = '\n'.join(lines)
-
-            return response_text
+        response_text, error = LLMClient.generate(
+            system_prompt=system_prompt,
+            messages=[
+                {"role": "user", "content": user_message}
+            ],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            use_premium=True,
+            tool=tool,
+            backend='claude',
+        )
+        if error:
+            logger.error(f"Claude API error: {error}")
+            raise Exception(error)
 
-        except Exception as e:
-            logger.error(f"Claude API error: {e}")
-            raise
+        if json_mode:
+            # Strip markdown code blocks if present
+            response_text = response_text.strip()
+            if response_text.startswith('```'):
+                lines = response_text.split('\n')
+                # Remove first and last lines (```json and ```)
+                lines = [l for l in lines if not l.strip().startswith('```')]
+                response_text = '\n'.join(lines)
+
+        return response_text
 
     @staticmethod
     def call_claude_json(system_prompt, user_message, max_tokens=4096, temperature=0.7):
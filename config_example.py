@@ -49,9 +49,204 @@ ANTHROPIC_MODEL = 'claude-sonnet-4-5-20250929'  # Default model for tool operati
 WRITINGBOT_API_URL = 'https://api.writingbot.ai'
 WRITINGBOT_API_KEY = ''  # Shared secret with GPU server
 
+# Pooled HTTP transport to the LLM backends (per gunicorn worker)
+LLM_HTTP_POOL_SIZE = 20  # Max keep-alive connections per backend
+LLM_HTTP_RETRIES = 2  # Retries on connection errors only (never after the request was sent)
+LLM_HTTP_BACKOFF = 0.2  # Backoff factor between connect retries, in seconds
+# Shared Anthropic SDK client (one per worker; the async one is per event loop
+# and sized by LLM_ASYNC_POOL_SIZE)
+LLM_ANTHROPIC_POOL_SIZE = 20  # Max keep-alive connections to the Claude API
+LLM_ANTHROPIC_KEEPALIVE = 30  # Seconds an idle connection is kept open
+LLM_ANTHROPIC_TIMEOUT = 120  # Default read timeout; the circuit breaker sets per-call timeouts
+LLM_ANTHROPIC_CONNECT_TIMEOUT = 5
+LLM_ANTHROPIC_MAX_RETRIES = 2  # SDK retries on connection errors, 429 and 5xx
+
+# Async LLM views. Enable only when served by an ASGI server, e.g.
+#   gunicorn app.asgi:application -k uvicorn.workers.UvicornWorker
+# LLM-bound endpoints then await the upstream call instead of holding a worker.
+# Async LLM clients are pooled per event loop only when this is on; otherwise
+# each async call opens its own client and closes it before its loop ends.
+LLM_ASYNC_VIEWS = False
+LLM_ASYNC_POOL_SIZE = 200  # Max connections per backend per event loop
+
+# Concurrent batches (LLMClient.generate_many, bulk AI detection)
+LLM_BATCH_POOL_SIZE = 32  # Threads in the shared per-process pool
+LLM_BATCH_MAX_CONCURRENCY = 8  # Default max in-flight calls per batch
+# Process-wide cap on concurrent batch calls per backend (unlisted backends: 8)
+LLM_BACKEND_CONCURRENCY = {
+    'open_source': 16,
+    'claude': 8,
+    'detector': 8,
+}
+
+# Admission control: per-process lanes by tier (free/premium) and tool class
+# (interactive/batch). Free lanes shed with 429 when their queue is full.
+LLM_ADMISSION_ENABLED = True
+LLM_ADMISSION_CAPACITY = 48  # Upstream calls in flight per process, all lanes
+LLM_ADMISSION_BATCH_TOOLS = ('ai_detector_bulk',)
+# limit: max in flight; queue: max waiting; timeout: max seconds waiting
+LLM_ADMISSION_LANES = {
+    'premium_interactive': {'limit': 32, 'queue': 64, 'timeout': 15},
+    'premium_batch': {'limit': 8, 'queue': 64, 'timeout': 60},
+    'free_interactive': {'limit': 20, 'queue': 16, 'timeout': 3},
+    'free_batch': {'limit': 4, 'queue': 4, 'timeout': 3},
+}
+LLM_ADMISSION_RETRY_AFTER = 2  # Seconds, sent with 429 responses
+
+# Outbound rate limits per backend and API key, shared by all workers through
+# Redis (LLM_CACHE_ALIAS). Calls over the limit wait up to
+# LLM_RATE_LIMIT_MAX_WAIT seconds for the bucket to refill, then get a 429.
+LLM_RATE_LIMIT_ENABLED = False
+LLM_RATE_LIMIT_MAX_WAIT = 2.0
+LLM_RATE_LIMITS = {
+    'open_source': {'requests_per_sec': 40, 'burst': 80, 'tokens_per_min': 1_500_000},
+    'claude': {'requests_per_sec': 15, 'burst': 30, 'tokens_per_min': 400_000},
+    'detector': {'requests_per_sec': 60, 'burst': 120},
+}
+
+# Circuit breakers per LLM backend (open_source, claude, detector). An open
+# breaker fails calls in milliseconds: premium traffic fails over to the other
+# backend and AI detection falls back to heuristics.
+LLM_BREAKER_ENABLED = True
+LLM_BREAKER_WINDOW = 60  # Rolling window in seconds
+LLM_BREAKER_MIN_CALLS = 20  # Calls in the window before the breaker can open
+LLM_BREAKER_FAILURE_RATE = 0.5  # Share of failed or slow calls that opens it
+LLM_BREAKER_SLOW_CALL = 60  # Calls slower than this (seconds) count as failures
+LLM_BREAKER_OPEN_SECONDS = 30  # Time open before a half-open probe is allowed
+# Adaptive read timeout: p99 of recent successful calls x multiplier, clamped
+LLM_TIMEOUT_MIN = 15
+LLM_TIMEOUT_MAX = 120  # Also used until LLM_TIMEOUT_MIN_SAMPLES calls succeeded
+LLM_TIMEOUT_MULTIPLIER = 2.0
+LLM_TIMEOUT_MIN_SAMPLES = 20
+LLM_TIMEOUT_SAMPLES = 200  # Latency samples kept per backend
+LLM_CONNECT_TIMEOUT = 5
+
+# Hedged requests for short open-source calls (max_tokens <= LLM_HEDGE_MAX_TOKENS):
+# a duplicate is sent if no reply arrives within the LLM_HEDGE_PERCENTILE latency
+LLM_HEDGE_ENABLED = False
+LLM_HEDGE_MAX_TOKENS = 512
+LLM_HEDGE_PERCENTILE = 95
+LLM_HEDGE_DEFAULT_DELAY = 1.0  # Seconds, until LLM_HEDGE_MIN_SAMPLES calls were seen
+LLM_HEDGE_MIN_DELAY = 0.05
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_HEDGE_BUDGET = 0.1  # Max fraction of short calls that may be hedged
+LLM_HEDGE_BURST = 5  # Max hedges that can be saved up while traffic is healthy
+
+# Token budgets: max_tokens is sized from the input and the task, and context is
+# trimmed by estimated tokens. Calibration scales the local estimate per backend
+# until enough real usage has been observed.
+LLM_TOKEN_CALIBRATION = {
+    'open_source': 1.0,
+    'claude': 1.1,
+}
+LLM_MAX_TOKENS_HEADROOM = 128  # Tokens added on top of the expected output
+LLM_CHAT_HISTORY_TOKENS = 6000  # AI chat history kept per request
+LLM_PDF_CONTEXT_TOKENS = 12000  # Document text sent with a ChatPDF question
+
+# Long documents (summarizer, proofreader, translator, premium paraphraser) are split into chunks
+# of at most this many input tokens and processed in parallel
+LLM_MAPREDUCE_CHUNK_TOKENS = {
+    'summarize': 3000,
+    'proofread': 1200,
+    'translate': 1500,
+    'paraphrase': 1200,  # Premium paraphrases only, split at paragraph breaks
+}
+LLM_MAPREDUCE_CONCURRENCY = 6  # Chunk calls in flight per document
+LLM_USER_CONCURRENCY = 4  # Chunk calls in flight per user, across documents (paraphraser)
+
+# LLM call metrics, served in Prometheus format on /metrics (per process)
+LLM_METRICS_TOKEN = ''  # Bearer token scrapers must send; empty disables /metrics
+LLM_METRICS_LOG_SAMPLE = 0.0  # Fraction of calls also logged as a JSON line
+
+# Prompt-prefix caching: Claude cache_control blocks and an open-source prefix hint
+LLM_PROMPT_CACHE_ENABLED = True
+LLM_PROMPT_CACHE_MIN_TOKENS = 1024  # Claude does not cache shorter prefixes
+
+# LLM response cache (opt-in; identical requests are served from cache)
+LLM_CACHE_ENABLED = False
+LLM_CACHE_TTL = 3600  # Default TTL in seconds for the Redis tier
+LLM_CACHE_LOCAL_SIZE = 512  # Max entries in the in-process LRU tier
+LLM_CACHE_LOCAL_TTL = 300  # Max TTL in seconds for the in-process tier
+LLM_CACHE_MAX_CHARS = 65536  # Responses larger than this are not cached
+LLM_CACHE_ALIAS = 'default'  # Django cache alias for the shared tier
+# Per-tool override: True (default TTL), an int TTL in seconds, or False to disable.
+# Tools not listed use the opt-in chosen in code.
+LLM_CACHE_TOOLS = {
+    # 'translator_detect': 86400,
+    # 'ai_tools': True,
+    # 'paraphraser': False,
+}
+
+# Paraphraser synonyms (see paraphraser/synonyms.py): one batch call per
+# sentence, cached per (word, context window). Pre-fill with
+# `manage.py warm_synonyms`.
+LLM_SYNONYM_CONTEXT_WORDS = 2  # Words on either side that key an entry
+LLM_SYNONYM_BATCH_WORDS = 24  # Max words per batch call
+LLM_SYNONYM_TTL = 604800  # Seconds in the shared (Redis) tier
+LLM_SYNONYM_LOCAL_SIZE = 10000  # Max entries in the in-process LRU tier
+LLM_SYNONYM_LOCAL_TTL = 3600
+
+# Paraphraser alternatives: the page's "Alternatives" button asks for several
+# variants in one upstream call and cycles through them without new requests.
+# Plain paraphrase clicks stay single-output (and incremental on re-runs).
+PARAPHRASE_VARIANTS = 1  # Variants the Alternatives button asks for (1 = no button)
+PARAPHRASE_MAX_VARIANTS = 4  # Max n_variants accepted by /api/paraphrase/
+PARAPHRASE_VARIANT_TEMPERATURE = 0.9  # Higher than the default 0.7 for varied alternatives
+
+# Humanizer: with a target AI score (premium), extra rewrite rounds run until
+# the detector scores the output below it, within these limits
+HUMANIZER_MAX_ROUNDS = 3  # Rewrites in total, including the first
+HUMANIZER_TIME_BUDGET = 20  # Seconds
+
+# Near-duplicate result cache (see core/llm_neardup.py): resubmitted texts with
+# small edits reuse earlier results. Per tool: max SimHash distance in bits
+# (0-3; 0 = same text after whitespace/quote normalization). The paraphraser
+# samples, so a resubmission normally wants a fresh rewrite; add it with 0 to
+# serve repeats from cache.
+LLM_NEARDUP_ENABLED = False
+LLM_NEARDUP_TOOLS = {
+    'ai_detector': 3,
+    'grammar': 3,
+}
+LLM_NEARDUP_MIN_WORDS = 20  # Shorter texts only match after normalization
+LLM_NEARDUP_TTL = 86400
+LLM_NEARDUP_BUCKET_SIZE = 16  # Entries kept per LSH band value
+
+# Incremental paraphrasing (see core/llm_incremental.py): a re-run of the same
+# document (document_id, or the user's session) only re-paraphrases the
+# sentences that changed since the last run
+LLM_INCREMENTAL_ENABLED = False
+LLM_INCREMENTAL_CONTEXT = 1  # Neighbouring sentences sent as read-only context
+LLM_INCREMENTAL_MAX_CHANGED = 0.5  # Share of the text above which it is rewritten whole
+LLM_INCREMENTAL_TTL = 3600
+
+# Single-flight: identical in-flight LLM requests share one upstream call,
+# within a process and across processes via the LLM_CACHE_ALIAS cache.
+LLM_SINGLEFLIGHT_ENABLED = False
+LLM_SINGLEFLIGHT_WAIT = 120  # Max seconds a follower waits before calling upstream itself
+LLM_SINGLEFLIGHT_POLL = 0.1  # Seconds between result checks when following another process
+LLM_SINGLEFLIGHT_RESULT_TTL = 10  # Seconds a published result stays readable by followers
+
 # Premium LLM: set to True to use Claude for premium users
 USE_CLAUDE_FOR_PREMIUM = True
 
+# Model routing (see core/llm_routing.py): tool tag -> tier, or a list of rules
+# checked in order, e.g. [{'max_input_tokens': 1500, 'tier': 'small'}]. Rule
+# conditions: max_input_tokens, max_tokens, premium. Unrouted tools use
+# 'premium' for premium users and 'default' otherwise.
+LLM_MODEL_ROUTES = {
+    'translator_detect': 'small',
+    'synonyms': 'small',
+    # 'summarizer': [{'premium': False, 'max_input_tokens': 800, 'tier': 'small'}],
+}
+# Tier -> backend, model ('' = backend default) and estimated USD cost per
+# million (input, output) tokens, exported as llm_route_cost_usd_total
+LLM_MODEL_TIERS = {
+    'small': {'backend': 'open_source', 'model': 'qwen2.5:3b', 'cost': (0.02, 0.05)},
+    'default': {'backend': 'open_source', 'model': '', 'cost': (0.2, 0.6)},
+    'premium': {'backend': 'claude', 'model': '', 'cost': (3.0, 15.0)},
+}
+
 # Internal API secret (shared with GPU server for API key validation)
 INTERNAL_API_SECRET = ''  # python -c "import secrets; print(secrets.token_urlsafe(32))"
 
@@ -0,0 +1,267 @@
+"""
+Admission control for upstream LLM calls.
+
+Free and premium traffic used to compete equally for upstream capacity;
+``use_premium`` only chose the backend. LLMAdmission sits in front of every
+upstream call LLMClient makes and sorts it into one of four lanes:
+
+    premium_interactive, premium_batch, free_interactive, free_batch
+
+A call is batch when its tool tag is in LLM_ADMISSION_BATCH_TOOLS (bulk
+detection), interactive otherwise. Each lane has its own concurrency limit
+and queue in LLM_ADMISSION_LANES, and all lanes share LLM_ADMISSION_CAPACITY
+slots per process. Keeping the free lanes' limits below the capacity
+reserves headroom that only premium calls can use.
+
+When a slot frees up, queued calls are dequeued in the lane order above, so
+premium calls overtake free ones. A call whose lane queue is full, or that
+waits longer than its lane's timeout, is shed: LLMClient returns
+ADMISSION_ERROR without calling upstream, and LLMAdmissionMiddleware turns
+the failed response into a 429 with Retry-After. Free lanes have short
+queues and timeouts so a spike is rejected fast instead of piling up
+behind premium traffic.
+
+Queue depth, active calls and shed counts are exported on /metrics via
+stats(); time spent queued is the llm_admission_wait_seconds histogram.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+
+from core.llm_metrics import LLMMetrics
+
+ADMISSION_ERROR = 'The service is busy right now. Please try again in a moment.'
+
+LANE_ORDER = ('premium_interactive', 'premium_batch', 'free_interactive', 'free_batch')
+
+DEFAULT_LANES = {
+    'premium_interactive': {'limit': 32, 'queue': 64, 'timeout': 15},
+    'premium_batch': {'limit': 8, 'queue': 64, 'timeout': 60},
+    'free_interactive': {'limit': 20, 'queue': 16, 'timeout': 3},
+    'free_batch': {'limit': 4, 'queue': 4, 'timeout': 3},
+}
+
+# Per-request state set by LLMAdmissionMiddleware; a dict so worker threads
+# running in a copy of the context still report back to the request
+_request_state = contextvars.ContextVar('llm_admission_request', default=None)
+
+
+class _Waiter:
+    """A queued call, woken by a thread event or an event-loop future."""
+
+    def __init__(self, lane, loop=None):
+        self.lane = lane
+        self.granted = False
+        self.enqueued = time.monotonic()
+        self.event = threading.Event() if loop is None else None
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class LLMAdmission:
+    """Tiered concurrency limits and queues for upstream calls. See module docstring."""
+
+    _lock = threading.Lock()
+    _active = {}
+    _queues = {}
+    _in_use = 0
+    _stats = {}
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'LLM_ADMISSION_ENABLED', False)
+
+    @staticmethod
+    def lane_for(use_premium, tool=''):
+        """Return the lane name for a call."""
+        tier = 'premium' if use_premium else 'free'
+        batch_tools = getattr(settings, 'LLM_ADMISSION_BATCH_TOOLS', ('ai_detector_bulk',))
+        return f'{tier}_batch' if tool in batch_tools else f'{tier}_interactive'
+
+    @staticmethod
+    def lane_config(lane):
+        config = dict(DEFAULT_LANES[lane])
+        config.update(getattr(settings, 'LLM_ADMISSION_LANES', {}).get(lane, {}))
+        return config
+
+    @classmethod
+    @contextmanager
+    def admit(cls, use_premium, tool=''):
+        """
+        Hold an upstream slot for the duration of the block.
+
+        Yields None once admitted, or ADMISSION_ERROR if the call was shed
+        (the block should then return it as the error). Usage::
+
+            with LLMAdmission.admit(use_premium, tool) as error:
+                if error:
+                    return None, error
+                ...
+        """
+        if not cls.enabled():
+            yield None
+            return
+        lane = cls.lane_for(use_premium, tool)
+        admitted, waiter = cls._enter(lane)
+        if waiter is not None:
+            waiter.event.wait(cls.lane_config(lane)['timeout'])
+            admitted = cls._settle(lane, waiter)
+        cls._record(lane, admitted, waiter)
+        if not admitted:
+            yield ADMISSION_ERROR
+            return
+        try:
+            yield None
+        finally:
+            cls._release(lane)
+
+    @classmethod
+    @asynccontextmanager
+    async def aadmit(cls, use_premium, tool=''):
+        """Async counterpart of admit(); waits on the event loop."""
+        if not cls.enabled():
+            yield None
+            return
+        lane = cls.lane_for(use_premium, tool)
+        admitted, waiter = cls._enter(lane, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), cls.lane_config(lane)['timeout'])
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # Give back a slot granted while we were being cancelled
+                if cls._settle(lane, waiter):
+                    cls._release(lane)
+                raise
+            admitted = cls._settle(lane, waiter)
+        cls._record(lane, admitted, waiter)
+        if not admitted:
+            yield ADMISSION_ERROR
+            return
+        try:
+            yield None
+        finally:
+            cls._release(lane)
+
+    @classmethod
+    def stats(cls):
+        """Return per-lane active calls, queue depth, limits and counts."""
+        with cls._lock:
+            return {
+                lane: {
+                    'active': cls._active.get(lane, 0),
+                    'queued': len(cls._queues.get(lane, ())),
+                    'limit': cls.lane_config(lane)['limit'],
+                    **cls._stats.get(lane, {}),
+                }
+                for lane in LANE_ORDER
+            }
+
+    @classmethod
+    def begin_request(cls):
+        """Start tracking sheds for the current request. Returns a reset token."""
+        return _request_state.set({'shed': False})
+
+    @classmethod
+    def end_request(cls, token):
+        """Stop tracking; return True if a call of this request was shed."""
+        state = _request_state.get()
+        _request_state.reset(token)
+        return bool(state and state['shed'])
+
+    @staticmethod
+    def mark_shed():
+        """Flag the current request as shed, so the middleware answers 429."""
+        state = _request_state.get()
+        if state is not None:
+            state['shed'] = True
+
+    @classmethod
+    def reset(cls):
+        """Forget all lanes and counts (used by tests)."""
+        with cls._lock:
+            cls._active.clear()
+            cls._queues.clear()
+            cls._stats.clear()
+            cls._in_use = 0
+
+    @classmethod
+    def _enter(cls, lane, loop=None):
+        """
+        Try to take a slot. Returns (admitted, waiter): (True, None) when a
+        slot was free, (False, waiter) when queued, (False, None) when the
+        lane's queue is full.
+        """
+        with cls._lock:
+            queue = cls._queues.setdefault(lane, deque())
+            if not queue and cls._has_room(lane):
+                cls._grant(lane)
+                return True, None
+            if len(queue) >= cls.lane_config(lane)['queue']:
+                return False, None
+            waiter = _Waiter(lane, loop)
+            queue.append(waiter)
+            return False, waiter
+
+    @classmethod
+    def _settle(cls, lane, waiter):
+        """Return True if the waiter was granted a slot, else take it off the queue."""
+        with cls._lock:
+            if waiter.granted:
+                return True
+            try:
+                cls._queues[lane].remove(waiter)
+            except ValueError:
+                pass
+            return False
+
+    @classmethod
+    def _record(cls, lane, admitted, waiter):
+        wait = time.monotonic() - waiter.enqueued if waiter is not None else 0.0
+        LLMMetrics.observe_admission(lane, wait)
+        with cls._lock:
+            lane_stats = cls._stats.setdefault(lane, {'admitted': 0, 'shed': 0})
+            lane_stats['admitted' if admitted else 'shed'] += 1
+        if not admitted:
+            LLMMetrics.note(error_class='shed')
+            cls.mark_shed()
+
+    @classmethod
+    def _release(cls, lane):
+        with cls._lock:
+            cls._active[lane] -= 1
+            cls._in_use -= 1
+            # Hand freed slots to queued calls, highest-priority lane first
+            for candidate in LANE_ORDER:
+                queue = cls._queues.get(candidate)
+                while queue and cls._has_room(candidate):
+                    waiter = queue.popleft()
+                    waiter.granted = True
+                    cls._grant(candidate)
+                    waiter.wake()
+
+    @classmethod
+    def _has_room(cls, lane):
+        capacity = getattr(settings, 'LLM_ADMISSION_CAPACITY', 48)
+        return cls._in_use < capacity and cls._active.get(lane, 0) < cls.lane_config(lane)['limit']
+
+    @classmethod
+    def _grant(cls, lane):
+        cls._active[lane] = cls._active.get(lane, 0) + 1
+        cls._in_use += 1
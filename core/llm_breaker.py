@@ -0,0 +1,186 @@
+"""
+Per-backend circuit breakers and adaptive timeouts for LLM calls.
+
+Each backend ('open_source', 'claude', 'detector') gets a breaker that keeps
+a rolling window of call outcomes. A call counts as bad when it raises a
+transport error, returns a 5xx/429, or takes longer than
+LLM_BREAKER_SLOW_CALL seconds. The breaker moves through three states:
+
+    closed     calls flow; opens when the bad-call rate over the last
+               LLM_BREAKER_WINDOW seconds reaches LLM_BREAKER_FAILURE_RATE
+               (after at least LLM_BREAKER_MIN_CALLS calls)
+    open       calls are rejected immediately for LLM_BREAKER_OPEN_SECONDS
+    half_open  one probe call at a time is let through; success closes
+               the breaker, failure re-opens it
+
+Read timeouts adapt to the backend: p99 latency of recent successful calls
+times LLM_TIMEOUT_MULTIPLIER, clamped to [LLM_TIMEOUT_MIN, LLM_TIMEOUT_MAX].
+Until enough samples exist the timeout is LLM_TIMEOUT_MAX.
+
+State is per process; each gunicorn worker trips on its own observations.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger('app')
+
+
+class _TrackedCall:
+    """Handle yielded by CircuitBreaker.track()."""
+
+    def __init__(self, timeout, connect_timeout):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.ok = True
+
+    def failed(self):
+        """Mark the call as a backend failure (e.g. a 5xx reply)."""
+        self.ok = False
+
+
+class CircuitBreaker:
+    """Circuit breaker and latency tracker for one backend. See module docstring."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    _breakers = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.probe_until = 0.0
+        self.outcomes = deque()
+        self.latencies = deque(maxlen=getattr(settings, 'LLM_TIMEOUT_SAMPLES', 200))
+        self.counters = {'calls': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get(cls, backend):
+        """Return the process-wide breaker for ``backend``."""
+        breaker = cls._breakers.get(backend)
+        if breaker is None:
+            with cls._registry_lock:
+                breaker = cls._breakers.setdefault(backend, cls(backend))
+        return breaker
+
+    @classmethod
+    def stats(cls):
+        """Return state, adaptive timeout and counters for every backend."""
+        return {backend: breaker.snapshot() for backend, breaker in list(cls._breakers.items())}
+
+    @classmethod
+    def reset(cls):
+        """Forget all breakers (used by tests)."""
+        with cls._registry_lock:
+            cls._breakers.clear()
+
+    def allow(self):
+        """Return True if a call may go to the backend now."""
+        if not getattr(settings, 'LLM_BREAKER_ENABLED', True):
+            return True
+        now = time.monotonic()
+        with self.lock:
+            if self.state == self.OPEN:
+                if now - self.opened_at < getattr(settings, 'LLM_BREAKER_OPEN_SECONDS', 30):
+                    self.counters['rejected'] += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self.probe_until = 0.0
+            if self.state == self.HALF_OPEN:
+                if now < self.probe_until:
+                    self.counters['rejected'] += 1
+                    return False
+                # One probe at a time; a lost probe frees the slot after the max timeout
+                self.probe_until = now + getattr(settings, 'LLM_TIMEOUT_MAX', 120)
+            return True
+
+    def record(self, ok, latency, sample_latency=True):
+        """
+        Record the outcome of a call that allow() let through.
+
+        With ``sample_latency=False`` (streams) the latency neither feeds the
+        adaptive timeout nor marks the call as slow.
+        """
+        now = time.monotonic()
+        good = ok
+        if sample_latency:
+            good = ok and latency < getattr(settings, 'LLM_BREAKER_SLOW_CALL', 60)
+        with self.lock:
+            self.counters['calls'] += 1
+            if ok and sample_latency:
+                self.latencies.append(latency)
+            if not good:
+                self.counters['failures'] += 1
+
+            if self.state == self.HALF_OPEN:
+                if good:
+                    logger.info(f'LLM breaker for {self.backend} closed')
+                    self.state = self.CLOSED
+                    self.outcomes.clear()
+                else:
+                    self._open(now)
+                return
+
+            self.outcomes.append((now, good))
+            window = getattr(settings, 'LLM_BREAKER_WINDOW', 60)
+            while self.outcomes and now - self.outcomes[0][0] > window:
+                self.outcomes.popleft()
+
+            if self.state == self.CLOSED and len(self.outcomes) >= getattr(settings, 'LLM_BREAKER_MIN_CALLS', 20):
+                bad = sum(1 for _, was_good in self.outcomes if not was_good)
+                if bad / len(self.outcomes) >= getattr(settings, 'LLM_BREAKER_FAILURE_RATE', 0.5):
+                    self._open(now)
+
+    def timeout(self):
+        """Return the adaptive read timeout in seconds."""
+        max_timeout = getattr(settings, 'LLM_TIMEOUT_MAX', 120)
+        with self.lock:
+            samples = sorted(self.latencies)
+        if len(samples) < getattr(settings, 'LLM_TIMEOUT_MIN_SAMPLES', 20):
+            return max_timeout
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        adaptive = p99 * getattr(settings, 'LLM_TIMEOUT_MULTIPLIER', 2.0)
+        return max(getattr(settings, 'LLM_TIMEOUT_MIN', 15), min(max_timeout, adaptive))
+
+    @contextmanager
+    def track(self, is_failure=None, sample_latency=True):
+        """
+        Time a call and record its outcome.
+
+        Yields a handle with ``timeout`` (adaptive read timeout),
+        ``connect_timeout`` and ``failed()``. An exception escaping the block
+        counts as a failure unless ``is_failure(exc)`` says otherwise.
+        """
+        call = _TrackedCall(self.timeout(), getattr(settings, 'LLM_CONNECT_TIMEOUT', 5))
+        start = time.monotonic()
+        try:
+            yield call
+        except Exception as e:
+            if is_failure is None or is_failure(e):
+                call.ok = False
+            raise
+        finally:
+            self.record(call.ok, time.monotonic() - start, sample_latency)
+
+    def snapshot(self):
+        with self.lock:
+            data = {'state': self.state, **self.counters}
+        data['timeout'] = round(self.timeout(), 2)
+        return data
+
+    def _open(self, now):
+        if self.state != self.OPEN:
+            logger.warning(f'LLM breaker for {self.backend} opened')
+            self.counters['opened'] += 1
+        self.state = self.OPEN
+        self.opened_at = now
+        self.outcomes.clear()
@@ -0,0 +1,148 @@
+"""
+Content-addressed response cache for LLMClient.generate.
+
+Responses are keyed by a SHA-256 of the full request (backend, model,
+system prompt, messages, max_tokens, temperature), so only byte-identical
+requests share an entry. Two tiers are consulted in order:
+
+1. An in-process LRU (bounded by entry count, per-entry TTL).
+2. The shared Django cache (Redis in production), bounded by TTL and
+   Redis maxmemory eviction.
+
+Caching is opt-in: nothing is cached unless LLM_CACHE_ENABLED is set and
+the calling tool opts in, either in code (``cache=True``) or through the
+LLM_CACHE_TOOLS setting, which always wins so a tool can be switched on,
+off, or given its own TTL without a deploy.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger('app')
+
+
+class LLMResponseCache:
+    """Two-tier (in-process LRU + Redis) cache of successful LLM responses."""
+
+    KEY_PREFIX = 'llm_cache:'
+
+    _local = OrderedDict()
+    _lock = threading.Lock()
+    _stats = {}
+
+    @staticmethod
+    def make_key(backend, model, system_prompt, messages, max_tokens, temperature, n=1):
+        """Return a stable content hash for a generate() request."""
+        # Single-output keys predate ``n`` and stay as they were
+        parts = [backend, model, system_prompt, messages, max_tokens, temperature] + ([n] if n != 1 else [])
+        payload = json.dumps(
+            parts,
+            sort_keys=True,
+            separators=(',', ':'),
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def ttl_for(tool, cache=None):
+        """
+        Resolve whether a call is cacheable and for how long.
+
+        Args:
+            tool: Tool tag of the caller ('' if untagged).
+            cache: Caller's opt-in: True, False, or None (defer to settings).
+
+        Returns:
+            TTL in seconds, or 0 if the call must not be cached.
+        """
+        if not getattr(settings, 'LLM_CACHE_ENABLED', False):
+            return 0
+        default_ttl = getattr(settings, 'LLM_CACHE_TTL', 3600)
+        choice = getattr(settings, 'LLM_CACHE_TOOLS', {}).get(tool, cache)
+        if choice is True:
+            return default_ttl
+        if isinstance(choice, (int, float)) and not isinstance(choice, bool) and choice > 0:
+            return int(choice)
+        return 0
+
+    @classmethod
+    def get(cls, key, tool=''):
+        """Return the cached text for ``key`` or None, updating hit/miss counters."""
+        now = time.monotonic()
+        with cls._lock:
+            entry = cls._local.get(key)
+            if entry is not None:
+                expires, text = entry
+                if expires > now:
+                    cls._local.move_to_end(key)
+                    cls._count(tool, 'local_hits')
+                    return text
+                del cls._local[key]
+
+        text = None
+        try:
+            text = cls._backend().get(cls.KEY_PREFIX + key)
+        except Exception as e:
+            logger.warning(f'LLM cache read failed: {e}')
+
+        if text is not None:
+            cls._remember(key, text, getattr(settings, 'LLM_CACHE_LOCAL_TTL', 300))
+            with cls._lock:
+                cls._count(tool, 'redis_hits')
+            return text
+
+        with cls._lock:
+            cls._count(tool, 'misses')
+        return None
+
+    @classmethod
+    def set(cls, key, text, ttl):
+        """Store ``text`` in both tiers. Oversized responses are skipped."""
+        if not text or ttl <= 0:
+            return
+        if len(text) > getattr(settings, 'LLM_CACHE_MAX_CHARS', 65536):
+            return
+        cls._remember(key, text, min(ttl, getattr(settings, 'LLM_CACHE_LOCAL_TTL', 300)))
+        try:
+            cls._backend().set(cls.KEY_PREFIX + key, text, timeout=ttl)
+        except Exception as e:
+            logger.warning(f'LLM cache write failed: {e}')
+
+    @classmethod
+    def stats(cls):
+        """Return per-tool hit/miss counters for this process."""
+        with cls._lock:
+            return {tool: dict(counts) for tool, counts in cls._stats.items()}
+
+    @classmethod
+    def clear(cls):
+        """Empty the in-process tier and reset counters."""
+        with cls._lock:
+            cls._local.clear()
+            cls._stats.clear()
+
+    @classmethod
+    def _remember(cls, key, text, ttl):
+        max_entries = getattr(settings, 'LLM_CACHE_LOCAL_SIZE', 512)
+        if max_entries <= 0:
+            return
+        with cls._lock:
+            cls._local[key] = (time.monotonic() + ttl, text)
+            cls._local.move_to_end(key)
+            while len(cls._local) > max_entries:
+                cls._local.popitem(last=False)
+
+    @classmethod
+    def _count(cls, tool, field):
+        counts = cls._stats.setdefault(tool or 'untagged', {'local_hits': 0, 'redis_hits': 0, 'misses': 0})
+        counts[field] += 1
+
+    @staticmethod
+    def _backend():
+        return caches[getattr(settings, 'LLM_CACHE_ALIAS', 'default')]
@@ -1,72 +1,25 @@
 import json
 import logging
-import re
+import time
 
 import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings
 
-logger = logging.getLogger('app')
-
-
-def extract_json(text):
-    """
-    Robustly extract a JSON object from LLM output that may contain
-    preamble text, markdown code fences, or trailing commentary.
+from core import llm_transport
+from core.llm_admission import LLMAdmission
+from core.llm_breaker import CircuitBreaker
+from core.llm_cache import LLMResponseCache
+from core.llm_hedge import LLMHedger
+from core.llm_json import extract_json  # Services import it from here
+from core.llm_metrics import LLMMetrics
+from core.llm_prompt_cache import CachedPrompt, PromptCache
+from core.llm_ratelimit import LLMRateLimiter
+from core.llm_routing import ModelRouter
+from core.llm_singleflight import LLMSingleFlight
+from core.llm_tokens import TokenBudget
 
-    Returns parsed dict/list on success, raises ValueError on failure.
-    """
-    if not text or not text.strip():
-        raise ValueError('Empty response')
-
-    s = text.strip()
-
-    # 1. Strip markdown code fences (```json ... ``` or ``` ... ```)
-    fence_match = re.search(r'```(?:json)?\s*\n([\s\S]*?)```', s)
-    if fence_match:
-        s = fence_match.group(1).strip()
-
-    # 2. Try parsing directly
-    try:
-        return json.loads(s)
-    except json.JSONDecodeError:
-        pass
-
-    # 3. Find the outermost { ... } or [ ... ] in the text
-    for open_ch, close_ch in [('{', '}'), ('[', ']')]:
-        start = s.find(open_ch)
-        if start == -1:
-            continue
-        depth = 0
-        in_string = False
-        escape = False
-        end = -1
-        for i in range(start, len(s)):
-            c = s[i]
-            if escape:
-                escape = False
-                continue
-            if c == '\\' and in_string:
-                escape = True
-                continue
-            if c == '"' and not escape:
-                in_string = not in_string
-                continue
-            if in_string:
-                continue
-            if c == open_ch:
-                depth += 1
-            elif c == close_ch:
-                depth -= 1
-                if depth == 0:
-                    end = i
-                    break
-        if end != -1:
-            try:
-                return json.loads(s[start:end + 1])
-            except json.JSONDecodeError:
-                pass
-
-    raise ValueError(f'No valid JSON found in response: {text[:200]}')
+logger = logging.getLogger('app')
 
 
 class LLMClient:
@@ -79,7 +32,7 @@ class LLMClient:
 
     @classmethod
     def generate(cls, system_prompt, messages, max_tokens=4096,
-                 temperature=0.7, use_premium=False):
+                 temperature=0.7, use_premium=False, tool='', cache=None, n=1, backend=None):
         """
         Generate text using either open-source LLM or Claude.
 
@@ -88,44 +41,291 @@ class LLMClient:
             messages: List of dicts with 'role' and 'content'.
             max_tokens: Maximum tokens to generate.
             temperature: Sampling temperature.
-            use_premium: If True and Claude API key is set, use Claude.
+            use_premium: If True and Claude API key is set, use Claude
+                (unless LLM_MODEL_ROUTES sends the tool to another tier).
+            tool: Short tag naming the calling tool (e.g. 'paraphraser');
+                also selects the model tier, see core.llm_routing.
+            cache: Opt this call into the response cache (True/False), or
+                None to defer to LLM_CACHE_TOOLS. See core.llm_cache.
+            n: Number of alternative outputs to generate in this one call.
+                With n > 1 the text returned is a JSON array of up to n
+                distinct strings: the open-source backend samples them
+                (``n``), Claude is asked for a JSON array of n versions
+                with n times the token budget.
+            backend: Pin the call to 'claude' or 'open_source', bypassing
+                LLM_MODEL_ROUTES and breaker failover; an error is returned
+                when that backend is not configured or its breaker is open.
 
         Returns:
             Tuple of (text, error). On success error is None.
         """
-        if use_premium and getattr(settings, 'ANTHROPIC_API_KEY', ''):
-            return cls._call_claude(system_prompt, messages, max_tokens, temperature)
-        return cls._call_open_source(system_prompt, messages, max_tokens, temperature)
+        pinned = backend is not None
+        route, backend, model = cls._route(tool, use_premium, max_tokens, system_prompt, messages, backend)
+        with LLMMetrics.track(tool, backend, model, system_prompt, messages,
+                               llm_transport.queue_wait(), route=route) as record:
+            ttl = LLMResponseCache.ttl_for(tool, cache)
+            cache_key = None
+            if ttl:
+                cache_key = LLMResponseCache.make_key(
+                    backend, model, system_prompt, messages, max_tokens, temperature, n,
+                )
+                cached = LLMResponseCache.get(cache_key, tool)
+                if cached is not None:
+                    record.cache_hit = True
+                    return cached, None
+
+            def upstream():
+                with LLMAdmission.admit(use_premium, tool) as error:
+                    if error:
+                        return None, error
+                    target, error = cls._available_backend(backend, use_premium, pinned)
+                    if error:
+                        return None, error
+                    call = (system_prompt, messages, max_tokens, temperature,
+                            cls._failover(record, backend, target, model))
+                    error = LLMRateLimiter.acquire(target, record.input_tokens)
+                    if error:
+                        LLMMetrics.note(error_class='rate_limited')
+                        return None, error
+                    if target == 'claude':
+                        text, error = cls._call_claude(*call, n=n)
+                    elif LLMHedger.applies(max_tokens):
+                        text, error = LLMHedger.call(lambda: cls._call_open_source(*call, n=n))
+                    else:
+                        text, error = cls._call_open_source(*call, n=n)
+                    if text:
+                        LLMRateLimiter.consume(target, TokenBudget.estimate(text, target))
+                    if cache_key and not error:
+                        LLMResponseCache.set(cache_key, text, ttl)
+                    return text, error
+
+            if LLMSingleFlight.enabled():
+                flight_key = cache_key or LLMResponseCache.make_key(
+                    backend, model, system_prompt, messages, max_tokens, temperature, n,
+                )
+                # Calls only coalesce within an admission lane
+                flight_key = f'{LLMAdmission.lane_for(use_premium, tool)}:{flight_key}'
+                text, error = LLMSingleFlight.do(flight_key, upstream, tool)
+            else:
+                text, error = upstream()
+            LLMMetrics.finish(record, text, error)
+            return text, error
+
+    @classmethod
+    async def agenerate(cls, system_prompt, messages, max_tokens=4096,
+                        temperature=0.7, use_premium=False, tool='', cache=None, n=1, backend=None):
+        """
+        Async counterpart of generate() for ASGI views.
+
+        Uses the pooled httpx client and AsyncAnthropic, so a single process
+        can hold many upstream calls in flight. Same arguments and return
+        value as generate().
+        """
+        pinned = backend is not None
+        route, backend, model = cls._route(tool, use_premium, max_tokens, system_prompt, messages, backend)
+        with LLMMetrics.track(tool, backend, model, system_prompt, messages, route=route) as record:
+            ttl = LLMResponseCache.ttl_for(tool, cache)
+            cache_key = None
+            if ttl:
+                cache_key = LLMResponseCache.make_key(
+                    backend, model, system_prompt, messages, max_tokens, temperature, n,
+                )
+                cached = await sync_to_async(LLMResponseCache.get)(cache_key, tool)
+                if cached is not None:
+                    record.cache_hit = True
+                    return cached, None
+
+            async def upstream():
+                async with LLMAdmission.aadmit(use_premium, tool) as error:
+                    if error:
+                        return None, error
+                    target, error = cls._available_backend(backend, use_premium, pinned)
+                    if error:
+                        return None, error
+                    call = (system_prompt, messages, max_tokens, temperature,
+                            cls._failover(record, backend, target, model))
+                    error = await LLMRateLimiter.aacquire(target, record.input_tokens)
+                    if error:
+                        LLMMetrics.note(error_class='rate_limited')
+                        return None, error
+                    if target == 'claude':
+                        text, error = await cls._acall_claude(*call, n=n)
+                    elif LLMHedger.applies(max_tokens):
+                        text, error = await LLMHedger.acall(lambda: cls._acall_open_source(*call, n=n))
+                    else:
+                        text, error = await cls._acall_open_source(*call, n=n)
+                    if text:
+                        await LLMRateLimiter.aconsume(target, TokenBudget.estimate(text, target))
+                    if cache_key and not error:
+                        await sync_to_async(LLMResponseCache.set)(cache_key, text, ttl)
+                    return text, error
+
+            if LLMSingleFlight.enabled():
+                flight_key = cache_key or LLMResponseCache.make_key(
+                    backend, model, system_prompt, messages, max_tokens, temperature, n,
+                )
+                # Calls only coalesce within an admission lane
+                flight_key = f'{LLMAdmission.lane_for(use_premium, tool)}:{flight_key}'
+                text, error = await LLMSingleFlight.ado(flight_key, upstream, tool)
+            else:
+                text, error = await upstream()
+            LLMMetrics.finish(record, text, error)
+            return text, error
+
+    @classmethod
+    def generate_many(cls, requests, max_concurrency=None):
+        """
+        Run several independent generate() calls concurrently.
+
+        Args:
+            requests: List of dicts of generate() keyword arguments.
+            max_concurrency: Max calls of this batch in flight at once
+                (default LLM_BATCH_MAX_CONCURRENCY). The per-backend cap
+                LLM_BACKEND_CONCURRENCY applies across all batches.
+
+        Returns:
+            List of (text, error) tuples in the same order as ``requests``.
+        """
+        return llm_transport.run_concurrently(cls._batch_calls(requests), max_concurrency)
+
+    @classmethod
+    def generate_as_completed(cls, requests, max_concurrency=None, slot=None):
+        """
+        Like generate_many(), but yield (index, (text, error)) pairs as calls finish.
+
+        ``slot`` is an optional semaphore shared with other batches, e.g.
+        llm_transport.user_slot() to cap one user's calls in flight.
+        """
+        return llm_transport.iter_concurrently(cls._batch_calls(requests), max_concurrency, slot)
+
+    @classmethod
+    def _batch_calls(cls, requests):
+        """(backend, fn) pairs for llm_transport's concurrent runners."""
+        return [
+            (cls._route(request.get('tool', ''), request.get('use_premium', False),
+                        request.get('max_tokens', 4096), request.get('system_prompt'),
+                        request.get('messages'), request.get('backend'))[1],
+             lambda request=request: cls.generate(**request))
+            for request in requests
+        ]
+
+    @classmethod
+    def stream(cls, system_prompt, messages, max_tokens=4096,
+               temperature=0.7, use_premium=False, tool='', cache=None):
+        """
+        Stream generated text as it is produced.
+
+        Takes the same arguments as generate(). Yields (delta, error) tuples:
+        text deltas arrive as (delta, None); a failure ends the stream with a
+        single (None, error). A cached response is yielded as one delta.
+        """
+        route, backend, model = ModelRouter.route(tool, use_premium, max_tokens, system_prompt, messages)
+        # Not bound as the current call: a generator must not leak context
+        # variables into whoever iterates it
+        with LLMMetrics.track(tool, backend, model, system_prompt, messages, bind=False, route=route) as record:
+            ttl = LLMResponseCache.ttl_for(tool, cache)
+            cache_key = None
+            if ttl:
+                cache_key = LLMResponseCache.make_key(
+                    backend, model, system_prompt, messages, max_tokens, temperature,
+                )
+                cached = LLMResponseCache.get(cache_key, tool)
+                if cached is not None:
+                    record.cache_hit = True
+                    yield cached, None
+                    return
+
+            with LLMAdmission.admit(use_premium, tool) as error:
+                if error:
+                    record.error_class = 'shed'
+                    yield None, error
+                    return
+                target, error = cls._available_backend(backend, use_premium)
+                if error:
+                    record.error_class = 'circuit_open'
+                    yield None, error
+                    return
+                call_model = cls._failover(record, backend, target, model)
+                error = LLMRateLimiter.acquire(target, record.input_tokens)
+                if error:
+                    record.error_class = 'rate_limited'
+                    yield None, error
+                    return
+
+                if target == 'claude':
+                    deltas = cls._stream_claude(system_prompt, messages, max_tokens, temperature, call_model)
+                else:
+                    deltas = cls._stream_open_source(system_prompt, messages, max_tokens, temperature, call_model)
+
+                parts = []
+                for delta, error in deltas:
+                    if error:
+                        record.error_class = 'error'
+                        yield None, error
+                        return
+                    if not parts:
+                        record.ttfb = time.monotonic() - record.start
+                    parts.append(delta)
+                    yield delta, None
+
+                record.output_tokens = TokenBudget.estimate(''.join(parts), record.backend)
+                LLMRateLimiter.consume(target, record.output_tokens)
+                if cache_key:
+                    LLMResponseCache.set(cache_key, ''.join(parts), ttl)
 
     @classmethod
-    def detect_ai_text(cls, text):
+    def detect_ai_text(cls, text, use_premium=False, tool='ai_detector'):
         """
         Detect AI-generated text using the DeBERTa classifier on the GPU server.
 
         Args:
             text: Text to analyze.
+            use_premium: Admit the call in the premium lane (see core.llm_admission).
+            tool: Tool tag; bulk detection passes 'ai_detector_bulk'.
 
         Returns:
             Tuple of (dict, error). Dict has 'score', 'label', 'chunks'.
         """
+        with LLMMetrics.track(tool, 'detector', '', None, [{'content': text}]) as record:
+            with LLMAdmission.admit(use_premium, tool) as error:
+                result, error = (None, error) if error else cls._detect_ai_text(text)
+            LLMMetrics.finish(record, None, error)
+            return result, error
+
+    @classmethod
+    def _detect_ai_text(cls, text):
         api_url = getattr(settings, 'WRITINGBOT_API_URL', '')
         api_key = getattr(settings, 'WRITINGBOT_API_KEY', '')
 
         if not api_url:
+            LLMMetrics.note(error_class='not_configured')
             return None, 'AI detection service is not configured.'
 
+        breaker = CircuitBreaker.get('detector')
+        if not breaker.allow():
+            LLMMetrics.note(error_class='circuit_open')
+            return None, 'AI detection service is temporarily unavailable. Please try again.'
+        error = LLMRateLimiter.acquire('detector', TokenBudget.estimate(text))
+        if error:
+            LLMMetrics.note(error_class='rate_limited')
+            return None, error
+
         try:
-            resp = requests.post(
-                f'{api_url.rstrip("/")}/v1/text/ai-detect-model/',
-                json={'text': text},
-                headers={
-                    'Authorization': f'Bearer {api_key}',
-                    'Content-Type': 'application/json',
-                },
-                timeout=120,
-            )
+            with breaker.track() as call:
+                resp = llm_transport.post(
+                    'detector',
+                    f'{api_url.rstrip("/")}/v1/text/ai-detect-model/',
+                    json={'text': text},
+                    headers={
+                        'Authorization': f'Bearer {api_key}',
+                        'Content-Type': 'application/json',
+                    },
+                    timeout=(call.connect_timeout, call.timeout),
+                )
+                cls._check_status(call, resp.status_code)
 
             if resp.status_code != 200:
+                LLMMetrics.note(error_class=f'http_{resp.status_code}')
                 error_data = resp.json() if resp.headers.get('content-type', '').startswith('application/json') else {}
                 error_msg = error_data.get('error', f'AI detection service returned {resp.status_code}')
                 logger.error(f'AI detect model error: {resp.status_code} - {error_msg}')
@@ -134,85 +334,481 @@ class LLMClient:
             return resp.json(), None
 
         except requests.exceptions.Timeout:
+            LLMMetrics.note(error_class='timeout')
             logger.error('AI detect model request timed out')
             return None, 'The request timed out. Please try again.'
         except requests.exceptions.ConnectionError:
+            LLMMetrics.note(error_class='connection')
+            logger.error('Cannot connect to AI detect model service')
+            return None, 'AI detection service is temporarily unavailable. Please try again.'
+        except Exception as e:
+            LLMMetrics.note(error_class='unexpected')
+            logger.error(f'AI detect model unexpected error: {e}')
+            return None, 'An unexpected error occurred. Please try again.'
+
+    @classmethod
+    async def adetect_ai_text(cls, text, use_premium=False, tool='ai_detector'):
+        """Async counterpart of detect_ai_text()."""
+        with LLMMetrics.track(tool, 'detector', '', None, [{'content': text}]) as record:
+            async with LLMAdmission.aadmit(use_premium, tool) as error:
+                result, error = (None, error) if error else await cls._adetect_ai_text(text)
+            LLMMetrics.finish(record, None, error)
+            return result, error
+
+    @classmethod
+    async def _adetect_ai_text(cls, text):
+        import httpx
+
+        api_url = getattr(settings, 'WRITINGBOT_API_URL', '')
+        api_key = getattr(settings, 'WRITINGBOT_API_KEY', '')
+
+        if not api_url:
+            LLMMetrics.note(error_class='not_configured')
+            return None, 'AI detection service is not configured.'
+
+        breaker = CircuitBreaker.get('detector')
+        if not breaker.allow():
+            LLMMetrics.note(error_class='circuit_open')
+            return None, 'AI detection service is temporarily unavailable. Please try again.'
+        error = await LLMRateLimiter.aacquire('detector', TokenBudget.estimate(text))
+        if error:
+            LLMMetrics.note(error_class='rate_limited')
+            return None, error
+
+        try:
+            with breaker.track() as call:
+                resp = await llm_transport.apost(
+                    'detector',
+                    f'{api_url.rstrip("/")}/v1/text/ai-detect-model/',
+                    json={'text': text},
+                    headers={
+                        'Authorization': f'Bearer {api_key}',
+                        'Content-Type': 'application/json',
+                    },
+                    timeout=httpx.Timeout(call.timeout, connect=call.connect_timeout),
+                )
+                cls._check_status(call, resp.status_code)
+
+            if resp.status_code != 200:
+                LLMMetrics.note(error_class=f'http_{resp.status_code}')
+                logger.error(f'AI detect model error: {resp.status_code}')
+                return None, 'AI detection service is temporarily unavailable. Please try again.'
+
+            return resp.json(), None
+
+        except httpx.TimeoutException:
+            LLMMetrics.note(error_class='timeout')
+            logger.error('AI detect model request timed out')
+            return None, 'The request timed out. Please try again.'
+        except httpx.TransportError:
+            LLMMetrics.note(error_class='connection')
             logger.error('Cannot connect to AI detect model service')
             return None, 'AI detection service is temporarily unavailable. Please try again.'
         except Exception as e:
+            LLMMetrics.note(error_class='unexpected')
             logger.error(f'AI detect model unexpected error: {e}')
             return None, 'An unexpected error occurred. Please try again.'
 
+    @staticmethod
+    def _failover(record, backend, target, model):
+        """
+        Account a call to the backend it is actually sent to.
+
+        Returns the model to request: the routed one, or the target's
+        default model when the breakers moved the call to the other backend.
+        """
+        record.backend = target
+        if target == backend:
+            return model
+        record.route = ModelRouter.failover_tier(target)
+        record.model = None
+        return None
+
+    @staticmethod
+    def _route(tool, use_premium, max_tokens, system_prompt, messages, backend=None):
+        """ModelRouter.route(), or the default model of a pinned ``backend``."""
+        if backend is not None:
+            return ModelRouter.failover_tier(backend), backend, ModelRouter.backend_model(backend)
+        return ModelRouter.route(tool, use_premium, max_tokens, system_prompt, messages)
+
+    @staticmethod
+    def _available_backend(backend, use_premium, pinned=False):
+        """
+        Apply the circuit breakers to a routed call.
+
+        Returns (backend, None) with the backend to call, or (None, error)
+        when it is unavailable. Premium calls fail over to the other backend
+        (Claude needs an API key) when their breaker is open; free and
+        pinned calls fail fast.
+        """
+        if pinned and backend == 'claude' and not getattr(settings, 'ANTHROPIC_API_KEY', ''):
+            LLMMetrics.note(error_class='not_configured')
+            return None, 'AI service configuration error. Please contact support.'
+        if CircuitBreaker.get(backend).allow():
+            return backend, None
+
+        fallback = None
+        if use_premium and not pinned:
+            if backend == 'open_source' and getattr(settings, 'ANTHROPIC_API_KEY', ''):
+                fallback = 'claude'
+            elif backend == 'claude':
+                fallback = 'open_source'
+        if fallback and CircuitBreaker.get(fallback).allow():
+            logger.warning(f'LLM backend {backend} unavailable, failing over to {fallback}')
+            return fallback, None
+
+        LLMMetrics.note(error_class='circuit_open')
+        return None, 'AI service is temporarily unavailable. Please try again in a moment.'
+
+    @staticmethod
+    def _check_status(call, status_code):
+        """Count 5xx and 429 replies as backend failures for the breaker."""
+        if status_code >= 500 or status_code == 429:
+            call.failed()
+
+    @staticmethod
+    def _is_claude_outage(e):
+        """True for Claude SDK errors that reflect backend health, not the request."""
+        return type(e).__name__ not in (
+            'AuthenticationError', 'BadRequestError', 'PermissionDeniedError',
+            'NotFoundError', 'UnprocessableEntityError',
+        )
+
+    @staticmethod
+    def _open_source_payload(system_prompt, messages, max_tokens, temperature, model=None, **extra):
+        """Build the GPU server request body, with the routed model and prompt-prefix hint if any."""
+        payload = {
+            'system_prompt': system_prompt,
+            'messages': messages,
+            'max_tokens': max_tokens,
+            'temperature': temperature,
+            **extra,
+        }
+        if model:
+            payload['model'] = model
+        prefix_key = PromptCache.prefix_key(system_prompt, messages)
+        if prefix_key:
+            payload['prefix_cache_key'] = prefix_key
+        return payload
+
     @classmethod
-    def _call_open_source(cls, system_prompt, messages, max_tokens, temperature):
+    def _call_open_source(cls, system_prompt, messages, max_tokens, temperature, model=None, n=1):
         """Call the open-source LLM via api.writingbot.ai."""
         api_url = getattr(settings, 'WRITINGBOT_API_URL', '')
         api_key = getattr(settings, 'WRITINGBOT_API_KEY', '')
 
         if not api_url:
+            LLMMetrics.note(error_class='not_configured')
             return None, 'LLM service is not configured.'
 
         try:
-            resp = requests.post(
-                f'{api_url.rstrip("/")}/v1/text/generate/',
-                json={
-                    'system_prompt': system_prompt,
-                    'messages': messages,
-                    'max_tokens': max_tokens,
-                    'temperature': temperature,
-                },
-                headers={
-                    'Authorization': f'Bearer {api_key}',
-                    'Content-Type': 'application/json',
-                },
-                timeout=120,
-            )
+            with CircuitBreaker.get('open_source').track() as call:
+                resp = llm_transport.post(
+                    'open_source',
+                    f'{api_url.rstrip("/")}/v1/text/generate/',
+                    json=cls._open_source_payload(
+                        system_prompt, messages, max_tokens, temperature, model, **({'n': n} if n > 1 else {}),
+                    ),
+                    headers={
+                        'Authorization': f'Bearer {api_key}',
+                        'Content-Type': 'application/json',
+                    },
+                    timeout=(call.connect_timeout, call.timeout),
+                )
+                cls._check_status(call, resp.status_code)
 
             if resp.status_code != 200:
+                LLMMetrics.note(error_class=f'http_{resp.status_code}')
                 error_data = resp.json() if resp.headers.get('content-type', '').startswith('application/json') else {}
                 error_msg = error_data.get('error', f'LLM service returned {resp.status_code}')
                 logger.error(f'Open-source LLM error: {resp.status_code} - {error_msg}')
                 return None, 'An error occurred while generating text. Please try again.'
 
             data = resp.json()
+            LLMMetrics.note(model=data.get('model'))
             text = data.get('text', '')
+            if n > 1:
+                text = cls._join_variants(data.get('texts') or [text])
             if not text:
+                LLMMetrics.note(error_class='empty_response')
                 return None, 'Empty response from LLM service.'
             return text, None
 
         except requests.exceptions.Timeout:
+            LLMMetrics.note(error_class='timeout')
             logger.error('Open-source LLM request timed out')
             return None, 'The request timed out. Please try again.'
         except requests.exceptions.ConnectionError:
+            LLMMetrics.note(error_class='connection')
             logger.error('Cannot connect to open-source LLM service')
             return None, 'AI service is temporarily unavailable. Please try again.'
         except Exception as e:
+            LLMMetrics.note(error_class='unexpected')
             logger.error(f'Open-source LLM unexpected error: {e}')
             return None, 'An unexpected error occurred. Please try again.'
 
     @classmethod
-    def _call_claude(cls, system_prompt, messages, max_tokens, temperature):
+    def _call_claude(cls, system_prompt, messages, max_tokens, temperature, model=None, n=1):
         """Call Claude API (Anthropic) for premium users."""
         try:
-            import anthropic
-            client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-            response = client.messages.create(
-                model=getattr(settings, 'ANTHROPIC_MODEL', 'claude-sonnet-4-5-20250929'),
-                max_tokens=max_tokens,
-                system=system_prompt,
-                messages=messages,
-            )
+            client = llm_transport.get_anthropic()
+            if n > 1:
+                system_prompt, max_tokens = cls._variants_prompt(system_prompt, n), max_tokens * n
+            system, claude_messages = PromptCache.claude_params(system_prompt, messages)
+            with CircuitBreaker.get('claude').track(cls._is_claude_outage) as call:
+                response = client.messages.create(
+                    model=model or ModelRouter.backend_model('claude'),
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    system=system,
+                    messages=claude_messages,
+                    timeout=call.timeout,
+                )
+            text = response.content[0].text.strip()
+            output_tokens = getattr(response.usage, 'output_tokens', None)
+            TokenBudget.observe('claude', text, output_tokens)
+            if isinstance(output_tokens, int):
+                LLMMetrics.note(output_tokens=output_tokens)
+            PromptCache.record_usage(response.usage)
+            if n > 1:
+                text = cls._claude_variants(text)
+            return text, None
+
+        except Exception as e:
+            return None, cls._claude_error(e)
+
+    @classmethod
+    async def _acall_open_source(cls, system_prompt, messages, max_tokens, temperature, model=None, n=1):
+        """Async call to the open-source LLM via api.writingbot.ai."""
+        import httpx
+
+        api_url = getattr(settings, 'WRITINGBOT_API_URL', '')
+        api_key = getattr(settings, 'WRITINGBOT_API_KEY', '')
+
+        if not api_url:
+            LLMMetrics.note(error_class='not_configured')
+            return None, 'LLM service is not configured.'
+
+        try:
+            with CircuitBreaker.get('open_source').track() as call:
+                resp = await llm_transport.apost(
+                    'open_source',
+                    f'{api_url.rstrip("/")}/v1/text/generate/',
+                    json=cls._open_source_payload(
+                        system_prompt, messages, max_tokens, temperature, model, **({'n': n} if n > 1 else {}),
+                    ),
+                    headers={
+                        'Authorization': f'Bearer {api_key}',
+                        'Content-Type': 'application/json',
+                    },
+                    timeout=httpx.Timeout(call.timeout, connect=call.connect_timeout),
+                )
+                cls._check_status(call, resp.status_code)
+
+            if resp.status_code != 200:
+                LLMMetrics.note(error_class=f'http_{resp.status_code}')
+                logger.error(f'Open-source LLM error: {resp.status_code}')
+                return None, 'An error occurred while generating text. Please try again.'
+
+            data = resp.json()
+            LLMMetrics.note(model=data.get('model'))
+            text = data.get('text', '')
+            if n > 1:
+                text = cls._join_variants(data.get('texts') or [text])
+            if not text:
+                LLMMetrics.note(error_class='empty_response')
+                return None, 'Empty response from LLM service.'
+            return text, None
+
+        except httpx.TimeoutException:
+            LLMMetrics.note(error_class='timeout')
+            logger.error('Open-source LLM request timed out')
+            return None, 'The request timed out. Please try again.'
+        except httpx.TransportError:
+            LLMMetrics.note(error_class='connection')
+            logger.error('Cannot connect to open-source LLM service')
+            return None, 'AI service is temporarily unavailable. Please try again.'
+        except Exception as e:
+            LLMMetrics.note(error_class='unexpected')
+            logger.error(f'Open-source LLM unexpected error: {e}')
+            return None, 'An unexpected error occurred. Please try again.'
+
+    @classmethod
+    async def _acall_claude(cls, system_prompt, messages, max_tokens, temperature, model=None, n=1):
+        """Async call to the Claude API (Anthropic) for premium users."""
+        try:
+            if n > 1:
+                system_prompt, max_tokens = cls._variants_prompt(system_prompt, n), max_tokens * n
+            system, claude_messages = PromptCache.claude_params(system_prompt, messages)
+            async with llm_transport.async_anthropic() as client:
+                with CircuitBreaker.get('claude').track(cls._is_claude_outage) as call:
+                    response = await client.messages.create(
+                        model=model or ModelRouter.backend_model('claude'),
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        system=system,
+                        messages=claude_messages,
+                        timeout=call.timeout,
+                    )
             text = response.content[0].text.strip()
+            output_tokens = getattr(response.usage, 'output_tokens', None)
+            TokenBudget.observe('claude', text, output_tokens)
+            if isinstance(output_tokens, int):
+                LLMMetrics.note(output_tokens=output_tokens)
+            PromptCache.record_usage(response.usage)
+            if n > 1:
+                text = cls._claude_variants(text)
             return text, None
 
         except Exception as e:
-            error_type = type(e).__name__
-            logger.error(f'Claude API error ({error_type}): {e}')
+            return None, cls._claude_error(e)
+
+    @staticmethod
+    def _variants_prompt(system_prompt, n):
+        """Ask Claude for ``n`` versions as a JSON array, keeping a CachedPrompt's static prefix."""
+        note = (
+            f'\n\nWrite {n} distinct versions of your answer, each following all the instructions above. '
+            f'Return ONLY a JSON array of {n} strings, one per version, and nothing else.'
+        )
+        if isinstance(system_prompt, CachedPrompt):
+            return CachedPrompt(system_prompt.static, system_prompt.dynamic + note)
+        return (system_prompt or '') + note
+
+    @classmethod
+    def _claude_variants(cls, text):
+        """Re-encode Claude's JSON array of versions; a reply that is not one counts as a single version."""
+        try:
+            versions = extract_json(text)
+        except ValueError:
+            versions = None
+        if not isinstance(versions, list):
+            logger.warning('Claude returned no JSON array of versions, using the reply as one')
+            versions = [text]
+        return cls._join_variants(versions)
+
+    @staticmethod
+    def _join_variants(texts):
+        """Encode the distinct non-empty ``texts`` as the JSON array generate(n=...) returns, or None."""
+        variants = list(dict.fromkeys(text.strip() for text in texts if isinstance(text, str) and text.strip()))
+        return json.dumps(variants, ensure_ascii=False) if variants else None
+
+    @staticmethod
+    def _claude_error(e):
+        """Log a Claude SDK exception and return a user-facing message."""
+        error_type = type(e).__name__
+        logger.error(f'Claude API error ({error_type}): {e}')
+        LLMMetrics.note(error_class=error_type)
+
+        # Try to give user-friendly errors
+        if 'RateLimitError' in error_type:
+            return 'Service is temporarily busy. Please try again in a moment.'
+        if 'AuthenticationError' in error_type:
+            return 'AI service configuration error. Please contact support.'
+
+        return 'An error occurred while generating text. Please try again.'
 
-            # Try to give user-friendly errors
-            if 'RateLimitError' in error_type:
-                return None, 'Service is temporarily busy. Please try again in a moment.'
-            if 'AuthenticationError' in error_type:
-                return None, 'AI service configuration error. Please contact support.'
+    @classmethod
+    def _stream_open_source(cls, system_prompt, messages, max_tokens, temperature, model=None):
+        """
+        Stream from the open-source LLM.
 
-            return None, 'An error occurred while generating text. Please try again.'
+        The GPU server answers ``"stream": true`` with server-sent events or
+        newline-delimited JSON, one ``{"text": "<delta>"}`` object per line and
+        an optional ``[DONE]`` sentinel. A plain JSON body (server without
+        streaming support) is yielded as a single delta.
+        """
+        api_url = getattr(settings, 'WRITINGBOT_API_URL', '')
+        api_key = getattr(settings, 'WRITINGBOT_API_KEY', '')
+
+        if not api_url:
+            yield None, 'LLM service is not configured.'
+            return
+
+        try:
+            # Only the request up to the response headers is tracked; time to
+            # first byte says nothing about full-generation latency
+            with CircuitBreaker.get('open_source').track(sample_latency=False) as call:
+                resp = llm_transport.post(
+                    'open_source',
+                    f'{api_url.rstrip("/")}/v1/text/generate/',
+                    json=cls._open_source_payload(system_prompt, messages, max_tokens, temperature, model, stream=True),
+                    headers={
+                        'Authorization': f'Bearer {api_key}',
+                        'Content-Type': 'application/json',
+                        'Accept': 'text/event-stream',
+                    },
+                    timeout=(call.connect_timeout, call.timeout),
+                    stream=True,
+                )
+                cls._check_status(call, resp.status_code)
+
+            with resp:
+                if resp.status_code != 200:
+                    logger.error(f'Open-source LLM stream error: {resp.status_code}')
+                    yield None, 'An error occurred while generating text. Please try again.'
+                    return
+
+                if resp.headers.get('content-type', '').startswith('application/json'):
+                    text = resp.json().get('text', '')
+                    if not text:
+                        yield None, 'Empty response from LLM service.'
+                        return
+                    yield text, None
+                    return
+
+                produced = False
+                for line in resp.iter_lines(decode_unicode=True):
+                    if not line or line.startswith(':') or line.startswith('event:'):
+                        continue
+                    if line.startswith('data:'):
+                        line = line[5:].strip()
+                    if line == '[DONE]':
+                        break
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if event.get('error'):
+                        logger.error(f'Open-source LLM stream error event: {event["error"]}')
+                        yield None, 'An error occurred while generating text. Please try again.'
+                        return
+                    delta = event.get('text') or event.get('delta') or ''
+                    if delta:
+                        produced = True
+                        yield delta, None
+                    if event.get('done'):
+                        break
+
+                if not produced:
+                    yield None, 'Empty response from LLM service.'
+
+        except requests.exceptions.Timeout:
+            logger.error('Open-source LLM stream timed out')
+            yield None, 'The request timed out. Please try again.'
+        except requests.exceptions.ConnectionError:
+            logger.error('Cannot connect to open-source LLM service')
+            yield None, 'AI service is temporarily unavailable. Please try again.'
+        except Exception as e:
+            logger.error(f'Open-source LLM stream unexpected error: {e}')
+            yield None, 'An unexpected error occurred. Please try again.'
+
+    @classmethod
+    def _stream_claude(cls, system_prompt, messages, max_tokens, temperature, model=None):
+        """Stream from the Claude API (Anthropic) for premium users."""
+        try:
+            client = llm_transport.get_anthropic()
+            system, claude_messages = PromptCache.claude_params(system_prompt, messages)
+            with CircuitBreaker.get('claude').track(cls._is_claude_outage, sample_latency=False) as call:
+                with client.messages.stream(
+                    model=model or ModelRouter.backend_model('claude'),
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    system=system,
+                    messages=claude_messages,
+                    timeout=call.timeout,
+                ) as response:
+                    for delta in response.text_stream:
+                        if delta:
+                            yield delta, None
+        except Exception as e:
+            yield None, cls._claude_error(e)
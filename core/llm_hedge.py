@@ -0,0 +1,180 @@
+"""
+Hedged requests for short open-source LLM calls.
+
+Short, cheap calls (synonyms, language detection, next-sentence
+suggestions) get their p99 from the occasional slow GPU replica. For calls
+with max_tokens <= LLM_HEDGE_MAX_TOKENS, if no reply has arrived after the
+LLM_HEDGE_PERCENTILE latency of recent short calls, a duplicate request is
+sent and the first successful reply wins.
+
+Hedges are paid for from a token bucket: every eligible call adds
+LLM_HEDGE_BUDGET tokens and a hedge spends one, so at most that fraction of
+short-call traffic is duplicated. A primary that loses to its hedge is
+left to finish in the background and its reply discarded (a sync request
+cannot be interrupted mid-flight anyway), so the time the hedge saved can
+be measured; a losing hedge is cancelled in the async path.
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.conf import settings
+
+from core import llm_transport
+
+logger = logging.getLogger('app')
+
+
+class LLMHedger:
+    """Percentile-delayed request hedging with a traffic budget."""
+
+    _latencies = deque(maxlen=500)
+    _tokens = 0.0
+    _lock = threading.Lock()
+    _stats = {
+        'eligible': 0, 'hedged': 0, 'hedge_wins': 0, 'primary_wins': 0,
+        'budget_exhausted': 0, 'seconds_saved': 0.0,
+    }
+
+    @staticmethod
+    def applies(max_tokens):
+        """True if a call of this size should be hedged."""
+        return (getattr(settings, 'LLM_HEDGE_ENABLED', False)
+                and max_tokens <= getattr(settings, 'LLM_HEDGE_MAX_TOKENS', 512))
+
+    @classmethod
+    def call(cls, fn):
+        """
+        Run ``fn`` (returning a (text, error) tuple), hedging it if it is slow.
+
+        Nested inside a generate_many batch the call runs unhedged, so hedges
+        never compete with the batch for pool threads.
+        """
+        if getattr(llm_transport._batch_local, 'active', False):
+            return fn()
+
+        cls._count('eligible')
+        executor = llm_transport.get_executor()
+        start = time.monotonic()
+        primary = executor.submit(contextvars.copy_context().run, fn)
+        primary.add_done_callback(lambda f: f.cancelled() or cls._sample(time.monotonic() - start))
+
+        try:
+            return primary.result(timeout=cls.delay())
+        except TimeoutError:
+            pass
+
+        if not cls._spend():
+            return primary.result()
+
+        hedge = executor.submit(contextvars.copy_context().run, fn)
+        pending = {primary, hedge}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = done.pop()
+            text, error = winner.result()
+            if not error or not pending:
+                break
+        cls._finish(winner is hedge, pending, time.monotonic())
+        return text, error
+
+    @classmethod
+    async def acall(cls, afn):
+        """Async counterpart of call(); a losing hedge is cancelled."""
+        cls._count('eligible')
+        start = time.monotonic()
+        primary = asyncio.ensure_future(afn())
+        primary.add_done_callback(lambda f: f.cancelled() or cls._sample(time.monotonic() - start))
+
+        done, _ = await asyncio.wait({primary}, timeout=cls.delay())
+        if done or not cls._spend():
+            return await primary
+
+        hedge = asyncio.ensure_future(afn())
+        pending = {primary, hedge}
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = done.pop()
+            text, error = winner.result()
+            if not error or not pending:
+                break
+        if winner is not hedge:
+            for task in pending:
+                task.cancel()
+        cls._finish(winner is hedge, pending, time.monotonic())
+        return text, error
+
+    @classmethod
+    def delay(cls):
+        """Seconds to wait before hedging: the configured percentile of recent short calls."""
+        with cls._lock:
+            samples = sorted(cls._latencies)
+        if len(samples) < getattr(settings, 'LLM_HEDGE_MIN_SAMPLES', 20):
+            return getattr(settings, 'LLM_HEDGE_DEFAULT_DELAY', 1.0)
+        percentile = getattr(settings, 'LLM_HEDGE_PERCENTILE', 95)
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100))
+        return max(getattr(settings, 'LLM_HEDGE_MIN_DELAY', 0.05), samples[index])
+
+    @classmethod
+    def stats(cls):
+        """
+        Return hedging counters for this process.
+
+        ``hedge_wins`` counts hedges that answered first; ``seconds_saved``
+        sums how much earlier they answered than the primary eventually did.
+        """
+        with cls._lock:
+            data = dict(cls._stats)
+        data['seconds_saved'] = round(data['seconds_saved'], 3)
+        data['delay'] = round(cls.delay(), 3)
+        return data
+
+    @classmethod
+    def reset(cls):
+        """Reset samples, budget and counters (used by tests)."""
+        with cls._lock:
+            cls._latencies.clear()
+            cls._tokens = 0.0
+            for key in cls._stats:
+                cls._stats[key] = 0
+
+    @classmethod
+    def _spend(cls):
+        """Take a hedge token from the budget, if one is available."""
+        with cls._lock:
+            if cls._tokens >= 1:
+                cls._tokens -= 1
+                cls._stats['hedged'] += 1
+                return True
+            cls._stats['budget_exhausted'] += 1
+            return False
+
+    @classmethod
+    def _finish(cls, hedge_won, pending, won_at):
+        """Count the winner; when the hedge won, time how much later the abandoned primary finishes."""
+        cls._count('hedge_wins' if hedge_won else 'primary_wins')
+        if not hedge_won:
+            return
+        for loser in pending:
+            loser.add_done_callback(
+                lambda f: f.cancelled() or cls._count('seconds_saved', time.monotonic() - won_at)
+            )
+
+    @classmethod
+    def _sample(cls, latency):
+        with cls._lock:
+            cls._latencies.append(latency)
+
+    @classmethod
+    def _count(cls, field, amount=1):
+        with cls._lock:
+            cls._stats[field] += amount
+            if field == 'eligible':
+                cls._tokens = min(
+                    cls._tokens + getattr(settings, 'LLM_HEDGE_BUDGET', 0.1),
+                    getattr(settings, 'LLM_HEDGE_BURST', 5),
+                )
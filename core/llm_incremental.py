@@ -0,0 +1,297 @@
+"""
+Incremental re-rewriting of edited inputs.
+
+Users of the rewriting tools often edit one sentence and submit again, and
+the whole text was sent and generated again. For a document (a client
+document id, or the user's session), the last input is now kept together
+with a sentence-aligned mapping to its output:
+
+1. _tokens(): the input is cut into sentences, with a paragraph break token
+   between paragraphs.
+2. align(): output sentences are paired with input sentences one to one
+   where both paragraphs have the same number of sentences; otherwise the
+   whole paragraph (or text) is one unit mapped to its output.
+3. On the next run the new sentences are diffed against the stored ones
+   (difflib). Units whose sentences are all unchanged keep their output;
+   the remaining sentences are grouped into regions within a paragraph and
+   rewritten, each with LLM_INCREMENTAL_CONTEXT neighbouring sentences as
+   read-only context. stitch() joins the pieces with the new text's own
+   whitespace and stores the new mapping.
+
+If more than LLM_INCREMENTAL_MAX_CHANGED of the text changed, the caller
+rewrites it whole. State lives in the LLM_CACHE_ALIAS cache for
+LLM_INCREMENTAL_TTL seconds, keyed by tool, document and the parameters the
+output depends on (see NearDuplicateCache namespaces).
+"""
+import difflib
+import hashlib
+import json
+import logging
+import re
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger('app')
+
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+_SENTENCE_END = re.compile(r'(?:(?<=[.!?])|(?<=[.!?]["\')\]]))\s+')
+
+# Stored in place of the separator text, so whitespace variants still match
+BREAK = '\n\n'
+
+
+def _spans(text, separator, start, end):
+    """Yield (start, end) spans of ``text[start:end]`` between separator matches, stripped."""
+    position = start
+    for match in list(separator.finditer(text, start, end)) + [None]:
+        stop = match.start() if match else end
+        piece = text[position:stop]
+        if piece.strip():
+            left = position + len(piece) - len(piece.lstrip())
+            yield left, left + len(piece.strip())
+        position = match.end() if match else stop
+
+
+def _tokens(text):
+    """Return (kind, start, end) tokens of ``text``: 'sentence' spans and 'break' spans between paragraphs."""
+    tokens = []
+    for start, end in _spans(text, _PARAGRAPH_BREAK, 0, len(text)):
+        if tokens:
+            tokens.append(('break', tokens[-1][2], start))
+        tokens.extend(('sentence', s_start, s_end) for s_start, s_end in _spans(text, _SENTENCE_END, start, end))
+    return tokens
+
+
+def _words(tokens, text):
+    return [BREAK if kind == 'break' else text[start:end] for kind, start, end in tokens]
+
+
+def align(text, output):
+    """
+    Pair the sentences of ``text`` with its rewrite ``output``.
+
+    Returns:
+        Tuple of (sequence, units). ``sequence`` lists the input sentences
+        and BREAK markers; each unit is [start, end, output text] over
+        sequence indices. Paragraph breaks between units belong to no unit.
+    """
+    tokens = _tokens(text)
+    sequence = _words(tokens, text)
+    out_paragraphs = [output[start:end] for start, end in _spans(output, _PARAGRAPH_BREAK, 0, len(output))]
+    in_paragraphs = []  # (first, last + 1) sequence indices per paragraph
+    for index, word in enumerate(sequence):
+        if word == BREAK:
+            continue
+        if not in_paragraphs or sequence[index - 1] == BREAK:
+            in_paragraphs.append([index, index + 1])
+        else:
+            in_paragraphs[-1][1] = index + 1
+
+    if len(in_paragraphs) != len(out_paragraphs):
+        return sequence, [[0, len(sequence), output.strip()]] if sequence else []
+
+    units = []
+    for (first, last), paragraph in zip(in_paragraphs, out_paragraphs):
+        sentences = [paragraph[start:end] for start, end in _spans(paragraph, _SENTENCE_END, 0, len(paragraph))]
+        if len(sentences) == last - first:
+            units.extend([first + offset, first + offset + 1, sentence] for offset, sentence in enumerate(sentences))
+        else:
+            units.append([first, last, paragraph])
+    return sequence, units
+
+
+class Region:
+    """A run of changed sentences to rewrite, with read-only context around it."""
+
+    def __init__(self, text, before, after):
+        self.text = text
+        self.before = before
+        self.after = after
+
+    def __repr__(self):
+        return f'Region({self.text[:40]!r})'
+
+
+class IncrementalRewrite:
+    """A rewrite of an edited text that reuses unchanged sentences. See module docstring."""
+
+    KEY_PREFIX = 'llm_inc:'
+
+    _lock = threading.Lock()
+    _stats = {}
+
+    def __init__(self, tool, key, text, state):
+        self.tool = tool
+        self.key = key
+        self.text = text
+        self.tokens = _tokens(text)
+        self.sequence = _words(self.tokens, text)
+
+        # Units whose input sentences are all unchanged keep their output
+        self.reused = {}  # new start index -> (new end index, output)
+        old_sequence, old_units = state['sequence'], state['units']
+        matcher = difflib.SequenceMatcher(None, old_sequence, self.sequence, autojunk=False)
+        for a, b, size in matcher.get_matching_blocks():
+            for start, end, output in old_units:
+                if a <= start and end <= a + size:
+                    self.reused[b + start - a] = (b + end - a, output)
+
+        covered = set()
+        for start, (end, _) in self.reused.items():
+            covered.update(range(start, end))
+        # Changed sentences, grouped into runs that stay within a paragraph
+        self.spans = []  # (first, last + 1) sequence indices per region
+        for index, word in enumerate(self.sequence):
+            if index in covered or word == BREAK:
+                continue
+            if self.spans and self.spans[-1][1] == index:
+                self.spans[-1][1] = index + 1
+            else:
+                self.spans.append([index, index + 1])
+
+        context = getattr(settings, 'LLM_INCREMENTAL_CONTEXT', 1)
+        self.regions = [
+            Region(
+                self._slice(first, last),
+                self._context(range(first - 1, -1, -1), context)[::-1],
+                self._context(range(last, len(self.sequence)), context),
+            )
+            for first, last in self.spans
+        ]
+        changed = sum(len(region.text) for region in self.regions)
+        total = sum(len(word) for word in self.sequence if word != BREAK) or 1
+        self.changed_share = changed / total
+
+    @classmethod
+    def load(cls, tool, document, namespace, text):
+        """
+        Plan an incremental rewrite of ``text`` against the document's last run.
+
+        Returns:
+            An IncrementalRewrite whose ``regions`` need rewriting, or None
+            when the text should be rewritten whole (no previous run, other
+            parameters, or too much changed).
+        """
+        if not cls.enabled() or not document or len(text) > getattr(settings, 'LLM_CACHE_MAX_CHARS', 65536):
+            return None
+        key = cls._key(tool, document, namespace)
+        try:
+            state = cls._backend().get(key)
+        except Exception as e:
+            logger.warning(f'LLM incremental state read failed: {e}')
+            state = None
+        if not state:
+            cls._count(tool, 'full')
+            return None
+
+        plan = cls(tool, key, text, state)
+        if plan.changed_share > getattr(settings, 'LLM_INCREMENTAL_MAX_CHANGED', 0.5):
+            cls._count(tool, 'full')
+            return None
+        cls._count(tool, 'incremental')
+        return plan
+
+    @classmethod
+    def record(cls, tool, document, namespace, text, output):
+        """Store the mapping of a whole-text rewrite for the document's next run."""
+        if not cls.enabled() or not document or output is None:
+            return
+        if len(text) > getattr(settings, 'LLM_CACHE_MAX_CHARS', 65536):
+            return
+        sequence, units = align(text, output)
+        cls._save(cls._key(tool, document, namespace), sequence, units)
+
+    def stitch(self, outputs):
+        """
+        Join reused outputs and the regions' new ``outputs`` into the full
+        rewrite, and store the new mapping.
+
+        Args:
+            outputs: Rewritten text per region, in ``regions`` order.
+
+        Returns:
+            The rewritten text.
+        """
+        pieces = []
+        units = []
+        rewritten = {first: (last, output.strip()) for (first, last), output in zip(self.spans, outputs)}
+        index = 0
+        while index < len(self.sequence):
+            if index in self.reused:
+                end, piece = self.reused[index]
+                units.append([index, end, piece])
+            elif index in rewritten:
+                end, piece = rewritten[index]
+                aligned = align(self._slice(index, end), piece)[1]
+                units.extend([index + start, index + stop, output] for start, stop, output in aligned)
+            else:  # Paragraph break between units
+                end, piece = index + 1, self._slice(index, index + 1)
+            pieces.append(piece)
+            # Keep the new text's whitespace between sentences of a paragraph
+            if end < len(self.sequence) and BREAK not in (self.sequence[end - 1], self.sequence[end]):
+                pieces.append(self.text[self.tokens[end - 1][2]:self.tokens[end][1]])
+            index = end
+
+        reused = sum(end - start for start, (end, _) in self.reused.items())
+        self._count(self.tool, 'sentences_reused', reused)
+        self._count(self.tool, 'sentences_rewritten', sum(last - first for first, last in self.spans))
+        self._save(self.key, self.sequence, units)
+        return ''.join(pieces)
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'LLM_INCREMENTAL_ENABLED', False)
+
+    @classmethod
+    def stats(cls):
+        """Return per-tool counts of incremental and full runs and of reused and rewritten sentences."""
+        with cls._lock:
+            return {tool: dict(counts) for tool, counts in cls._stats.items()}
+
+    @classmethod
+    def clear(cls):
+        """Reset counters (state expires on its own)."""
+        with cls._lock:
+            cls._stats.clear()
+
+    def _slice(self, first, last):
+        """Original text of sequence indices [first, last)."""
+        return self.text[self.tokens[first][1]:self.tokens[last - 1][2]]
+
+    def _context(self, indices, count):
+        """Up to ``count`` sentences from ``indices``, stopping at a paragraph break."""
+        sentences = []
+        for index in indices:
+            if len(sentences) >= count or self.sequence[index] == BREAK:
+                break
+            sentences.append(self.sequence[index])
+        return sentences
+
+    @classmethod
+    def _save(cls, key, sequence, units):
+        try:
+            cls._backend().set(
+                key, {'sequence': sequence, 'units': units},
+                timeout=getattr(settings, 'LLM_INCREMENTAL_TTL', 3600),
+            )
+        except Exception as e:
+            logger.warning(f'LLM incremental state write failed: {e}')
+
+    @classmethod
+    def _key(cls, tool, document, namespace):
+        raw = json.dumps([tool, str(document), list(namespace)], sort_keys=True, ensure_ascii=False, default=str)
+        return f'{cls.KEY_PREFIX}{hashlib.sha256(raw.encode("utf-8")).hexdigest()}'
+
+    @classmethod
+    def _count(cls, tool, field, amount=1):
+        with cls._lock:
+            counts = cls._stats.setdefault(tool, {
+                'incremental': 0, 'full': 0, 'sentences_reused': 0, 'sentences_rewritten': 0,
+            })
+            counts[field] += amount
+
+    @staticmethod
+    def _backend():
+        return caches[getattr(settings, 'LLM_CACHE_ALIAS', 'default')]
@@ -0,0 +1,221 @@
+"""
+JSON extraction from LLM output.
+
+Models wrap JSON in markdown fences, put a sentence in front of it or a
+note after it. extract_json() recovers the document in one pass: clean JSON
+goes straight to the C decoder, otherwise the fence is located with
+str.find() and json.JSONDecoder.raw_decode() parses from the first bracket,
+ignoring whatever trails the document.
+
+IncrementalJSONParser consumes a reply as it streams and hands back each
+element of a watched array (e.g. the proofreader's ``corrections``) as soon
+as it closes, without re-scanning text it has already seen.
+
+Benchmark both against realistic replies with ``manage.py bench_llm_json``.
+"""
+import json
+import re
+
+_decoder = json.JSONDecoder()
+
+# Bracket positions tried per bracket type before giving up
+MAX_CANDIDATES = 8
+
+_JSON_START = frozenset('{["-0123456789')
+_STRUCTURAL = re.compile(r'["{}\[\]:,]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+def extract_json(text):
+    """
+    Robustly extract a JSON object from LLM output that may contain
+    preamble text, markdown code fences, or trailing commentary.
+
+    Returns parsed dict/list on success, raises ValueError on failure.
+    """
+    if not text or not text.strip():
+        raise ValueError('Empty response')
+
+    s = text.strip()
+
+    # 1. Fast path: the reply is just JSON (or a bare number/string)
+    if s[0] in _JSON_START:
+        try:
+            return json.loads(s)
+        except json.JSONDecodeError:
+            pass
+
+    # 2. Strip markdown code fences (```json ... ``` or ``` ... ```)
+    fenced = _fenced_body(s)
+    if fenced is not None:
+        s = fenced
+        try:
+            return json.loads(s)
+        except json.JSONDecodeError:
+            pass
+
+    # 3. Decode from the first { (then [) and ignore trailing commentary
+    for open_ch in ('{', '['):
+        start = s.find(open_ch)
+        tries = 0
+        while start != -1 and tries < MAX_CANDIDATES:
+            try:
+                return _decoder.raw_decode(s, start)[0]
+            except json.JSONDecodeError:
+                start = s.find(open_ch, start + 1)
+                tries += 1
+
+    raise ValueError(f'No valid JSON found in response: {text[:200]}')
+
+
+def _fenced_body(s):
+    """Return the inside of the first complete ``` fence, or None."""
+    start = s.find('```')
+    if start == -1:
+        return None
+    body = start + 3
+    if s.startswith('json', body):
+        body += 4
+    newline = s.find('\n', body)
+    if newline == -1 or s[body:newline].strip():
+        return None
+    end = s.find('```', newline)
+    if end == -1:
+        return None
+    return s[newline + 1:end].strip()
+
+
+class IncrementalJSONParser:
+    """
+    Incremental parser emitting the elements of one array as they close.
+
+    Args:
+        array_key: Key of the watched array in the top-level object, e.g.
+            'corrections'. With None the top-level value itself must be
+            the array.
+
+    Only object and array elements are emitted; scalar elements are skipped.
+    Text before the document (preamble, an opening fence) is ignored.
+
+    Usage::
+
+        parser = IncrementalJSONParser('corrections')
+        for delta, error in LLMClient.stream(...):
+            for correction in parser.feed(delta):
+                ...
+        document = parser.result()
+    """
+
+    def __init__(self, array_key=None):
+        self.array_key = array_key
+        self._chunks = []
+        self._text = ''  # Unscanned text plus the element or key being read
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._string_start = None
+        self._last_string = None
+        self._key = None
+        self._array_depth = None
+        self._array_seen = False
+        self._item_start = None
+        self._done = False
+
+    @property
+    def done(self):
+        """True once the top-level value holding the watched array has closed."""
+        return self._done
+
+    def feed(self, chunk):
+        """Consume the next chunk of text; return the elements completed by it."""
+        self._chunks.append(chunk)
+        if self._done:
+            return []
+        items = []
+        text = self._text + chunk
+        pos = self._pos
+
+        while True:
+            if self._in_string:
+                match = _STRING_SPECIAL.search(text, pos)
+                if match is None:
+                    pos = len(text)
+                    break
+                i = match.start()
+                if text[i] == '\\':
+                    if i + 1 >= len(text):
+                        pos = i  # Wait for the escaped character
+                        break
+                    pos = i + 2
+                    continue
+                self._in_string = False
+                if self._string_start is not None:
+                    self._last_string = text[self._string_start:i]
+                    self._string_start = None
+                pos = i + 1
+                continue
+
+            match = _STRUCTURAL.search(text, pos)
+            if match is None:
+                pos = len(text)
+                break
+            i = match.start()
+            c = text[i]
+            pos = i + 1
+
+            if self._depth == 0 and c not in '{[':
+                continue
+            if c == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None:
+                    self._string_start = pos  # A key of the top-level object
+            elif c in '{[':
+                if self._array_depth is not None and self._depth == self._array_depth and self._item_start is None:
+                    self._item_start = i
+                if c == '[' and self._array_depth is None and not self._array_seen and self._watches(self._depth):
+                    self._array_depth = self._depth + 1
+                    self._array_seen = True
+                self._depth += 1
+            elif c in '}]':
+                self._depth -= 1
+                if self._array_depth is not None:
+                    if self._depth == self._array_depth and self._item_start is not None:
+                        items.append(json.loads(text[self._item_start:pos]))
+                        self._item_start = None
+                    elif self._depth < self._array_depth:
+                        self._array_depth = None
+                if self._depth == 0:
+                    if self._array_seen:
+                        self._done = True
+                        break
+                    # A bracketed aside before the real document; keep looking
+                    self._key = None
+            elif c == ':' and self._depth == 1:
+                self._key = self._last_string
+            elif c == ',' and self._depth == 1:
+                self._key = None
+
+        # Keep only what is still needed, so each feed costs O(len(chunk))
+        cut = pos
+        for start in (self._item_start, self._string_start):
+            if start is not None:
+                cut = min(cut, start)
+        if cut:
+            text = text[cut:]
+            pos -= cut
+            if self._item_start is not None:
+                self._item_start -= cut
+            if self._string_start is not None:
+                self._string_start -= cut
+        self._text = text
+        self._pos = pos
+        return items
+
+    def result(self):
+        """Parse the whole text fed so far with extract_json()."""
+        return extract_json(''.join(self._chunks))
+
+    def _watches(self, depth):
+        if self.array_key is None:
+            return depth == 0
+        return depth == 1 and self._key == self.array_key
@@ -0,0 +1,188 @@
+"""
+Map-reduce over long documents.
+
+Summaries, proofreads and translations used to send the whole document in
+one prompt. Long documents then hit the max_tokens ceiling (truncated
+output) or ran as one very long call. Services now split documents longer
+than their chunk budget and process the pieces in parallel:
+
+1. split(): cut the text into chunks of at most ``budget`` tokens, at
+   paragraph breaks where possible, then at sentence ends, and only as a
+   last resort inside a sentence. Chunks are exact slices of the input;
+   each records its character offset and the whitespace separating it from
+   the next chunk, so results can be mapped back to the document.
+2. map() / amap(): run one LLM call per chunk, at most
+   LLM_MAPREDUCE_CONCURRENCY at once (LLMClient.generate_many). stream()
+   yields the results in chunk order as soon as they are ready.
+3. reduce: task-specific, in the calling service (hierarchical summary,
+   corrections with offsets remapped to the whole document, concatenated
+   translation or paraphrase; see join()).
+
+Latency therefore grows with chunks / concurrency rather than with total
+length. Texts within one chunk budget take the single-call path unchanged.
+"""
+import asyncio
+import re
+
+from django.conf import settings
+
+from core.llm_client import LLMClient
+from core.llm_tokens import TokenBudget
+
+# Chunk budgets in input tokens, by task
+DEFAULT_CHUNK_TOKENS = {
+    'summarize': 3000,
+    'proofread': 1200,  # Output is ~2.6x the input
+    'translate': 1500,
+    'paraphrase': 1200,  # Expand mode doubles the output
+}
+
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+_SENTENCE_END = re.compile(r'(?:(?<=[.!?])|(?<=[.!?]["\')\]]))\s+')
+
+
+class Chunk:
+    """A slice of a document: ``text`` starts at ``offset`` and is followed by ``separator``."""
+
+    def __init__(self, text, offset, separator=''):
+        self.text = text
+        self.offset = offset
+        self.separator = separator
+
+    def __repr__(self):
+        return f'Chunk(offset={self.offset}, tokens~{TokenBudget.estimate(self.text)})'
+
+
+class MapReduce:
+    """Chunking and parallel per-chunk calls for long documents. See module docstring."""
+
+    @staticmethod
+    def chunk_tokens(task):
+        """Return the chunk budget for ``task`` (LLM_MAPREDUCE_CHUNK_TOKENS)."""
+        budgets = getattr(settings, 'LLM_MAPREDUCE_CHUNK_TOKENS', {})
+        return budgets.get(task, DEFAULT_CHUNK_TOKENS.get(task, 1500))
+
+    @classmethod
+    def needs_split(cls, text, task, backend='open_source'):
+        """True if ``text`` is longer than one chunk for ``task``."""
+        return TokenBudget.estimate(text, backend) > cls.chunk_tokens(task)
+
+    @classmethod
+    def split(cls, text, budget, backend='open_source'):
+        """
+        Split ``text`` into Chunks of at most ``budget`` tokens.
+
+        Returns:
+            List of Chunk objects covering the text in order; offsets index
+            into ``text``. Joining each chunk's text and separator gives
+            back the text without its leading and trailing whitespace.
+        """
+        first = len(text) - len(text.lstrip())
+        last = len(text.rstrip())
+        pieces = []  # (start, end) spans of paragraphs, or sentences of long ones
+        for start, end in cls._spans(text, _PARAGRAPH_BREAK, first, last):
+            if TokenBudget.estimate(text[start:end], backend) <= budget:
+                pieces.append((start, end))
+                continue
+            for s_start, s_end in cls._spans(text, _SENTENCE_END, start, end):
+                pieces.extend(cls._hard_split(text, s_start, s_end, budget, backend))
+
+        # Pack consecutive pieces into chunks under the budget
+        groups = []
+        used = 0
+        for start, end in pieces:
+            cost = TokenBudget.estimate(text[start:end], backend)
+            if groups and used + cost <= budget:
+                groups[-1][1] = end
+                used += cost
+            else:
+                groups.append([start, end])
+                used = cost
+
+        chunks = []
+        for index, (start, end) in enumerate(groups):
+            next_start = groups[index + 1][0] if index + 1 < len(groups) else end
+            chunks.append(Chunk(text[start:end], start, text[end:next_start]))
+        return chunks
+
+    @staticmethod
+    def join(chunks, outputs):
+        """Rejoin per-chunk outputs with the original separators (paragraph breaks etc.)."""
+        return ''.join(output.strip() + chunk.separator for chunk, output in zip(chunks, outputs))
+
+    @staticmethod
+    def max_concurrency():
+        return getattr(settings, 'LLM_MAPREDUCE_CONCURRENCY', 6)
+
+    @classmethod
+    def map(cls, chunks, build_request):
+        """
+        Run one LLMClient.generate() call per chunk in parallel.
+
+        Args:
+            chunks: List of Chunk objects.
+            build_request: Callable taking a Chunk and returning generate()
+                keyword arguments.
+
+        Returns:
+            List of (text, error) tuples in chunk order.
+        """
+        return LLMClient.generate_many([build_request(chunk) for chunk in chunks], cls.max_concurrency())
+
+    @classmethod
+    def stream(cls, chunks, build_request, slot=None):
+        """
+        Like map(), but yield each chunk's (text, error) as soon as it and
+        every chunk before it have finished.
+
+        Args:
+            slot: Optional semaphore shared with other documents, e.g.
+                llm_transport.user_slot(), capping their calls together.
+        """
+        requests = [build_request(chunk) for chunk in chunks]
+        ready = {}
+        position = 0
+        for index, result in LLMClient.generate_as_completed(requests, cls.max_concurrency(), slot):
+            ready[index] = result
+            while position in ready:
+                yield ready.pop(position)
+                position += 1
+
+    @classmethod
+    async def amap(cls, chunks, build_request):
+        """Async counterpart of map(); runs at most LLM_MAPREDUCE_CONCURRENCY calls at once."""
+        semaphore = asyncio.Semaphore(cls.max_concurrency())
+
+        async def run(chunk):
+            async with semaphore:
+                return await LLMClient.agenerate(**build_request(chunk))
+
+        return await asyncio.gather(*(run(chunk) for chunk in chunks))
+
+    @staticmethod
+    def _spans(text, separator, start=0, end=None):
+        """Yield (start, end) spans of ``text[start:end]`` between separator matches."""
+        end = len(text) if end is None else end
+        position = start
+        for match in separator.finditer(text, start, end):
+            if match.start() > position:
+                yield position, match.start()
+            position = match.end()
+        if position < end:
+            yield position, end
+
+    @staticmethod
+    def _hard_split(text, start, end, budget, backend):
+        """Split an over-long sentence into budget-sized spans, at whitespace where possible."""
+        spans = []
+        while start < end:
+            piece = TokenBudget.truncate(text[start:end], budget, backend)
+            cut = start + len(piece)
+            if cut < end and not text[cut].isspace():
+                space = text.rfind(' ', start, cut)
+                cut = space if space > start else max(cut, start + 1)
+            spans.append((start, cut))
+            start = cut
+            while start < end and text[start].isspace():
+                start += 1
+        return spans
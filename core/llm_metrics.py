@@ -0,0 +1,319 @@
+"""
+Per-call metrics for LLM requests.
+
+LLMClient wraps every generate/stream call in LLMMetrics.track(), which
+records the tool tag, backend, model tier, model, queue wait (time waiting
+for a batch slot), connect time, time to first byte, total latency, input
+and output size in tokens, error class and whether the response cache
+answered.
+
+Metrics are aggregated per process into Prometheus-style counters and
+histograms and served as text by core.views.MetricsView on /metrics
+(scrape every gunicorn worker, or run one worker per scrape target). With
+LLM_METRICS_LOG_SAMPLE > 0, that fraction of calls is also logged as one
+JSON line each.
+
+Lower layers (the HTTP transport, backend calls) add what only they can see
+to the current call with LLMMetrics.note(); outside a tracked call it is a
+no-op.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from core.llm_routing import ModelRouter
+from core.llm_tokens import TokenBudget
+
+logger = logging.getLogger('app')
+
+_current = contextvars.ContextVar('llm_call', default=None)
+
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+HISTOGRAMS = {
+    'llm_request_duration_seconds': ('Total LLM call latency', SECONDS_BUCKETS),
+    'llm_queue_wait_seconds': ('Time waiting for a batch slot before the call', SECONDS_BUCKETS),
+    'llm_connect_seconds': ('Time spent opening upstream connections', SECONDS_BUCKETS),
+    'llm_ttfb_seconds': ('Time to first byte from the upstream', SECONDS_BUCKETS),
+    'llm_input_tokens': ('Estimated prompt size in tokens', TOKEN_BUCKETS),
+    'llm_output_tokens': ('Reply size in tokens', TOKEN_BUCKETS),
+    'llm_admission_wait_seconds': ('Time queued for an admission slot, by lane', SECONDS_BUCKETS),
+    'llm_route_duration_seconds': ('LLM call latency by tool and model tier', SECONDS_BUCKETS),
+}
+COUNTERS = {
+    'llm_requests_total': 'LLM calls by outcome (ok, cache_hit or an error class)',
+    'llm_errors_total': 'Failed LLM calls by error class',
+    'llm_prompt_cache_tokens_total': 'Claude prompt tokens by prompt-cache outcome (read, write, uncached)',
+    'llm_route_cost_usd_total': 'Estimated LLM spend in USD by tool and model tier (LLM_MODEL_TIERS prices)',
+}
+
+
+class _CallRecord:
+    """Measurements for one tracked call."""
+
+    def __init__(self, tool, backend, model, queue_wait, route=None):
+        self.tool = tool or 'untagged'
+        self.backend = backend
+        self.model = model or None
+        self.route = route
+        self.queue_wait = queue_wait
+        self.connect = None
+        self.ttfb = None
+        self.latency = None
+        self.input_tokens = 0
+        self.output_tokens = None
+        self.error_class = None
+        self.cache_hit = False
+        self.prompt_cache_read = None
+        self.prompt_cache_write = None
+        self.prompt_uncached = None
+        self.start = time.monotonic()
+
+    def as_dict(self):
+        return {
+            'tool': self.tool, 'backend': self.backend, 'model': self.model, 'route': self.route,
+            'queue_wait': self.queue_wait, 'connect': self.connect, 'ttfb': self.ttfb,
+            'latency': self.latency, 'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens, 'error_class': self.error_class,
+            'cache_hit': self.cache_hit, 'prompt_cache_read': self.prompt_cache_read,
+            'prompt_cache_write': self.prompt_cache_write, 'prompt_uncached': self.prompt_uncached,
+        }
+
+
+class LLMMetrics:
+    """Process-wide LLM call metrics. See module docstring."""
+
+    _counters = {}
+    _histograms = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    @contextmanager
+    def track(cls, tool, backend, model, system_prompt, messages, queue_wait=0.0, bind=True, route=None):
+        """
+        Measure one LLM call.
+
+        Yields the call record; callers set ``output_tokens``, ``cache_hit``
+        or ``error_class`` on it, or use finish(). With ``bind=False`` the
+        record is not made current (generators must not leak context
+        variables into their consumer). ``route`` is the model tier chosen
+        by core.llm_routing.
+        """
+        record = _CallRecord(tool, backend, model, queue_wait, route)
+        record.input_tokens = TokenBudget.estimate(system_prompt or '', backend) + sum(
+            TokenBudget.estimate(m.get('content', ''), backend) + TokenBudget.MESSAGE_OVERHEAD
+            for m in messages if isinstance(m.get('content'), str)
+        )
+        token = _current.set(record) if bind else None
+        try:
+            yield record
+        except (GeneratorExit, asyncio.CancelledError):
+            # Client went away mid-stream or the request was cancelled
+            record.error_class = record.error_class or 'cancelled'
+            raise
+        except BaseException:
+            record.error_class = record.error_class or 'exception'
+            raise
+        finally:
+            if token is not None:
+                _current.reset(token)
+            record.latency = time.monotonic() - record.start
+            cls.observe(record)
+
+    @staticmethod
+    def finish(record, text, error):
+        """Fill in the outcome of a (text, error) result."""
+        if error:
+            record.error_class = record.error_class or 'error'
+        elif record.output_tokens is None and text:
+            record.output_tokens = TokenBudget.estimate(text, record.backend)
+
+    @staticmethod
+    def note(**fields):
+        """
+        Add measurements to the current call, e.g. note(connect=0.02, ttfb=0.4).
+
+        ``connect`` accumulates (retries open several connections); other
+        fields are set once, the first value wins. A no-op outside track().
+        """
+        record = _current.get()
+        if record is None:
+            return
+        for field, value in fields.items():
+            if value is None:
+                continue
+            if field == 'connect':
+                record.connect = (record.connect or 0.0) + value
+            elif getattr(record, field, None) is None:
+                setattr(record, field, value)
+
+    @classmethod
+    def observe(cls, record):
+        """Aggregate a finished call into the process counters and histograms."""
+        outcome = 'cache_hit' if record.cache_hit else (record.error_class or 'ok')
+        labels = (('tool', record.tool), ('backend', record.backend))
+        with cls._lock:
+            cls._inc('llm_requests_total', labels + (('model', record.model or ''), ('outcome', outcome)))
+            if record.error_class:
+                cls._inc('llm_errors_total', labels + (('error_class', record.error_class),))
+            cls._observe('llm_request_duration_seconds', labels, record.latency)
+            cls._observe('llm_input_tokens', labels, record.input_tokens)
+            if not record.cache_hit:
+                cls._observe('llm_queue_wait_seconds', labels, record.queue_wait)
+                cls._observe('llm_connect_seconds', labels, record.connect)
+                cls._observe('llm_ttfb_seconds', labels, record.ttfb)
+            cls._observe('llm_output_tokens', labels, record.output_tokens)
+            if record.prompt_cache_read is not None:
+                for kind, tokens in (('read', record.prompt_cache_read), ('write', record.prompt_cache_write),
+                                     ('uncached', record.prompt_uncached)):
+                    cls._inc('llm_prompt_cache_tokens_total', labels + (('kind', kind),), tokens)
+            if record.route:
+                route_labels = (('tool', record.tool), ('route', record.route))
+                cls._observe('llm_route_duration_seconds', route_labels, record.latency)
+                if not record.cache_hit:
+                    cls._inc('llm_route_cost_usd_total', route_labels,
+                             ModelRouter.cost(record.route, record.input_tokens, record.output_tokens))
+
+        sample = getattr(settings, 'LLM_METRICS_LOG_SAMPLE', 0.0)
+        if sample and random.random() < sample:
+            logger.info(f'llm_call {json.dumps(record.as_dict())}')
+
+    @classmethod
+    def observe_admission(cls, lane, wait):
+        """Record how long a call waited in its admission lane (see core.llm_admission)."""
+        with cls._lock:
+            cls._observe('llm_admission_wait_seconds', (('lane', lane),), wait)
+
+    @classmethod
+    def render(cls):
+        """Return all metrics, including the other LLM components' stats, in Prometheus text format."""
+        lines = []
+        with cls._lock:
+            counters = dict(cls._counters)
+            histograms = {key: list(value) for key, value in cls._histograms.items()}
+
+        for name, help_text in COUNTERS.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{cls._labels(labels)} {value}')
+
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for (metric, labels), counts in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(buckets, counts):
+                    lines.append(f'{name}_bucket{cls._labels(labels + (("le", str(bound)),))} {count}')
+                lines.append(f'{name}_bucket{cls._labels(labels + (("le", "+Inf"),))} {counts[-1]}')
+                lines.append(f'{name}_sum{cls._labels(labels)} {round(counts[-2], 6)}')
+                lines.append(f'{name}_count{cls._labels(labels)} {counts[-1]}')
+
+        lines += cls._prompt_cache_ratio_lines(counters)
+        lines += cls._component_lines()
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def _prompt_cache_ratio_lines(cls, counters):
+        """Share of prompt tokens served from the Claude prompt cache, per tool."""
+        totals = {}
+        for (metric, labels), value in counters.items():
+            if metric != 'llm_prompt_cache_tokens_total':
+                continue
+            label_map = dict(labels)
+            counts = totals.setdefault(label_map['tool'], [0, 0])
+            counts[1] += value
+            if label_map['kind'] == 'read':
+                counts[0] += value
+        if not totals:
+            return []
+        lines = ['# TYPE llm_prompt_cache_hit_ratio gauge']
+        for tool, (read, total) in sorted(totals.items()):
+            ratio = round(read / total, 4) if total else 0
+            lines.append(f'llm_prompt_cache_hit_ratio{cls._labels((("tool", tool),))} {ratio}')
+        return lines
+
+    @classmethod
+    def reset(cls):
+        """Reset all metrics (used by tests)."""
+        with cls._lock:
+            cls._counters.clear()
+            cls._histograms.clear()
+
+    @classmethod
+    def _inc(cls, name, labels, amount=1):
+        key = (name, labels)
+        cls._counters[key] = cls._counters.get(key, 0) + amount
+
+    @classmethod
+    def _observe(cls, name, labels, value):
+        if value is None:
+            return
+        buckets = HISTOGRAMS[name][1]
+        # Cumulative bucket counts, then sum and count
+        counts = cls._histograms.setdefault((name, labels), [0] * (len(buckets) + 2))
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                counts[index] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ''
+        pairs = ','.join(
+            f'{key}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+            for key, value in labels
+        )
+        return '{' + pairs + '}'
+
+    @classmethod
+    def _component_lines(cls):
+        """Expose the pool, caches, single-flight, breaker, hedge, admission and rate-limit counters as gauges."""
+        from core import llm_transport
+        from core.llm_admission import LLMAdmission
+        from core.llm_breaker import CircuitBreaker
+        from core.llm_cache import LLMResponseCache
+        from core.llm_hedge import LLMHedger
+        from core.llm_incremental import IncrementalRewrite
+        from core.llm_neardup import NearDuplicateCache
+        from core.llm_ratelimit import LLMRateLimiter
+        from core.llm_singleflight import LLMSingleFlight
+
+        sources = [
+            ('llm_pool', 'backend', llm_transport.pool_stats()),
+            ('llm_cache', 'tool', LLMResponseCache.stats()),
+            ('llm_neardup', 'tool', NearDuplicateCache.stats()),
+            ('llm_incremental', 'tool', IncrementalRewrite.stats()),
+            ('llm_singleflight', 'tool', LLMSingleFlight.stats()),
+            ('llm_breaker', 'backend', CircuitBreaker.stats()),
+            ('llm_hedge', None, {'': LLMHedger.stats()}),
+            ('llm_admission', 'lane', LLMAdmission.stats()),
+            ('llm_ratelimit', 'backend', LLMRateLimiter.stats()),
+        ]
+        families = {}
+        for prefix, label, groups in sources:
+            for group, values in sorted(groups.items()):
+                for field, value in sorted(values.items()):
+                    name = f'{prefix}_{field}'
+                    if field == 'state':
+                        name, value = f'{prefix}_open', int(value == 'open')
+                    if isinstance(value, bool) or not isinstance(value, (int, float)):
+                        continue
+                    labels = ((label, group),) if label else ()
+                    families.setdefault(name, []).append(f'{name}{cls._labels(labels)} {value}')
+
+        lines = []
+        for name, samples in families.items():
+            lines.append(f'# TYPE {name} gauge')
+            lines += samples
+        return lines
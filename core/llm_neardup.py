@@ -0,0 +1,285 @@
+"""
+Near-duplicate result cache for text tools.
+
+The response cache (core.llm_cache) only matches byte-identical requests,
+but users often resubmit a text with a trailing space, different quotes or
+one edited word. Tool results are therefore also cached under a signature of
+the text that survives such edits:
+
+1. normalize(): Unicode NFKC, straight quotes and dashes, collapsed
+   whitespace. Texts that normalize to the same string share an entry.
+2. simhash(): a 64-bit SimHash over word trigrams. Similar texts get
+   signatures a few bits apart; the Hamming distance is the similarity
+   measure.
+3. An LSH index: each signature is cut into four 16-bit bands, and each
+   band value lists the entries that have it. Two signatures at most three
+   bits apart share at least one band, so a lookup only compares a handful
+   of candidates.
+
+LLM_NEARDUP_TOOLS sets the maximum Hamming distance per tool (0 matches
+normalized text only; tools not listed are not cached). Texts shorter than
+LLM_NEARDUP_MIN_WORDS only get normalized matches, as their signatures are
+too coarse. Entries and bands live in the LLM_CACHE_ALIAS cache (Redis in
+production) for LLM_NEARDUP_TTL seconds.
+
+Callers decide what a close match may reuse: the AI detector serves the
+model score, the grammar checker reuses corrections of unchanged paragraphs
+(see ParagraphReuse) and rechecks only the edited ones.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import unicodedata
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger('app')
+
+_QUOTES = str.maketrans({
+    '‘': "'", '’': "'", '‚': "'", '‛': "'", '′': "'",
+    '“': '"', '”': '"', '„': '"', '‟': '"', '″': '"',
+    '–': '-', '—': '-', '−': '-',
+})
+_WHITESPACE = re.compile(r'\s+')
+_WORD = re.compile(r'\w+')
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+
+class NearDuplicateCache:
+    """Caches tool results under normalized and SimHash signatures. See module docstring."""
+
+    KEY_PREFIX = 'llm_nd:'
+    BANDS = 4
+    BAND_BITS = 16
+
+    _lock = threading.Lock()
+    _stats = {}
+
+    @staticmethod
+    def normalize(text):
+        """Return ``text`` with Unicode, quote, dash and whitespace variants folded."""
+        text = unicodedata.normalize('NFKC', text).translate(_QUOTES)
+        return _WHITESPACE.sub(' ', text).strip()
+
+    @staticmethod
+    def simhash(normalized):
+        """Return the 64-bit SimHash of word trigrams of normalized text."""
+        words = _WORD.findall(normalized.lower())
+        features = [' '.join(words[i:i + 3]) for i in range(max(1, len(words) - 2))]
+        hashes = [
+            int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+            for feature in features
+        ]
+        signature = 0
+        half = len(hashes) / 2
+        for bit in range(64):
+            if sum((value >> bit) & 1 for value in hashes) > half:
+                signature |= 1 << bit
+        return signature
+
+    @classmethod
+    def max_distance(cls, tool):
+        """Return the tool's Hamming distance threshold, or None if it is not cached."""
+        if not getattr(settings, 'LLM_NEARDUP_ENABLED', False):
+            return None
+        distance = getattr(settings, 'LLM_NEARDUP_TOOLS', {}).get(tool)
+        if distance is None or distance is False:
+            return None
+        # Four bands only guarantee candidates up to three bits apart
+        return max(0, min(int(distance), cls.BANDS - 1))
+
+    @classmethod
+    def get(cls, tool, text, namespace=()):
+        """
+        Look up a result for ``text`` or a close match.
+
+        Args:
+            tool: Tool tag; selects the threshold and the key space.
+            text: Submitted text.
+            namespace: Parameters the result depends on (dialect, mode...).
+
+        Returns:
+            Tuple of (cached_text, result) for the closest entry within the
+            tool's threshold, or None.
+        """
+        distance = cls.max_distance(tool)
+        if distance is None:
+            return None
+        normalized = cls.normalize(text)
+        space = cls._space(tool, namespace)
+        backend = cls._backend()
+        try:
+            entry = backend.get(cls._entry_key(space, normalized))
+            if entry is not None:
+                cls._count(tool, 'exact_hits')
+                return entry['text'], entry['result']
+            if distance and cls._fuzzy(normalized):
+                match = cls._nearest(backend, space, cls.simhash(normalized), distance)
+                if match is not None:
+                    cls._count(tool, 'near_hits')
+                    return match['text'], match['result']
+        except Exception as e:
+            logger.warning(f'LLM near-duplicate cache read failed: {e}')
+        cls._count(tool, 'misses')
+        return None
+
+    @classmethod
+    def set(cls, tool, text, result, namespace=()):
+        """Store ``result`` for ``text`` and index its signature."""
+        if cls.max_distance(tool) is None or result is None:
+            return
+        if len(text) > getattr(settings, 'LLM_CACHE_MAX_CHARS', 65536):
+            return
+        normalized = cls.normalize(text)
+        space = cls._space(tool, namespace)
+        ttl = getattr(settings, 'LLM_NEARDUP_TTL', 86400)
+        backend = cls._backend()
+        entry_key = cls._entry_key(space, normalized)
+        try:
+            if cls._fuzzy(normalized):
+                signature = cls.simhash(normalized)
+                band_keys = cls._band_keys(space, signature)
+                bands = backend.get_many(band_keys)
+                size = getattr(settings, 'LLM_NEARDUP_BUCKET_SIZE', 16)
+                updates = {}
+                for key in band_keys:
+                    members = [member for member in bands.get(key, []) if member[0] != entry_key]
+                    updates[key] = (members + [(entry_key, signature)])[-size:]
+                backend.set_many(updates, timeout=ttl)
+            backend.set(entry_key, {'text': text, 'result': result}, timeout=ttl)
+        except Exception as e:
+            logger.warning(f'LLM near-duplicate cache write failed: {e}')
+
+    @classmethod
+    def stats(cls):
+        """Return per-tool exact_hits, near_hits and misses for this process."""
+        with cls._lock:
+            return {tool: dict(counts) for tool, counts in cls._stats.items()}
+
+    @classmethod
+    def clear(cls):
+        """Reset counters (entries expire on their own)."""
+        with cls._lock:
+            cls._stats.clear()
+
+    @classmethod
+    def _nearest(cls, backend, space, signature, distance):
+        """Return the closest indexed entry within ``distance`` bits, or None."""
+        candidates = {}
+        for members in backend.get_many(cls._band_keys(space, signature)).values():
+            for entry_key, other in members:
+                candidates[entry_key] = (signature ^ other).bit_count()
+        close = sorted((bits, key) for key, bits in candidates.items() if bits <= distance)
+        if not close:
+            return None
+        entries = backend.get_many([key for _, key in close])
+        for _, key in close:
+            if key in entries:
+                return entries[key]
+        return None
+
+    @classmethod
+    def _fuzzy(cls, normalized):
+        return len(_WORD.findall(normalized)) >= getattr(settings, 'LLM_NEARDUP_MIN_WORDS', 20)
+
+    @staticmethod
+    def _space(tool, namespace):
+        raw = json.dumps([tool, list(namespace)], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+    @classmethod
+    def _entry_key(cls, space, normalized):
+        digest = hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+        return f'{cls.KEY_PREFIX}e:{space}:{digest}'
+
+    @classmethod
+    def _band_keys(cls, space, signature):
+        mask = (1 << cls.BAND_BITS) - 1
+        return [
+            f'{cls.KEY_PREFIX}b:{space}:{band}:{(signature >> (band * cls.BAND_BITS)) & mask:04x}'
+            for band in range(cls.BANDS)
+        ]
+
+    @classmethod
+    def _count(cls, tool, field):
+        with cls._lock:
+            counts = cls._stats.setdefault(tool, {'exact_hits': 0, 'near_hits': 0, 'misses': 0})
+            counts[field] += 1
+
+    @staticmethod
+    def _backend():
+        return caches[getattr(settings, 'LLM_CACHE_ALIAS', 'default')]
+
+
+def _paragraphs(text):
+    """Return (start, end) spans of the non-blank paragraphs of ``text``, without surrounding whitespace."""
+    spans = []
+    position = 0
+    for match in list(_PARAGRAPH_BREAK.finditer(text)) + [None]:
+        end = match.start() if match else len(text)
+        piece = text[position:end]
+        stripped = piece.strip()
+        if stripped:
+            start = position + len(piece) - len(piece.lstrip())
+            spans.append((start, start + len(stripped)))
+        position = match.end() if match else end
+    return spans
+
+
+class ParagraphReuse:
+    """
+    Maps positions between a cached text and a resubmitted near-duplicate.
+
+    Paragraphs that appear unchanged in both texts keep their cached
+    results; the edited ones are joined into ``recheck_text`` for a fresh
+    call. map_cached() and map_recheck() translate character spans from
+    either source into positions in the new text.
+    """
+
+    def __init__(self, cached_text, text):
+        available = defaultdict(deque)
+        for start, end in _paragraphs(cached_text):
+            available[cached_text[start:end]].append(start)
+
+        self.reused = []  # (cached start, cached end, new start)
+        changed = []
+        for start, end in _paragraphs(text):
+            starts = available.get(text[start:end])
+            if starts:
+                cached_start = starts.popleft()
+                self.reused.append((cached_start, cached_start + end - start, start))
+            else:
+                changed.append((start, end))
+
+        self.recheck_spans = []  # (recheck start, recheck end, new start)
+        parts = []
+        offset = 0
+        for start, end in changed:
+            if parts:
+                offset += 2
+            self.recheck_spans.append((offset, offset + end - start, start))
+            parts.append(text[start:end])
+            offset += end - start
+        self.recheck_text = '\n\n'.join(parts)
+        total = sum(end - start for start, end in _paragraphs(text)) or 1
+        self.changed_share = sum(end - start for start, end in changed) / total
+
+    def map_cached(self, start, end):
+        """Map a span of the cached text to the new text, or None if its paragraph changed."""
+        return self._map(self.reused, start, end)
+
+    def map_recheck(self, start, end):
+        """Map a span of ``recheck_text`` to the new text, or None."""
+        return self._map(self.recheck_spans, start, end)
+
+    @staticmethod
+    def _map(spans, start, end):
+        for source_start, source_end, target_start in spans:
+            if source_start <= start and end <= source_end:
+                shift = target_start - source_start
+                return start + shift, end + shift
+        return None
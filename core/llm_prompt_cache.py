@@ -0,0 +1,103 @@
+"""
+Prompt-prefix caching.
+
+Large prompt prefixes repeat across calls: mode prompts, JSON schemas, a
+PDF re-sent with every question about it. Services mark the repeating part
+by building the prompt as CachedPrompt(static, dynamic). A CachedPrompt is
+an ordinary string (static + dynamic), so cache keys, token estimates and
+the open-source payload are unchanged, but:
+
+- On the Claude path the static part becomes a separate content block with
+  ``cache_control``, so Anthropic bills it at the cache-read rate and skips
+  re-processing it. Claude ignores prefixes under its minimum cacheable
+  length, so prefixes shorter than LLM_PROMPT_CACHE_MIN_TOKENS are sent as
+  plain text.
+- The open-source backend gets ``prefix_cache_key``, a hash of the static
+  parts, so the GPU server can route calls that share a prefix to the
+  replica that already holds it in its KV cache.
+
+Claude reports cache reads and writes per call; they feed the
+llm_prompt_cache_* metrics (see core.llm_metrics), including a hit ratio
+per tool.
+"""
+import hashlib
+
+from django.conf import settings
+
+from core.llm_metrics import LLMMetrics
+from core.llm_tokens import TokenBudget
+
+# Anthropic allows four cache breakpoints per request
+MAX_BREAKPOINTS = 4
+
+
+class CachedPrompt(str):
+    """A prompt string whose ``static`` prefix repeats across calls."""
+
+    def __new__(cls, static, dynamic=''):
+        prompt = super().__new__(cls, static + dynamic)
+        prompt.static = static
+        prompt.dynamic = dynamic
+        return prompt
+
+
+class PromptCache:
+    """Builds cache-aware request parameters. See module docstring."""
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'LLM_PROMPT_CACHE_ENABLED', True)
+
+    @classmethod
+    def claude_params(cls, system_prompt, messages):
+        """
+        Return (system, messages) for ``anthropic.messages.create``.
+
+        CachedPrompt system prompts and message contents are split into a
+        cached static block and a plain dynamic block; everything else is
+        passed through unchanged.
+        """
+        if not cls.enabled():
+            return system_prompt, messages
+        breakpoints = [MAX_BREAKPOINTS]
+        system = cls._blocks(system_prompt, breakpoints) or system_prompt
+        converted = []
+        for message in messages:
+            blocks = cls._blocks(message.get('content'), breakpoints)
+            converted.append({**message, 'content': blocks} if blocks else message)
+        return system, converted
+
+    @classmethod
+    def prefix_key(cls, system_prompt, messages):
+        """Return the open-source prefix hint for a request, or None."""
+        if not cls.enabled():
+            return None
+        static = [
+            part.static for part in [system_prompt] + [m.get('content') for m in messages]
+            if isinstance(part, CachedPrompt) and part.static
+        ]
+        if not static:
+            return None
+        return hashlib.sha256('\x00'.join(static).encode('utf-8')).hexdigest()[:32]
+
+    @staticmethod
+    def record_usage(usage):
+        """Report a Claude reply's cache reads and writes to the current call's metrics."""
+        read = getattr(usage, 'cache_read_input_tokens', None)
+        written = getattr(usage, 'cache_creation_input_tokens', None)
+        uncached = getattr(usage, 'input_tokens', None)
+        if all(isinstance(value, int) for value in (read, written, uncached)):
+            LLMMetrics.note(prompt_cache_read=read, prompt_cache_write=written, prompt_uncached=uncached)
+
+    @staticmethod
+    def _blocks(content, breakpoints):
+        if not isinstance(content, CachedPrompt) or not content.static or breakpoints[0] <= 0:
+            return None
+        min_tokens = getattr(settings, 'LLM_PROMPT_CACHE_MIN_TOKENS', 1024)
+        if TokenBudget.estimate(content.static, 'claude') < min_tokens:
+            return None
+        breakpoints[0] -= 1
+        blocks = [{'type': 'text', 'text': content.static, 'cache_control': {'type': 'ephemeral'}}]
+        if content.dynamic:
+            blocks.append({'type': 'text', 'text': content.dynamic})
+        return blocks
@@ -0,0 +1,296 @@
+"""
+Outbound token-bucket rate limits per LLM backend and API key.
+
+Nothing used to pace our own calls to the GPU server or Anthropic, so bursts
+drew upstream 429s that reached users as "Service is temporarily busy". Each
+backend now has two token buckets, keyed by backend and a fingerprint of its
+API key:
+
+    requests   refills at requests_per_sec, holds up to burst requests
+    tokens     refills at tokens_per_min / 60, holds up to tokens_per_min
+
+(limits in LLM_RATE_LIMITS; a missing limit is not enforced). A call takes
+one request and its estimated prompt tokens before going upstream; the
+output tokens are charged once the reply is in. A call that would overdraw
+a bucket reserves its share and sleeps until the bucket refills, so bursts
+are smoothed into a short queue. If the wait would exceed
+LLM_RATE_LIMIT_MAX_WAIT seconds, the call fails fast instead and the
+request is answered with a 429 like a shed call (see core.middleware).
+
+Buckets live in Redis (the LLM_CACHE_ALIAS cache through django-redis),
+checked and debited by one Lua script, so the limits hold across all
+workers and hosts. If that cache is not Redis or Redis fails, each process
+falls back to a local bucket with the same limits.
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from core.llm_admission import LLMAdmission
+
+try:
+    from django_redis import get_redis_connection
+except ImportError:  # Local buckets only
+    get_redis_connection = None
+
+logger = logging.getLogger('app')
+
+RATE_LIMIT_ERROR = 'Service is temporarily busy. Please try again in a moment.'
+
+# KEYS: requests bucket, tokens bucket. ARGV: per bucket (rate/s, capacity,
+# cost), then max wait and key TTL. Returns {wait, requests left, tokens left};
+# wait is -1 when the call was refused and nothing was taken.
+_ACQUIRE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1e6
+local max_wait = tonumber(ARGV[7])
+local levels = {}
+local wait = 0
+for i = 1, 2 do
+    local rate = tonumber(ARGV[i * 3 - 2])
+    local capacity = tonumber(ARGV[i * 3 - 1])
+    local cost = tonumber(ARGV[i * 3])
+    local level = capacity
+    if rate > 0 then
+        local state = redis.call('HMGET', KEYS[i], 'level', 'ts')
+        level = tonumber(state[1]) or capacity
+        local ts = tonumber(state[2]) or now
+        level = math.min(capacity, level + math.max(0, now - ts) * rate)
+        if level < cost then
+            wait = math.max(wait, (cost - level) / rate)
+        end
+    end
+    levels[i] = level
+end
+if wait > max_wait then
+    return {'-1', tostring(levels[1]), tostring(levels[2])}
+end
+for i = 1, 2 do
+    if tonumber(ARGV[i * 3 - 2]) > 0 then
+        levels[i] = levels[i] - tonumber(ARGV[i * 3])
+        redis.call('HSET', KEYS[i], 'level', levels[i], 'ts', now)
+        redis.call('EXPIRE', KEYS[i], tonumber(ARGV[8]))
+    end
+end
+return {tostring(wait), tostring(levels[1]), tostring(levels[2])}
+"""
+
+
+class _LocalBucket:
+    """In-process token bucket, used when Redis is unavailable."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, cost):
+        return max(0.0, (cost - self.level) / self.rate)
+
+
+class LLMRateLimiter:
+    """Paces outbound calls per backend and API key. See module docstring."""
+
+    KEY_PREFIX = 'llm_rl:'
+
+    _local = {}
+    _stats = {}
+    _lock = threading.Lock()
+    _scripts = {}
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'LLM_RATE_LIMIT_ENABLED', False)
+
+    @classmethod
+    def acquire(cls, backend, tokens=0):
+        """
+        Take one request and ``tokens`` prompt tokens from ``backend``'s
+        buckets, sleeping until they are available.
+
+        Returns:
+            None when the call may proceed, or an error string when the wait
+            would exceed LLM_RATE_LIMIT_MAX_WAIT.
+        """
+        wait = cls._take(backend, tokens)
+        if wait is None:
+            LLMAdmission.mark_shed()
+            return RATE_LIMIT_ERROR
+        if wait:
+            time.sleep(wait)
+        return None
+
+    @classmethod
+    async def aacquire(cls, backend, tokens=0):
+        """Async counterpart of acquire(); waits without blocking the event loop."""
+        if not cls._limits(backend):
+            return None
+        wait = await sync_to_async(cls._take, thread_sensitive=False)(backend, tokens)
+        if wait is None:
+            LLMAdmission.mark_shed()
+            return RATE_LIMIT_ERROR
+        if wait:
+            await asyncio.sleep(wait)
+        return None
+
+    @classmethod
+    def consume(cls, backend, tokens):
+        """Charge ``tokens`` output tokens after the call, without waiting."""
+        limits = cls._limits(backend)
+        if not limits or not limits.get('tokens_per_min') or not tokens:
+            return
+        client = cls._redis()
+        if client is not None:
+            try:
+                client.hincrbyfloat(cls._keys(backend)[1], 'level', -tokens)
+                return
+            except Exception as e:
+                logger.warning(f'LLM rate limiter unavailable, using local buckets: {e}')
+        with cls._lock:
+            bucket = cls._local_buckets(backend, limits)[1]
+            bucket.refill(time.monotonic())
+            bucket.level -= tokens
+
+    @classmethod
+    async def aconsume(cls, backend, tokens):
+        """Async counterpart of consume()."""
+        if cls._limits(backend):
+            await sync_to_async(cls.consume, thread_sensitive=False)(backend, tokens)
+
+    @classmethod
+    def stats(cls):
+        """
+        Return per-backend counters for this process.
+
+        ``requests_available`` and ``tokens_available`` are the bucket fill
+        levels seen by the last call; ``waited`` and ``wait_seconds`` count
+        calls that queued for a refill, ``rejected`` those refused outright.
+        """
+        with cls._lock:
+            return {backend: dict(counts) for backend, counts in cls._stats.items()}
+
+    @classmethod
+    def reset(cls):
+        """Forget local buckets and counters (used by tests)."""
+        with cls._lock:
+            cls._local.clear()
+            cls._stats.clear()
+
+    @classmethod
+    def _take(cls, backend, tokens):
+        """Debit the buckets; return the seconds to wait, or None if refused."""
+        limits = cls._limits(backend)
+        if not limits:
+            return 0.0
+        rates = cls._rates(limits)
+        tokens = min(tokens, rates[1][1]) if rates[1][0] else 0
+        max_wait = getattr(settings, 'LLM_RATE_LIMIT_MAX_WAIT', 2.0)
+
+        result = None
+        client = cls._redis()
+        if client is not None:
+            try:
+                result = cls._take_redis(client, backend, rates, tokens, max_wait)
+            except Exception as e:
+                logger.warning(f'LLM rate limiter unavailable, using local buckets: {e}')
+        if result is None:
+            result = cls._take_local(backend, limits, rates, tokens, max_wait)
+
+        wait, requests_left, tokens_left = result
+        with cls._lock:
+            counts = cls._stats.setdefault(backend, {
+                'requests_available': 0, 'tokens_available': 0, 'waited': 0, 'wait_seconds': 0.0, 'rejected': 0,
+            })
+            counts['requests_available'] = round(requests_left, 2)
+            counts['tokens_available'] = round(tokens_left)
+            if wait is None:
+                counts['rejected'] += 1
+            elif wait:
+                counts['waited'] += 1
+                counts['wait_seconds'] = round(counts['wait_seconds'] + wait, 3)
+        return wait
+
+    @classmethod
+    def _take_redis(cls, client, backend, rates, tokens, max_wait):
+        script = cls._scripts.get(id(client))
+        if script is None:
+            script = cls._scripts[id(client)] = client.register_script(_ACQUIRE_SCRIPT)
+        (request_rate, request_capacity), (token_rate, token_capacity) = rates
+        ttl = int(max(request_capacity / (request_rate or 1), token_capacity / (token_rate or 1))) + 60
+        wait, requests_left, tokens_left = script(keys=cls._keys(backend), args=[
+            request_rate, request_capacity, 1, token_rate, token_capacity, tokens, max_wait, ttl,
+        ])
+        wait = float(wait)
+        return (None if wait < 0 else wait), float(requests_left), float(tokens_left)
+
+    @classmethod
+    def _take_local(cls, backend, limits, rates, tokens, max_wait):
+        now = time.monotonic()
+        costs = (1, tokens)
+        with cls._lock:
+            buckets = cls._local_buckets(backend, limits)
+            wait = 0.0
+            for bucket, cost in zip(buckets, costs):
+                if bucket:
+                    bucket.refill(now)
+                    wait = max(wait, bucket.wait_for(cost))
+            levels = [bucket.level if bucket else capacity for bucket, (_, capacity) in zip(buckets, rates)]
+            if wait > max_wait:
+                return None, levels[0], levels[1]
+            for bucket, cost in zip(buckets, costs):
+                if bucket:
+                    bucket.level -= cost
+            return wait, levels[0] - (1 if buckets[0] else 0), levels[1] - (tokens if buckets[1] else 0)
+
+    @classmethod
+    def _local_buckets(cls, backend, limits):
+        buckets = cls._local.get(backend)
+        if buckets is None:
+            buckets = cls._local[backend] = tuple(
+                _LocalBucket(rate, capacity) if rate else None for rate, capacity in cls._rates(limits)
+            )
+        return buckets
+
+    @staticmethod
+    def _rates(limits):
+        """Return ((request rate/s, burst), (token rate/s, token capacity)); rate 0 means unlimited."""
+        per_sec = limits.get('requests_per_sec') or 0
+        per_min = limits.get('tokens_per_min') or 0
+        return (per_sec, limits.get('burst') or max(1, per_sec)), (per_min / 60, per_min)
+
+    @classmethod
+    def _limits(cls, backend):
+        if not cls.enabled():
+            return None
+        return getattr(settings, 'LLM_RATE_LIMITS', {}).get(backend)
+
+    @classmethod
+    def _keys(cls, backend):
+        """Redis keys of ``backend``'s buckets, per API key fingerprint."""
+        api_key = {
+            'claude': getattr(settings, 'ANTHROPIC_API_KEY', ''),
+        }.get(backend, getattr(settings, 'WRITINGBOT_API_KEY', ''))
+        fingerprint = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+        # Hash tag keeps both buckets in one Redis Cluster slot
+        base = f'{cls.KEY_PREFIX}{{{backend}:{fingerprint}}}'
+        return [f'{base}:requests', f'{base}:tokens']
+
+    @staticmethod
+    def _redis():
+        """Return the raw Redis client behind LLM_CACHE_ALIAS, or None."""
+        if get_redis_connection is None:
+            return None
+        try:
+            return get_redis_connection(getattr(settings, 'LLM_CACHE_ALIAS', 'default'))
+        except Exception:  # Not a django-redis cache
+            return None
@@ -0,0 +1,126 @@
+"""
+Model routing by task and size.
+
+Every LLMClient call used to go to one model per plan: the GPU server's
+main model for free users, Claude for premium users. A language detection
+reply of two tokens held the same big-model slot as a full essay. Calls are
+now routed to a model tier:
+
+    small     a small, fast model for classification and lookup calls
+    default   the GPU server's main model
+    premium   Claude
+
+LLM_MODEL_ROUTES maps a tool tag to a tier, or to a list of rules checked in
+order. The first rule whose conditions all hold picks the tier:
+
+    'summarizer': [{'premium': False, 'max_input_tokens': 800, 'tier': 'small'}],
+
+Rule conditions are ``max_input_tokens`` (estimated prompt size),
+``max_tokens`` (the call's output budget) and ``premium`` (the caller's
+plan). Tools without a route, or whose rules all fail, keep the plan
+default: premium for premium users, default otherwise.
+
+LLM_MODEL_TIERS sets each tier's backend, model and estimated cost per
+million input and output tokens. A tier whose backend cannot be used falls
+back to the default tier: Claude tiers need ANTHROPIC_API_KEY, and the
+premium tier also needs USE_CLAUDE_FOR_PREMIUM. An empty model leaves the
+choice to the backend (WRITINGBOT_MODEL / ANTHROPIC_MODEL).
+
+core.llm_metrics exports latency and estimated cost per route.
+"""
+from django.conf import settings
+
+from core.llm_tokens import TokenBudget
+
+DEFAULT_TIERS = {
+    'small': {'backend': 'open_source', 'model': '', 'cost': (0.0, 0.0)},
+    'default': {'backend': 'open_source', 'model': '', 'cost': (0.0, 0.0)},
+    'premium': {'backend': 'claude', 'model': '', 'cost': (3.0, 15.0)},
+}
+
+# Short classification and lookup calls
+DEFAULT_ROUTES = {
+    'translator_detect': 'small',
+    'synonyms': 'small',
+}
+
+
+class ModelRouter:
+    """Maps calls to a model tier. See module docstring."""
+
+    @staticmethod
+    def tier_config(tier):
+        """Return the {'backend', 'model', 'cost'} config of ``tier`` (LLM_MODEL_TIERS)."""
+        configured = getattr(settings, 'LLM_MODEL_TIERS', {}).get(tier, {})
+        return {**DEFAULT_TIERS.get(tier, DEFAULT_TIERS['default']), **configured}
+
+    @classmethod
+    def route(cls, tool, use_premium, max_tokens=4096, system_prompt=None, messages=None):
+        """
+        Choose the tier for a call.
+
+        Returns:
+            Tuple of (tier, backend, model). ``model`` is the configured
+            model name, or the backend default for an empty one.
+        """
+        tier = cls._match(tool, use_premium, max_tokens, system_prompt, messages)
+        if tier is None:
+            tier = 'premium' if use_premium else 'default'
+        config = cls.tier_config(tier)
+        if not cls._usable(tier, config['backend']):
+            tier = 'default'
+            config = cls.tier_config(tier)
+        return tier, config['backend'], config['model'] or cls.backend_model(config['backend'])
+
+    @staticmethod
+    def backend_model(backend):
+        """Return the default model name of ``backend``."""
+        if backend == 'claude':
+            return getattr(settings, 'ANTHROPIC_MODEL', 'claude-sonnet-4-5-20250929')
+        return getattr(settings, 'WRITINGBOT_MODEL', '')
+
+    @staticmethod
+    def failover_tier(backend):
+        """The tier a call is accounted to after failing over to ``backend``."""
+        return 'premium' if backend == 'claude' else 'default'
+
+    @classmethod
+    def cost(cls, tier, input_tokens, output_tokens):
+        """Estimated cost in USD of a call on ``tier``."""
+        input_price, output_price = cls.tier_config(tier)['cost']
+        return ((input_tokens or 0) * input_price + (output_tokens or 0) * output_price) / 1_000_000
+
+    @staticmethod
+    def _match(tool, use_premium, max_tokens, system_prompt, messages):
+        """Return the tier the route table picks for the call, or None."""
+        routes = {**DEFAULT_ROUTES, **getattr(settings, 'LLM_MODEL_ROUTES', {})}
+        rules = routes.get(tool)
+        if not rules:
+            return None
+        if isinstance(rules, str):
+            return rules
+
+        input_tokens = None
+        for rule in rules:
+            if 'premium' in rule and rule['premium'] != bool(use_premium):
+                continue
+            if 'max_tokens' in rule and max_tokens > rule['max_tokens']:
+                continue
+            if 'max_input_tokens' in rule:
+                if input_tokens is None:
+                    input_tokens = TokenBudget.estimate(system_prompt or '') + sum(
+                        TokenBudget.estimate(m.get('content', '')) + TokenBudget.MESSAGE_OVERHEAD
+                        for m in messages or [] if isinstance(m.get('content'), str)
+                    )
+                if input_tokens > rule['max_input_tokens']:
+                    continue
+            return rule['tier']
+        return None
+
+    @staticmethod
+    def _usable(tier, backend):
+        if backend != 'claude':
+            return True
+        if not getattr(settings, 'ANTHROPIC_API_KEY', ''):
+            return False
+        return tier != 'premium' or getattr(settings, 'USE_CLAUDE_FOR_PREMIUM', True)
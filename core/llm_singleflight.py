@@ -0,0 +1,279 @@
+"""
+Single-flight coalescing of identical in-flight LLMClient.generate calls.
+
+When a popular prompt spikes, identical requests arrive within the same
+second and would each go upstream. While one request for a given request
+hash (see LLMResponseCache.make_key) is in flight, later identical requests
+wait for its result instead of issuing their own:
+
+1. Within a process, followers block on the leader's event (or await its
+   future on the same event loop).
+2. Across processes, the leader holds a short lock in the shared Django
+   cache (Redis in production) and publishes its (text, error) result under
+   a result key that followers poll.
+
+If the leader dies or the wait exceeds LLM_SINGLEFLIGHT_WAIT, followers make
+their own upstream call, so coalescing can only ever save calls. Likewise
+when the leader was shed by admission control or refused by the rate
+limiter: those errors are about the leader's slot, not the request, so
+they are never published and each follower tries for itself.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core.llm_admission import ADMISSION_ERROR
+from core.llm_ratelimit import RATE_LIMIT_ERROR
+
+logger = logging.getLogger('app')
+
+
+class _Flight:
+    """An in-process call that followers can wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class LLMSingleFlight:
+    """Coalesces identical concurrent upstream calls. See module docstring."""
+
+    LOCK_PREFIX = 'llm_sf:lock:'
+    RESULT_PREFIX = 'llm_sf:result:'
+
+    _flights = {}
+    _async_flights = {}
+    _lock = threading.Lock()
+    _stats = {}
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'LLM_SINGLEFLIGHT_ENABLED', False)
+
+    @classmethod
+    def do(cls, key, fn, tool=''):
+        """
+        Run ``fn`` once per ``key`` across concurrent callers.
+
+        Args:
+            key: Request hash identifying identical calls.
+            fn: Zero-argument callable making the upstream call; returns
+                a (text, error) tuple.
+            tool: Tool tag used for metrics.
+
+        Returns:
+            The (text, error) tuple from this call or from the leader.
+        """
+        with cls._lock:
+            flight = cls._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = cls._flights[key] = _Flight()
+
+        if not leader:
+            if flight.event.wait(cls._wait()) and cls._shareable(flight.result):
+                cls._count(tool, 'coalesced_local')
+                return flight.result
+            if not flight.event.is_set():
+                cls._count(tool, 'timeouts')
+            cls._count(tool, 'upstream')
+            return fn()
+
+        try:
+            flight.result = cls._distributed(key, fn, tool)
+            return flight.result
+        finally:
+            with cls._lock:
+                cls._flights.pop(key, None)
+            flight.event.set()
+
+    @classmethod
+    async def ado(cls, key, afn, tool=''):
+        """Async counterpart of do(); ``afn`` is a coroutine function."""
+        loop = asyncio.get_running_loop()
+        local_key = (id(loop), key)
+        future = cls._async_flights.get(local_key)
+        if future is not None and not future.done():
+            try:
+                result = await asyncio.wait_for(asyncio.shield(future), cls._wait())
+            except asyncio.TimeoutError:
+                cls._count(tool, 'timeouts')
+                result = None
+            if cls._shareable(result):
+                cls._count(tool, 'coalesced_local')
+                return result
+            cls._count(tool, 'upstream')
+            return await afn()
+
+        future = cls._async_flights[local_key] = loop.create_future()
+        result = None
+        try:
+            result = await cls._adistributed(key, afn, tool)
+            return result
+        finally:
+            cls._async_flights.pop(local_key, None)
+            future.set_result(result)
+
+    @classmethod
+    def stats(cls):
+        """
+        Return per-tool counters for this process.
+
+        ``upstream`` counts calls that went upstream; ``coalesced_local`` and
+        ``coalesced_remote`` count calls served by another caller's result
+        (the upstream calls saved); ``timeouts`` counts followers that gave
+        up waiting and called upstream themselves.
+        """
+        with cls._lock:
+            return {tool: dict(counts) for tool, counts in cls._stats.items()}
+
+    @classmethod
+    def reset(cls):
+        """Reset counters (in-flight calls are left alone)."""
+        with cls._lock:
+            cls._stats.clear()
+
+    @classmethod
+    def _distributed(cls, key, fn, tool):
+        """Lead or follow the cross-process flight for ``key``."""
+        backend = cls._backend()
+        lock_key = cls.LOCK_PREFIX + key
+        result_key = cls.RESULT_PREFIX + key
+        deadline = time.monotonic() + cls._wait()
+
+        acquired = False
+        try:
+            while True:
+                acquired = backend.add(lock_key, 1, timeout=int(cls._wait()) + 1)
+                if acquired:
+                    break
+                result = cls._await_leader(backend, lock_key, result_key, deadline)
+                if result is not None:
+                    cls._count(tool, 'coalesced_remote')
+                    return tuple(result)
+                if time.monotonic() >= deadline:
+                    cls._count(tool, 'timeouts')
+                    break
+                # Leader died without publishing; try to take over
+        except Exception as e:
+            logger.warning(f'LLM single-flight lock unavailable: {e}')
+
+        cls._count(tool, 'upstream')
+        if not acquired:
+            return fn()
+
+        try:
+            result = fn()
+            if not cls._shareable(result):
+                return result
+            try:
+                backend.set(result_key, list(result), timeout=cls._result_ttl())
+            except Exception as e:
+                logger.warning(f'LLM single-flight publish failed: {e}')
+            return result
+        finally:
+            try:
+                backend.delete(lock_key)
+            except Exception as e:
+                logger.warning(f'LLM single-flight unlock failed: {e}')
+
+    @classmethod
+    def _await_leader(cls, backend, lock_key, result_key, deadline):
+        """Poll until the leader publishes, releases the lock, or time runs out."""
+        while time.monotonic() < deadline:
+            time.sleep(cls._poll())
+            result = backend.get(result_key)
+            if result is not None:
+                return result
+            if backend.get(lock_key) is None:
+                return backend.get(result_key)
+        return None
+
+    @classmethod
+    async def _adistributed(cls, key, afn, tool):
+        """Async counterpart of _distributed()."""
+        backend = cls._backend()
+        lock_key = cls.LOCK_PREFIX + key
+        result_key = cls.RESULT_PREFIX + key
+        deadline = time.monotonic() + cls._wait()
+
+        acquired = False
+        try:
+            while True:
+                acquired = await backend.aadd(lock_key, 1, timeout=int(cls._wait()) + 1)
+                if acquired:
+                    break
+                result = await cls._aawait_leader(backend, lock_key, result_key, deadline)
+                if result is not None:
+                    cls._count(tool, 'coalesced_remote')
+                    return tuple(result)
+                if time.monotonic() >= deadline:
+                    cls._count(tool, 'timeouts')
+                    break
+        except Exception as e:
+            logger.warning(f'LLM single-flight lock unavailable: {e}')
+
+        cls._count(tool, 'upstream')
+        if not acquired:
+            return await afn()
+
+        try:
+            result = await afn()
+            if not cls._shareable(result):
+                return result
+            try:
+                await backend.aset(result_key, list(result), timeout=cls._result_ttl())
+            except Exception as e:
+                logger.warning(f'LLM single-flight publish failed: {e}')
+            return result
+        finally:
+            try:
+                await backend.adelete(lock_key)
+            except Exception as e:
+                logger.warning(f'LLM single-flight unlock failed: {e}')
+
+    @classmethod
+    async def _aawait_leader(cls, backend, lock_key, result_key, deadline):
+        """Async counterpart of _await_leader()."""
+        while time.monotonic() < deadline:
+            await asyncio.sleep(cls._poll())
+            result = await backend.aget(result_key)
+            if result is not None:
+                return result
+            if await backend.aget(lock_key) is None:
+                return await backend.aget(result_key)
+        return None
+
+    @classmethod
+    def _count(cls, tool, field):
+        with cls._lock:
+            counts = cls._stats.setdefault(tool or 'untagged', {
+                'upstream': 0, 'coalesced_local': 0, 'coalesced_remote': 0, 'timeouts': 0,
+            })
+            counts[field] += 1
+
+    @staticmethod
+    def _shareable(result):
+        """True for a leader result followers may use: not a shed or rate-limited call."""
+        return result is not None and result[1] not in (ADMISSION_ERROR, RATE_LIMIT_ERROR)
+
+    @staticmethod
+    def _wait():
+        return getattr(settings, 'LLM_SINGLEFLIGHT_WAIT', 120)
+
+    @staticmethod
+    def _poll():
+        return getattr(settings, 'LLM_SINGLEFLIGHT_POLL', 0.1)
+
+    @staticmethod
+    def _result_ttl():
+        return getattr(settings, 'LLM_SINGLEFLIGHT_RESULT_TTL', 10)
+
+    @staticmethod
+    def _backend():
+        return caches[getattr(settings, 'LLM_CACHE_ALIAS', 'default')]
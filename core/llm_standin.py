@@ -0,0 +1,285 @@
+"""
+Local stand-in for the GPU server, for load tests and benchmarks.
+
+Implements the two endpoints LLMClient calls on api.writingbot.ai:
+
+    POST /v1/text/generate/         {"text": ...} ("texts" too with "n"), or SSE deltas with "stream": true
+    POST /v1/text/ai-detect-model/  {"score", "label", "chunks"}
+
+in one of three modes:
+
+- synthetic: replies are generated locally. Latency is time to first token
+  drawn from a distribution (see LatencyModel), plus output tokens divided
+  by a token rate. Errors and slow outliers are injected at given rates.
+  Plain prompts get their input text echoed back. Prompts asking for JSON
+  get an object with the grammar and proofread keys filled in.
+- record: requests are forwarded to a real upstream. Each request, reply
+  and measured latency is appended to a JSONL capture file.
+- replay: replies come from a capture file with their recorded latency.
+  A request is matched by its hash first. Otherwise the endpoint's recorded
+  replies are cycled, so production captures still give a realistic
+  latency and size distribution for new prompts.
+
+Run it with ``manage.py llm_standin``; ``manage.py load_test_llm`` starts
+one in-process and drives the API views through it.
+"""
+import hashlib
+import itertools
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core.llm_tokens import TokenBudget
+
+logger = logging.getLogger('app')
+
+GENERATE_PATH = '/v1/text/generate/'
+DETECT_PATH = '/v1/text/ai-detect-model/'
+
+
+class LatencyModel:
+    """
+    A latency distribution parsed from a spec string:
+
+        fixed:0.3            always 0.3 s
+        uniform:0.1,0.6      uniform between 0.1 and 0.6 s
+        lognormal:0.4,0.5    median 0.4 s, sigma 0.5 (long right tail)
+    """
+
+    def __init__(self, spec):
+        kind, _, args = spec.partition(':')
+        try:
+            values = [float(value) for value in args.split(',')] if args else []
+        except ValueError:
+            raise ValueError(f'Invalid latency spec: {spec}')
+        expected = {'fixed': 1, 'uniform': 2, 'lognormal': 2}
+        if expected.get(kind) != len(values):
+            raise ValueError(f'Invalid latency spec: {spec}')
+        self.kind = kind
+        self.values = values
+
+    def sample(self):
+        if self.kind == 'fixed':
+            return self.values[0]
+        if self.kind == 'uniform':
+            return random.uniform(*self.values)
+        median, sigma = self.values
+        return random.lognormvariate(math.log(median), sigma)
+
+
+def request_hash(path, payload):
+    """Hash a request for replay matching; streaming and non-streaming calls match."""
+    body = {key: value for key, value in payload.items() if key != 'stream'}
+    raw = json.dumps([path, body], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class StandIn:
+    """
+    Reply source for the stand-in server.
+
+    Args:
+        latency: LatencyModel for time to first token.
+        tokens_per_sec: Generation rate; 0 disables the per-token delay.
+        error_rate: Fraction of requests answered with ``error_status``.
+        error_status: HTTP status of injected errors.
+        slow_rate: Fraction of requests whose latency is multiplied by
+            ``slow_factor`` (tail-latency outliers).
+        slow_factor: Latency multiplier for slow requests.
+        record_path: Capture file written in record mode.
+        upstream: Base URL forwarded to in record mode.
+        upstream_key: API key for the upstream in record mode.
+        replay_path: Capture file read in replay mode.
+        latency_scale: Multiplier for replayed latencies.
+    """
+
+    def __init__(self, latency=None, tokens_per_sec=60.0, error_rate=0.0, error_status=503,
+                 slow_rate=0.0, slow_factor=10.0, record_path=None, upstream=None,
+                 upstream_key='', replay_path=None, latency_scale=1.0):
+        self.latency = latency or LatencyModel('lognormal:0.3,0.4')
+        self.tokens_per_sec = tokens_per_sec
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.slow_rate = slow_rate
+        self.slow_factor = slow_factor
+        self.record_path = record_path
+        self.upstream = upstream.rstrip('/') if upstream else None
+        self.upstream_key = upstream_key
+        self.latency_scale = latency_scale
+        self._record_lock = threading.Lock()
+        self._replay = {}
+        self._replay_cycles = {}
+        if replay_path:
+            self._load(replay_path)
+        if record_path and not self.upstream:
+            raise ValueError('Record mode needs an upstream URL.')
+
+    def reply(self, path, payload):
+        """
+        Return (status, body, delay) for a request.
+
+        ``delay`` is (ttfb, seconds per streamed token); the server sleeps
+        accordingly so callers see realistic timing.
+        """
+        if self._replay:
+            return self._replayed(path, payload)
+        if self.upstream:
+            return self._recorded(path, payload)
+        return self._synthetic(path, payload)
+
+    # Synthetic mode
+
+    def _synthetic(self, path, payload):
+        ttfb = self.latency.sample()
+        if self.slow_rate and random.random() < self.slow_rate:
+            ttfb *= self.slow_factor
+        if self.error_rate and random.random() < self.error_rate:
+            return self.error_status, {'error': 'Injected error'}, (ttfb, 0.0)
+        if path == DETECT_PATH:
+            score = round(random.uniform(5, 95), 1)
+            body = {'score': score, 'label': 'ai' if score >= 50 else 'human', 'chunks': [score]}
+            return 200, body, (ttfb, 0.0)
+        text = self._synthetic_text(payload)
+        per_token = 1.0 / self.tokens_per_sec if self.tokens_per_sec else 0.0
+        body = {'text': text, 'model': 'standin'}
+        n = payload.get('n') or 1
+        if n > 1:
+            body['texts'] = [text] + [f'{text} ({index})' for index in range(2, n + 1)]
+        return 200, body, (ttfb, per_token)
+
+    @staticmethod
+    def _synthetic_text(payload):
+        messages = payload.get('messages') or [{}]
+        prompt = messages[-1].get('content') or ''
+        if not isinstance(prompt, str):
+            prompt = json.dumps(prompt)
+        quoted = re.search(r'"""\n?(.*?)\n?"""', prompt, re.S)
+        text = quoted.group(1) if quoted else prompt
+        wants_json = 'JSON' in prompt or 'JSON' in (payload.get('system_prompt') or '')
+        if wants_json:
+            text = json.dumps({
+                'corrections': [],
+                'writing_scores': {'grammar': 90, 'fluency': 85, 'clarity': 88, 'engagement': 80, 'delivery': 84},
+                'tone': 'neutral',
+                'readability_score': 60.0,
+                'overall_score': 90,
+                'summary': 'No issues found.',
+                'error_counts': {},
+                'corrected_text': text,
+            })
+        return TokenBudget.truncate(text, payload.get('max_tokens') or 4096) or 'Ok.'
+
+    # Record mode
+
+    def _recorded(self, path, payload):
+        import requests
+
+        body = {key: value for key, value in payload.items() if key != 'stream'}
+        start = time.monotonic()
+        try:
+            resp = requests.post(
+                f'{self.upstream}{path}', json=body, timeout=(5, 120),
+                headers={'Authorization': f'Bearer {self.upstream_key}'},
+            )
+            status, reply = resp.status_code, resp.json()
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f'Stand-in upstream error: {e}')
+            status, reply = 502, {'error': 'Upstream unavailable'}
+        latency = time.monotonic() - start
+        entry = {
+            'path': path, 'hash': request_hash(path, payload), 'request': body,
+            'status': status, 'body': reply, 'latency': round(latency, 4),
+        }
+        with self._record_lock:
+            with open(self.record_path, 'a', encoding='utf-8') as capture:
+                capture.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        # Already waited for the real upstream
+        return status, reply, (0.0, 0.0)
+
+    # Replay mode
+
+    def _load(self, replay_path):
+        by_path = {}
+        with open(replay_path, encoding='utf-8') as capture:
+            for line in capture:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self._replay[(entry['path'], entry['hash'])] = entry
+                by_path.setdefault(entry['path'], []).append(entry)
+        self._replay_cycles = {path: itertools.cycle(entries) for path, entries in by_path.items()}
+
+    def _replayed(self, path, payload):
+        entry = self._replay.get((path, request_hash(path, payload)))
+        if entry is None:
+            cycle = self._replay_cycles.get(path)
+            if cycle is None:
+                return 404, {'error': 'No recorded traffic for this endpoint'}, (0.0, 0.0)
+            with self._record_lock:
+                entry = next(cycle)
+        return entry['status'], entry['body'], (entry['latency'] * self.latency_scale, 0.0)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    standin = None
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': 'Invalid JSON'})
+            return
+        if self.path not in (GENERATE_PATH, DETECT_PATH):
+            self._send_json(404, {'error': 'Not found'})
+            return
+
+        status, body, (ttfb, per_token) = self.standin.reply(self.path, payload)
+        if status == 200 and payload.get('stream') and self.path == GENERATE_PATH:
+            self._stream(body.get('text', ''), ttfb, per_token)
+            return
+        tokens = TokenBudget.estimate(body.get('text', '')) if isinstance(body, dict) else 0
+        time.sleep(ttfb + tokens * per_token)
+        self._send_json(status, body)
+
+    def _stream(self, text, ttfb, per_token):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        time.sleep(ttfb)
+        for word in re.findall(r'\S+\s*', text):
+            time.sleep(TokenBudget.estimate(word) * per_token)
+            self._chunk(f'data: {json.dumps({"text": word})}\n\n')
+        self._chunk('data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _chunk(self, data):
+        raw = data.encode('utf-8')
+        self.wfile.write(f'{len(raw):x}\r\n'.encode('ascii') + raw + b'\r\n')
+        self.wfile.flush()
+
+    def _send_json(self, status, body):
+        raw = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, format, *args):
+        logger.debug(f'llm_standin {self.address_string()} {format % args}')
+
+
+def make_server(standin, host='127.0.0.1', port=0):
+    """Return a ThreadingHTTPServer serving ``standin``; port 0 picks a free port."""
+    handler = type('StandInHandler', (_Handler,), {'standin': standin})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
@@ -0,0 +1,146 @@
+"""
+Token estimation and budgeting for LLM requests.
+
+Requests used to size ``max_tokens`` with fixed ceilings (4096 for a
+paraphrase, 8192 for a proofread) and trim context by characters or message
+count. An oversized ``max_tokens`` makes the upstream server reserve KV-cache
+for output that never comes, which lowers its batch throughput; character
+limits over- or under-fill the context window depending on the language.
+
+TokenBudget estimates token counts locally with a cheap tokenizer
+approximation, sizes ``max_tokens`` from the input and the task, and trims
+context to a token budget. Estimates are scaled per backend by
+LLM_TOKEN_CALIBRATION and, once enough Claude replies have reported their
+real usage, by the observed ratio of real to estimated tokens.
+"""
+import math
+import re
+import threading
+
+from django.conf import settings
+
+# Letter runs, digit runs, single non-ASCII characters and single symbols.
+# Whitespace is free: BPE vocabularies fold it into the following token.
+_PIECE_RE = re.compile(r'[A-Za-z]+|\d+|[^\x00-\x7f]|[^\sA-Za-z\d]')
+
+
+class TokenBudget:
+    """Local token estimates, max_tokens sizing and context trimming."""
+
+    # Output tokens per input token, by task
+    TASK_RATIOS = {
+        'rewrite': 1.3,
+        'expand': 2.5,
+        'shorten': 0.8,
+        'translate': 2.0,
+        'grammar_check': 1.5,  # Corrections JSON with quoted spans
+        'proofread': 2.6,  # Corrected document plus the corrections JSON
+        'summarize': 1.0,
+    }
+    MESSAGE_OVERHEAD = 4  # Role and separator tokens per chat message
+    OBSERVE_ALPHA = 0.05
+    OBSERVE_MIN_SAMPLES = 20
+
+    _observed = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def estimate(cls, text, backend='open_source'):
+        """Return the approximate number of tokens in ``text`` for ``backend``."""
+        if not text:
+            return 0
+        return math.ceil(cls._raw_estimate(text) * cls.calibration(backend))
+
+    @classmethod
+    def max_tokens_for(cls, text, task, ceiling, backend='open_source', floor=256):
+        """
+        Size ``max_tokens`` for a task whose output scales with its input.
+
+        Args:
+            text: The input the model will rewrite, translate, etc.
+            task: Key into TASK_RATIOS.
+            ceiling: Upper bound (the previous fixed value).
+            backend: Backend whose tokenizer the estimate is calibrated for.
+            floor: Lower bound, so short inputs still get room for a reply.
+
+        Returns:
+            Integer max_tokens between ``floor`` and ``ceiling``.
+        """
+        expected = cls.estimate(text, backend) * cls.TASK_RATIOS.get(task, 1.0)
+        headroom = getattr(settings, 'LLM_MAX_TOKENS_HEADROOM', 128)
+        return max(floor, min(ceiling, math.ceil(expected) + headroom))
+
+    @classmethod
+    def truncate(cls, text, budget, backend='open_source'):
+        """Return the longest prefix of ``text`` that fits in ``budget`` tokens."""
+        if cls.estimate(text, backend) <= budget:
+            return text
+        raw_budget = budget / cls.calibration(backend)
+        used = 0
+        for match in _PIECE_RE.finditer(text):
+            used += cls._piece_cost(match.group())
+            if used > raw_budget:
+                return text[:match.start()].rstrip()
+        return text
+
+    @classmethod
+    def trim_messages(cls, messages, budget, backend='open_source'):
+        """
+        Keep the newest messages that fit in ``budget`` tokens.
+
+        The last message is always kept. Leading assistant messages are
+        dropped so the conversation still opens with a user turn.
+        """
+        kept = []
+        used = 0
+        for message in reversed(messages):
+            cost = cls.estimate(message.get('content', ''), backend) + cls.MESSAGE_OVERHEAD
+            if kept and used + cost > budget:
+                break
+            kept.append(message)
+            used += cost
+        kept.reverse()
+        while len(kept) > 1 and kept[0].get('role') == 'assistant':
+            kept.pop(0)
+        return kept
+
+    @classmethod
+    def observe(cls, backend, text, actual_tokens):
+        """Record the real token count a backend reported for ``text``."""
+        if not isinstance(actual_tokens, int) or actual_tokens <= 0 or not text:
+            return
+        ratio = actual_tokens / max(1, cls._raw_estimate(text))
+        with cls._lock:
+            samples, current = cls._observed.get(backend, (0, ratio))
+            cls._observed[backend] = (
+                samples + 1,
+                current + cls.OBSERVE_ALPHA * (ratio - current),
+            )
+
+    @classmethod
+    def calibration(cls, backend):
+        """Return the factor applied to raw estimates for ``backend``."""
+        samples, ratio = cls._observed.get(backend, (0, None))
+        if samples >= cls.OBSERVE_MIN_SAMPLES:
+            return min(2.0, max(0.5, ratio))
+        return getattr(settings, 'LLM_TOKEN_CALIBRATION', {}).get(backend, 1.0)
+
+    @classmethod
+    def reset(cls):
+        """Forget observed calibration (used by tests)."""
+        with cls._lock:
+            cls._observed.clear()
+
+    @classmethod
+    def _raw_estimate(cls, text):
+        return sum(cls._piece_cost(piece) for piece in _PIECE_RE.findall(text))
+
+    @staticmethod
+    def _piece_cost(piece):
+        if piece.isascii():
+            if piece.isalpha():
+                # Common words are one token; long words split every ~7 chars
+                return max(1, (len(piece) + 5) // 7)
+            if piece.isdigit():
+                return (len(piece) + 2) // 3
+        return 1
@@ -0,0 +1,541 @@
+"""
+Pooled HTTP transport for LLM backends.
+
+Every LLMClient call used to go through the module-level ``requests.post``,
+which opens a fresh TCP + TLS connection per request. This module keeps one
+``requests.Session`` per backend per process, with a sized urllib3 pool,
+keep-alive, and retries with backoff on connection errors only (a POST that
+reached the server is never replayed).
+
+Sessions are keyed by PID so gunicorn workers forked after the first call
+never share sockets with their parent.
+
+Claude calls go through one long-lived ``anthropic.Anthropic`` client per
+process and API key (get_anthropic()), so its httpx pool and TLS sessions
+are reused instead of being rebuilt for every call. Pool size, timeouts and
+SDK retries come from the LLM_ANTHROPIC_* settings.
+
+Async views use the httpx/AsyncAnthropic counterparts below. Async clients
+are bound to the event loop that created them; under ASGI they are pooled
+per (PID, loop, backend), otherwise each call gets its own client.
+
+run_concurrently() fans independent calls out over a shared thread pool,
+capped per batch and per backend, and optionally per user (user_slot()).
+
+Connection setup time, time to first byte and batch queue wait are reported
+to the current LLMMetrics call.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from core.llm_metrics import LLMMetrics
+
+logger = logging.getLogger('app')
+
+_sessions = {}
+_counters = {}
+_anthropic_clients = {}
+_lock = threading.Lock()
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.monotonic()
+        try:
+            super().connect()
+        finally:
+            LLMMetrics.note(connect=time.monotonic() - start)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        start = time.monotonic()
+        try:
+            super().connect()
+        finally:
+            LLMMetrics.note(connect=time.monotonic() - start)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+def _build_session():
+    pool_size = getattr(settings, 'LLM_HTTP_POOL_SIZE', 20)
+    retry = Retry(
+        total=getattr(settings, 'LLM_HTTP_RETRIES', 2),
+        connect=getattr(settings, 'LLM_HTTP_RETRIES', 2),
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=getattr(settings, 'LLM_HTTP_BACKOFF', 0.2),
+        allowed_methods=None,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+        pool_block=False,
+    )
+    adapter.poolmanager.pool_classes_by_scheme = {
+        'http': _TimedHTTPConnectionPool,
+        'https': _TimedHTTPSConnectionPool,
+    }
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Connection': 'keep-alive'})
+    return session
+
+
+def get_session(backend='open_source'):
+    """
+    Return the process-wide pooled session for a backend.
+
+    Args:
+        backend: Backend name, e.g. 'open_source' or 'detector'.
+
+    Returns:
+        requests.Session shared by every caller in this process.
+    """
+    key = (os.getpid(), backend)
+    session = _sessions.get(key)
+    if session is not None:
+        return session
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            # Drop sessions inherited from a parent process after fork
+            for stale in [k for k in _sessions if k[0] != key[0]]:
+                _sessions.pop(stale, None)
+                _counters.pop(stale, None)
+            session = _build_session()
+            _sessions[key] = session
+            _counters[key] = {'requests': 0, 'errors': 0}
+        return session
+
+
+def post(backend, url, **kwargs):
+    """
+    POST through the pooled session for ``backend`` and count the outcome.
+
+    Raises the same ``requests`` exceptions as ``requests.post``.
+    """
+    session = get_session(backend)
+    counters = _counters.get((os.getpid(), backend))
+    try:
+        resp = session.post(url, **kwargs)
+    except requests.exceptions.RequestException:
+        if counters is not None:
+            counters['errors'] += 1
+        raise
+    if counters is not None:
+        counters['requests'] += 1
+    # requests stops the clock once the response headers are parsed
+    elapsed = getattr(resp, 'elapsed', None)
+    if elapsed is not None and hasattr(elapsed, 'total_seconds'):
+        LLMMetrics.note(ttfb=elapsed.total_seconds())
+    return resp
+
+
+def pool_stats():
+    """
+    Return connection pool statistics for this process, keyed by backend.
+
+    Each entry reports the configured pool size, how many connections
+    urllib3 has opened, how many are idle in the pool right now, and
+    request/error counts. Use it to size gunicorn workers against
+    LLM_HTTP_POOL_SIZE.
+    """
+    pid = os.getpid()
+    stats = {}
+    for (owner, backend), session in list(_sessions.items()):
+        if owner != pid:
+            continue
+        adapter = session.get_adapter('https://')
+        opened = 0
+        idle = 0
+        served = 0
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            served += pool.num_requests
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        counters = _counters.get((owner, backend), {})
+        stats[backend] = {
+            'pid': pid,
+            'pool_size': adapter._pool_maxsize,
+            'connections_opened': opened,
+            'connections_idle': idle,
+            'pool_requests': served,
+            'requests': counters.get('requests', 0),
+            'errors': counters.get('errors', 0),
+        }
+    return stats
+
+
+def reset():
+    """Close and forget all pooled sessions and clients (used by tests and on shutdown)."""
+    with _lock:
+        for session in list(_sessions.values()) + list(_anthropic_clients.values()):
+            try:
+                session.close()
+            except Exception as e:
+                logger.warning(f'Error closing LLM session: {e}')
+        _sessions.clear()
+        _counters.clear()
+        _anthropic_clients.clear()
+        _async_clients.clear()
+
+
+# ----------------------------------------------------------------------
+# Anthropic SDK clients
+# ----------------------------------------------------------------------
+
+def _anthropic_options(pool_size, async_client=False):
+    """Constructor arguments for an Anthropic client with a sized connection pool."""
+    import anthropic
+    from anthropic._constants import DEFAULT_CONNECTION_LIMITS
+
+    timeout = anthropic.Timeout(
+        getattr(settings, 'LLM_ANTHROPIC_TIMEOUT', 120),
+        connect=getattr(settings, 'LLM_ANTHROPIC_CONNECT_TIMEOUT', 5),
+    )
+    # Built from the SDK's own Limits class: its httpx may not be ours
+    limits = type(DEFAULT_CONNECTION_LIMITS)(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=getattr(settings, 'LLM_ANTHROPIC_KEEPALIVE', 30),
+    )
+    http_client_class = anthropic.DefaultAsyncHttpxClient if async_client else anthropic.DefaultHttpxClient
+    return {
+        'api_key': settings.ANTHROPIC_API_KEY,
+        'timeout': timeout,
+        'max_retries': getattr(settings, 'LLM_ANTHROPIC_MAX_RETRIES', 2),
+        'http_client': http_client_class(timeout=timeout, limits=limits),
+    }
+
+
+def get_anthropic():
+    """
+    Return the process-wide ``anthropic.Anthropic`` client.
+
+    One client is kept per process and API key; like the pooled sessions,
+    clients inherited from a parent process after fork are dropped. The
+    client is thread-safe, so every caller in the process shares its
+    connection pool (LLM_ANTHROPIC_POOL_SIZE connections).
+    """
+    import anthropic
+
+    key = (os.getpid(), settings.ANTHROPIC_API_KEY)
+    client = _anthropic_clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _anthropic_clients.get(key)
+        if client is None:
+            for stale in [k for k in _anthropic_clients if k[0] != key[0]]:
+                _anthropic_clients.pop(stale, None)
+            client = anthropic.Anthropic(**_anthropic_options(getattr(settings, 'LLM_ANTHROPIC_POOL_SIZE', 20)))
+            _anthropic_clients[key] = client
+        return client
+
+
+# ----------------------------------------------------------------------
+# Bounded concurrent calls
+# ----------------------------------------------------------------------
+
+_executors = {}
+_backend_slots = {}
+_user_slots = weakref.WeakValueDictionary()
+_batch_local = threading.local()
+
+
+def get_executor():
+    """Return this process's shared thread pool for concurrent LLM calls."""
+    pid = os.getpid()
+    executor = _executors.get(pid)
+    if executor is not None:
+        return executor
+    with _lock:
+        executor = _executors.get(pid)
+        if executor is None:
+            _executors.clear()
+            executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'LLM_BATCH_POOL_SIZE', 32),
+                thread_name_prefix='llm-batch',
+            )
+            _executors[pid] = executor
+        return executor
+
+
+def backend_slot(backend):
+    """
+    Return the process-wide semaphore capping concurrent batch calls to a backend.
+
+    Limits come from LLM_BACKEND_CONCURRENCY, e.g. {'open_source': 16, 'claude': 8};
+    unlisted backends get 8.
+    """
+    key = (os.getpid(), backend)
+    slot = _backend_slots.get(key)
+    if slot is not None:
+        return slot
+    with _lock:
+        slot = _backend_slots.get(key)
+        if slot is None:
+            for stale in [k for k in _backend_slots if k[0] != key[0]]:
+                _backend_slots.pop(stale, None)
+            limit = getattr(settings, 'LLM_BACKEND_CONCURRENCY', {}).get(backend, 8)
+            slot = threading.BoundedSemaphore(max(1, limit))
+            _backend_slots[key] = slot
+        return slot
+
+
+def user_slot(user):
+    """
+    Return the process-wide semaphore capping one user's concurrent batch calls.
+
+    Batches of the same user (e.g. two long documents paraphrased at once)
+    share LLM_USER_CONCURRENCY calls in flight. A slot is dropped once no
+    batch holds it.
+    """
+    key = (os.getpid(), str(user))
+    with _lock:
+        slot = _user_slots.get(key)
+        if slot is None:
+            slot = threading.BoundedSemaphore(max(1, getattr(settings, 'LLM_USER_CONCURRENCY', 4)))
+            _user_slots[key] = slot
+        return slot
+
+
+def queue_wait():
+    """Seconds the current batch call waited for a pool thread and backend slot."""
+    return getattr(_batch_local, 'queue_wait', 0.0)
+
+
+def _run_call(backend, fn, queued_at=None):
+    nested = getattr(_batch_local, 'active', False)
+    queued_at = queued_at or time.monotonic()
+    _batch_local.active = True
+    try:
+        if nested:
+            # The enclosing batch call already holds a backend slot
+            return fn()
+        with backend_slot(backend):
+            _batch_local.queue_wait = time.monotonic() - queued_at
+            return fn()
+    except Exception as e:
+        logger.error(f'Concurrent LLM call failed ({backend}): {e}')
+        return None, 'An unexpected error occurred. Please try again.'
+    finally:
+        _batch_local.active = nested
+        if not nested:
+            _batch_local.queue_wait = 0.0
+
+
+def run_concurrently(calls, max_concurrency=None, slot=None):
+    """
+    Run independent LLM calls on the shared pool and return results in order.
+
+    Args:
+        calls: List of (backend, fn) pairs; each fn takes no arguments and
+            returns a (result, error) tuple.
+        max_concurrency: Max calls of this batch in flight at once
+            (default LLM_BATCH_MAX_CONCURRENCY). Backend caps still apply.
+        slot: Optional semaphore each call holds while it runs, shared with
+            other batches (see user_slot()).
+
+    Returns:
+        List of (result, error) tuples, one per call, in input order. A call
+        that raises yields (None, error) instead of failing the batch.
+    """
+    results = [None] * len(calls)
+    for index, result in iter_concurrently(calls, max_concurrency, slot):
+        results[index] = result
+    return results
+
+
+def iter_concurrently(calls, max_concurrency=None, slot=None):
+    """
+    Like run_concurrently(), but yield (index, result) pairs as calls finish.
+
+    With a ``slot``, a call is only started once it gets the slot; while
+    calls of this batch are in flight, a taken slot waits for one of them
+    to finish instead of blocking.
+    """
+    if max_concurrency is None:
+        max_concurrency = getattr(settings, 'LLM_BATCH_MAX_CONCURRENCY', 8)
+    max_concurrency = max(1, max_concurrency)
+    if slot is not None:
+        calls = [(backend, _holding(slot, fn)) for backend, fn in calls]
+
+    # Run inline for trivial batches, and from inside a pool thread so a
+    # nested batch cannot starve the pool it is running on
+    if len(calls) <= 1 or max_concurrency == 1 or getattr(_batch_local, 'active', False):
+        for index, (backend, fn) in enumerate(calls):
+            if slot is not None:
+                slot.acquire()
+            yield index, _run_call(backend, fn)
+        return
+
+    executor = get_executor()
+    pending = {}
+    queue = deque(enumerate(calls))
+
+    def submit_ready():
+        while queue and len(pending) < max_concurrency:
+            if slot is not None and not slot.acquire(blocking=not pending):
+                return
+            index, (backend, fn) = queue.popleft()
+            pending[executor.submit(_run_call, backend, fn, time.monotonic())] = index
+
+    submit_ready()
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future.result()
+        submit_ready()
+
+
+def _holding(slot, fn):
+    """Wrap ``fn`` to release ``slot`` (acquired by the submitter) when it returns."""
+    def call():
+        try:
+            return fn()
+        finally:
+            slot.release()
+    return call
+
+
+# ----------------------------------------------------------------------
+# Async transport (ASGI)
+# ----------------------------------------------------------------------
+
+_async_clients = {}
+
+
+def _pool_async_clients():
+    """
+    Async clients are pooled per loop only under an ASGI server
+    (LLM_ASYNC_VIEWS), whose loop lives as long as the worker. Elsewhere
+    async_to_sync runs each call on a fresh loop that it then closes.
+    """
+    return getattr(settings, 'LLM_ASYNC_VIEWS', False)
+
+
+@asynccontextmanager
+async def _loop_client(backend, factory):
+    """
+    Yield the client for ``backend`` on the running loop, creating it with
+    ``factory`` if needed.
+
+    Without per-loop pooling the client lives for one call and is closed
+    before its loop goes away, so no connection pool outlives it. Pooled
+    clients of closed loops (worker shutdown, fork) are dropped on the way.
+    """
+    if not _pool_async_clients():
+        client = factory()
+        try:
+            yield client
+        finally:
+            await _aclose(client)
+        return
+
+    loop = asyncio.get_running_loop()
+    key = (os.getpid(), id(loop), backend)
+    entry = _async_clients.get(key)
+    if entry is None or entry[0] is not loop:
+        for stale, (stale_loop, _) in list(_async_clients.items()):
+            if stale_loop.is_closed() or stale[0] != key[0]:
+                _async_clients.pop(stale, None)
+        entry = (loop, factory())
+        _async_clients[key] = entry
+    yield entry[1]
+
+
+async def _aclose(client):
+    """Close an httpx.AsyncClient or AsyncAnthropic client, logging failures."""
+    try:
+        close = getattr(client, 'aclose', None) or client.close
+        await close()
+    except Exception as e:
+        logger.warning(f'Error closing async LLM client: {e}')
+
+
+def async_client(backend='open_source'):
+    """
+    Async context manager yielding the ``httpx.AsyncClient`` for a backend
+    on the running loop.
+
+    Connection errors are retried LLM_HTTP_RETRIES times by the transport;
+    requests that reached the server are never replayed.
+    """
+    import httpx
+
+    def factory():
+        pool_size = getattr(settings, 'LLM_ASYNC_POOL_SIZE', 200)
+        return httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(
+                retries=getattr(settings, 'LLM_HTTP_RETRIES', 2),
+                limits=httpx.Limits(
+                    max_connections=pool_size,
+                    max_keepalive_connections=pool_size,
+                ),
+            ),
+        )
+
+    return _loop_client(backend, factory)
+
+
+async def apost(backend, url, **kwargs):
+    """Async POST through the client for ``backend``."""
+    start = time.monotonic()
+    connect_started = []
+
+    async def trace(event, info):
+        if event == 'connection.connect_tcp.started':
+            connect_started.append(time.monotonic())
+        elif event in ('connection.connect_tcp.complete', 'connection.start_tls.complete'):
+            if connect_started:
+                LLMMetrics.note(connect=time.monotonic() - connect_started.pop())
+                if event == 'connection.connect_tcp.complete':
+                    connect_started.append(time.monotonic())
+        elif event.endswith('.receive_response_headers.complete'):
+            LLMMetrics.note(ttfb=time.monotonic() - start)
+
+    kwargs.setdefault('extensions', {})['trace'] = trace
+    async with async_client(backend) as client:
+        return await client.post(url, **kwargs)
+
+
+def async_anthropic():
+    """Async context manager yielding the ``anthropic.AsyncAnthropic`` client for the running loop."""
+    import anthropic
+
+    return _loop_client(
+        'claude',
+        lambda: anthropic.AsyncAnthropic(
+            **_anthropic_options(getattr(settings, 'LLM_ASYNC_POOL_SIZE', 200), async_client=True)
+        ),
+    )
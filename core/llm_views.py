@@ -0,0 +1,115 @@
+"""
+Base views for API endpoints whose work is a single LLM-bound service call.
+
+An LLMAPIView splits its POST handler into four steps:
+
+    validate(request)                -> (params, error_response)
+    call(params) / acall(params)     -> (result, error)
+    respond(request, params, result) -> Response
+    error_response(error)            -> Response
+
+The sync post() runs them in order under WSGI. AsyncLLMAPIView runs the same
+steps from an async view: DRF authentication, throttling and validation run
+in a worker thread, and only the upstream call is awaited. Under ASGI a
+single process can then hold hundreds of slow LLM calls in flight.
+
+URLconfs route through llm_api_view(), which picks the async view when
+LLM_ASYNC_VIEWS is enabled (i.e. the site is served by an ASGI server).
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+class LLMAPIView(APIView):
+    """DRF view built from validate/call/respond steps. See module docstring."""
+
+    def validate(self, request):
+        """Return (params, None) or (None, error Response)."""
+        raise NotImplementedError
+
+    def call(self, params):
+        """Run the service call. Returns (result, error)."""
+        raise NotImplementedError
+
+    async def acall(self, params):
+        """Async counterpart of call()."""
+        raise NotImplementedError
+
+    def respond(self, request, params, result):
+        """Build the success response (and record history/usage)."""
+        return Response(result)
+
+    def error_response(self, error):
+        """Build the response for a service error."""
+        return Response(
+            {'error': error},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    def post(self, request):
+        params, error_response = self.validate(request)
+        if error_response:
+            return error_response
+
+        result, error = self.call(params)
+        if error:
+            return self.error_response(error)
+
+        return self.respond(request, params, result)
+
+
+class AsyncLLMAPIView(View):
+    """
+    Async POST view that drives an LLMAPIView subclass.
+
+    Everything DRF normally does (parsing, authentication, permissions,
+    throttling, exception handling, rendering) still runs, but in a worker
+    thread; only ``acall()`` runs on the event loop.
+    """
+
+    api_view_class = None
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # APIView views are CSRF-exempt; SessionAuthentication enforces it
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def post(self, request, *args, **kwargs):
+        api_view = self.api_view_class()
+        api_view.args = args
+        api_view.kwargs = kwargs
+        drf_request = api_view.initialize_request(request, *args, **kwargs)
+        api_view.request = drf_request
+        api_view.headers = api_view.default_response_headers
+
+        try:
+            await sync_to_async(api_view.initial)(drf_request, *args, **kwargs)
+            params, response = await sync_to_async(api_view.validate)(drf_request)
+            if response is None:
+                result, error = await api_view.acall(params)
+                if error:
+                    response = api_view.error_response(error)
+                else:
+                    response = await sync_to_async(api_view.respond)(drf_request, params, result)
+        except Exception as exc:
+            response = api_view.handle_exception(exc)
+
+        response = api_view.finalize_response(drf_request, response, *args, **kwargs)
+        if isinstance(response, Response):
+            response = await sync_to_async(response.render)()
+        return response
+
+
+def llm_api_view(api_view_class):
+    """
+    Return the view callable for an LLMAPIView, async when LLM_ASYNC_VIEWS is set.
+    """
+    if getattr(settings, 'LLM_ASYNC_VIEWS', False):
+        return AsyncLLMAPIView.as_view(api_view_class=api_view_class)
+    return api_view_class.as_view()
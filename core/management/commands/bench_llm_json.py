@@ -0,0 +1,140 @@
+"""
+Micro-benchmark for core.llm_json against realistic (and malformed) LLM replies.
+Usage: python manage.py bench_llm_json [--number 200] [--chunk 16]
+
+Compares extract_json() with the previous regex + character-loop
+implementation, and times IncrementalJSONParser fed in stream-sized chunks.
+"""
+import json
+import re
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from core.llm_json import IncrementalJSONParser, extract_json
+
+
+def legacy_extract_json(text):
+    """The pre-rewrite extract_json, kept here as the benchmark baseline."""
+    if not text or not text.strip():
+        raise ValueError('Empty response')
+    s = text.strip()
+    fence_match = re.search(r'```(?:json)?\s*\n([\s\S]*?)```', s)
+    if fence_match:
+        s = fence_match.group(1).strip()
+    try:
+        return json.loads(s)
+    except json.JSONDecodeError:
+        pass
+    for open_ch, close_ch in [('{', '}'), ('[', ']')]:
+        start = s.find(open_ch)
+        if start == -1:
+            continue
+        depth = 0
+        in_string = False
+        escape = False
+        end = -1
+        for i in range(start, len(s)):
+            c = s[i]
+            if escape:
+                escape = False
+                continue
+            if c == '\\' and in_string:
+                escape = True
+                continue
+            if c == '"' and not escape:
+                in_string = not in_string
+                continue
+            if in_string:
+                continue
+            if c == open_ch:
+                depth += 1
+            elif c == close_ch:
+                depth -= 1
+                if depth == 0:
+                    end = i
+                    break
+        if end != -1:
+            try:
+                return json.loads(s[start:end + 1])
+            except json.JSONDecodeError:
+                pass
+    raise ValueError('No valid JSON found in response')
+
+
+def proofread_reply(corrections):
+    """A proofreader reply with ``corrections`` entries (~8k tokens at 150)."""
+    return json.dumps({
+        'overall_score': 72,
+        'error_counts': {'grammar': corrections // 2, 'spelling': corrections // 2},
+        'corrections': [
+            {
+                'original': f'teh {{draft}} number {i}',
+                'suggestion': f'the "draft" number {i}',
+                'type': 'spelling',
+                'explanation': 'Common misspelling; braces {like these} and \\"quotes\\" must not confuse the parser.',
+                'position': {'start': i * 40, 'end': i * 40 + 3},
+            }
+            for i in range(corrections)
+        ],
+        'corrected_text': 'The draft paragraph, corrected. ' * corrections * 4,
+    }, indent=2)
+
+
+def corpus():
+    """Name -> reply text, covering the shapes seen in production."""
+    small = json.dumps({'paragraph': 'A short summary of the text.', 'score': 81})
+    large = proofread_reply(150)
+    return {
+        'clean_small': small,
+        'clean_proofread_8k': large,
+        'fenced_small': f'```json\n{small}\n```',
+        'fenced_proofread_8k': f'```json\n{large}\n```',
+        'preamble_and_note': f'Here is the analysis you asked for:\n\n{small}\n\nLet me know if you need more.',
+        'preamble_proofread_8k': f'Sure! Below is the proofread document.\n{large}\nI fixed every issue I found.',
+        'braces_in_preamble': f'Scores use the {{0-100}} scale as requested:\n{small}',
+        'bare_number': '72',
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark JSON extraction on realistic LLM replies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=200, help='Calls per case')
+        parser.add_argument('--chunk', type=int, default=16, help='Characters per streamed chunk')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        chunk = options['chunk']
+
+        self.stdout.write(f'{"case":<24}{"bytes":>8}{"legacy us":>12}{"new us":>10}{"speedup":>9}')
+        for name, text in corpus().items():
+            new = min(timeit.repeat(lambda: extract_json(text), number=number, repeat=3)) / number
+            try:
+                if legacy_extract_json(text) != extract_json(text):
+                    self.stderr.write(f'{name}: results differ from the legacy implementation')
+            except ValueError:
+                self.stdout.write(f'{name:<24}{len(text):>8}{"fails":>12}{new * 1e6:>10.1f}{"":>9}')
+                continue
+            legacy = min(timeit.repeat(lambda: legacy_extract_json(text), number=number, repeat=3)) / number
+            self.stdout.write(
+                f'{name:<24}{len(text):>8}{legacy * 1e6:>12.1f}{new * 1e6:>10.1f}{legacy / new:>8.1f}x'
+            )
+
+        text = f'```json\n{proofread_reply(150)}\n```'
+        chunks = [text[i:i + chunk] for i in range(0, len(text), chunk)]
+
+        def stream():
+            parser = IncrementalJSONParser('corrections')
+            count = 0
+            for piece in chunks:
+                count += len(parser.feed(piece))
+            return count
+
+        emitted = stream()
+        seconds = min(timeit.repeat(stream, number=max(1, number // 10), repeat=3)) / max(1, number // 10)
+        self.stdout.write(
+            f'\nincremental, {len(chunks)} chunks of {chunk} chars: '
+            f'{seconds * 1e3:.2f} ms per reply, {emitted} corrections emitted'
+        )
@@ -0,0 +1,62 @@
+"""
+Run the local GPU-server stand-in (see core.llm_standin).
+Usage:
+    python manage.py llm_standin [--port 8765] [--latency lognormal:0.3,0.4] [--tokens-per-sec 60]
+                                 [--error-rate 0.01] [--slow-rate 0.01]
+    python manage.py llm_standin --record capture.jsonl --upstream https://api.writingbot.ai
+    python manage.py llm_standin --replay capture.jsonl [--latency-scale 1.0]
+
+Point WRITINGBOT_API_URL at http://127.0.0.1:<port> to use it.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.llm_standin import LatencyModel, StandIn, make_server
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in for the GPU server (synthetic, record or replay mode)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', default='lognormal:0.3,0.4',
+                            help='Time to first token: fixed:S, uniform:A,B or lognormal:MEDIAN,SIGMA')
+        parser.add_argument('--tokens-per-sec', type=float, default=60.0, help='Generation rate; 0 for instant')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail')
+        parser.add_argument('--error-status', type=int, default=503, help='HTTP status of injected errors')
+        parser.add_argument('--slow-rate', type=float, default=0.0, help='Fraction of requests that are slow')
+        parser.add_argument('--slow-factor', type=float, default=10.0, help='Latency multiplier for slow requests')
+        parser.add_argument('--record', help='Forward to --upstream and append each exchange to this JSONL file')
+        parser.add_argument('--upstream', help='Real GPU server base URL for --record')
+        parser.add_argument('--replay', help='Serve replies from this capture file')
+        parser.add_argument('--latency-scale', type=float, default=1.0, help='Multiplier for replayed latencies')
+
+    def handle(self, *args, **options):
+        try:
+            standin = StandIn(
+                latency=LatencyModel(options['latency']),
+                tokens_per_sec=options['tokens_per_sec'],
+                error_rate=options['error_rate'],
+                error_status=options['error_status'],
+                slow_rate=options['slow_rate'],
+                slow_factor=options['slow_factor'],
+                record_path=options['record'],
+                upstream=options['upstream'],
+                upstream_key=getattr(settings, 'WRITINGBOT_API_KEY', ''),
+                replay_path=options['replay'],
+                latency_scale=options['latency_scale'],
+            )
+        except (ValueError, OSError) as e:
+            raise CommandError(str(e))
+
+        server = make_server(standin, options['host'], options['port'])
+        host, port = server.server_address[:2]
+        mode = 'replay' if options['replay'] else 'record' if options['record'] else 'synthetic'
+        self.stdout.write(f'LLM stand-in ({mode}) listening on http://{host}:{port}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
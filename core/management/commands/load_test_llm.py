@@ -0,0 +1,153 @@
+"""
+Load-test the main LLM-backed API views end to end against the GPU-server stand-in.
+Usage:
+    python manage.py load_test_llm [--endpoints paraphrase,grammar] [--requests 100] [--concurrency 16]
+                                   [--latency lognormal:0.3,0.4] [--tokens-per-sec 60] [--error-rate 0.01]
+                                   [--replay capture.jsonl] [--standin http://127.0.0.1:8765] [--mixed]
+
+Requests go through the full Django stack (middleware, DRF, services,
+LLMClient, the HTTP pool) with the test client; only the GPU server is
+replaced. Without --standin a stand-in is started in-process with the given
+latency model or capture. Reports requests/sec and latency percentiles per
+endpoint: the baseline to compare every performance change against.
+
+Views write history rows, so run it against a development database.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from core.llm_standin import LatencyModel, StandIn, make_server
+
+SAMPLE_TEXT = (
+    'Remote work has changed how teams communicate and plan their days. Many companies now rely on '
+    'written updates instead of meetings, which gives people more time for focused work but also '
+    'makes clear writing a core skill. Managers report that projects move faster when decisions are '
+    'documented, yet new employees sometimes feel isolated without casual conversations. To balance '
+    'these effects, several organizations schedule regular video calls, shared online workshops and '
+    'optional office days. Research on the topic is still developing, and the long term impact on '
+    'productivity, wellbeing and company culture will depend on how carefully these practices are '
+    'designed, measured and adjusted over time by the people involved.'
+)
+
+# Endpoint name -> (URL name, request body factory)
+SCENARIOS = {
+    'paraphrase': ('paraphrase_api', lambda text: {'text': text, 'mode': 'standard'}),
+    'grammar': ('grammar_check_api', lambda text: {'text': text}),
+    'summarize': ('summarize_api', lambda text: {'text': text}),
+    'translate': ('translate_api', lambda text: {'text': text, 'target_lang': 'es'}),
+    'humanize': ('humanize_api', lambda text: {'text': text}),
+    'ai_detect': ('ai_detect_api', lambda text: {'text': text}),
+}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Drive the main LLM API views through a GPU-server stand-in and report throughput and latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', default=','.join(SCENARIOS),
+                            help=f'Comma-separated subset of: {", ".join(SCENARIOS)}')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--mixed', action='store_true',
+                            help='Interleave all endpoints in one run instead of one run per endpoint')
+        parser.add_argument('--standin', help='Use a running stand-in at this URL instead of starting one')
+        parser.add_argument('--latency', default='lognormal:0.3,0.4', help='Stand-in time to first token')
+        parser.add_argument('--tokens-per-sec', type=float, default=60.0, help='Stand-in generation rate')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Stand-in injected error rate')
+        parser.add_argument('--replay', help='Start the stand-in in replay mode from this capture')
+
+    def handle(self, *args, **options):
+        endpoints = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = [name for name in endpoints if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f'Unknown endpoints: {", ".join(unknown)}')
+
+        server = None
+        url = options['standin']
+        if not url:
+            try:
+                standin = StandIn(
+                    latency=LatencyModel(options['latency']),
+                    tokens_per_sec=options['tokens_per_sec'],
+                    error_rate=options['error_rate'],
+                    replay_path=options['replay'],
+                )
+            except (ValueError, OSError) as e:
+                raise CommandError(str(e))
+            server = make_server(standin)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f'http://127.0.0.1:{server.server_address[1]}'
+
+        with override_settings(WRITINGBOT_API_URL=url, ANTHROPIC_API_KEY='', ALLOWED_HOSTS=['*']):
+            try:
+                self.stdout.write(f'Stand-in: {url}, {options["concurrency"]} clients, '
+                                  f'{options["requests"]} requests per endpoint')
+                self.stdout.write(
+                    f'{"endpoint":<12}{"reqs":>6}{"errors":>8}{"req/s":>8}'
+                    f'{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"max ms":>9}'
+                )
+                if options['mixed']:
+                    jobs = [(name, i) for name in endpoints for i in range(options['requests'])]
+                    random.shuffle(jobs)
+                    self._report(self._run(jobs, options['concurrency']))
+                else:
+                    for name in endpoints:
+                        jobs = [(name, i) for i in range(options['requests'])]
+                        self._report(self._run(jobs, options['concurrency']))
+            finally:
+                if server:
+                    server.shutdown()
+                    server.server_close()
+
+    def _run(self, jobs, concurrency):
+        """Run (endpoint, index) jobs; return {endpoint: (latencies, statuses, elapsed)}."""
+        local = threading.local()
+        results = {}
+        lock = threading.Lock()
+
+        def request(job):
+            name, index = job
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = Client()
+            url_name, body = SCENARIOS[name]
+            start = time.monotonic()
+            # Distinct texts so the response cache and single-flight cannot answer
+            response = client.post(
+                reverse(url_name), body(f'{SAMPLE_TEXT} (Sample {index}.)'), content_type='application/json',
+            )
+            elapsed = time.monotonic() - start
+            with lock:
+                latencies, statuses = results.setdefault(name, ([], []))
+                latencies.append(elapsed)
+                statuses.append(response.status_code)
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            list(executor.map(request, jobs))
+        elapsed = time.monotonic() - start
+        return {name: (latencies, statuses, elapsed) for name, (latencies, statuses) in results.items()}
+
+    def _report(self, results):
+        for name, (latencies, statuses, elapsed) in results.items():
+            errors = sum(1 for status in statuses if status >= 400)
+            self.stdout.write(
+                f'{name:<12}{len(latencies):>6}{errors:>8}{len(latencies) / elapsed:>8.1f}'
+                + ''.join(f'{percentile(latencies, pct) * 1e3:>9.0f}' for pct in (50, 95, 99, 100))
+            )
+            failed = sorted({status for status in statuses if status >= 400})
+            if failed:
+                self.stdout.write(f'{"":<12}error statuses: {", ".join(map(str, failed))}')
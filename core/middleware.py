@@ -0,0 +1,54 @@
+"""
+Middleware for the LLM layer.
+
+LLMAdmissionMiddleware reports shed calls to the client. Services turn LLM
+errors into their own error responses (usually 400 or 500); when the error
+was the admission layer shedding the call (or the outbound rate limiter
+refusing it), the client should back off and retry instead, so the response
+is replaced with a 429 carrying Retry-After.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import JsonResponse
+
+from core.llm_admission import ADMISSION_ERROR, LLMAdmission
+
+
+class LLMAdmissionMiddleware:
+    """Turn failed responses of requests whose LLM call was shed into 429s."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = LLMAdmission.begin_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            shed = LLMAdmission.end_request(token)
+        return self._finish(response, shed)
+
+    async def __acall__(self, request):
+        token = LLMAdmission.begin_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            shed = LLMAdmission.end_request(token)
+        return self._finish(response, shed)
+
+    @staticmethod
+    def _finish(response, shed):
+        # Views that recovered from the shed call (e.g. partial bulk results)
+        # answer with a success status and are left alone
+        if not shed or response.status_code < 400 or response.streaming:
+            return response
+        overloaded = JsonResponse({'error': ADMISSION_ERROR, 'overloaded': True}, status=429)
+        overloaded['Retry-After'] = str(getattr(settings, 'LLM_ADMISSION_RETRY_AFTER', 2))
+        return overloaded
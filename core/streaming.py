@@ -0,0 +1,63 @@
+"""
+Server-sent event (SSE) helpers for streaming LLM output to the browser.
+
+Each event is a JSON payload:
+
+    data: {"delta": "text"}            incremental text
+    event: done / data: {...}          final payload (post-processed text, counts)
+    event: error / data: {"error": ""} failure; the stream ends
+
+Nothing is buffered server-side beyond the current delta.
+"""
+import json
+
+from django.http import StreamingHttpResponse
+
+
+def sse_event(data, event=None):
+    """Encode one server-sent event."""
+    payload = json.dumps(data, ensure_ascii=False)
+    if event:
+        return f'event: {event}\ndata: {payload}\n\n'
+    return f'data: {payload}\n\n'
+
+
+def sse_response(events):
+    """
+    Wrap an iterator of encoded events in a non-buffered streaming response.
+
+    Args:
+        events: Iterator of strings produced by sse_event().
+
+    Returns:
+        StreamingHttpResponse with text/event-stream content type.
+    """
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def stream_events(deltas, on_complete=None):
+    """
+    Turn a (delta, error) iterator into SSE events.
+
+    Args:
+        deltas: Iterator of (delta, error) tuples, e.g. from LLMClient.stream().
+        on_complete: Optional callable taking the full text and returning the
+            dict sent with the final ``done`` event (or None to send {}).
+
+    Yields:
+        Encoded SSE strings.
+    """
+    parts = []
+    for delta, error in deltas:
+        if error:
+            yield sse_event({'error': error}, event='error')
+            return
+        parts.append(delta)
+        yield sse_event({'delta': delta})
+
+    final = on_complete(''.join(parts)) if on_complete else None
+    yield sse_event(final or {}, event='done')
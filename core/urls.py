@@ -24,4 +24,5 @@ urlpatterns = [
     path('trust-center/', views.TrustCenterPage.as_view(), name='trust'),
     path('student-resources/', views.StudentResourcesPage.as_view(), name='student-resources'),
     path('professionals/', views.ProfessionalsPage.as_view(), name='professionals'),
+    path('metrics', views.MetricsView.as_view(), name='metrics'),
 ]
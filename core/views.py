@@ -1,3 +1,6 @@
+import hmac
+
+from django.http import Http404, HttpResponse
 from django.shortcuts import render, redirect
 from django.views.generic import View
 from django.contrib.auth import login, logout
@@ -7,6 +10,7 @@ from accounts.models import CustomUser
 from accounts.views import GlobalVars
 from app.utils import Utils
 from contact_messages.models.message import Message
+from core.llm_metrics import LLMMetrics
 import config
 
 
@@ -615,6 +619,22 @@ class DeleteAccountPage(View):
         )
 
 
+class MetricsView(View):
+    """
+    Prometheus scrape endpoint for LLM metrics (see core.llm_metrics).
+
+    Disabled unless LLM_METRICS_TOKEN is set; scrapers must send it as a
+    bearer token.
+    """
+
+    def get(self, request):
+        token = getattr(config, 'LLM_METRICS_TOKEN', '')
+        supplied = request.headers.get('Authorization', '')
+        if not token or not hmac.compare_digest(supplied, f'Bearer {token}'):
+            raise Http404
+        return HttpResponse(LLMMetrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def custom_404(request, exception):
     try:
         g = GlobalVars.get_globals(request)
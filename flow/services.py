@@ -8,6 +8,7 @@ import requests
 from django.conf import settings
 from django.utils import timezone
 from core.llm_client import LLMClient, extract_json
+from core.llm_tokens import TokenBudget
 
 logger = logging.getLogger('app')
 
@@ -43,6 +44,43 @@ class FlowService:
         Returns:
             Tuple of (suggestion_text, error). On success error is None.
         """
+        request = cls._suggest_request(document_content, cursor_position, use_premium)
+        if request is None:
+            return 'Start writing your document here...', None
+
+        try:
+            suggestion, error = LLMClient.generate(**request)
+            if error:
+                return None, error
+            return suggestion.strip(), None
+
+        except Exception as e:
+            logger.error(f'Unexpected error during suggest_next: {e}')
+            return None, 'An unexpected error occurred. Please try again.'
+
+    @classmethod
+    async def asuggest_next(cls, document_content, cursor_position=None, use_premium=False):
+        """Async counterpart of suggest_next() for ASGI views."""
+        request = cls._suggest_request(document_content, cursor_position, use_premium)
+        if request is None:
+            return 'Start writing your document here...', None
+
+        try:
+            suggestion, error = await LLMClient.agenerate(**request)
+            if error:
+                return None, error
+            return suggestion.strip(), None
+
+        except Exception as e:
+            logger.error(f'Unexpected error during suggest_next: {e}')
+            return None, 'An unexpected error occurred. Please try again.'
+
+    @staticmethod
+    def _suggest_request(document_content, cursor_position, use_premium):
+        """
+        Build the LLMClient keyword arguments for suggest_next(), or None if
+        there is no text before the cursor to continue.
+        """
         system_prompt = (
             'You are an expert writing assistant embedded in a document editor. '
             'Given the document content so far, suggest the next 1-2 sentences that naturally '
@@ -61,24 +99,17 @@ class FlowService:
                 pass
 
         if not text.strip():
-            return 'Start writing your document here...', None
-
-        try:
-            suggestion, error = LLMClient.generate(
-                system_prompt=system_prompt,
-                messages=[
-                    {'role': 'user', 'content': f'Continue this text:\n\n{text}'}
-                ],
-                max_tokens=512,
-                use_premium=use_premium
-            )
-            if error:
-                return None, error
-            return suggestion.strip(), None
-
-        except Exception as e:
-            logger.error(f'Unexpected error during suggest_next: {e}')
-            return None, 'An unexpected error occurred. Please try again.'
+            return None
+
+        return {
+            'system_prompt': system_prompt,
+            'messages': [
+                {'role': 'user', 'content': f'Continue this text:\n\n{text}'}
+            ],
+            'max_tokens': 512,
+            'use_premium': use_premium,
+            'tool': 'flow_suggest',
+        }
 
     @classmethod
     def ai_review(cls, document_content, use_premium=False):
@@ -115,7 +146,8 @@ class FlowService:
                     {'role': 'user', 'content': f'Review this document:\n\n{document_content}'}
                 ],
                 max_tokens=1024,
-                use_premium=use_premium
+                use_premium=use_premium,
+                tool='flow_review',
             )
             if error:
                 return None, error
@@ -165,7 +197,8 @@ class FlowService:
                     {'role': 'user', 'content': f'Generate a document outline for: {keywords}'}
                 ],
                 max_tokens=2048,
-                use_premium=use_premium
+                use_premium=use_premium,
+                tool='flow_smart_start',
             )
             if error:
                 return None, error
@@ -275,7 +308,8 @@ class FlowService:
                     {'role': 'user', 'content': f'Generate an outline for: {topic}'}
                 ],
                 max_tokens=1024,
-                use_premium=use_premium
+                use_premium=use_premium,
+                tool='flow_outline',
             )
             if error:
                 return None, error
@@ -359,6 +393,17 @@ class FlowService:
     # AI Chat
     # ------------------------------------------------------------------
 
+    CHAT_SYSTEM_PROMPT = (
+        'You are a helpful, friendly AI writing assistant on WritingBot.ai. '
+        'You help users with writing tasks such as brainstorming ideas, improving '
+        'their writing, explaining grammar rules, suggesting outlines, and answering '
+        'questions about writing, language, and communication. '
+        'Be concise but thorough. Use markdown formatting in your responses when '
+        'appropriate (headings, bullet points, bold, code blocks, etc.). '
+        'If the user asks something outside the scope of writing and language, '
+        'you may still answer helpfully but gently steer back to writing topics.'
+    )
+
     @classmethod
     def chat(cls, message, history=None, use_premium=False):
         """
@@ -372,41 +417,18 @@ class FlowService:
         Returns:
             Tuple of (response_text, error). On success error is None.
         """
-        system_prompt = (
-            'You are a helpful, friendly AI writing assistant on WritingBot.ai. '
-            'You help users with writing tasks such as brainstorming ideas, improving '
-            'their writing, explaining grammar rules, suggesting outlines, and answering '
-            'questions about writing, language, and communication. '
-            'Be concise but thorough. Use markdown formatting in your responses when '
-            'appropriate (headings, bullet points, bold, code blocks, etc.). '
-            'If the user asks something outside the scope of writing and language, '
-            'you may still answer helpfully but gently steer back to writing topics.'
-        )
-
         if not message or not message.strip():
             return None, 'Please enter a message.'
 
-        # Build the messages list from history + current message
-        messages = []
-        if history:
-            for entry in history:
-                role = entry.get('role', '')
-                content = entry.get('content', '')
-                if role in ('user', 'assistant') and content:
-                    messages.append({'role': role, 'content': content})
-
-        messages.append({'role': 'user', 'content': message.strip()})
-
-        # Limit conversation context to last 20 messages to manage token usage
-        if len(messages) > 20:
-            messages = messages[-20:]
+        messages = cls._build_chat_messages(message, history)
 
         try:
             reply, error = LLMClient.generate(
-                system_prompt=system_prompt,
+                system_prompt=cls.CHAT_SYSTEM_PROMPT,
                 messages=messages,
                 max_tokens=2048,
-                use_premium=use_premium
+                use_premium=use_premium,
+                tool='ai_chat',
             )
             if error:
                 return None, error
@@ -416,6 +438,64 @@ class FlowService:
             logger.error(f'Unexpected error during chat: {e}')
             return None, 'An unexpected error occurred. Please try again.'
 
+    @classmethod
+    async def achat(cls, message, history=None, use_premium=False):
+        """Async counterpart of chat() for ASGI views."""
+        if not message or not message.strip():
+            return None, 'Please enter a message.'
+
+        try:
+            reply, error = await LLMClient.agenerate(
+                system_prompt=cls.CHAT_SYSTEM_PROMPT,
+                messages=cls._build_chat_messages(message, history),
+                max_tokens=2048,
+                use_premium=use_premium,
+                tool='ai_chat',
+            )
+            if error:
+                return None, error
+            return reply.strip(), None
+
+        except Exception as e:
+            logger.error(f'Unexpected error during chat: {e}')
+            return None, 'An unexpected error occurred. Please try again.'
+
+    @classmethod
+    def chat_stream(cls, message, history=None, use_premium=False):
+        """
+        Stream a chat reply as it is generated.
+
+        Takes the same arguments as chat(). Yields (delta, error) tuples from
+        LLMClient.stream().
+        """
+        if not message or not message.strip():
+            yield None, 'Please enter a message.'
+            return
+
+        yield from LLMClient.stream(
+            system_prompt=cls.CHAT_SYSTEM_PROMPT,
+            messages=cls._build_chat_messages(message, history),
+            max_tokens=2048,
+            use_premium=use_premium,
+            tool='ai_chat',
+        )
+
+    @staticmethod
+    def _build_chat_messages(message, history):
+        """Build the messages list from history + current message."""
+        messages = []
+        if history:
+            for entry in history:
+                role = entry.get('role', '')
+                content = entry.get('content', '')
+                if role in ('user', 'assistant') and content:
+                    messages.append({'role': role, 'content': content})
+
+        messages.append({'role': 'user', 'content': message.strip()})
+
+        # Limit conversation context to a token budget, keeping the newest turns
+        return TokenBudget.trim_messages(messages, getattr(settings, 'LLM_CHAT_HISTORY_TOKENS', 6000))
+
     # ------------------------------------------------------------------
     # AI Search
     # ------------------------------------------------------------------
@@ -458,7 +538,8 @@ class FlowService:
                     {'role': 'user', 'content': f'Research this topic: {query.strip()}'}
                 ],
                 max_tokens=3000,
-                use_premium=use_premium
+                use_premium=use_premium,
+                tool='ai_search',
             )
             if error:
                 return None, error
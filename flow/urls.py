@@ -1,5 +1,6 @@
 from django.urls import path
 
+from core.llm_views import llm_api_view
 from flow.views import (
     FlowPage,
     SharedDocumentPage,
@@ -11,6 +12,7 @@ from flow.views import (
     ShareDocumentAPI,
     AIChatPage,
     AIChatAPI,
+    AIChatStreamAPI,
     AISearchPage,
     AISearchAPI,
 )
@@ -25,10 +27,11 @@ urlpatterns = [
     # API routes
     path('api/flow/documents/', DocumentListAPI.as_view(), name='flow_documents_api'),
     path('api/flow/documents/<uuid:uuid>/', DocumentDetailAPI.as_view(), name='flow_document_detail_api'),
-    path('api/flow/ai-suggest/', AISuggestAPI.as_view(), name='flow_ai_suggest_api'),
+    path('api/flow/ai-suggest/', llm_api_view(AISuggestAPI), name='flow_ai_suggest_api'),
     path('api/flow/ai-review/', AIReviewAPI.as_view(), name='flow_ai_review_api'),
     path('api/flow/smart-start/', SmartStartAPI.as_view(), name='flow_smart_start_api'),
     path('api/flow/share/', ShareDocumentAPI.as_view(), name='flow_share_api'),
-    path('api/ai-chat/', AIChatAPI.as_view(), name='ai_chat_api'),
+    path('api/ai-chat/', llm_api_view(AIChatAPI), name='ai_chat_api'),
+    path('api/ai-chat/stream/', AIChatStreamAPI.as_view(), name='ai_chat_stream_api'),
     path('api/ai-search/', AISearchAPI.as_view(), name='ai_search_api'),
 ]
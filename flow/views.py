@@ -10,6 +10,8 @@ from rest_framework.views import APIView
 
 from accounts.views import GlobalVars
 from app.utils import Utils
+from core.llm_views import LLMAPIView
+from core.streaming import sse_response, stream_events
 from flow.models import Document, DocumentVersion, Note
 from flow.services import FlowService
 import config
@@ -219,13 +221,13 @@ class DocumentDetailAPI(APIView):
         return Response({'success': True}, status=status.HTTP_200_OK)
 
 
-class AISuggestAPI(APIView):
+class AISuggestAPI(LLMAPIView):
     """
     POST /api/flow/ai-suggest/
     Get AI-generated next sentence suggestions based on document content.
     """
 
-    def post(self, request):
+    def validate(self, request):
         ip = Utils.get_ip(request)
         user_agent = request.META.get('HTTP_USER_AGENT', '')
         allowed, remaining, limit = FlowService.check_daily_limit(
@@ -233,7 +235,7 @@ class AISuggestAPI(APIView):
         )
 
         if not allowed:
-            return Response(
+            return None, Response(
                 {
                     'error': f'Daily limit of {limit} suggestions reached. Upgrade to Premium for unlimited access.',
                     'upgrade': True,
@@ -243,24 +245,32 @@ class AISuggestAPI(APIView):
 
         data = request.data
         content = data.get('content', '').strip()
-        cursor_position = data.get('cursor_position')
-
-        # Strip HTML for the AI
-        plain_text = strip_html(content)
 
         is_premium = (
             request.user.is_authenticated
             and getattr(request.user, 'is_plan_active', False)
         )
-        suggestion, error = FlowService.suggest_next(plain_text, cursor_position, use_premium=is_premium)
+        return {
+            # Strip HTML for the AI
+            'plain_text': strip_html(content),
+            'cursor_position': data.get('cursor_position'),
+            'ip': ip,
+            'user_agent': user_agent,
+            'is_premium': is_premium,
+        }, None
+
+    def call(self, ctx):
+        return FlowService.suggest_next(
+            ctx['plain_text'], ctx['cursor_position'], use_premium=ctx['is_premium'],
+        )
 
-        if error:
-            return Response(
-                {'error': error},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+    async def acall(self, ctx):
+        return await FlowService.asuggest_next(
+            ctx['plain_text'], ctx['cursor_position'], use_premium=ctx['is_premium'],
+        )
 
-        FlowService.increment_daily_usage('flow_suggest', request.user, ip, user_agent)
+    def respond(self, request, ctx, suggestion):
+        FlowService.increment_daily_usage('flow_suggest', request.user, ctx['ip'], ctx['user_agent'])
 
         return Response({
             'suggestion': suggestion,
@@ -480,15 +490,21 @@ class AIChatPage(View):
         )
 
 
-class AIChatAPI(APIView):
+class AIChatAPI(LLMAPIView):
     """POST /api/ai-chat/ - Send a message and get an AI response."""
 
-    def post(self, request):
+    def validate(self, request):
+        """
+        Validate the message and the daily limit.
+
+        Returns:
+            Tuple of (context, error_response). On success error_response is None.
+        """
         message = request.data.get('message', '').strip()
         history = request.data.get('history', [])
 
         if not message:
-            return Response(
+            return None, Response(
                 {'error': 'Please enter a message.'},
                 status=status.HTTP_400_BAD_REQUEST,
             )
@@ -501,7 +517,7 @@ class AIChatAPI(APIView):
         )
 
         if not allowed:
-            return Response(
+            return None, Response(
                 {
                     'error': f'Daily limit of {limit} messages reached. Upgrade to Premium for unlimited chat.',
                     'upgrade': True,
@@ -509,26 +525,35 @@ class AIChatAPI(APIView):
                 status=status.HTTP_403_FORBIDDEN,
             )
 
-        # Call the chat service
         is_premium = (
             request.user.is_authenticated
             and getattr(request.user, 'is_plan_active', False)
         )
-        reply, error = FlowService.chat(message, history, use_premium=is_premium)
+        return {
+            'message': message,
+            'history': history,
+            'ip': ip,
+            'user_agent': user_agent,
+            'is_premium': is_premium,
+        }, None
+
+    @staticmethod
+    def record_usage(request, ctx):
+        """Increment the usage counter and return (remaining, limit)."""
+        FlowService.increment_daily_usage('ai_chat', request.user, ctx['ip'], ctx['user_agent'])
+        _, remaining, limit = FlowService.check_daily_limit(
+            'ai_chat', request.user, ctx['ip'], ctx['user_agent'],
+        )
+        return remaining, limit
 
-        if error:
-            return Response(
-                {'error': error},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
+    def call(self, ctx):
+        return FlowService.chat(ctx['message'], ctx['history'], use_premium=ctx['is_premium'])
 
-        # Increment usage counter
-        FlowService.increment_daily_usage('ai_chat', request.user, ip, user_agent)
+    async def acall(self, ctx):
+        return await FlowService.achat(ctx['message'], ctx['history'], use_premium=ctx['is_premium'])
 
-        # Re-check remaining
-        _, remaining, limit = FlowService.check_daily_limit(
-            'ai_chat', request.user, ip, user_agent,
-        )
+    def respond(self, request, ctx, reply):
+        remaining, limit = self.record_usage(request, ctx)
 
         return Response({
             'reply': reply,
@@ -537,6 +562,26 @@ class AIChatAPI(APIView):
         })
 
 
+class AIChatStreamAPI(AIChatAPI):
+    """
+    POST /api/ai-chat/stream/ - Same input as AIChatAPI; streams the reply as
+    server-sent events. Usage is counted only when the stream completes.
+    """
+
+    def post(self, request):
+        ctx, error_response = self.validate(request)
+        if error_response:
+            return error_response
+
+        deltas = FlowService.chat_stream(ctx['message'], ctx['history'], use_premium=ctx['is_premium'])
+
+        def on_complete(reply):
+            remaining, limit = self.record_usage(request, ctx)
+            return {'reply': reply.strip(), 'remaining': remaining, 'limit': limit}
+
+        return sse_response(stream_events(deltas, on_complete))
+
+
 # ======================================================================
 # AI Search
 # ======================================================================
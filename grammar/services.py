@@ -1,54 +1,46 @@
 import io
 import json
 import logging
+
+from asgiref.sync import sync_to_async
+
 from core.llm_client import LLMClient, extract_json
+from core.llm_mapreduce import MapReduce
+from core.llm_neardup import NearDuplicateCache, ParagraphReuse
+from core.llm_prompt_cache import CachedPrompt
+from core.llm_tokens import TokenBudget
 
 logger = logging.getLogger('app')
 
 
 class AIGrammarService:
-    def __init__(self):
-        pass
-
-    def check_grammar(self, text, dialect='en-us', use_premium=False):
-        """
-        Check grammar and score writing quality.
-        Returns (result_dict, error_string).
-        result_dict contains 'corrections' list and 'writing_scores' dict.
-        """
-        prompt = f"""You are an expert grammar checker and writing analyst. Analyze the following text for grammar, spelling, punctuation, and style issues.
-
-Dialect: {dialect}
-
-Text to analyze:
-\"\"\"
-{text}
-\"\"\"
+    # Instructions come before the text so they form a cacheable prompt prefix
+    CHECK_INSTRUCTIONS = """You are an expert grammar checker and writing analyst. Analyze the text at the end of this message for grammar, spelling, punctuation, and style issues, written in the given dialect.
 
 Return a JSON object with exactly this structure:
-{{
+{
   "corrections": [
-    {{
+    {
       "original": "the exact text with the error",
       "suggestion": "the corrected text",
       "type": "grammar|spelling|punctuation|style|clarity|wordiness|passive_voice",
       "explanation": "brief explanation of why this is an error and how to fix it",
-      "position": {{
+      "position": {
         "start": 0,
         "end": 10
-      }}
-    }}
+      }
+    }
   ],
-  "writing_scores": {{
+  "writing_scores": {
     "grammar": 85,
     "fluency": 78,
     "clarity": 82,
     "engagement": 70,
     "delivery": 75
-  }},
+  },
   "tone": "formal|semi-formal|neutral|semi-casual|casual",
   "readability_score": 65.5
-}}
+}
 
 Important rules:
 - Each score must be an integer from 0-100
@@ -56,19 +48,138 @@ Important rules:
 - Only flag genuine errors or meaningful improvements
 - Be precise with positions - they must exactly match the original text
 - readability_score should be the Flesch-Kincaid reading ease score (0-100)
-- Return ONLY valid JSON, no markdown formatting or extra text"""
+- Return ONLY valid JSON, no markdown formatting or extra text
+
+"""
+
+    def __init__(self):
+        pass
+
+    def check_grammar(self, text, dialect='en-us', use_premium=False):
+        """
+        Check grammar and score writing quality.
+        Returns (result_dict, error_string).
+        result_dict contains 'corrections' list and 'writing_scores' dict.
+        """
+        cached, reuse = self._near_duplicate(text, dialect)
+        if cached is not None and not reuse.recheck_text:
+            return self._reuse_result(text, dialect, reuse, cached, None), None
 
         try:
-            response_text, error = LLMClient.generate(
-                system_prompt=None,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=4096,
-                use_premium=use_premium
-            )
+            response_text, error = LLMClient.generate(**self._check_grammar_request(
+                reuse.recheck_text if reuse else text, dialect, use_premium,
+            ))
+        except Exception as e:
+            logger.error(f"Grammar check error: {e}")
+            return None, str(e)
 
-            if error:
-                return None, error
+        if error:
+            return None, error
+        return self._finish_check(text, dialect, reuse, cached, response_text)
 
+    async def acheck_grammar(self, text, dialect='en-us', use_premium=False):
+        """Async counterpart of check_grammar() for ASGI views."""
+        cached, reuse = await sync_to_async(self._near_duplicate)(text, dialect)
+        if cached is not None and not reuse.recheck_text:
+            return await sync_to_async(self._reuse_result)(text, dialect, reuse, cached, None), None
+
+        try:
+            response_text, error = await LLMClient.agenerate(**self._check_grammar_request(
+                reuse.recheck_text if reuse else text, dialect, use_premium,
+            ))
+        except Exception as e:
+            logger.error(f"Grammar check error: {e}")
+            return None, str(e)
+
+        if error:
+            return None, error
+        return await sync_to_async(self._finish_check)(text, dialect, reuse, cached, response_text)
+
+    @staticmethod
+    def _near_duplicate(text, dialect):
+        """
+        Look up an earlier check of the same or a slightly edited text.
+
+        Returns (cached_result, ParagraphReuse), or (None, None) when there
+        is no match or no paragraph of it can be reused.
+        """
+        match = NearDuplicateCache.get('grammar', text, (dialect,))
+        if match is None:
+            return None, None
+        cached_text, cached = match
+        reuse = ParagraphReuse(cached_text, text)
+        if not reuse.reused:
+            return None, None
+        return cached, reuse
+
+    @classmethod
+    def _finish_check(cls, text, dialect, reuse, cached, response_text):
+        """Parse a (re)check reply, merge reused corrections and cache the result."""
+        result, error = cls._parse_grammar_response(response_text)
+        if error:
+            return None, error
+        if reuse is not None:
+            return cls._reuse_result(text, dialect, reuse, cached, result), None
+        NearDuplicateCache.set('grammar', text, result, (dialect,))
+        return result, None
+
+    @staticmethod
+    def _reuse_result(text, dialect, reuse, cached, fresh):
+        """
+        Combine the cached check of unchanged paragraphs with ``fresh``, the
+        check of the edited paragraphs (None if nothing changed).
+
+        Scores are weighted by the share of text each check covers.
+        """
+        corrections = []
+        sources = [(cached, reuse.map_cached)] + ([(fresh, reuse.map_recheck)] if fresh else [])
+        for source, map_span in sources:
+            for correction in source.get('corrections', []):
+                position = correction.get('position') or {}
+                try:
+                    span = map_span(int(position['start']), int(position['end']))
+                except (KeyError, TypeError, ValueError):
+                    span = None
+                if span is None:
+                    continue
+                corrections.append({**correction, 'position': {'start': span[0], 'end': span[1]}})
+        corrections.sort(key=lambda correction: correction['position']['start'])
+
+        result = {**cached, 'corrections': corrections}
+        if fresh:
+            share = reuse.changed_share
+            result['writing_scores'] = {
+                key: round(value * (1 - share) + fresh['writing_scores'].get(key, value) * share)
+                for key, value in cached['writing_scores'].items()
+            }
+            result['readability_score'] = round(
+                float(cached['readability_score']) * (1 - share) + float(fresh['readability_score']) * share, 1,
+            )
+            if share >= 0.5:
+                result['tone'] = fresh['tone']
+        NearDuplicateCache.set('grammar', text, result, (dialect,))
+        return result
+
+    @staticmethod
+    def _check_grammar_request(text, dialect, use_premium):
+        """Build the LLMClient keyword arguments for a grammar check."""
+        prompt = CachedPrompt(
+            AIGrammarService.CHECK_INSTRUCTIONS,
+            f'Dialect: {dialect}\n\nText to analyze:\n"""\n{text}\n"""',
+        )
+
+        return {
+            'system_prompt': None,
+            'messages': [{"role": "user", "content": prompt}],
+            'max_tokens': TokenBudget.max_tokens_for(text, 'grammar_check', ceiling=4096),
+            'use_premium': use_premium,
+            'tool': 'grammar',
+        }
+
+    @staticmethod
+    def _parse_grammar_response(response_text):
+        """Parse and sanitize the grammar check JSON. Returns (result_dict, error_string)."""
+        try:
             result = extract_json(response_text)
 
             # Validate structure
@@ -177,6 +288,43 @@ class ProofreaderService:
     ALLOWED_EXTENSIONS = {'docx', 'txt', 'pdf'}
     MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
 
+    # Instructions come before the document so they form a cacheable prompt prefix
+    PROOFREAD_INSTRUCTIONS = """You are an expert professional proofreader. Analyze the document at the end of this message thoroughly for ALL errors and issues across these categories: grammar, spelling, punctuation, style, clarity, and wordiness.
+
+Return a JSON object with exactly this structure:
+{
+  "overall_score": 78,
+  "summary": "A brief 1-2 sentence summary of the document's overall writing quality and main issues found.",
+  "error_counts": {
+    "grammar": 3,
+    "spelling": 1,
+    "punctuation": 2,
+    "style": 4,
+    "clarity": 2,
+    "wordiness": 1
+  },
+  "corrections": [
+    {
+      "original": "the exact text with the error",
+      "suggestion": "the corrected text",
+      "type": "grammar|spelling|punctuation|style|clarity|wordiness",
+      "explanation": "Brief explanation of why this is an error and the fix"
+    }
+  ],
+  "corrected_text": "The entire document text with ALL corrections applied. This must be the complete document, not a summary."
+}
+
+Important rules:
+- overall_score is 0-100 where 100 is perfect. Deduct points for each error found.
+- error_counts must accurately reflect the number of corrections in each category.
+- corrections must list EVERY error found, even minor ones.
+- Each correction type must be one of: grammar, spelling, punctuation, style, clarity, wordiness
+- corrected_text must be the COMPLETE document with all fixes applied, preserving the original structure and paragraphs.
+- Be thorough but do not invent errors that do not exist.
+- Return ONLY valid JSON, no markdown formatting or extra text.
+
+"""
+
     def __init__(self):
         pass
 
@@ -259,83 +407,18 @@ class ProofreaderService:
             - corrections: list of correction dicts
             - corrected_text: the full corrected version
             - summary: brief summary of the document quality
-        """
-        prompt = f"""You are an expert professional proofreader. Analyze the following document thoroughly for ALL errors and issues across these categories: grammar, spelling, punctuation, style, clarity, and wordiness.
-
-Document to proofread:
-\"\"\"
-{text}
-\"\"\"
-
-Return a JSON object with exactly this structure:
-{{
-  "overall_score": 78,
-  "summary": "A brief 1-2 sentence summary of the document's overall writing quality and main issues found.",
-  "error_counts": {{
-    "grammar": 3,
-    "spelling": 1,
-    "punctuation": 2,
-    "style": 4,
-    "clarity": 2,
-    "wordiness": 1
-  }},
-  "corrections": [
-    {{
-      "original": "the exact text with the error",
-      "suggestion": "the corrected text",
-      "type": "grammar|spelling|punctuation|style|clarity|wordiness",
-      "explanation": "Brief explanation of why this is an error and the fix"
-    }}
-  ],
-  "corrected_text": "The entire document text with ALL corrections applied. This must be the complete document, not a summary."
-}}
-
-Important rules:
-- overall_score is 0-100 where 100 is perfect. Deduct points for each error found.
-- error_counts must accurately reflect the number of corrections in each category.
-- corrections must list EVERY error found, even minor ones.
-- Each correction type must be one of: grammar, spelling, punctuation, style, clarity, wordiness
-- corrected_text must be the COMPLETE document with all fixes applied, preserving the original structure and paragraphs.
-- Be thorough but do not invent errors that do not exist.
-- Return ONLY valid JSON, no markdown formatting or extra text."""
 
+        Documents longer than one chunk are proofread in parallel chunks
+        (see _proofread_long).
+        """
         try:
-            response_text, error = LLMClient.generate(
-                system_prompt=None,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=8192,
-                use_premium=use_premium
-            )
+            if MapReduce.needs_split(text, 'proofread'):
+                return self._proofread_long(text, use_premium)
 
+            response_text, error = LLMClient.generate(**self._proofread_request(text, use_premium))
             if error:
                 return None, error
-
-            result = extract_json(response_text)
-
-            # Validate and sanitize structure
-            if 'overall_score' not in result:
-                result['overall_score'] = 50
-            result['overall_score'] = max(0, min(100, int(result['overall_score'])))
-
-            if 'summary' not in result:
-                result['summary'] = 'Proofreading analysis complete.'
-
-            if 'error_counts' not in result:
-                result['error_counts'] = {}
-            for cat in ['grammar', 'spelling', 'punctuation', 'style', 'clarity', 'wordiness']:
-                result['error_counts'].setdefault(cat, 0)
-                result['error_counts'][cat] = max(0, int(result['error_counts'][cat]))
-
-            if 'corrections' not in result:
-                result['corrections'] = []
-
-            if 'corrected_text' not in result or not result['corrected_text'].strip():
-                result['corrected_text'] = text  # Fall back to original
-
-            total_errors = sum(result['error_counts'].values())
-            result['total_errors'] = total_errors
-
-            return result, None
+            return self._parse_proofread(response_text, text), None
 
         except (ValueError, json.JSONDecodeError) as e:
             logger.error(f"Proofreader JSON parse error: {e}")
@@ -344,6 +427,92 @@ Important rules:
             logger.error(f"Proofreader error: {e}")
             return None, str(e)
 
+    def _proofread_long(self, text, use_premium):
+        """
+        Proofread a long document in parallel chunks and merge the results.
+
+        Corrections get a ``position`` in the whole document (chunk offset
+        plus where ``original`` occurs in the chunk), error counts are
+        summed, and the score is the word-weighted mean of the chunk scores.
+        """
+        chunks = MapReduce.split(text, MapReduce.chunk_tokens('proofread'))
+        results = MapReduce.map(chunks, lambda chunk: self._proofread_request(chunk.text, use_premium))
+
+        parts = []
+        for chunk, (response_text, error) in zip(chunks, results):
+            if error:
+                return None, error
+            parts.append(self._parse_proofread(response_text, chunk.text))
+
+        corrections = []
+        for chunk, part in zip(chunks, parts):
+            for correction in part['corrections']:
+                original = correction.get('original')
+                start = chunk.text.find(original) if original else -1
+                if start != -1:
+                    correction['position'] = {
+                        'start': chunk.offset + start,
+                        'end': chunk.offset + start + len(correction['original']),
+                    }
+                corrections.append(correction)
+
+        weights = [max(1, len(chunk.text.split())) for chunk in chunks]
+        error_counts = {
+            cat: sum(part['error_counts'].get(cat, 0) for part in parts) for cat in parts[0]['error_counts']
+        }
+        # The weakest section's summary names the document's main issues
+        weakest = min(parts, key=lambda part: part['overall_score'])
+        return {
+            'overall_score': round(sum(p['overall_score'] * w for p, w in zip(parts, weights)) / sum(weights)),
+            'summary': weakest['summary'],
+            'error_counts': error_counts,
+            'corrections': corrections,
+            'corrected_text': MapReduce.join(chunks, [part['corrected_text'] for part in parts]),
+            'total_errors': sum(error_counts.values()),
+        }, None
+
+    def _proofread_request(self, text, use_premium):
+        """Build the LLMClient keyword arguments for proofreading ``text``."""
+        return {
+            'system_prompt': None,
+            'messages': [{"role": "user", "content": CachedPrompt(
+                self.PROOFREAD_INSTRUCTIONS, f'Document to proofread:\n"""\n{text}\n"""',
+            )}],
+            'max_tokens': TokenBudget.max_tokens_for(text, 'proofread', ceiling=8192),
+            'use_premium': use_premium,
+            'tool': 'proofreader',
+        }
+
+    @staticmethod
+    def _parse_proofread(response_text, text):
+        """Parse and sanitize a proofreading reply for ``text``. Raises ValueError on bad JSON."""
+        result = extract_json(response_text)
+
+        # Validate and sanitize structure
+        if 'overall_score' not in result:
+            result['overall_score'] = 50
+        result['overall_score'] = max(0, min(100, int(result['overall_score'])))
+
+        if 'summary' not in result:
+            result['summary'] = 'Proofreading analysis complete.'
+
+        if 'error_counts' not in result:
+            result['error_counts'] = {}
+        for cat in ['grammar', 'spelling', 'punctuation', 'style', 'clarity', 'wordiness']:
+            result['error_counts'].setdefault(cat, 0)
+            result['error_counts'][cat] = max(0, int(result['error_counts'][cat]))
+
+        if 'corrections' not in result:
+            result['corrections'] = []
+
+        if 'corrected_text' not in result or not result['corrected_text'].strip():
+            result['corrected_text'] = text  # Fall back to original
+
+        total_errors = sum(result['error_counts'].values())
+        result['total_errors'] = total_errors
+
+        return result
+
     def generate_corrected_docx(self, corrected_text):
         """
         Generate a DOCX file from corrected text.
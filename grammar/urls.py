@@ -1,4 +1,6 @@
 from django.urls import path
+
+from core.llm_views import llm_api_view
 from grammar.views import (
     GrammarPage, GrammarCheckAPI, GrammarFixAPI,
     ProofreaderPage, ProofreadAPI, ProofreadDownloadAPI,
@@ -6,7 +8,7 @@ from grammar.views import (
 
 urlpatterns = [
     path('grammar-check/', GrammarPage.as_view(), name='grammar'),
-    path('api/grammar/check/', GrammarCheckAPI.as_view(), name='grammar_check_api'),
+    path('api/grammar/check/', llm_api_view(GrammarCheckAPI), name='grammar_check_api'),
     path('api/grammar/fix/', GrammarFixAPI.as_view(), name='grammar_fix_api'),
     # Proofreader
     path('proofreader/', ProofreaderPage.as_view(), name='proofreader'),
@@ -10,6 +10,7 @@ from rest_framework.response import Response
 from rest_framework import status
 
 from accounts.views import GlobalVars
+from core.llm_views import LLMAPIView
 from grammar.models import GrammarCheckHistory
 from grammar.services import AIGrammarService, ProofreaderService
 
@@ -35,13 +36,13 @@ class GrammarPage(View):
         return render(request, 'tools/grammar.html', context)
 
 
-class GrammarCheckAPI(APIView):
-    def post(self, request):
+class GrammarCheckAPI(LLMAPIView):
+    def validate(self, request):
         text = request.data.get('text', '').strip()
         dialect = request.data.get('dialect', 'en-us')
 
         if not text:
-            return Response(
+            return None, Response(
                 {'error': 'Please enter some text to check.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
@@ -55,7 +56,7 @@ class GrammarCheckAPI(APIView):
         )
 
         if not is_premium and word_count > free_limit:
-            return Response(
+            return None, Response(
                 {
                     'error': f'Free accounts are limited to {free_limit} words. You entered {word_count} words.',
                     'upgrade': True
@@ -63,23 +64,23 @@ class GrammarCheckAPI(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        service = AIGrammarService()
-        result, error = service.check_grammar(text, dialect)
+        return {'text': text, 'dialect': dialect, 'word_count': word_count}, None
 
-        if error:
-            return Response(
-                {'error': error},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+    def call(self, params):
+        return AIGrammarService().check_grammar(params['text'], params['dialect'])
 
+    async def acall(self, params):
+        return await AIGrammarService().acheck_grammar(params['text'], params['dialect'])
+
+    def respond(self, request, params, result):
         # Save history
         try:
             GrammarCheckHistory.objects.create(
                 user=request.user if request.user.is_authenticated else None,
-                input_text=text,
+                input_text=params['text'],
                 corrections=result.get('corrections', []),
                 writing_score=result.get('writing_scores', {}),
-                word_count=word_count,
+                word_count=params['word_count'],
             )
         except Exception as e:
             logger.error(f"Failed to save grammar check history: {e}")
@@ -89,7 +90,7 @@ class GrammarCheckAPI(APIView):
             'writing_scores': result.get('writing_scores', {}),
             'tone': result.get('tone', 'neutral'),
             'readability_score': result.get('readability_score', 50),
-            'word_count': word_count,
+            'word_count': params['word_count'],
         })
 
 
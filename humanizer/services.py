@@ -1,8 +1,12 @@
-import json
 import logging
-import re
+import time
 
-from core.llm_client import LLMClient, extract_json
+from django.conf import settings
+
+from ai_detector.services import AIDetectorService
+from core import llm_transport
+from core.llm_client import LLMClient
+from core.llm_routing import ModelRouter
 
 logger = logging.getLogger('app')
 
@@ -10,55 +14,87 @@ logger = logging.getLogger('app')
 class AIHumanizerService:
 
     @staticmethod
-    def humanize(text, mode='basic', use_premium=False):
+    def humanize(text, mode='basic', use_premium=False, target_score=None, time_budget=None):
         """
         Rewrite AI-generated text to sound more human.
 
+        Scores come from the AI detector model (blended with its heuristics),
+        not from a generative model; the input is scored while it is being
+        rewritten.
+
         Args:
             text: The AI-generated text to humanize
             mode: 'basic' for light touch, 'advanced' for deep rewrite
             use_premium: Whether to use premium model tier
+            target_score: If set, rewrite the output again while its AI score
+                is above this, up to HUMANIZER_MAX_ROUNDS rewrites in total
+            time_budget: Seconds the extra rounds may take in total
+                (default HUMANIZER_TIME_BUDGET)
 
         Returns:
             tuple: (result_dict, error_string)
-            result_dict contains: output_text, ai_score_before, ai_score_after
+            result_dict contains: output_text, ai_score_before, ai_score_after, rounds
         """
         if not text or not text.strip():
             return None, 'Please provide text to humanize.'
 
         try:
-            # First, assess the AI score of the input
-            score_prompt = f"""Analyze this text and estimate how likely it is to be AI-generated.
-Return ONLY a JSON object with this format: {{"ai_score": 75}}
-The score should be 0-100 where 100 = definitely AI generated.
+            started = time.monotonic()
+            backend = ModelRouter.route('humanizer', use_premium)[1]
+            (ai_score_before, _), (output_text, error) = llm_transport.run_concurrently([
+                ('detector', lambda: (AIHumanizerService._ai_score(text, use_premium), None)),
+                (backend, lambda: LLMClient.generate(**AIHumanizerService._rewrite_request(text, mode, use_premium))),
+            ])
+            if error:
+                return None, error
 
-Text:
-{text}"""
+            output_text = output_text.strip()
+            ai_score_after = AIHumanizerService._ai_score(output_text, use_premium)
+
+            rounds = 1
+            if time_budget is None:
+                time_budget = getattr(settings, 'HUMANIZER_TIME_BUDGET', 20)
+            max_rounds = getattr(settings, 'HUMANIZER_MAX_ROUNDS', 3)
+            while target_score is not None and ai_score_after > target_score and rounds < max_rounds:
+                # Extra rounds cost about as much as the first one
+                elapsed = time.monotonic() - started
+                if elapsed + elapsed / rounds > time_budget:
+                    break
+                candidate, error = LLMClient.generate(
+                    **AIHumanizerService._rewrite_request(output_text, mode, use_premium)
+                )
+                rounds += 1
+                if error:
+                    break
+                candidate = candidate.strip()
+                score = AIHumanizerService._ai_score(candidate, use_premium)
+                if score < ai_score_after:
+                    output_text, ai_score_after = candidate, score
 
-            score_text, error = LLMClient.generate(
-                system_prompt="You are an AI text detector.",
-                messages=[{"role": "user", "content": score_prompt}],
-                max_tokens=256,
-                use_premium=use_premium
-            )
+            return {
+                'output_text': output_text,
+                'ai_score_before': ai_score_before,
+                'ai_score_after': ai_score_after,
+                'rounds': rounds,
+            }, None
 
-            if error:
-                return None, error
+        except Exception as e:
+            logger.error(f'Unexpected error in humanizer: {str(e)}')
+            return None, 'An unexpected error occurred. Please try again.'
 
-            try:
-                score_data = extract_json(score_text)
-                if isinstance(score_data, dict):
-                    ai_score_before = max(0, min(100, int(score_data.get('ai_score', 70))))
-                elif isinstance(score_data, (int, float)):
-                    ai_score_before = max(0, min(100, int(score_data)))
-                else:
-                    ai_score_before = 70
-            except (ValueError, json.JSONDecodeError, TypeError):
-                ai_score_before = 70
-
-            # Humanize the text based on mode
-            if mode == 'advanced':
-                humanize_prompt = f"""Rewrite the following text to make it sound completely human-written. Apply deep transformations:
+    @staticmethod
+    def _ai_score(text, use_premium):
+        """AI likelihood 0-100 from the AI detector (model score blended with heuristics)."""
+        result, error = AIDetectorService.detect(text, use_premium=use_premium, tool='humanizer_score')
+        if error:
+            return 50
+        return result['overall_score']
+
+    @staticmethod
+    def _rewrite_request(text, mode, use_premium):
+        """Build the LLMClient keyword arguments for the rewrite."""
+        if mode == 'advanced':
+            humanize_prompt = f"""Rewrite the following text to make it sound completely human-written. Apply deep transformations:
 
 1. Vary sentence structure significantly - mix short punchy sentences with longer ones
 2. Add natural imperfections - contractions, informal transitions, occasional colloquialisms
@@ -75,8 +111,8 @@ IMPORTANT: Return ONLY the rewritten text. Do not include any explanations, note
 
 Text to rewrite:
 {text}"""
-            else:
-                humanize_prompt = f"""Lightly rewrite the following text to reduce obvious AI patterns while keeping it close to the original:
+        else:
+            humanize_prompt = f"""Lightly rewrite the following text to reduce obvious AI patterns while keeping it close to the original:
 
 1. Replace commonly flagged AI words (furthermore, moreover, additionally, delve, tapestry, multifaceted, nuanced, comprehensive, robust) with simpler alternatives
 2. Add some contractions where natural (do not -> don't, it is -> it's)
@@ -89,53 +125,10 @@ IMPORTANT: Return ONLY the rewritten text. Do not include any explanations, note
 Text to rewrite:
 {text}"""
 
-            output_text, error = LLMClient.generate(
-                system_prompt="You are a professional text rewriter who makes AI text sound human.",
-                messages=[{"role": "user", "content": humanize_prompt}],
-                max_tokens=4096,
-                use_premium=use_premium
-            )
-
-            if error:
-                return None, error
-
-            output_text = output_text.strip()
-
-            # Score the output
-            score_after_prompt = f"""Analyze this text and estimate how likely it is to be AI-generated.
-Return ONLY a JSON object with this format: {{"ai_score": 25}}
-The score should be 0-100 where 100 = definitely AI generated.
-
-Text:
-{output_text}"""
-
-            score_after_text, error = LLMClient.generate(
-                system_prompt="You are an AI text detector.",
-                messages=[{"role": "user", "content": score_after_prompt}],
-                max_tokens=256,
-                use_premium=use_premium
-            )
-
-            if error:
-                return None, error
-
-            try:
-                score_after_data = extract_json(score_after_text)
-                if isinstance(score_after_data, dict):
-                    ai_score_after = max(0, min(100, int(score_after_data.get('ai_score', 30))))
-                elif isinstance(score_after_data, (int, float)):
-                    ai_score_after = max(0, min(100, int(score_after_data)))
-                else:
-                    ai_score_after = max(5, ai_score_before - (40 if mode == 'advanced' else 25))
-            except (ValueError, json.JSONDecodeError, TypeError):
-                ai_score_after = max(5, ai_score_before - (40 if mode == 'advanced' else 25))
-
-            return {
-                'output_text': output_text,
-                'ai_score_before': ai_score_before,
-                'ai_score_after': ai_score_after,
-            }, None
-
-        except Exception as e:
-            logger.error(f'Unexpected error in humanizer: {str(e)}')
-            return None, 'An unexpected error occurred. Please try again.'
+        return {
+            'system_prompt': "You are a professional text rewriter who makes AI text sound human.",
+            'messages': [{"role": "user", "content": humanize_prompt}],
+            'max_tokens': 4096,
+            'use_premium': use_premium,
+            'tool': 'humanizer',
+        }
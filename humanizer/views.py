@@ -74,8 +74,16 @@ class HumanizeAPI(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        # Premium users can ask for extra rewrite rounds until the AI score is low enough
+        target_score = None
+        if is_premium and data.get('target_score') not in (None, ''):
+            try:
+                target_score = max(0, min(100, int(data['target_score'])))
+            except (TypeError, ValueError):
+                pass
+
         # Run humanization
-        result, error = AIHumanizerService.humanize(text, mode, use_premium=is_premium)
+        result, error = AIHumanizerService.humanize(text, mode, use_premium=is_premium, target_score=target_score)
 
         if error:
             return Response(
@@ -100,5 +108,6 @@ class HumanizeAPI(APIView):
             'output_text': result['output_text'],
             'ai_score_before': result['ai_score_before'],
             'ai_score_after': result['ai_score_after'],
+            'rounds': result['rounds'],
             'word_count': word_count,
         })
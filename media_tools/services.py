@@ -316,6 +316,7 @@ class AIImageService:
             ],
             max_tokens=1024,
             use_premium=use_premium,
+            tool='image_prompt',
         )
         if error:
             return None, error
@@ -381,12 +382,8 @@ class TranscriptionService:
                 except Exception:
                     duration_str = 'unknown'
 
-                import anthropic
-                client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-                response = client.messages.create(
-                    model=settings.ANTHROPIC_MODEL,
-                    max_tokens=2048,
-                    system=(
+                return LLMClient.generate(
+                    system_prompt=(
                         'You are a transcription assistant. The user has uploaded an audio file for transcription. '
                         'Since you cannot directly process audio, explain that the transcription service requires '
                         'the Whisper API integration to be configured. Provide helpful information about the uploaded file.'
@@ -399,10 +396,11 @@ class TranscriptionService:
                             f'Duration: {duration_str}\n\n'
                             'Please provide a status message about this transcription request.'
                         )}
-                    ]
+                    ],
+                    max_tokens=2048,
+                    use_premium=True,
+                    tool='transcriber',
                 )
-                result = response.content[0].text.strip()
-                return result, None
 
             finally:
                 os.unlink(tmp_path)
@@ -471,6 +469,7 @@ class LogoService:
             ],
             max_tokens=1500,
             use_premium=use_premium,
+            tool='logo_generator',
         )
         if error:
             return None, error
@@ -540,6 +539,7 @@ class CharacterService:
             ],
             max_tokens=2000,
             use_premium=use_premium,
+            tool='character_generator',
         )
         if error:
             return None, error
@@ -695,6 +695,7 @@ class BannerService:
             ],
             max_tokens=1500,
             use_premium=use_premium,
+            tool='banner_generator',
         )
         if error:
             return None, error
@@ -764,6 +765,7 @@ class PresentationService:
             ],
             max_tokens=4096,
             use_premium=use_premium,
+            tool='presentation_maker',
         )
         if error:
             return None, error
@@ -1034,6 +1036,7 @@ class ImageToolService:
             ],
             max_tokens=1024,
             use_premium=use_premium,
+            tool='media_prompt',
         )
         if error:
             return None, error
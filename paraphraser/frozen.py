@@ -0,0 +1,145 @@
+"""
+Frozen-term protection for the paraphraser.
+
+Frozen words used to be listed in the prompt and fixed up afterwards with
+one regex compiled and applied per word per request, and nothing stopped
+the model from rewording them. Now:
+
+1. FrozenTerms.get() compiles a term set once into a single alternation
+   (longest terms first, case-insensitive, whole words only) and keeps it
+   in an LRU keyed by the set.
+2. mask() swaps every frozen occurrence for an opaque placeholder
+   (``[[F1]]``, ``[[F2]]``... one per distinct term) before the LLM call,
+   so the model never sees the terms and cannot reword them.
+3. restore() puts the terms back, in the spelling the user froze them, in
+   one pass over the output and reports placeholders the model dropped;
+   normalize() fixes the casing of any term the model wrote out itself.
+   restore_stream() does the same for streamed deltas, holding back a
+   delta tail that may be the start of a split placeholder.
+"""
+import logging
+import re
+import threading
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger('app')
+
+_PLACEHOLDER = re.compile(r'\[\[F(\d+)\]\]')
+_MAX_TERM_SETS = 256
+
+
+class FrozenTerms:
+    """A compiled set of frozen terms. See module docstring."""
+
+    _compiled = OrderedDict()
+    _lock = threading.Lock()
+
+    def __init__(self, terms):
+        # Spellings differing only in case: the first in sorted order wins
+        canonical = {}
+        for term in sorted(term.strip() for term in terms if isinstance(term, str) and term.strip()):
+            canonical.setdefault(term.lower(), term)
+        self.terms = sorted(canonical.values(), key=lambda term: (-len(term), term.lower()))
+        self._index = {term.lower(): number for number, term in enumerate(self.terms, 1)}
+        self.pattern = None
+        if self.terms:
+            alternation = '|'.join(re.escape(term) for term in self.terms)
+            self.pattern = re.compile(rf'(?<!\w)(?:{alternation})(?!\w)', re.IGNORECASE)
+
+    @classmethod
+    def get(cls, terms):
+        """Return the compiled FrozenTerms for ``terms``, from the LRU when already built."""
+        key = tuple(sorted({term.strip() for term in terms or [] if isinstance(term, str) and term.strip()}))
+        with cls._lock:
+            compiled = cls._compiled.get(key)
+            if compiled is not None:
+                cls._compiled.move_to_end(key)
+                return compiled
+        compiled = cls(key)
+        with cls._lock:
+            cls._compiled[key] = compiled
+            cls._compiled.move_to_end(key)
+            while len(cls._compiled) > _MAX_TERM_SETS:
+                cls._compiled.popitem(last=False)
+        return compiled
+
+    def mask(self, text):
+        """
+        Replace frozen terms in ``text`` with placeholders.
+
+        Returns:
+            Tuple of (masked_text, counts), where counts maps placeholder
+            numbers to the occurrences masked.
+        """
+        if self.pattern is None or not text:
+            return text, Counter()
+        counts = Counter()
+
+        def replace(match):
+            number = self._index[match.group().lower()]
+            counts[number] += 1
+            return f'[[F{number}]]'
+
+        return self.pattern.sub(replace, text), counts
+
+    def restore(self, text, counts):
+        """
+        Put the frozen terms back in place of their placeholders.
+
+        Returns:
+            Tuple of (text, missing), where missing lists the terms whose
+            placeholders occur fewer times than they were masked.
+        """
+        if not text:
+            return text, []
+        seen = Counter()
+
+        def replace(match):
+            number = int(match.group(1))
+            if not 0 < number <= len(self.terms):
+                return match.group()
+            seen[number] += 1
+            return self.terms[number - 1]
+
+        text = _PLACEHOLDER.sub(replace, text)
+        missing = [self.terms[number - 1] for number, count in sorted(counts.items()) if seen[number] < count]
+        if missing:
+            logger.warning(f'Paraphrase dropped frozen terms: {", ".join(missing)[:200]}')
+        return text, missing
+
+    def restore_stream(self, deltas):
+        """Restore placeholders in streamed (delta, error) tuples, re-cutting deltas around split placeholders."""
+        pending = ''
+        for delta, error in deltas:
+            if error:
+                if pending:
+                    yield self.restore(pending, Counter())[0], None
+                yield delta, error
+                return
+            pending += delta or ''
+            # Hold back a tail that could still grow into a placeholder
+            cut = pending.rfind('[')
+            if cut == -1 or ']]' in pending[cut:] or len(pending) - cut > 12:
+                cut = len(pending)
+            elif cut > 0 and pending[cut - 1] == '[':
+                cut -= 1
+            ready, pending = pending[:cut], pending[cut:]
+            if ready:
+                yield self.restore(ready, Counter())[0], None
+        if pending:
+            yield self.restore(pending, Counter())[0], None
+
+    def normalize(self, text):
+        """Rewrite frozen terms that appear in ``text`` in any casing to their frozen spelling."""
+        if self.pattern is None or not text:
+            return text
+        return self.pattern.sub(lambda match: self.terms[self._index[match.group().lower()] - 1], text)
+
+    @staticmethod
+    def prompt_note():
+        """System prompt instruction for masked text."""
+        return (
+            'The text contains placeholders of the form [[F1]], [[F2]]. Each stands for a term that must '
+            'not change. Copy every placeholder exactly as written, as many times as it occurs, where the '
+            'term belongs in the rewritten sentence. Do not translate, explain or remove placeholders.'
+        )
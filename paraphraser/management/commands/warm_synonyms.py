@@ -0,0 +1,45 @@
+"""
+Pre-fill the synonym cache (see paraphraser.synonyms).
+Usage: python manage.py warm_synonyms [--days 30] [--limit 5000] [--top 500] [--max-calls 100] [--file texts.txt]
+
+Counts (word, context) pairs in recent paraphraser inputs, or in a text
+file, and fetches synonyms for the most frequent ones that are not cached.
+Run it from cron after deploys or Redis flushes.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from paraphraser.models import ParaphraseHistory
+from paraphraser.synonyms import SynonymEngine
+
+
+class Command(BaseCommand):
+    help = 'Pre-fill the synonym cache with the most frequent words of recent paraphraser inputs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Read paraphrase history from this many days')
+        parser.add_argument('--limit', type=int, default=5000, help='Max history entries to read')
+        parser.add_argument('--top', type=int, default=500, help='Number of most frequent (word, context) pairs')
+        parser.add_argument('--max-calls', type=int, default=100, help='Max batch LLM calls')
+        parser.add_argument('--file', help='Read texts from this file (one per line) instead of the history')
+
+    def handle(self, *args, **options):
+        if options['file']:
+            try:
+                with open(options['file'], encoding='utf-8') as source:
+                    texts = source.read().splitlines()
+            except OSError as e:
+                raise CommandError(str(e))
+        else:
+            since = timezone.now() - timedelta(days=options['days'])
+            texts = ParaphraseHistory.objects.filter(created_at__gte=since).order_by('-created_at').values_list(
+                'input_text', flat=True,
+            )[:options['limit']]
+
+        result = SynonymEngine.warm(texts, top=options['top'], max_calls=options['max_calls'])
+        self.stdout.write(
+            f"{result['frequent']} frequent pairs, {result['already_cached']} already cached, "
+            f"{result['calls']} batch calls made"
+        )
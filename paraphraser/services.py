@@ -1,18 +1,32 @@
+import asyncio
 import json
 import logging
 import re
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
 
+from core import llm_transport
 from core.llm_client import LLMClient
+from core.llm_incremental import IncrementalRewrite
+from core.llm_mapreduce import MapReduce
+from core.llm_neardup import NearDuplicateCache
+from core.llm_prompt_cache import CachedPrompt
+from core.llm_tokens import TokenBudget
+from paraphraser.frozen import FrozenTerms
+from paraphraser.synonyms import SynonymEngine
 
 logger = logging.getLogger('app')
 
+# Returned when a generate(n=...) reply holds no usable alternative
+NO_VARIANTS_ERROR = 'Failed to generate paraphrase alternatives. Please try again.'
+
 
 class AIParaphraseService:
     """
     Service layer for AI-powered paraphrasing using the Anthropic Claude API.
-    Handles mode-specific prompts, frozen word preservation, and post-processing.
+    Handles mode-specific prompts, frozen word preservation (see
+    paraphraser.frozen), and post-processing.
     """
 
     MODE_PROMPTS = {
@@ -84,10 +98,15 @@ class AIParaphraseService:
 
     @classmethod
     def paraphrase(cls, text, mode='standard', synonym_level=3, frozen_words=None,
-                   settings_dict=None, language='en', use_premium=False):
+                   settings_dict=None, language='en', use_premium=False, document=None, n_variants=1,
+                   owner=None):
         """
         Paraphrase text with mode-specific system prompts.
 
+        Long premium inputs (see splits()) are paraphrased paragraph by
+        paragraph in parallel, with the same prompt and frozen terms for
+        every chunk.
+
         Args:
             text: The input text to paraphrase.
             mode: Paraphrasing mode (standard, fluency, formal, academic, simple, creative, expand, shorten, custom, humanizer).
@@ -96,115 +115,342 @@ class AIParaphraseService:
             settings_dict: Dict with optional keys: use_contractions, active_voice, custom_instructions.
             language: ISO language code for the output.
             use_premium: If True, use Claude for premium users.
+            document: Key of the user's document or session. When set, a
+                re-run after small edits only rewrites the changed
+                sentences (see core.llm_incremental).
+            n_variants: Number of alternative paraphrases to generate in
+                one upstream call. Meant for inputs that are not split.
+            owner: Key of the user or session; its chunk calls share
+                LLM_USER_CONCURRENCY across documents.
 
         Returns:
             Tuple of (output_text, error). On success error is None; on failure output_text is None.
+            With n_variants > 1 output_text is a list of up to n_variants
+            distinct paraphrases.
         """
         if frozen_words is None:
             frozen_words = []
         if settings_dict is None:
             settings_dict = {}
 
-        # Build the system prompt
-        system_prompt = cls._build_system_prompt(mode, synonym_level, frozen_words, settings_dict, language)
+        args = (mode, synonym_level, frozen_words, settings_dict, language, use_premium)
+        if n_variants > 1:
+            namespace = cls._cache_namespace(*args) + (n_variants,)
+            match = NearDuplicateCache.get('paraphraser', text, namespace)
+            if match is not None:
+                return match[1], None
+            request, masked = cls._variants_request(text, n_variants, *args)
+            raw, error = LLMClient.generate(**request)
+            if error:
+                return None, error
+            variants = cls._split_variants(raw, frozen_words, settings_dict, masked)
+            if not variants:
+                return None, NO_VARIANTS_ERROR
+            NearDuplicateCache.set('paraphraser', text, variants, namespace)
+            return variants, None
+
+        namespace = cls._cache_namespace(*args)
+        match = NearDuplicateCache.get('paraphraser', text, namespace)
+        if match is not None:
+            IncrementalRewrite.record('paraphraser', document, namespace, text, match[1])
+            return match[1], None
+
+        plan = IncrementalRewrite.load('paraphraser', document, namespace, text)
+        if plan is not None:
+            requests = [cls._region_request(region, *args) for region in plan.regions]
+            results = LLMClient.generate_many([request for request, _ in requests])
+            outputs = []
+            for (output, error), (_, masked) in zip(results, requests):
+                if error:
+                    return None, error
+                outputs.append(cls._post_process(output, frozen_words, settings_dict, masked))
+            output_text = plan.stitch(outputs)
+        elif cls.splits(text, use_premium):
+            chunks = MapReduce.split(text, MapReduce.chunk_tokens('paraphrase'))
+            outputs = []
+            for output, error in cls._paraphrase_chunks(chunks, args, owner):
+                if error:
+                    return None, error
+                outputs.append(output)
+            output_text = MapReduce.join(chunks, outputs)
+            IncrementalRewrite.record('paraphraser', document, namespace, text, output_text)
+        else:
+            request, masked = cls._paraphrase_request(text, *args)
+            output_text, error = LLMClient.generate(**request)
 
-        # Build the user message — clearly demarcate the text so the model
-        # doesn't confuse system-prompt instructions with user content.
-        if mode == 'custom' and settings_dict.get('custom_instructions'):
-            user_message = (
-                f"Custom instructions: {settings_dict['custom_instructions']}\n\n"
-                f"Text to paraphrase:\n\"\"\"\n{text}\n\"\"\""
-            )
+            if error:
+                return None, error
+
+            # Post-processing
+            output_text = cls._post_process(output_text, frozen_words, settings_dict, masked)
+            IncrementalRewrite.record('paraphraser', document, namespace, text, output_text)
+
+        NearDuplicateCache.set('paraphraser', text, output_text, namespace)
+        return output_text, None
+
+    @classmethod
+    async def aparaphrase(cls, text, mode='standard', synonym_level=3, frozen_words=None,
+                          settings_dict=None, language='en', use_premium=False, document=None, n_variants=1,
+                          owner=None):
+        """
+        Async counterpart of paraphrase() for ASGI views.
+
+        Chunks of a long input run at most LLM_MAPREDUCE_CONCURRENCY at once;
+        the cross-document per-user cap applies to the threaded paths only.
+        """
+        if frozen_words is None:
+            frozen_words = []
+        if settings_dict is None:
+            settings_dict = {}
+
+        args = (mode, synonym_level, frozen_words, settings_dict, language, use_premium)
+        if n_variants > 1:
+            namespace = cls._cache_namespace(*args) + (n_variants,)
+            match = await sync_to_async(NearDuplicateCache.get)('paraphraser', text, namespace)
+            if match is not None:
+                return match[1], None
+            request, masked = cls._variants_request(text, n_variants, *args)
+            raw, error = await LLMClient.agenerate(**request)
+            if error:
+                return None, error
+            variants = cls._split_variants(raw, frozen_words, settings_dict, masked)
+            if not variants:
+                return None, NO_VARIANTS_ERROR
+            await sync_to_async(NearDuplicateCache.set)('paraphraser', text, variants, namespace)
+            return variants, None
+
+        namespace = cls._cache_namespace(*args)
+        match = await sync_to_async(NearDuplicateCache.get)('paraphraser', text, namespace)
+        if match is not None:
+            await sync_to_async(IncrementalRewrite.record)('paraphraser', document, namespace, text, match[1])
+            return match[1], None
+
+        plan = await sync_to_async(IncrementalRewrite.load)('paraphraser', document, namespace, text)
+        if plan is not None:
+            requests = [cls._region_request(region, *args) for region in plan.regions]
+            results = await asyncio.gather(*(LLMClient.agenerate(**request) for request, _ in requests))
+            outputs = []
+            for (output, error), (_, masked) in zip(results, requests):
+                if error:
+                    return None, error
+                outputs.append(cls._post_process(output, frozen_words, settings_dict, masked))
+            output_text = await sync_to_async(plan.stitch)(outputs)
+        elif cls.splits(text, use_premium):
+            chunks = MapReduce.split(text, MapReduce.chunk_tokens('paraphrase'))
+            masked = {}
+
+            def build(chunk):
+                request, masked[chunk.offset] = cls._paraphrase_request(chunk.text, *args)
+                return request
+
+            outputs = []
+            for chunk, (output, error) in zip(chunks, await MapReduce.amap(chunks, build)):
+                if error:
+                    return None, error
+                outputs.append(cls._post_process(output, frozen_words, settings_dict, masked[chunk.offset]))
+            output_text = MapReduce.join(chunks, outputs)
+            await sync_to_async(IncrementalRewrite.record)('paraphraser', document, namespace, text, output_text)
         else:
-            user_message = f"\"\"\"\n{text}\n\"\"\""
+            request, masked = cls._paraphrase_request(text, *args)
+            output_text, error = await LLMClient.agenerate(**request)
 
-        output_text, error = LLMClient.generate(
-            system_prompt=system_prompt,
-            messages=[{'role': 'user', 'content': user_message}],
-            max_tokens=4096,
-            use_premium=use_premium,
-        )
+            if error:
+                return None, error
 
-        if error:
-            return None, error
+            output_text = cls._post_process(output_text, frozen_words, settings_dict, masked)
+            await sync_to_async(IncrementalRewrite.record)('paraphraser', document, namespace, text, output_text)
 
-        # Post-processing
-        output_text = cls._post_process(output_text, frozen_words, settings_dict)
+        await sync_to_async(NearDuplicateCache.set)('paraphraser', text, output_text, namespace)
         return output_text, None
 
     @classmethod
-    def get_synonyms(cls, word, context='', use_premium=False):
+    def paraphrase_stream(cls, text, mode='standard', synonym_level=3, frozen_words=None,
+                          settings_dict=None, language='en', use_premium=False, owner=None):
         """
-        Get a list of contextual synonyms for a word.
+        Stream a paraphrase as it is generated.
 
-        Args:
-            word: The word to find synonyms for.
-            context: The surrounding sentence for context-aware synonyms.
-            use_premium: If True, use Claude for premium users.
+        Takes the same arguments as paraphrase(). Yields (delta, error) tuples
+        from LLMClient.stream(), with frozen terms already restored. Deltas
+        are otherwise raw model output; callers should run _post_process()
+        on the joined text once the stream completes.
+
+        Long premium inputs are paraphrased in parallel chunks instead; each
+        chunk's post-processed output, followed by its paragraph break, is
+        one delta, yielded in order as soon as the chunks before it are done.
+        """
+        if frozen_words is None:
+            frozen_words = []
+        if settings_dict is None:
+            settings_dict = {}
+
+        args = (mode, synonym_level, frozen_words, settings_dict, language, use_premium)
+        if cls.splits(text, use_premium):
+            chunks = MapReduce.split(text, MapReduce.chunk_tokens('paraphrase'))
+            for chunk, (output, error) in zip(chunks, cls._paraphrase_chunks(chunks, args, owner)):
+                if error:
+                    yield None, error
+                    return
+                yield output + chunk.separator, None
+            return
+
+        request, _ = cls._paraphrase_request(text, *args)
+        yield from FrozenTerms.get(frozen_words).restore_stream(LLMClient.stream(**request))
+
+    @staticmethod
+    def splits(text, use_premium):
+        """True for premium inputs longer than one paraphrase chunk (LLM_MAPREDUCE_CHUNK_TOKENS)."""
+        return bool(use_premium) and MapReduce.needs_split(text, 'paraphrase')
+
+    @classmethod
+    def _paraphrase_chunks(cls, chunks, args, owner):
+        """
+        Paraphrase the chunks of a long input in parallel.
+
+        Every chunk gets the same system prompt and frozen terms; at most
+        LLM_USER_CONCURRENCY calls of the owner run at once. Yields
+        (output, error) per chunk in order, stopping after an error.
+        """
+        frozen_words, settings_dict = args[2], args[3]
+        masked = {}
+
+        def build(chunk):
+            request, masked[chunk.offset] = cls._paraphrase_request(chunk.text, *args)
+            return request
+
+        slot = llm_transport.user_slot(owner) if owner else None
+        for chunk, (output, error) in zip(chunks, MapReduce.stream(chunks, build, slot)):
+            if error:
+                yield None, error
+                return
+            yield cls._post_process(output, frozen_words, settings_dict, masked[chunk.offset]), None
+
+    @staticmethod
+    def _cache_namespace(mode, synonym_level, frozen_words, settings_dict, language, use_premium):
+        """Parameters a cached paraphrase depends on (see core.llm_neardup)."""
+        return (mode, synonym_level, sorted(frozen_words), settings_dict, language, bool(use_premium))
+
+    @classmethod
+    def _paraphrase_request(cls, text, mode, synonym_level, frozen_words, settings_dict,
+                            language, use_premium):
+        """
+        Build the LLMClient keyword arguments for a paraphrase call, with
+        frozen terms masked.
 
         Returns:
-            Tuple of (synonyms_list, error). On success error is None.
+            Tuple of (request kwargs, placeholder counts for _post_process()).
         """
-        system_prompt = (
-            'You are a synonym generator. Given a word and its surrounding context, provide a list of '
-            'suitable synonyms or alternative words that fit naturally in the same context. '
-            'Return ONLY a JSON array of strings, nothing else. Example: ["word1", "word2", "word3"]. '
-            'Provide 5-8 synonyms ordered from most to least suitable. '
-            'If the word has no good synonyms in context, return an empty array [].'
-        )
+        masked_text, masked = FrozenTerms.get(frozen_words).mask(text)
+        return {
+            'system_prompt': cls._build_system_prompt(mode, synonym_level, bool(masked), settings_dict, language),
+            'messages': [{'role': 'user', 'content': cls._build_user_message(masked_text, mode, settings_dict)}],
+            'max_tokens': TokenBudget.max_tokens_for(
+                text, mode if mode in ('expand', 'shorten') else 'rewrite', ceiling=4096,
+            ),
+            'use_premium': use_premium,
+            'tool': 'paraphraser',
+        }, masked
 
-        user_message = f'Word: "{word}"'
+    @classmethod
+    def _region_request(cls, region, mode, synonym_level, frozen_words, settings_dict, language, use_premium):
+        """Build the _paraphrase_request() for re-paraphrasing an edited region (see core.llm_incremental)."""
+        request, masked = cls._paraphrase_request(
+            region.text, mode, synonym_level, frozen_words, settings_dict, language, use_premium,
+        )
+        frozen = FrozenTerms.get(frozen_words)
+        context = []
+        if region.before:
+            before = frozen.mask(' '.join(region.before))[0]
+            context.append(f'Preceding text (context only, do not paraphrase or repeat it): {before}')
+        if region.after:
+            after = frozen.mask(' '.join(region.after))[0]
+            context.append(f'Following text (context only, do not paraphrase or repeat it): {after}')
         if context:
-            user_message += f'\nContext: "{context}"'
+            message = request['messages'][0]
+            message['content'] = '\n'.join(context) + '\n\n' + message['content']
+        return request, masked
 
-        raw, error = LLMClient.generate(
-            system_prompt=system_prompt,
-            messages=[{'role': 'user', 'content': user_message}],
-            max_tokens=256,
-            use_premium=use_premium,
+    @classmethod
+    def _variants_request(cls, text, n_variants, mode, synonym_level, frozen_words, settings_dict,
+                          language, use_premium):
+        """Build the _paraphrase_request() for ``n_variants`` alternatives in one call."""
+        request, masked = cls._paraphrase_request(
+            text, mode, synonym_level, frozen_words, settings_dict, language, use_premium,
         )
+        request['n'] = n_variants
+        request['temperature'] = getattr(settings, 'PARAPHRASE_VARIANT_TEMPERATURE', 0.9)
+        return request, masked
 
-        if error:
-            return None, error
-
+    @classmethod
+    def _split_variants(cls, raw, frozen_words, settings_dict, masked):
+        """Post-process each alternative of a generate(n=...) reply, dropping empty and repeated ones."""
         try:
-            # Handle case where model wraps in markdown code block
-            if raw.startswith('```'):
-                raw = raw.split('\n', 1)[-1].rsplit('```', 1)[0].strip()
-            synonyms = json.loads(raw)
+            variants = json.loads(raw)
+        except ValueError:
+            variants = None
+        if not isinstance(variants, list):
+            variants = [raw]
+        outputs = (cls._post_process(variant, frozen_words, settings_dict, masked) for variant in variants
+                   if isinstance(variant, str))
+        return list(dict.fromkeys(output for output in outputs if output))
 
-            if not isinstance(synonyms, list):
-                return [], None
+    @classmethod
+    def get_synonyms(cls, word, context='', use_premium=False):
+        """
+        Get a list of contextual synonyms for a word.
 
-            # Filter to strings only and limit
-            synonyms = [s for s in synonyms if isinstance(s, str)][:8]
-            return synonyms, None
+        Served from the synonym cache when possible; a miss fetches the
+        whole context sentence in one call (see paraphraser.synonyms).
 
-        except (json.JSONDecodeError, ValueError):
-            logger.warning(f'Failed to parse synonym response for word: {word}')
-            return [], None
+        Args:
+            word: The word to find synonyms for.
+            context: The surrounding sentence for context-aware synonyms.
+            use_premium: If True, use Claude for premium users.
+
+        Returns:
+            Tuple of (synonyms_list, error). On success error is None.
+        """
+        return SynonymEngine.lookup(word, context, use_premium)
 
     @classmethod
-    def _build_system_prompt(cls, mode, synonym_level, frozen_words, settings_dict, language):
-        """Build the full system prompt from mode, settings, and constraints."""
-        parts = []
+    def get_sentence_synonyms(cls, sentence, use_premium=False):
+        """
+        Get contextual synonyms for every content word of a sentence in one call.
+
+        Returns:
+            Tuple of ({word: synonyms_list}, error). On success error is None.
+        """
+        return SynonymEngine.batch(sentence, use_premium)
+
+    @classmethod
+    def _build_system_prompt(cls, mode, synonym_level, masked, settings_dict, language):
+        """
+        Build the full system prompt from mode, settings, and constraints.
 
+        The mode, synonym level and output instructions come first and form
+        the cacheable static prefix; per-request constraints follow it.
+        """
         # Base mode prompt
         base_prompt = cls.MODE_PROMPTS.get(mode, cls.MODE_PROMPTS['standard'])
-        parts.append(base_prompt)
 
         # Synonym level instruction
         synonym_level = max(1, min(5, synonym_level))
-        parts.append(cls.SYNONYM_LEVEL_INSTRUCTIONS[synonym_level])
-
-        # Frozen words
-        if frozen_words:
-            frozen_str = ', '.join(f'"{w}"' for w in frozen_words)
-            parts.append(
-                f'IMPORTANT: The following words/phrases MUST remain exactly as they are and must NOT be '
-                f'changed, replaced, or paraphrased: {frozen_str}. Keep them in their original position '
-                f'and form within the text.'
-            )
+
+        # Output instruction
+        static = '\n\n'.join([
+            base_prompt,
+            cls.SYNONYM_LEVEL_INSTRUCTIONS[synonym_level],
+            'The user will provide text wrapped in triple quotes ("""). Paraphrase ONLY that text. '
+            'Do NOT paraphrase these instructions. '
+            'CRITICAL: Return ONLY the paraphrased text. Do not include any explanations, notes, '
+            'introductions, labels, or commentary such as "Here is the paraphrased text:". '
+            'Do not wrap the output in quotes. Output the rewritten text directly and nothing else.',
+        ])
+
+        parts = []
+
+        # Frozen words, masked as placeholders
+        if masked:
+            parts.append(f'IMPORTANT: {FrozenTerms.prompt_note()}')
 
         # Contractions preference
         if settings_dict.get('use_contractions') is True:
@@ -220,16 +466,20 @@ class AIParaphraseService:
         if language and language != 'en':
             parts.append(f'Output the paraphrased text in the language with ISO code: {language}.')
 
-        # Output instruction
-        parts.append(
-            'The user will provide text wrapped in triple quotes ("""). Paraphrase ONLY that text. '
-            'Do NOT paraphrase these instructions. '
-            'CRITICAL: Return ONLY the paraphrased text. Do not include any explanations, notes, '
-            'introductions, labels, or commentary such as "Here is the paraphrased text:". '
-            'Do not wrap the output in quotes. Output the rewritten text directly and nothing else.'
-        )
+        return CachedPrompt(static, ''.join(f'\n\n{part}' for part in parts))
 
-        return '\n\n'.join(parts)
+    @staticmethod
+    def _build_user_message(text, mode, settings_dict):
+        """
+        Build the user message. The text is clearly demarcated so the model
+        doesn't confuse system-prompt instructions with user content.
+        """
+        if mode == 'custom' and settings_dict.get('custom_instructions'):
+            return (
+                f"Custom instructions: {settings_dict['custom_instructions']}\n\n"
+                f"Text to paraphrase:\n\"\"\"\n{text}\n\"\"\""
+            )
+        return f"\"\"\"\n{text}\n\"\"\""
 
     # Common preamble patterns the model may prepend despite instructions
     _PREAMBLE_RE = re.compile(
@@ -242,8 +492,13 @@ class AIParaphraseService:
     )
 
     @classmethod
-    def _post_process(cls, text, frozen_words, settings_dict):
-        """Apply post-processing to the paraphrased output."""
+    def _post_process(cls, text, frozen_words, settings_dict, masked=None):
+        """
+        Apply post-processing to the paraphrased output.
+
+        ``masked`` is the placeholder count from _paraphrase_request();
+        placeholders are restored and checked against it.
+        """
         if not text:
             return text
 
@@ -254,12 +509,11 @@ class AIParaphraseService:
         if text.startswith('"""') and text.endswith('"""'):
             text = text[3:-3]
 
-        # Re-insert frozen words if the model changed them despite instructions.
-        # This is a best-effort pass: for each frozen word, if a case-insensitive
-        # variant appears, normalize it back to the original casing.
-        for word in frozen_words:
-            pattern = re.compile(re.escape(word), re.IGNORECASE)
-            text = pattern.sub(word, text)
+        # Restore masked frozen words, then normalize any the model wrote
+        # out itself back to the frozen casing, one pass each
+        frozen = FrozenTerms.get(frozen_words)
+        text = frozen.restore(text, masked or {})[0]
+        text = frozen.normalize(text)
 
         # Strip any leading/trailing quotes the model may have wrapped
         if text.startswith('"') and text.endswith('"'):
@@ -0,0 +1,310 @@
+"""
+Batched, cached contextual synonyms for the paraphraser.
+
+Clicking a word used to cost one LLM call per word, uncached. Synonyms are
+now fetched for every content word of the sentence in one call, and each
+word's list is cached under its form and the words around it:
+
+    key = (lowercased word, LLM_SYNONYM_CONTEXT_WORDS words on either side)
+
+Context longer than a sentence is narrowed to the sentence that contains
+the word first. The first click in a sentence pays for one batch call;
+further clicks in the same sentence, and the same phrase in other texts,
+are served from the cache. Two tiers are consulted, as in core.llm_cache: an in-process LRU
+(LLM_SYNONYM_LOCAL_SIZE entries, LLM_SYNONYM_LOCAL_TTL seconds), then the
+LLM_CACHE_ALIAS cache (Redis in production) for LLM_SYNONYM_TTL seconds.
+
+``manage.py warm_synonyms`` pre-fills the cache with the most frequent
+(word, context) pairs of recent paraphraser inputs.
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core.llm_client import LLMClient, extract_json
+
+logger = logging.getLogger('app')
+
+_WORD = re.compile(r"[^\W\d_]+(?:['’-][^\W\d_]+)*")
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+|\n+')
+
+# Function words never offered for synonyms
+STOPWORDS = frozenset('''
+a about above after again against all am an and any are as at be because been before being below between
+both but by can could did do does doing down during each few for from further had has have having he her
+here hers herself him himself his how i if in into is it its itself just me more most my myself no nor not
+now of off on once only or other our ours ourselves out over own same she should so some such than that the
+their theirs them themselves then there these they this those through to too under until up very was we
+were what when where which while who whom why will with would you your yours yourself yourselves
+'''.split())
+
+SYSTEM_PROMPT = (
+    'You are a synonym generator. Given a sentence and a list of words from it, provide for each word '
+    'suitable synonyms or alternative words that fit naturally in that sentence, in the same grammatical '
+    'form. Return ONLY a JSON object mapping each listed word, exactly as given, to an array of 5-8 '
+    'synonyms ordered from most to least suitable. Use an empty array for words with no good synonym '
+    'in context. Example: {"fast": ["quick", "rapid"], "car": ["vehicle", "automobile"]}'
+)
+
+
+def _fold(word):
+    return word.lower().replace('’', "'")
+
+
+def sentence_of(text, word):
+    """Return the first sentence of ``text`` that contains ``word``, or '' if none does."""
+    target = _fold(word.strip())
+    for sentence in _SENTENCE_END.split(text):
+        if any(_fold(found) == target for found in _WORD.findall(sentence)):
+            return sentence.strip()
+    return ''
+
+
+def content_words(sentence):
+    """
+    Return (word, key) pairs for the content words of ``sentence``.
+
+    Function words, one- and two-letter words are skipped; at most
+    LLM_SYNONYM_BATCH_WORDS words are returned.
+    """
+    words = _WORD.findall(sentence)
+    folded = [_fold(word) for word in words]
+    span = getattr(settings, 'LLM_SYNONYM_CONTEXT_WORDS', 2)
+    pairs = []
+    seen = set()
+    for index, word in enumerate(folded):
+        if len(word) < 3 or word in STOPWORDS:
+            continue
+        window = folded[max(0, index - span):index] + ['_'] + folded[index + 1:index + 1 + span]
+        key = SynonymEngine.make_key(word, window)
+        if key not in seen:
+            seen.add(key)
+            pairs.append((words[index], key))
+    return pairs[:getattr(settings, 'LLM_SYNONYM_BATCH_WORDS', 24)]
+
+
+class SynonymEngine:
+    """Two-tier cache of contextual synonyms filled by batch calls. See module docstring."""
+
+    KEY_PREFIX = 'syn:'
+
+    _local = OrderedDict()
+    _lock = threading.Lock()
+    _stats = {'local_hits': 0, 'redis_hits': 0, 'misses': 0, 'batch_calls': 0}
+
+    @staticmethod
+    def make_key(word, window):
+        """Cache key of a lowercased word in its context window (the word itself replaced by '_')."""
+        raw = f'{word}|{" ".join(window)}'
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+    @classmethod
+    def lookup(cls, word, context='', use_premium=False):
+        """
+        Return synonyms for ``word`` as used in ``context``.
+
+        ``context`` may be a whole text; only the sentence containing the
+        word is used. A cache miss fetches the uncached content words of that
+        sentence in one batch call, so the next clicks in it are hits.
+
+        Returns:
+            Tuple of (synonyms_list, error).
+        """
+        target = _fold(word.strip())
+        context = sentence_of(context, word) if context else ''
+        pairs = content_words(context) if context else []
+        key = next((key for found, key in pairs if _fold(found) == target), None)
+        if key is None:
+            # Function word, or no context: look the word up on its own
+            key = cls.make_key(target, [_fold(w) for w in _WORD.findall(context)] or ['_'])
+            pairs = [(word.strip(), key)]
+
+        cached = cls._get_many([key])
+        if key in cached:
+            return cached[key], None
+
+        others = cls._get_many([other for _, other in pairs if other != key])
+        missing = [(found, other) for found, other in pairs if other not in others]
+        results, error = cls._fetch(context or word, missing, use_premium)
+        if error:
+            return None, error
+        return results.get(key, []), None
+
+    @classmethod
+    def batch(cls, sentence, use_premium=False):
+        """
+        Return synonyms for every content word of ``sentence``.
+
+        Cached words are served from the cache; the rest are fetched in one
+        LLM call.
+
+        Returns:
+            Tuple of ({word: synonyms_list}, error).
+        """
+        pairs = content_words(sentence)
+        cached = cls._get_many([key for _, key in pairs])
+        missing = [(word, key) for word, key in pairs if key not in cached]
+        if missing:
+            fetched, error = cls._fetch(sentence, missing, use_premium)
+            if error:
+                return None, error
+            cached.update(fetched)
+        return {word: cached.get(key, []) for word, key in pairs}, None
+
+    @classmethod
+    def warm(cls, texts, top=500, max_calls=100):
+        """
+        Pre-fill the cache with the ``top`` most frequent (word, context)
+        pairs of ``texts``, at most ``max_calls`` batch calls.
+
+        Each call fetches a whole sentence containing an uncached frequent
+        pair, so its other words are cached along with it.
+
+        Returns:
+            Dict with the number of frequent pairs, those already cached,
+            and the batch calls made.
+        """
+        counts = Counter()
+        sentence_of = {}
+        for text in texts:
+            for sentence in _SENTENCE_END.split(text or ''):
+                for _, key in content_words(sentence):
+                    counts[key] += 1
+                    sentence_of.setdefault(key, sentence.strip())
+
+        wanted = [key for key, _ in counts.most_common(top)]
+        cached = set(cls._get_many(wanted))
+        done = set(cached)
+        calls = 0
+        for key in wanted:
+            if key in done:
+                continue
+            if calls >= max_calls:
+                break
+            sentence = sentence_of[key]
+            _, error = cls.batch(sentence)
+            calls += 1
+            if error:
+                logger.warning(f'Synonym warm-up stopped: {error}')
+                break
+            done.update(other for _, other in content_words(sentence))
+        return {'frequent': len(wanted), 'already_cached': len(cached), 'calls': calls}
+
+    @classmethod
+    def stats(cls):
+        """Return hit, miss and batch call counters for this process."""
+        with cls._lock:
+            return dict(cls._stats)
+
+    @classmethod
+    def clear(cls):
+        """Empty the in-process tier and reset counters."""
+        with cls._lock:
+            cls._local.clear()
+            for field in cls._stats:
+                cls._stats[field] = 0
+
+    @classmethod
+    def _fetch(cls, sentence, pairs, use_premium):
+        """Ask the model for synonyms of ``pairs`` words in one call and cache them by key."""
+        words = list(dict.fromkeys(word for word, _ in pairs))
+        listed = ', '.join(f'"{word}"' for word in words)
+        raw, error = LLMClient.generate(
+            system_prompt=SYSTEM_PROMPT,
+            messages=[{'role': 'user', 'content': f'Sentence: "{sentence}"\nWords: {listed}'}],
+            max_tokens=min(2048, 64 + 48 * len(words)),
+            use_premium=use_premium,
+            tool='synonyms',
+        )
+        if error:
+            return None, error
+        with cls._lock:
+            cls._stats['batch_calls'] += 1
+
+        try:
+            parsed = extract_json(raw)
+        except ValueError:
+            logger.warning(f'Failed to parse synonym response for: {", ".join(words)[:200]}')
+            return {}, None
+        if isinstance(parsed, list) and len(words) == 1:
+            parsed = {words[0]: parsed}
+        if not isinstance(parsed, dict):
+            return {}, None
+
+        folded = {_fold(str(word)): value for word, value in parsed.items()}
+        results = {}
+        for word, key in pairs:
+            synonyms = folded.get(_fold(word))
+            if isinstance(synonyms, list):
+                # Filter to strings only and limit
+                results[key] = [s for s in synonyms if isinstance(s, str)][:8]
+        cls._set_many(results)
+        return results, None
+
+    @classmethod
+    def _get_many(cls, keys):
+        """Return {key: synonyms} for the cached keys, from the local tier first."""
+        now = time.monotonic()
+        found = {}
+        with cls._lock:
+            for key in keys:
+                entry = cls._local.get(key)
+                if entry is not None:
+                    if entry[0] > now:
+                        cls._local.move_to_end(key)
+                        found[key] = entry[1]
+                    else:
+                        del cls._local[key]
+            cls._stats['local_hits'] += len(found)
+
+        remote = [key for key in keys if key not in found]
+        if remote:
+            try:
+                shared = cls._backend().get_many([cls.KEY_PREFIX + key for key in remote])
+            except Exception as e:
+                logger.warning(f'Synonym cache read failed: {e}')
+                shared = {}
+            for key in remote:
+                synonyms = shared.get(cls.KEY_PREFIX + key)
+                if synonyms is not None:
+                    found[key] = synonyms
+                    cls._remember(key, synonyms)
+            with cls._lock:
+                cls._stats['redis_hits'] += sum(1 for key in remote if key in found)
+                cls._stats['misses'] += sum(1 for key in remote if key not in found)
+        return found
+
+    @classmethod
+    def _set_many(cls, results):
+        if not results:
+            return
+        for key, synonyms in results.items():
+            cls._remember(key, synonyms)
+        try:
+            cls._backend().set_many(
+                {cls.KEY_PREFIX + key: synonyms for key, synonyms in results.items()},
+                timeout=getattr(settings, 'LLM_SYNONYM_TTL', 7 * 86400),
+            )
+        except Exception as e:
+            logger.warning(f'Synonym cache write failed: {e}')
+
+    @classmethod
+    def _remember(cls, key, synonyms):
+        max_entries = getattr(settings, 'LLM_SYNONYM_LOCAL_SIZE', 10000)
+        if max_entries <= 0:
+            return
+        with cls._lock:
+            cls._local[key] = (time.monotonic() + getattr(settings, 'LLM_SYNONYM_LOCAL_TTL', 3600), synonyms)
+            cls._local.move_to_end(key)
+            while len(cls._local) > max_entries:
+                cls._local.popitem(last=False)
+
+    @staticmethod
+    def _backend():
+        return caches[getattr(settings, 'LLM_CACHE_ALIAS', 'default')]
@@ -1,10 +1,12 @@
 from django.urls import path
 
-from paraphraser.views import ParaphraserPage, ParaphraseAPI, SynonymAPI, HistoryAPI
+from core.llm_views import llm_api_view
+from paraphraser.views import ParaphraserPage, ParaphraseAPI, ParaphraseStreamAPI, SynonymAPI, HistoryAPI
 
 urlpatterns = [
     path('paraphrasing-tool/', ParaphraserPage.as_view(), name='paraphraser'),
-    path('api/paraphrase/', ParaphraseAPI.as_view(), name='paraphrase_api'),
+    path('api/paraphrase/', llm_api_view(ParaphraseAPI), name='paraphrase_api'),
+    path('api/paraphrase/stream/', ParaphraseStreamAPI.as_view(), name='paraphrase_stream_api'),
     path('api/paraphrase/synonyms/', SynonymAPI.as_view(), name='paraphrase_synonyms_api'),
     path('api/paraphrase/history/', HistoryAPI.as_view(), name='paraphrase_history_api'),
 ]
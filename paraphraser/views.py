@@ -8,8 +8,10 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from accounts.views import GlobalVars
+from core.llm_views import LLMAPIView
+from core.streaming import sse_response, stream_events
 from paraphraser.models import ParaphraseHistory
-from paraphraser.services import AIParaphraseService
+from paraphraser.services import AIParaphraseService, NO_VARIANTS_ERROR
 import config
 
 logger = logging.getLogger('app')
@@ -45,17 +47,24 @@ class ParaphraserPage(View):
                 'free_word_limit': FREE_WORD_LIMIT,
                 'free_modes': FREE_MODES,
                 'all_modes': ALL_MODES,
+                'variants': getattr(django_settings, 'PARAPHRASE_VARIANTS', 1),
             }
         )
 
 
-class ParaphraseAPI(APIView):
+class ParaphraseAPI(LLMAPIView):
     """
     POST /api/paraphrase/
     Accepts text and settings, returns paraphrased output.
     """
 
-    def post(self, request):
+    def validate(self, request):
+        """
+        Parse and validate the request body against free-tier limits.
+
+        Returns:
+            Tuple of (params, error_response). On success error_response is None.
+        """
         data = request.data
         text = data.get('text', '').strip()
         mode = data.get('mode', 'standard')
@@ -66,13 +75,13 @@ class ParaphraseAPI(APIView):
 
         # --- Validation ---
         if not text:
-            return Response(
+            return None, Response(
                 {'error': 'Please enter some text to paraphrase.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         if mode not in ALL_MODES:
-            return Response(
+            return None, Response(
                 {'error': 'Invalid paraphrasing mode.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
@@ -83,6 +92,13 @@ class ParaphraseAPI(APIView):
         except (ValueError, TypeError):
             synonym_level = 3
 
+        # Alternatives generated in the same upstream call
+        try:
+            n_variants = int(data.get('n_variants', 1))
+            n_variants = max(1, min(getattr(django_settings, 'PARAPHRASE_MAX_VARIANTS', 4), n_variants))
+        except (ValueError, TypeError):
+            n_variants = 1
+
         word_count = AIParaphraseService.count_words(text)
         is_premium = (
             request.user.is_authenticated and request.user.is_plan_active
@@ -91,7 +107,7 @@ class ParaphraseAPI(APIView):
         # --- Free tier limits ---
         if not is_premium:
             if word_count > FREE_WORD_LIMIT:
-                return Response(
+                return None, Response(
                     {
                         'error': f'Free accounts are limited to {FREE_WORD_LIMIT} words. You entered {word_count} words.',
                         'upgrade': True,
@@ -101,7 +117,7 @@ class ParaphraseAPI(APIView):
                     status=status.HTTP_403_FORBIDDEN
                 )
             if mode not in FREE_MODES:
-                return Response(
+                return None, Response(
                     {
                         'error': f'The "{mode}" mode is available for premium users only.',
                         'upgrade': True,
@@ -109,58 +125,149 @@ class ParaphraseAPI(APIView):
                     status=status.HTTP_403_FORBIDDEN
                 )
 
-        # --- Call AI service ---
-        output_text, error = AIParaphraseService.paraphrase(
-            text=text,
-            mode=mode,
-            synonym_level=synonym_level,
-            frozen_words=frozen_words,
-            settings_dict=settings_dict,
-            language=language,
-            use_premium=is_premium,
-        )
+        # Long inputs are paraphrased in chunks, one version only
+        if n_variants > 1 and AIParaphraseService.splits(text, is_premium):
+            n_variants = 1
 
-        if error:
-            return Response(
-                {'error': error},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        # Re-runs of the same document only re-paraphrase edited sentences;
+        # without a document_id the user's session is the document
+        document = None
+        session = getattr(request, 'session', None)
+        owner = request.user.pk if request.user.is_authenticated else getattr(session, 'session_key', None)
+        if owner:
+            document = f"{owner}:{str(data.get('document_id') or '')[:64]}"
+
+        return {
+            'text': text,
+            'mode': mode,
+            'synonym_level': synonym_level,
+            'frozen_words': frozen_words,
+            'settings_dict': settings_dict,
+            'language': language,
+            'use_premium': is_premium,
+            'word_count': word_count,
+            'document': document,
+            'n_variants': n_variants,
+            'owner': owner,
+        }, None
+
+    @staticmethod
+    def save_history(request, params, output_text):
+        """Save history for authenticated users."""
+        if not request.user.is_authenticated:
+            return
+        try:
+            ParaphraseHistory.objects.create(
+                user=request.user,
+                input_text=params['text'],
+                output_text=output_text,
+                mode=params['mode'],
+                synonym_level=params['synonym_level'],
+                frozen_words=params['frozen_words'],
+                settings=params['settings_dict'],
+                language=params['language'],
+                word_count=params['word_count'],
             )
+        except Exception as e:
+            logger.error(f'Failed to save paraphrase history: {e}')
+
+    @staticmethod
+    def service_kwargs(params):
+        return {
+            'text': params['text'],
+            'mode': params['mode'],
+            'synonym_level': params['synonym_level'],
+            'frozen_words': params['frozen_words'],
+            'settings_dict': params['settings_dict'],
+            'language': params['language'],
+            'use_premium': params['use_premium'],
+            'owner': params['owner'],
+        }
+
+    def call(self, params):
+        return AIParaphraseService.paraphrase(
+            **self.service_kwargs(params), document=params['document'], n_variants=params['n_variants'],
+        )
 
-        # --- Save history for authenticated users ---
-        if request.user.is_authenticated:
-            try:
-                ParaphraseHistory.objects.create(
-                    user=request.user,
-                    input_text=text,
-                    output_text=output_text,
-                    mode=mode,
-                    synonym_level=synonym_level,
-                    frozen_words=frozen_words,
-                    settings=settings_dict,
-                    language=language,
-                    word_count=word_count,
-                )
-            except Exception as e:
-                logger.error(f'Failed to save paraphrase history: {e}')
+    async def acall(self, params):
+        return await AIParaphraseService.aparaphrase(
+            **self.service_kwargs(params), document=params['document'], n_variants=params['n_variants'],
+        )
+
+    def respond(self, request, params, output_text):
+        # With n_variants the first alternative is the output; the page
+        # keeps the others to cycle through without new requests
+        variants = output_text if isinstance(output_text, list) else [output_text]
+        if not variants:
+            return self.error_response(NO_VARIANTS_ERROR)
+        output_text = variants[0]
+        self.save_history(request, params, output_text)
 
         return Response({
             'output_text': output_text,
-            'input_word_count': word_count,
+            'variants': variants,
+            'input_word_count': params['word_count'],
             'output_word_count': AIParaphraseService.count_words(output_text),
-            'mode': mode,
+            'mode': params['mode'],
         })
 
 
+class ParaphraseStreamAPI(ParaphraseAPI):
+    """
+    POST /api/paraphrase/stream/
+    Same input as ParaphraseAPI; streams the output as server-sent events.
+    The final "done" event carries the post-processed text and word counts.
+    """
+
+    def post(self, request):
+        params, error_response = self.validate(request)
+        if error_response:
+            return error_response
+
+        deltas = AIParaphraseService.paraphrase_stream(**self.service_kwargs(params))
+
+        def on_complete(raw_text):
+            output_text = raw_text
+            # Split inputs stream chunks that are already post-processed
+            if not AIParaphraseService.splits(params['text'], params['use_premium']):
+                output_text = AIParaphraseService._post_process(
+                    raw_text, params['frozen_words'], params['settings_dict'],
+                )
+            self.save_history(request, params, output_text)
+            return {
+                'output_text': output_text,
+                'input_word_count': params['word_count'],
+                'output_word_count': AIParaphraseService.count_words(output_text),
+                'mode': params['mode'],
+            }
+
+        return sse_response(stream_events(deltas, on_complete))
+
+
 class SynonymAPI(APIView):
     """
     POST /api/paraphrase/synonyms/
-    Returns contextual synonyms for a clicked word.
+    Returns contextual synonyms for a clicked word, or with only a
+    "sentence", for every content word of the sentence.
     """
 
     def post(self, request):
         data = request.data
         word = data.get('word', '').strip()
         context = data.get('context', '').strip()
+        sentence = data.get('sentence', '').strip()
+
+        if not word and sentence:
+            synonyms, error = AIParaphraseService.get_sentence_synonyms(sentence)
+            if error:
+                return Response(
+                    {'error': error},
+                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                )
+            return Response({
+                'sentence': sentence,
+                'synonyms': synonyms,
+            })
 
         if not word:
             return Response(
@@ -6,6 +6,8 @@ import tempfile
 
 from django.conf import settings
 from core.llm_client import LLMClient
+from core.llm_prompt_cache import CachedPrompt
+from core.llm_tokens import TokenBudget
 
 logger = logging.getLogger('app')
 
@@ -334,10 +336,10 @@ class PDFService:
             if not text or not text.strip():
                 return None, 'Could not extract any text from this PDF.'
 
-            # Truncate to reasonable size for the API
-            max_chars = 50000
-            if len(text) > max_chars:
-                text = text[:max_chars] + '\n\n[Document truncated due to length...]'
+            # Truncate to the context token budget for the API
+            truncated = TokenBudget.truncate(text, getattr(settings, 'LLM_PDF_CONTEXT_TOKENS', 12000))
+            if len(truncated) < len(text):
+                text = truncated + '\n\n[Document truncated due to length...]'
 
             answer, error = LLMClient.generate(
                 system_prompt=(
@@ -348,11 +350,13 @@ class PDFService:
                 messages=[
                     {
                         'role': 'user',
-                        'content': f'Document content:\n\n{text}\n\n---\n\nQuestion: {question}'
+                        # The document repeats for every question about it
+                        'content': CachedPrompt(f'Document content:\n\n{text}\n\n---\n\n', f'Question: {question}'),
                     }
                 ],
                 max_tokens=2048,
-                use_premium=use_premium
+                use_premium=use_premium,
+                tool='chat_pdf',
             )
 
             if error:
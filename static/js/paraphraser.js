@@ -10,6 +10,8 @@
  * - Compare modes (3-column comparison)
  * - File upload (.txt, .docx)
  * - Copy to clipboard
+ * - Alternatives (on request): one call returns several variants; asking
+ *   again for the same input cycles through them without a new request
  * - History loading (premium)
  */
 function paraphraser() {
@@ -34,6 +36,12 @@ function paraphraser() {
         // Compare results
         compareResults: [],
 
+        // Alternatives from the last request, and the payload they belong to
+        variants: [],
+        variantIndex: 0,
+        variantsKey: '',
+        variantCount: 1,
+
         // Config passed from template
         isPremium: false,
         freeWordLimit: 500,
@@ -93,6 +101,8 @@ function paraphraser() {
             if (modesEl && modesEl.value) {
                 this.freeModes = modesEl.value.split(',').map(function(s) { return s.trim(); }).filter(Boolean);
             }
+            var variantsEl = document.getElementById('paraphraseVariants');
+            if (variantsEl) this.variantCount = parseInt(variantsEl.value, 10) || 1;
 
             // Load history for premium users
             if (this.isPremium) {
@@ -122,9 +132,14 @@ function paraphraser() {
 
         /**
          * Main paraphrase action - POST to /api/paraphrase/
+         *
+         * A plain click asks for one version, so re-runs after small edits
+         * only rewrite the changed sentences; ``nVariants`` > 1 asks for
+         * that many alternatives in one call.
          */
-        paraphrase: function () {
+        paraphrase: function (nVariants) {
             var self = this;
+            nVariants = nVariants || 1;
             var text = this.inputText.trim();
 
             if (!text) {
@@ -132,17 +147,6 @@ function paraphraser() {
                 return;
             }
 
-            this.errorMessage = '';
-            this.showUpgrade = false;
-            this.isLoading = true;
-            this.outputHtml = '';
-            this.outputText = '';
-            this.diffHtml = '';
-            this.showDiff = false;
-            this.outputWordCount = 0;
-            this.synonymPopup.visible = false;
-            this.compareResults = [];
-
             var payload = {
                 text: text,
                 mode: this.mode,
@@ -159,6 +163,30 @@ function paraphraser() {
                 payload.settings.custom_instructions = this.paraphraseSettings.custom_instructions;
             }
 
+            // Same input and settings again: show the next alternative
+            var key = JSON.stringify(payload);
+            if (key === this.variantsKey && this.variants.length > 1) {
+                this.nextVariant();
+                return;
+            }
+
+            this.errorMessage = '';
+            this.showUpgrade = false;
+            this.isLoading = true;
+            this.outputHtml = '';
+            this.outputText = '';
+            this.diffHtml = '';
+            this.showDiff = false;
+            this.outputWordCount = 0;
+            this.synonymPopup.visible = false;
+            this.compareResults = [];
+            this.variants = [];
+            this.variantsKey = '';
+
+            if (nVariants > 1) {
+                payload.n_variants = nVariants;
+            }
+
             fetch('/api/paraphrase/', {
                 method: 'POST',
                 headers: {
@@ -181,10 +209,9 @@ function paraphraser() {
                     return;
                 }
 
-                self.outputText = result.data.output_text;
-                self.outputWordCount = result.data.output_word_count || self.countWords(self.outputText);
-                self.outputHtml = self._renderOutputWords(self.outputText);
-                self.diffHtml = self.computeDiff(self.inputText, self.outputText);
+                self.variants = result.data.variants || [result.data.output_text];
+                self.variantsKey = key;
+                self.showVariant(0);
             })
             .catch(function (err) {
                 self.isLoading = false;
@@ -192,6 +219,34 @@ function paraphraser() {
             });
         },
 
+        /**
+         * Alternatives action: ask for PARAPHRASE_VARIANTS versions of the input
+         */
+        paraphraseAlternatives: function () {
+            this.paraphrase(this.variantCount);
+        },
+
+        /**
+         * Show alternative ``index`` of the last request
+         */
+        showVariant: function (index) {
+            this.variantIndex = index;
+            this.outputText = this.variants[index];
+            this.outputWordCount = this.countWords(this.outputText);
+            this.outputHtml = this._renderOutputWords(this.outputText);
+            this.diffHtml = this.computeDiff(this.inputText, this.outputText);
+            this.synonymPopup.visible = false;
+        },
+
+        /**
+         * Cycle to the next alternative, without a request
+         */
+        nextVariant: function () {
+            if (this.variants.length > 1) {
+                this.showVariant((this.variantIndex + 1) % this.variants.length);
+            }
+        },
+
         /**
          * Toggle the diff view on/off
          */
@@ -511,7 +566,7 @@ function paraphraser() {
                 },
                 body: JSON.stringify({
                     word: word,
-                    context: self.outputText,
+                    context: self._sentenceAround(wordIndex),
                 }),
             })
             .then(function (resp) { return resp.json(); })
@@ -527,6 +582,36 @@ function paraphraser() {
             });
         },
 
+        /**
+         * Return the sentence of the output that holds word ``wordIndex``.
+         * Boundaries match the server's: whitespace after . ! ? or a newline.
+         */
+        _sentenceAround: function (wordIndex) {
+            var tokens = this.outputText.split(/(\s+)/);
+            var pos = -1;
+            var actualIndex = 0;
+            for (var i = 0; i < tokens.length; i++) {
+                if (tokens[i].trim() === '') continue;
+                if (actualIndex === wordIndex) {
+                    pos = i;
+                    break;
+                }
+                actualIndex++;
+            }
+            if (pos === -1) return this.outputText;
+
+            // Words sit at even token indices, whitespace at odd ones
+            var start = pos;
+            while (start >= 2 && tokens[start - 1].indexOf('\n') === -1 && !/[.!?]$/.test(tokens[start - 2])) {
+                start -= 2;
+            }
+            var end = pos;
+            while (end + 2 < tokens.length && tokens[end + 1].indexOf('\n') === -1 && !/[.!?]$/.test(tokens[end])) {
+                end += 2;
+            }
+            return tokens.slice(start, end + 1).join('');
+        },
+
         /**
          * Replace a word in the output with a chosen synonym
          */
@@ -549,6 +634,7 @@ function paraphraser() {
             }
 
             this.outputText = words.join('');
+            if (this.variants.length > 1) this.variants[this.variantIndex] = this.outputText;
             this.outputHtml = this._renderOutputWords(this.outputText);
             this.diffHtml = this.computeDiff(this.inputText, this.outputText);
             this.outputWordCount = this.countWords(this.outputText);
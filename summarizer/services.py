@@ -1,6 +1,8 @@
 import json
 import logging
 from core.llm_client import LLMClient, extract_json
+from core.llm_mapreduce import MapReduce
+from core.llm_tokens import TokenBudget
 
 logger = logging.getLogger('app')
 
@@ -28,12 +30,111 @@ class AISummarizerService:
         custom_instructions: custom instructions for 'custom' mode (premium only)
         keywords: list of keywords to emphasize in the summary
         Returns (result_dict, error_string).
+
+        Texts longer than one chunk are condensed chunk by chunk first (see
+        _condense_round) and the final summary is written from the result.
         """
+        target_words = self._target_words(text, length)
+        source = text
+        try:
+            while MapReduce.needs_split(source, 'summarize'):
+                chunks = MapReduce.split(source, MapReduce.chunk_tokens('summarize'))
+                results = MapReduce.map(chunks, self._condense_request(mode, length, use_premium, keywords))
+                condensed, error = self._condense_round(results, mode)
+                if error:
+                    return None, error
+                if len(condensed) >= len(source):
+                    break  # Not getting shorter; summarize the text as it is
+                source = condensed
+
+            request, output_mode = self._summarize_request(
+                source, mode, length, use_premium, custom_instructions, keywords, target_words,
+            )
+            response_text, error = LLMClient.generate(**request)
+        except Exception as e:
+            logger.error(f"Summarizer error: {e}")
+            return None, str(e)
+
+        if error:
+            return None, error
+        return self._parse_summary(response_text, text, mode, output_mode)
+
+    async def asummarize(self, text, mode='paragraph', length=3, use_premium=False,
+                         custom_instructions=None, keywords=None):
+        """Async counterpart of summarize() for ASGI views."""
+        target_words = self._target_words(text, length)
+        source = text
+        try:
+            while MapReduce.needs_split(source, 'summarize'):
+                chunks = MapReduce.split(source, MapReduce.chunk_tokens('summarize'))
+                results = await MapReduce.amap(chunks, self._condense_request(mode, length, use_premium, keywords))
+                condensed, error = self._condense_round(results, mode)
+                if error:
+                    return None, error
+                if len(condensed) >= len(source):
+                    break  # Not getting shorter; summarize the text as it is
+                source = condensed
+
+            request, output_mode = self._summarize_request(
+                source, mode, length, use_premium, custom_instructions, keywords, target_words,
+            )
+            response_text, error = await LLMClient.agenerate(**request)
+        except Exception as e:
+            logger.error(f"Summarizer error: {e}")
+            return None, str(e)
+
+        if error:
+            return None, error
+        return self._parse_summary(response_text, text, mode, output_mode)
+
+    def _target_words(self, text, length):
+        """Summary length in words for ``text`` at length setting 1-5."""
         length = max(1, min(5, int(length)))
         target_pct = self.LENGTH_MAP.get(length, 30)
+        return max(20, int(len(text.split()) * target_pct / 100))
 
-        word_count = len(text.split())
-        target_words = max(20, int(word_count * target_pct / 100))
+    def _condense_request(self, mode, length, use_premium, keywords):
+        """
+        Return a MapReduce request builder summarizing one chunk.
+
+        Key-sentence summaries extract sentences at every level so the final
+        pass still quotes the original; other modes condense to paragraphs
+        and apply custom instructions only in the final pass.
+        """
+        chunk_mode = 'key_sentences' if mode == 'key_sentences' else 'paragraph'
+
+        def build(chunk):
+            return self._summarize_request(chunk.text, chunk_mode, length, use_premium, None, keywords)[0]
+
+        return build
+
+    @staticmethod
+    def _condense_round(results, mode):
+        """Join the per-chunk summaries of one round. Returns (text, error_string)."""
+        parts = []
+        for response_text, error in results:
+            if error:
+                return None, error
+            try:
+                result = extract_json(response_text)
+            except ValueError as e:
+                logger.error(f"Summarizer chunk JSON parse error: {e}")
+                return None, "Failed to parse AI response"
+            if mode == 'key_sentences':
+                parts.append(' '.join(result.get('sentences', [])))
+            else:
+                parts.append(result.get('paragraph', ''))
+        return '\n\n'.join(part for part in parts if part.strip()), None
+
+    def _summarize_request(self, text, mode, length, use_premium, custom_instructions, keywords,
+                           target_words=None):
+        """
+        Build the LLMClient keyword arguments for a summary.
+        ``target_words`` defaults to the length setting applied to ``text``.
+        Returns (request_kwargs, output_mode).
+        """
+        if target_words is None:
+            target_words = self._target_words(text, length)
 
         # Build keyword instruction if provided
         keyword_instruction = ''
@@ -81,17 +182,18 @@ Return ONLY a valid JSON object with this structure:
 
 Return ONLY valid JSON, no markdown formatting or extra text."""
 
+        return {
+            'system_prompt': "You are an expert text summarizer.",
+            'messages': [{"role": "user", "content": prompt}],
+            'max_tokens': TokenBudget.max_tokens_for(text, 'summarize', ceiling=2048),
+            'use_premium': use_premium,
+            'tool': 'summarizer',
+        }, output_mode
+
+    @staticmethod
+    def _parse_summary(response_text, text, mode, output_mode):
+        """Parse the summary JSON and compute stats. Returns (result_dict, error_string)."""
         try:
-            response_text, error = LLMClient.generate(
-                system_prompt="You are an expert text summarizer.",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=2048,
-                use_premium=use_premium
-            )
-
-            if error:
-                return None, error
-
             result = extract_json(response_text)
 
             # Build the summary text
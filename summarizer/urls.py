@@ -1,7 +1,9 @@
 from django.urls import path
+
+from core.llm_views import llm_api_view
 from summarizer.views import SummarizerPage, SummarizeAPI
 
 urlpatterns = [
     path('summarize/', SummarizerPage.as_view(), name='summarizer'),
-    path('api/summarize/', SummarizeAPI.as_view(), name='summarize_api'),
+    path('api/summarize/', llm_api_view(SummarizeAPI), name='summarize_api'),
 ]
@@ -2,11 +2,11 @@ import logging
 from django.views import View
 from django.shortcuts import render
 from django.conf import settings
-from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 
 from accounts.views import GlobalVars
+from core.llm_views import LLMAPIView
 from summarizer.models import SummaryHistory
 from summarizer.services import AISummarizerService
 
@@ -35,8 +35,8 @@ class SummarizerPage(View):
         return render(request, 'tools/summarizer.html', context)
 
 
-class SummarizeAPI(APIView):
-    def post(self, request):
+class SummarizeAPI(LLMAPIView):
+    def validate(self, request):
         text = request.data.get('text', '').strip()
         mode = request.data.get('mode', 'paragraph')
         length = request.data.get('length', 3)
@@ -44,7 +44,7 @@ class SummarizeAPI(APIView):
         keywords = request.data.get('keywords', [])
 
         if not text:
-            return Response(
+            return None, Response(
                 {'error': 'Please enter some text to summarize.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
@@ -69,7 +69,7 @@ class SummarizeAPI(APIView):
         word_limit = limits['premium_words'] if is_premium else limits['free_words']
 
         if word_count > word_limit:
-            return Response(
+            return None, Response(
                 {
                     'error': f'{"Premium" if is_premium else "Free"} accounts are limited to {word_limit} words. You entered {word_count} words.',
                     'upgrade': not is_premium
@@ -79,7 +79,7 @@ class SummarizeAPI(APIView):
 
         # Custom mode is premium only
         if mode == 'custom' and not is_premium:
-            return Response(
+            return None, Response(
                 {
                     'error': 'Custom mode is available for Premium users only.',
                     'upgrade': True
@@ -89,7 +89,7 @@ class SummarizeAPI(APIView):
 
         # Validate custom_instructions for custom mode
         if mode == 'custom' and not custom_instructions:
-            return Response(
+            return None, Response(
                 {'error': 'Please provide custom instructions for custom mode.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
@@ -100,28 +100,43 @@ class SummarizeAPI(APIView):
         else:
             keywords = []
 
-        service = AISummarizerService()
-        result, error = service.summarize(
-            text, mode, length, use_premium=is_premium,
-            custom_instructions=custom_instructions if mode == 'custom' else None,
-            keywords=keywords if keywords else None
-        )
+        return {
+            'text': text,
+            'mode': mode,
+            'length': length,
+            'word_count': word_count,
+            'use_premium': is_premium,
+            'custom_instructions': custom_instructions if mode == 'custom' else None,
+            'keywords': keywords if keywords else None,
+        }, None
+
+    @staticmethod
+    def service_kwargs(params):
+        return {
+            'text': params['text'],
+            'mode': params['mode'],
+            'length': params['length'],
+            'use_premium': params['use_premium'],
+            'custom_instructions': params['custom_instructions'],
+            'keywords': params['keywords'],
+        }
 
-        if error:
-            return Response(
-                {'error': error},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+    def call(self, params):
+        return AISummarizerService().summarize(**self.service_kwargs(params))
+
+    async def acall(self, params):
+        return await AISummarizerService().asummarize(**self.service_kwargs(params))
 
+    def respond(self, request, params, result):
         # Save history
         try:
             SummaryHistory.objects.create(
                 user=request.user if request.user.is_authenticated else None,
-                input_text=text,
+                input_text=params['text'],
                 output_text=result.get('summary', ''),
-                mode=mode,
-                summary_length=length,
-                word_count=word_count,
+                mode=params['mode'],
+                summary_length=params['length'],
+                word_count=params['word_count'],
             )
         except Exception as e:
             logger.error(f"Failed to save summary history: {e}")
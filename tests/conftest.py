@@ -2,15 +2,59 @@
 Shared fixtures and mock helpers for WritingBot tests.
 """
 import json
+import re
 from unittest.mock import patch, MagicMock
 
 import django
+import pytest
 from django.test import TestCase, RequestFactory, Client
 
 # Ensure Django settings are configured
 django.setup()
 
 
+# ---------------------------------------------------------------
+# Process-global LLM state
+# ---------------------------------------------------------------
+
+def reset_llm_state():
+    """Reset breakers, lanes, counters and in-process caches of the LLM layer."""
+    from core.llm_admission import LLMAdmission
+    from core.llm_breaker import CircuitBreaker
+    from core.llm_cache import LLMResponseCache
+    from core.llm_hedge import LLMHedger
+    from core.llm_incremental import IncrementalRewrite
+    from core.llm_metrics import LLMMetrics
+    from core.llm_neardup import NearDuplicateCache
+    from core.llm_ratelimit import LLMRateLimiter
+    from core.llm_singleflight import LLMSingleFlight
+    from core.llm_tokens import TokenBudget
+    from paraphraser.synonyms import SynonymEngine
+
+    CircuitBreaker.reset()
+    LLMAdmission.reset()
+    LLMSingleFlight.reset()
+    LLMMetrics.reset()
+    LLMHedger.reset()
+    LLMRateLimiter.reset()
+    TokenBudget.reset()
+    LLMResponseCache.clear()
+    NearDuplicateCache.clear()
+    IncrementalRewrite.clear()
+    SynonymEngine.clear()
+
+
+@pytest.fixture(autouse=True)
+def _isolate_llm_state():
+    """
+    Give every test fresh LLM state: an earlier test's un-mocked failures
+    must not leave a breaker open for the next one.
+    """
+    reset_llm_state()
+    yield
+    reset_llm_state()
+
+
 # ---------------------------------------------------------------
 # Mock LLM responses
 # ---------------------------------------------------------------
@@ -121,7 +165,7 @@ MOCK_LANGUAGE_DETECT_RESPONSE = 'en'
 
 
 def mock_llm_generate(system_prompt='', messages=None, max_tokens=4096,
-                      temperature=0.7, use_premium=False):
+                      temperature=0.7, use_premium=False, **kwargs):
     """
     Default mock for LLMClient.generate that returns reasonable responses
     based on the system prompt content.
@@ -130,6 +174,10 @@ def mock_llm_generate(system_prompt='', messages=None, max_tokens=4096,
     user_msg = messages[0]['content'] if messages else '' if not messages else ''
 
     if 'paraphras' in prompt_lower:
+        # Multi-variant calls get a JSON array, as LLMClient returns them
+        n = kwargs.get('n', 1)
+        if n > 1:
+            return json.dumps([MOCK_PARAPHRASE_RESPONSE] + [f'{MOCK_PARAPHRASE_RESPONSE} ({i})' for i in range(2, n + 1)]), None
         return MOCK_PARAPHRASE_RESPONSE, None
     if 'grammar' in prompt_lower or 'corrections' in prompt_lower:
         return MOCK_GRAMMAR_RESPONSE, None
@@ -146,6 +194,10 @@ def mock_llm_generate(system_prompt='', messages=None, max_tokens=4096,
     if 'outline' in prompt_lower and 'json' in prompt_lower:
         return MOCK_OUTLINE_JSON_RESPONSE, None
     if 'synonym' in prompt_lower:
+        # Batch requests list the words to cover after "Words:"
+        words = re.findall(r'"([^"]+)"', user_msg.split('Words:', 1)[1]) if 'Words:' in user_msg else []
+        if words:
+            return json.dumps({word: json.loads(MOCK_SYNONYMS_RESPONSE) for word in words}), None
         return MOCK_SYNONYMS_RESPONSE, None
     if 'chat' in prompt_lower or 'writing assistant' in prompt_lower:
         return MOCK_CHAT_RESPONSE, None
@@ -1,7 +1,7 @@
 """Tests for the AI detector service."""
 from unittest.mock import patch
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from tests.conftest import MOCK_AI_DETECT_MODEL_RESPONSE
 
@@ -60,3 +60,22 @@ class AIDetectorServiceTests(TestCase):
         # Low score -> human_written dominant
         confs = AIDetectorService._score_to_confidences(10)
         self.assertEqual(max(confs, key=confs.get), 'human_written')
+
+
+@override_settings(LLM_NEARDUP_ENABLED=True, LLM_NEARDUP_TOOLS={'ai_detector': 3})
+@patch('core.llm_client.LLMClient.detect_ai_text', return_value=(MOCK_AI_DETECT_MODEL_RESPONSE, None))
+class AIDetectorNearDuplicateTests(TestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_resubmitted_text_reuses_model_score(self, mock_detect):
+        from ai_detector.services import AIDetectorService
+        text = 'The “new” policy takes effect next month. Staff should read the guide before then.'
+        first, _ = AIDetectorService.detect(text)
+        second, error = AIDetectorService.detect(text.replace('“', '"').replace('”', '"') + ' ')
+
+        self.assertIsNone(error)
+        mock_detect.assert_called_once()
+        self.assertEqual(first['overall_score'], second['overall_score'])
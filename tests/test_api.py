@@ -333,6 +333,32 @@ class ParaphraseAPIv1Tests(BaseAPITestCase):
         self.assertIn(response.status_code, [401, 403])
 
 
+    @patch('core.llm_client.LLMClient.stream')
+    def test_paraphrase_stream(self, mock_stream):
+        mock_stream.return_value = iter([('The quick ', None), ('brown fox.', None)])
+        response = self.client.post(
+            '/api/v1/paraphrase/stream/',
+            data=json.dumps({'text': 'The fast brown fox.', 'mode': 'standard'}),
+            content_type='application/json',
+            HTTP_X_API_KEY='test-api-token-paraphrase',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('data: {"delta": "The quick "}', body)
+        self.assertIn('event: done', body)
+        self.assertIn('"output_text": "The quick brown fox."', body)
+
+    def test_paraphrase_stream_validates_like_paraphrase(self):
+        response = self.client.post(
+            '/api/v1/paraphrase/stream/',
+            data=json.dumps({'text': '', 'mode': 'standard'}),
+            content_type='application/json',
+            HTTP_X_API_KEY='test-api-token-paraphrase',
+        )
+        self.assertEqual(response.status_code, 400)
+
+
 # ======================================================================
 # Public API v1: Grammar
 # ======================================================================
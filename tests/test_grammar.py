@@ -1,7 +1,8 @@
 """Tests for the grammar service."""
+import json
 from unittest.mock import patch
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from tests.conftest import MOCK_GRAMMAR_RESPONSE
 
@@ -48,3 +49,88 @@ class GrammarServiceTests(TestCase):
         service.check_grammar('Test text.', use_premium=True)
         call_kwargs = mock_gen.call_args[1]
         self.assertTrue(call_kwargs.get('use_premium', False))
+
+
+@override_settings(LLM_MAPREDUCE_CHUNK_TOKENS={'proofread': 40})
+class ProofreadMapReduceTests(TestCase):
+
+    @staticmethod
+    def _chunk_reply(system_prompt, messages, **kwargs):
+        chunk = messages[0]['content'].dynamic.split('"""\n', 1)[1].rsplit('\n"""', 1)[0]
+        corrections = []
+        if 'teh' in chunk:
+            corrections.append({'original': 'teh', 'suggestion': 'the', 'type': 'spelling', 'explanation': ''})
+        return json.dumps({
+            'overall_score': 90 if corrections else 100,
+            'summary': 'Has typos.' if corrections else 'Clean.',
+            'error_counts': {'spelling': len(corrections)},
+            'corrections': corrections,
+            'corrected_text': chunk.replace('teh', 'the'),
+        }), None
+
+    def test_long_document_corrections_use_document_offsets(self):
+        from grammar.services import ProofreaderService
+        clean = 'The report was finished on time and sent to every team member for review.'
+        text = '\n\n'.join([clean] * 4 + ['Then teh manager approved it.'])
+
+        with patch('core.llm_client.LLMClient.generate', side_effect=self._chunk_reply) as mock_gen:
+            result, error = ProofreaderService().proofread(text)
+
+        self.assertIsNone(error)
+        self.assertGreater(mock_gen.call_count, 1)
+        position = result['corrections'][0]['position']
+        self.assertEqual(text[position['start']:position['end']], 'teh')
+        self.assertEqual(result['corrected_text'], text.replace('teh', 'the'))
+        self.assertEqual(result['error_counts']['spelling'], 1)
+        self.assertEqual(result['summary'], 'Has typos.')
+
+
+@override_settings(LLM_NEARDUP_ENABLED=True, LLM_NEARDUP_TOOLS={'grammar': 3})
+class GrammarNearDuplicateTests(TestCase):
+
+    PARAGRAPHS = [
+        'Teh committee met on Tuesday to review the budget for the coming year and the hiring plan.',
+        'Several members asked for more detail on travel costs, which rose sharply last quarter.',
+        'The chair promised a written summary by Friday so that everyone can prepare questions.',
+    ]
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    @staticmethod
+    def _reply(system_prompt, messages, **kwargs):
+        text = messages[0]['content'].dynamic.split('"""\n', 1)[1].rsplit('\n"""', 1)[0]
+        corrections = []
+        for typo, fix in (('Teh', 'The'), ('cost ', 'costs ')):
+            if typo in text:
+                start = text.index(typo)
+                corrections.append({
+                    'original': typo, 'suggestion': fix, 'type': 'spelling', 'explanation': '',
+                    'position': {'start': start, 'end': start + len(typo)},
+                })
+        return json.dumps({
+            'corrections': corrections,
+            'writing_scores': {'grammar': 80, 'fluency': 80, 'clarity': 80, 'engagement': 80, 'delivery': 80},
+            'tone': 'formal',
+            'readability_score': 60.0,
+        }), None
+
+    def test_resubmission_rechecks_only_edited_paragraphs(self):
+        from grammar.services import AIGrammarService
+        text = '\n\n'.join(self.PARAGRAPHS)
+        edited = '\n\n'.join(self.PARAGRAPHS[:2] + [self.PARAGRAPHS[2].replace('questions', 'cost questions')])
+
+        with patch('core.llm_client.LLMClient.generate', side_effect=self._reply) as mock_gen:
+            AIGrammarService().check_grammar(text)
+            result, error = AIGrammarService().check_grammar(edited)
+            again, _ = AIGrammarService().check_grammar(edited + '  ')
+
+        self.assertIsNone(error)
+        self.assertEqual(mock_gen.call_count, 2)
+        rechecked = mock_gen.call_args.kwargs['messages'][0]['content'].dynamic
+        self.assertIn(self.PARAGRAPHS[2][:20], rechecked)
+        self.assertNotIn(self.PARAGRAPHS[0][:20], rechecked)
+        found = [edited[c['position']['start']:c['position']['end']] for c in result['corrections']]
+        self.assertEqual(found, ['Teh', 'cost '])
+        self.assertEqual(again['corrections'], result['corrections'])
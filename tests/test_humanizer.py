@@ -1,39 +1,94 @@
 """Tests for the humanizer service."""
-from unittest.mock import patch, call
+from unittest.mock import patch
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
-from tests.conftest import MOCK_HUMANIZE_SCORE_RESPONSE, MOCK_HUMANIZE_TEXT_RESPONSE
+from tests.conftest import MOCK_HUMANIZE_TEXT_RESPONSE
+
+
+def score_by_text(scores, default=90):
+    """
+    side_effect for AIDetectorService.detect keyed on the text, since the
+    input is scored concurrently with the rewrite.
+    """
+    def side_effect(text, use_premium=False, tool='ai_detector'):
+        return {'overall_score': scores.get(text.strip(), default)}, None
+    return side_effect
 
 
 class HumanizerServiceTests(TestCase):
 
+    @patch('ai_detector.services.AIDetectorService.detect')
     @patch('core.llm_client.LLMClient.generate')
-    def test_humanize_basic(self, mock_gen):
+    def test_humanize_basic(self, mock_gen, mock_detect):
         from humanizer.services import AIHumanizerService
-        # Three calls: score before, rewrite, score after
-        mock_gen.side_effect = [
-            (MOCK_HUMANIZE_SCORE_RESPONSE, None),  # AI score before
-            (MOCK_HUMANIZE_TEXT_RESPONSE, None),     # Rewrite
-            ('15', None),                             # AI score after
-        ]
+        mock_gen.return_value = (MOCK_HUMANIZE_TEXT_RESPONSE, None)
+        mock_detect.side_effect = score_by_text({MOCK_HUMANIZE_TEXT_RESPONSE: 15})
         result, error = AIHumanizerService.humanize('AI-generated text here.', mode='basic')
         self.assertIsNone(error)
-        self.assertIsNotNone(result)
         self.assertIn('output_text', result)
-        self.assertEqual(mock_gen.call_count, 3)
+        # One rewrite; both scores come from the detector
+        self.assertEqual(mock_gen.call_count, 1)
+        self.assertEqual(mock_detect.call_count, 2)
+        self.assertEqual(mock_detect.call_args.kwargs['tool'], 'humanizer_score')
+        self.assertEqual(result['rounds'], 1)
 
+    @patch('ai_detector.services.AIDetectorService.detect')
     @patch('core.llm_client.LLMClient.generate')
-    def test_humanize_advanced(self, mock_gen):
+    def test_humanize_advanced(self, mock_gen, mock_detect):
         from humanizer.services import AIHumanizerService
-        mock_gen.side_effect = [
-            ('80', None),
-            (MOCK_HUMANIZE_TEXT_RESPONSE, None),
-            ('10', None),
-        ]
+        mock_gen.return_value = (MOCK_HUMANIZE_TEXT_RESPONSE, None)
+        mock_detect.side_effect = score_by_text({
+            'AI-generated text here.': 80,
+            MOCK_HUMANIZE_TEXT_RESPONSE: 10,
+        })
         result, error = AIHumanizerService.humanize('AI-generated text here.', mode='advanced')
         self.assertIsNone(error)
-        self.assertIsNotNone(result)
+        self.assertEqual(result['ai_score_before'], 80)
+        self.assertEqual(result['ai_score_after'], 10)
+
+    @patch('ai_detector.services.AIDetectorService.detect')
+    @patch('core.llm_client.LLMClient.generate')
+    def test_humanize_detector_error_scores_neutral(self, mock_gen, mock_detect):
+        from humanizer.services import AIHumanizerService
+        mock_gen.return_value = (MOCK_HUMANIZE_TEXT_RESPONSE, None)
+        mock_detect.return_value = (None, 'AI detection service is unavailable.')
+        result, error = AIHumanizerService.humanize('AI-generated text here.')
+        self.assertIsNone(error)
+        self.assertEqual(result['ai_score_before'], 50)
+        self.assertEqual(result['ai_score_after'], 50)
+
+    @override_settings(HUMANIZER_MAX_ROUNDS=3)
+    @patch('ai_detector.services.AIDetectorService.detect')
+    @patch('core.llm_client.LLMClient.generate')
+    def test_humanize_rewrites_until_target_score(self, mock_gen, mock_detect):
+        from humanizer.services import AIHumanizerService
+        mock_gen.side_effect = [('First rewrite.', None), ('Second rewrite.', None)]
+        mock_detect.side_effect = score_by_text({
+            'AI-generated text here.': 90,
+            'First rewrite.': 60,
+            'Second rewrite.': 20,
+        })
+        result, error = AIHumanizerService.humanize('AI-generated text here.', target_score=30)
+        self.assertIsNone(error)
+        self.assertEqual(result['rounds'], 2)
+        self.assertEqual(result['output_text'], 'Second rewrite.')
+        self.assertEqual(result['ai_score_after'], 20)
+        # The second round rewrites the first output
+        self.assertIn('First rewrite.', mock_gen.call_args.kwargs['messages'][0]['content'])
+
+    @override_settings(HUMANIZER_MAX_ROUNDS=2)
+    @patch('ai_detector.services.AIDetectorService.detect')
+    @patch('core.llm_client.LLMClient.generate')
+    def test_humanize_keeps_best_round(self, mock_gen, mock_detect):
+        from humanizer.services import AIHumanizerService
+        mock_gen.side_effect = [('First rewrite.', None), ('Second rewrite.', None)]
+        mock_detect.side_effect = score_by_text({'First rewrite.': 40, 'Second rewrite.': 70})
+        result, error = AIHumanizerService.humanize('AI-generated text here.', target_score=10)
+        self.assertIsNone(error)
+        self.assertEqual(result['rounds'], 2)
+        self.assertEqual(result['output_text'], 'First rewrite.')
+        self.assertEqual(result['ai_score_after'], 40)
 
     @patch('core.llm_client.LLMClient.generate')
     def test_humanize_empty_text(self, mock_gen):
@@ -42,10 +97,12 @@ class HumanizerServiceTests(TestCase):
         self.assertIsNone(result)
         self.assertIsNotNone(error)
 
+    @patch('ai_detector.services.AIDetectorService.detect')
     @patch('core.llm_client.LLMClient.generate')
-    def test_humanize_error_handling(self, mock_gen):
+    def test_humanize_error_handling(self, mock_gen, mock_detect):
         from humanizer.services import AIHumanizerService
         mock_gen.return_value = (None, 'LLM service error')
+        mock_detect.side_effect = score_by_text({})
         result, error = AIHumanizerService.humanize('Test text.')
         self.assertIsNone(result)
         self.assertIsNotNone(error)
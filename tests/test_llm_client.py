@@ -1,13 +1,15 @@
 """Tests for core.llm_client.LLMClient."""
-from unittest.mock import patch, MagicMock
+import json
+from unittest.mock import patch, AsyncMock, MagicMock
 
+from asgiref.sync import async_to_sync
 from django.test import TestCase, override_settings
 
 
 class LLMClientTestCase(TestCase):
     """Test LLMClient routing and error handling."""
 
-    @patch('core.llm_client.requests.post')
+    @patch('core.llm_transport.post')
     def test_open_source_call_success(self, mock_post):
         """Test successful open-source LLM call."""
         from core.llm_client import LLMClient
@@ -31,7 +33,7 @@ class LLMClientTestCase(TestCase):
         self.assertIsNone(error)
         mock_post.assert_called_once()
 
-    @patch('core.llm_client.requests.post')
+    @patch('core.llm_transport.post')
     def test_open_source_call_error(self, mock_post):
         """Test open-source LLM call with server error."""
         from core.llm_client import LLMClient
@@ -51,7 +53,7 @@ class LLMClientTestCase(TestCase):
         self.assertIsNone(text)
         self.assertIsNotNone(error)
 
-    @patch('core.llm_client.requests.post')
+    @patch('core.llm_transport.post')
     def test_open_source_call_timeout(self, mock_post):
         """Test open-source LLM call timeout."""
         import requests as req
@@ -81,7 +83,7 @@ class LLMClientTestCase(TestCase):
         self.assertIsNone(text)
         self.assertIn('not configured', error.lower())
 
-    @patch('core.llm_client.requests.post')
+    @patch('core.llm_transport.post')
     def test_premium_routes_to_claude(self, mock_post):
         """Test that use_premium=True routes to Claude when API key is set."""
         from core.llm_client import LLMClient
@@ -98,7 +100,7 @@ class LLMClientTestCase(TestCase):
         mock_post.assert_not_called()
         self.assertEqual(text, 'Claude response')
 
-    @patch('core.llm_client.requests.post')
+    @patch('core.llm_transport.post')
     def test_premium_falls_back_to_open_source(self, mock_post):
         """Test that use_premium=True falls back to open-source when no Claude key."""
         from core.llm_client import LLMClient
@@ -117,3 +119,1598 @@ class LLMClientTestCase(TestCase):
 
         mock_post.assert_called_once()
         self.assertEqual(text, 'OS response')
+
+    @patch('core.llm_transport.post')
+    def test_open_source_variants_are_sampled_in_one_call(self, mock_post):
+        """Test that n > 1 asks the GPU server for n samples and returns them as a JSON array."""
+        from core.llm_client import LLMClient
+
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        mock_resp.json.return_value = {'text': 'One.', 'texts': ['One.', 'Two.', 'One.', ' ']}
+        mock_post.return_value = mock_resp
+
+        with self.settings(WRITINGBOT_API_URL='https://api.test.com', WRITINGBOT_API_KEY='k'):
+            text, error = LLMClient.generate('Test', [{'role': 'user', 'content': 'Hello'}], n=3)
+
+        self.assertIsNone(error)
+        self.assertEqual(json.loads(text), ['One.', 'Two.'])
+        mock_post.assert_called_once()
+        self.assertEqual(mock_post.call_args.kwargs['json']['n'], 3)
+
+    @patch('core.llm_transport.get_anthropic')
+    def test_claude_variants_come_from_one_json_reply(self, mock_get_anthropic):
+        """Test that Claude is asked for a JSON array of versions, keeping the cached prompt prefix."""
+        from core.llm_client import LLMClient
+        from core.llm_prompt_cache import CachedPrompt
+
+        response = MagicMock()
+        response.content = [MagicMock(text='Sure: ["First.", "Second."]')]
+        mock_get_anthropic.return_value.messages.create.return_value = response
+
+        with self.settings(ANTHROPIC_API_KEY='test-key'):
+            text, error = LLMClient.generate(
+                CachedPrompt('Static. ', 'Dynamic.'), [{'role': 'user', 'content': 'Hello'}],
+                max_tokens=100, use_premium=True, n=2,
+            )
+
+        self.assertIsNone(error)
+        self.assertEqual(json.loads(text), ['First.', 'Second.'])
+        request = mock_get_anthropic.return_value.messages.create.call_args.kwargs
+        self.assertEqual(request['max_tokens'], 200)
+        self.assertIn('JSON array of 2 strings', str(request['system']))
+        self.assertTrue(str(request['system']).startswith('Static. Dynamic.'))
+
+
+class LLMTransportTestCase(TestCase):
+    """Test the pooled HTTP transport shared by LLMClient."""
+
+    def setUp(self):
+        from core import llm_transport
+        llm_transport.reset()
+
+    def tearDown(self):
+        from core import llm_transport
+        llm_transport.reset()
+
+    def test_session_reused_per_backend(self):
+        """Test that each backend gets one long-lived session per process."""
+        from core import llm_transport
+
+        first = llm_transport.get_session('open_source')
+        self.assertIs(llm_transport.get_session('open_source'), first)
+        self.assertIsNot(llm_transport.get_session('detector'), first)
+
+    def test_async_clients_closed_per_call_unless_pooled(self):
+        """Test that async clients outside ASGI are closed with their call, and pooled per loop under it."""
+        from core import llm_transport
+
+        clients = []
+
+        def factory():
+            clients.append(AsyncMock())
+            return clients[-1]
+
+        async def use_twice():
+            for _ in range(2):
+                async with llm_transport._loop_client('open_source', factory) as client:
+                    self.assertIs(client, clients[-1])
+
+        async_to_sync(use_twice)()
+        self.assertEqual(len(clients), 2)
+        for client in clients:
+            client.aclose.assert_awaited_once()
+
+        clients.clear()
+        with self.settings(LLM_ASYNC_VIEWS=True):
+            async_to_sync(use_twice)()
+        self.assertEqual(len(clients), 1)
+        clients[0].aclose.assert_not_awaited()
+
+    @override_settings(LLM_HTTP_POOL_SIZE=7)
+    def test_pool_stats_reports_pool_size_and_counts(self):
+        """Test pool statistics expose configured size and request counters."""
+        from core import llm_transport
+
+        session = llm_transport.get_session('open_source')
+        with patch.object(session, 'post', return_value=MagicMock(status_code=200)):
+            llm_transport.post('open_source', 'https://api.test.com/v1/text/generate/', json={})
+
+        stats = llm_transport.pool_stats()['open_source']
+        self.assertEqual(stats['pool_size'], 7)
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['errors'], 0)
+
+    @override_settings(ANTHROPIC_API_KEY='sk-test', LLM_ANTHROPIC_POOL_SIZE=5)
+    def test_anthropic_client_reused_per_process(self):
+        """Test that Claude calls share one SDK client until the PID changes."""
+        from core import llm_transport
+
+        first = llm_transport.get_anthropic()
+        self.assertIs(llm_transport.get_anthropic(), first)
+        with patch('core.llm_transport.os.getpid', return_value=-1):
+            forked = llm_transport.get_anthropic()
+        self.assertIsNot(forked, first)
+        self.assertEqual(len(llm_transport._anthropic_clients), 1)
+
+    @override_settings(ANTHROPIC_API_KEY='sk-test')
+    def test_legacy_ai_service_goes_through_llm_client(self):
+        """Test that AIService.call_claude uses LLMClient and raises its errors."""
+        from app.ai_service import AIService
+
+        with patch('core.llm_client.LLMClient.generate', return_value=('```json\n{"a": 1}\n```', None)) as mock_gen:
+            self.assertEqual(AIService.call_claude_json('Sys', 'Hi'), {'a': 1})
+        self.assertTrue(mock_gen.call_args.kwargs['use_premium'])
+        self.assertEqual(mock_gen.call_args.kwargs['tool'], 'ai_service')
+
+        with patch('core.llm_client.LLMClient.generate', return_value=(None, 'Service is busy.')):
+            with self.assertRaises(Exception):
+                AIService.call_claude('Sys', 'Hi')
+
+    @override_settings(LLM_CACHE_ENABLED=False, LLM_SINGLEFLIGHT_ENABLED=False,
+                       WRITINGBOT_API_URL='https://api.test.com', WRITINGBOT_API_KEY='k')
+    @patch('core.llm_transport.post')
+    def test_legacy_ai_service_never_falls_back_to_open_source(self, mock_post):
+        """Test that AIService.call_claude raises instead of using another model."""
+        from app.ai_service import AIService
+        from core.llm_breaker import CircuitBreaker
+
+        with self.settings(ANTHROPIC_API_KEY=''):
+            with self.assertRaises(Exception):
+                AIService.call_claude('Sys', 'Hi')
+
+        with self.settings(ANTHROPIC_API_KEY='sk-test'), \
+                patch.object(CircuitBreaker.get('claude'), 'allow', return_value=False):
+            with self.assertRaises(Exception):
+                AIService.call_claude('Sys', 'Hi')
+        mock_post.assert_not_called()
+
+    @override_settings(ANTHROPIC_API_KEY='sk-test', LLM_CACHE_ENABLED=False, LLM_SINGLEFLIGHT_ENABLED=False)
+    @patch('core.llm_transport.get_anthropic')
+    def test_claude_calls_forward_temperature(self, mock_get_anthropic):
+        """Test that the caller's temperature reaches the Anthropic SDK on every Claude path."""
+        from app.ai_service import AIService
+        from core.llm_client import LLMClient
+
+        client = mock_get_anthropic.return_value
+        client.messages.create.return_value = MagicMock(content=[MagicMock(text='Answer.')])
+        AIService.call_claude('Sys', 'Hi', temperature=0.2)
+        self.assertEqual(client.messages.create.call_args.kwargs['temperature'], 0.2)
+
+        client.messages.stream.return_value.__enter__.return_value.text_stream = iter(['Ans', 'wer.'])
+        list(LLMClient.stream('Sys', [{'role': 'user', 'content': 'Hi'}], temperature=0.3, use_premium=True))
+        self.assertEqual(client.messages.stream.call_args.kwargs['temperature'], 0.3)
+
+        async_client = AsyncMock()
+        async_client.messages.create.return_value = MagicMock(content=[MagicMock(text='Answer.')])
+        async_cm = MagicMock()
+        async_cm.__aenter__.return_value = async_client
+        with patch('core.llm_transport.async_anthropic', return_value=async_cm):
+            async_to_sync(LLMClient.agenerate)('Sys', [{'role': 'user', 'content': 'Hi'}], temperature=0.4,
+                                               use_premium=True)
+        self.assertEqual(async_client.messages.create.call_args.kwargs['temperature'], 0.4)
+
+
+@override_settings(
+    LLM_CACHE_ENABLED=True,
+    LLM_CACHE_TOOLS={},
+    WRITINGBOT_API_URL='https://api.test.com',
+    WRITINGBOT_API_KEY='k',
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class LLMResponseCacheTestCase(TestCase):
+    """Test the opt-in response cache in front of LLMClient.generate."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def _ok(self, text='Cached text.'):
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        mock_resp.json.return_value = {'text': text}
+        return mock_resp
+
+    @patch('core.llm_transport.post')
+    def test_identical_requests_hit_cache(self, mock_post):
+        """Test that an opted-in repeat request is served without an upstream call."""
+        from core.llm_cache import LLMResponseCache
+        from core.llm_client import LLMClient
+
+        mock_post.return_value = self._ok()
+        for _ in range(2):
+            text, error = LLMClient.generate(
+                'Detect.', [{'role': 'user', 'content': 'Hola'}], tool='demo', cache=True,
+            )
+            self.assertEqual(text, 'Cached text.')
+            self.assertIsNone(error)
+
+        mock_post.assert_called_once()
+        stats = LLMResponseCache.stats()['demo']
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['local_hits'], 1)
+
+    @patch('core.llm_transport.post')
+    def test_not_cached_without_opt_in(self, mock_post):
+        """Test that calls are not cached unless the tool opts in."""
+        from core.llm_client import LLMClient
+
+        mock_post.return_value = self._ok()
+        for _ in range(2):
+            LLMClient.generate('Detect.', [{'role': 'user', 'content': 'Hola'}], tool='demo')
+
+        self.assertEqual(mock_post.call_count, 2)
+
+    @patch('core.llm_transport.post')
+    def test_settings_override_disables_tool(self, mock_post):
+        """Test that LLM_CACHE_TOOLS can switch off a tool that opts in from code."""
+        from core.llm_client import LLMClient
+
+        mock_post.return_value = self._ok()
+        with self.settings(LLM_CACHE_TOOLS={'demo': False}):
+            for _ in range(2):
+                LLMClient.generate('Detect.', [{'role': 'user', 'content': 'Hola'}], tool='demo', cache=True)
+
+        self.assertEqual(mock_post.call_count, 2)
+
+    def test_key_depends_on_every_request_field(self):
+        """Test that changing any request field changes the cache key."""
+        from core.llm_cache import LLMResponseCache
+
+        base = ('open_source', 'm', 'sys', [{'role': 'user', 'content': 'x'}], 100, 0.5)
+        key = LLMResponseCache.make_key(*base)
+        self.assertEqual(key, LLMResponseCache.make_key(*base))
+        for i, changed in enumerate(['claude', 'n', 'sys2', [{'role': 'user', 'content': 'y'}], 101, 0.6]):
+            args = list(base)
+            args[i] = changed
+            self.assertNotEqual(key, LLMResponseCache.make_key(*args))
+
+
+@override_settings(WRITINGBOT_API_URL='https://api.test.com', WRITINGBOT_API_KEY='k', LLM_CACHE_ENABLED=False)
+class LLMClientStreamTestCase(TestCase):
+    """Test LLMClient.stream() parsing and error handling."""
+
+    def _resp(self, lines=None, content_type='text/event-stream', status_code=200, body=None):
+        mock_resp = MagicMock()
+        mock_resp.status_code = status_code
+        mock_resp.headers = {'content-type': content_type}
+        mock_resp.iter_lines.return_value = iter(lines or [])
+        mock_resp.json.return_value = body or {}
+        return mock_resp
+
+    @patch('core.llm_transport.post')
+    def test_stream_parses_sse_deltas(self, mock_post):
+        """Test that SSE data lines are yielded as deltas until [DONE]."""
+        from core.llm_client import LLMClient
+
+        mock_post.return_value = self._resp([
+            ': keep-alive',
+            'data: {"text": "Hello"}',
+            '',
+            'data: {"text": ", world"}',
+            'data: [DONE]',
+            'data: {"text": "ignored"}',
+        ])
+        chunks = list(LLMClient.stream('Sys', [{'role': 'user', 'content': 'Hi'}]))
+
+        self.assertEqual(chunks, [('Hello', None), (', world', None)])
+        self.assertTrue(mock_post.call_args[1]['stream'])
+        self.assertTrue(mock_post.call_args[1]['json']['stream'])
+
+    @patch('core.llm_transport.post')
+    def test_stream_falls_back_to_json_body(self, mock_post):
+        """Test that a non-streaming JSON reply is yielded as one delta."""
+        from core.llm_client import LLMClient
+
+        mock_post.return_value = self._resp(content_type='application/json', body={'text': 'Full text.'})
+        chunks = list(LLMClient.stream('Sys', [{'role': 'user', 'content': 'Hi'}]))
+
+        self.assertEqual(chunks, [('Full text.', None)])
+
+    @patch('core.llm_transport.post')
+    def test_stream_reports_error_status(self, mock_post):
+        """Test that a non-200 status ends the stream with a single error."""
+        from core.llm_client import LLMClient
+
+        mock_post.return_value = self._resp(status_code=503)
+        chunks = list(LLMClient.stream('Sys', [{'role': 'user', 'content': 'Hi'}]))
+
+        self.assertEqual(len(chunks), 1)
+        self.assertIsNone(chunks[0][0])
+        self.assertIsNotNone(chunks[0][1])
+
+
+@override_settings(WRITINGBOT_API_URL='https://api.test.com', WRITINGBOT_API_KEY='k', LLM_CACHE_ENABLED=False)
+class LLMClientAsyncTestCase(TestCase):
+    """Test LLMClient.agenerate() over the async transport."""
+
+    def _resp(self, status_code=200, body=None):
+        mock_resp = MagicMock()
+        mock_resp.status_code = status_code
+        mock_resp.json.return_value = body or {}
+        return mock_resp
+
+    @patch('core.llm_transport.apost', new_callable=AsyncMock)
+    def test_agenerate_success(self, mock_apost):
+        """Test that agenerate() returns the upstream text like generate()."""
+        from core.llm_client import LLMClient
+
+        mock_apost.return_value = self._resp(body={'text': 'Async text.'})
+        text, error = async_to_sync(LLMClient.agenerate)(
+            'Sys', [{'role': 'user', 'content': 'Hi'}], max_tokens=100,
+        )
+
+        self.assertEqual(text, 'Async text.')
+        self.assertIsNone(error)
+        self.assertEqual(mock_apost.call_args[0][0], 'open_source')
+        self.assertEqual(mock_apost.call_args[1]['json']['max_tokens'], 100)
+
+    @patch('core.llm_transport.apost', new_callable=AsyncMock)
+    def test_agenerate_error_status(self, mock_apost):
+        """Test that a non-200 reply becomes an error tuple."""
+        from core.llm_client import LLMClient
+
+        mock_apost.return_value = self._resp(status_code=503)
+        text, error = async_to_sync(LLMClient.agenerate)('Sys', [{'role': 'user', 'content': 'Hi'}])
+
+        self.assertIsNone(text)
+        self.assertIsNotNone(error)
+
+    @patch('core.llm_client.LLMClient.agenerate', new_callable=AsyncMock, return_value=('Greetings to the world.', None))
+    def test_async_view_runs_drf_steps(self, mock_agen):
+        """Test that AsyncLLMAPIView validates, awaits acall() and renders."""
+        from django.contrib.auth.models import AnonymousUser
+        from django.test import RequestFactory
+
+        from core.llm_views import AsyncLLMAPIView
+        from paraphraser.views import ParaphraseAPI
+
+        view = AsyncLLMAPIView.as_view(api_view_class=ParaphraseAPI)
+        factory = RequestFactory()
+
+        request = factory.post('/api/paraphrase/', {'text': 'Hello there world.'}, content_type='application/json')
+        request.user = AnonymousUser()
+        response = async_to_sync(view)(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['output_text'], 'Greetings to the world.')
+        self.assertTrue(mock_agen.called)
+
+        request = factory.post('/api/paraphrase/', {'text': ''}, content_type='application/json')
+        request.user = AnonymousUser()
+        response = async_to_sync(view)(request)
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(
+    WRITINGBOT_API_URL='https://api.test.com', WRITINGBOT_API_KEY='k',
+    LLM_CACHE_ENABLED=False, LLM_SINGLEFLIGHT_ENABLED=True, LLM_SINGLEFLIGHT_POLL=0.01,
+)
+class LLMSingleFlightTestCase(TestCase):
+    """Test coalescing of identical in-flight generate() calls."""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+
+    @patch('core.llm_transport.post')
+    def test_identical_concurrent_calls_share_one_upstream_call(self, mock_post):
+        """Test that concurrent identical requests in one process go upstream once."""
+        import threading
+        import time
+        from core.llm_client import LLMClient
+        from core.llm_singleflight import LLMSingleFlight
+
+        def slow_post(*args, **kwargs):
+            time.sleep(0.2)
+            mock_resp = MagicMock()
+            mock_resp.status_code = 200
+            mock_resp.json.return_value = {'text': 'Shared text.'}
+            return mock_resp
+
+        mock_post.side_effect = slow_post
+        results = []
+
+        def call():
+            results.append(LLMClient.generate(
+                'Sys', [{'role': 'user', 'content': 'Same prompt'}], tool='ai_tools',
+            ))
+
+        threads = [threading.Thread(target=call) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(results, [('Shared text.', None)] * 5)
+        stats = LLMSingleFlight.stats()['ai_tools']
+        self.assertEqual(stats['upstream'], 1)
+        self.assertEqual(stats['coalesced_local'], 4)
+
+    def test_shed_leader_result_is_not_shared(self):
+        """Test that followers of a shed or rate-limited leader call upstream themselves."""
+        import threading
+        import time
+        from core.llm_admission import ADMISSION_ERROR
+        from core.llm_singleflight import LLMSingleFlight
+
+        calls = []
+
+        def upstream():
+            calls.append(1)
+            if len(calls) == 1:
+                time.sleep(0.1)
+                return None, ADMISSION_ERROR
+            return 'Own text.', None
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(LLMSingleFlight.do('shed', upstream)))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(results.count((None, ADMISSION_ERROR)), 1)
+        self.assertEqual(results.count(('Own text.', None)), 2)
+
+    @patch('core.llm_transport.post')
+    def test_calls_do_not_coalesce_across_admission_lanes(self, mock_post):
+        """Test that free and premium calls with the same prompt each go upstream."""
+        import threading
+        import time
+        from core.llm_client import LLMClient
+
+        def slow_post(*args, **kwargs):
+            time.sleep(0.1)
+            return MagicMock(status_code=200, json=MagicMock(return_value={'text': 'Synonyms.'}))
+
+        mock_post.side_effect = slow_post
+        threads = [
+            threading.Thread(target=LLMClient.generate, args=('Sys', [{'role': 'user', 'content': 'fast'}]),
+                             kwargs={'use_premium': premium, 'tool': 'synonyms'})
+            for premium in (False, True)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(mock_post.call_count, 2)
+
+    def test_follower_uses_result_published_by_another_process(self):
+        """Test that a held cross-process lock makes callers wait for the published result."""
+        import threading
+        from django.core.cache import cache
+        from core.llm_singleflight import LLMSingleFlight
+
+        cache.add(LLMSingleFlight.LOCK_PREFIX + 'abc', 1)
+
+        def other_process_finishes():
+            cache.set(LLMSingleFlight.RESULT_PREFIX + 'abc', ['Remote text.', None])
+            cache.delete(LLMSingleFlight.LOCK_PREFIX + 'abc')
+
+        timer = threading.Timer(0.05, other_process_finishes)
+        timer.start()
+        fn = MagicMock(return_value=('Local text.', None))
+        result = LLMSingleFlight.do('abc', fn, tool='paraphraser')
+        timer.join()
+
+        self.assertEqual(result, ('Remote text.', None))
+        fn.assert_not_called()
+        self.assertEqual(LLMSingleFlight.stats()['paraphraser']['coalesced_remote'], 1)
+
+    def test_follower_takes_over_when_leader_dies(self):
+        """Test that a released lock without a result lets the follower call upstream."""
+        import threading
+        from django.core.cache import cache
+        from core.llm_singleflight import LLMSingleFlight
+
+        cache.add(LLMSingleFlight.LOCK_PREFIX + 'dead', 1)
+        timer = threading.Timer(0.05, cache.delete, [LLMSingleFlight.LOCK_PREFIX + 'dead'])
+        timer.start()
+        fn = MagicMock(return_value=('Own text.', None))
+        result = LLMSingleFlight.do('dead', fn)
+        timer.join()
+
+        self.assertEqual(result, ('Own text.', None))
+        fn.assert_called_once()
+        self.assertIsNone(cache.get(LLMSingleFlight.LOCK_PREFIX + 'dead'))
+
+    @patch('core.llm_transport.apost', new_callable=AsyncMock)
+    def test_async_identical_calls_share_one_upstream_call(self, mock_apost):
+        """Test that agenerate() coalesces identical calls on one event loop."""
+        import asyncio
+        from core.llm_client import LLMClient
+
+        async def slow_apost(*args, **kwargs):
+            await asyncio.sleep(0.05)
+            mock_resp = MagicMock()
+            mock_resp.status_code = 200
+            mock_resp.json.return_value = {'text': 'Async shared.'}
+            return mock_resp
+
+        mock_apost.side_effect = slow_apost
+
+        async def run():
+            return await asyncio.gather(*[
+                LLMClient.agenerate('Sys', [{'role': 'user', 'content': 'Same'}]) for _ in range(3)
+            ])
+
+        results = async_to_sync(run)()
+
+        self.assertEqual(mock_apost.call_count, 1)
+        self.assertEqual(results, [('Async shared.', None)] * 3)
+
+
+@override_settings(LLM_CACHE_ENABLED=False, LLM_SINGLEFLIGHT_ENABLED=False)
+class LLMClientGenerateManyTestCase(TestCase):
+    """Test LLMClient.generate_many() ordering and concurrency caps."""
+
+    @patch('core.llm_client.LLMClient.generate')
+    def test_results_keep_request_order(self, mock_gen):
+        """Test that results come back in request order whatever finishes first."""
+        import time
+        from core.llm_client import LLMClient
+
+        def slow_echo(system_prompt='', messages=None, **kwargs):
+            delay = float(messages[0]['content'])
+            time.sleep(delay)
+            return f'done {delay}', None
+
+        mock_gen.side_effect = slow_echo
+        requests = [
+            {'system_prompt': 'Sys', 'messages': [{'role': 'user', 'content': d}]}
+            for d in ('0.15', '0.0', '0.05')
+        ]
+        results = LLMClient.generate_many(requests, max_concurrency=3)
+
+        self.assertEqual(results, [('done 0.15', None), ('done 0.0', None), ('done 0.05', None)])
+
+    @override_settings(LLM_BACKEND_CONCURRENCY={'open_source': 2})
+    @patch('core.llm_client.LLMClient.generate')
+    def test_backend_cap_limits_in_flight_calls(self, mock_gen):
+        """Test that LLM_BACKEND_CONCURRENCY caps calls even with a higher batch limit."""
+        import threading
+        import time
+        from core import llm_transport
+        from core.llm_client import LLMClient
+
+        llm_transport._backend_slots.clear()
+        lock = threading.Lock()
+        state = {'now': 0, 'peak': 0}
+
+        def tracked(**kwargs):
+            with lock:
+                state['now'] += 1
+                state['peak'] = max(state['peak'], state['now'])
+            time.sleep(0.05)
+            with lock:
+                state['now'] -= 1
+            return 'ok', None
+
+        mock_gen.side_effect = tracked
+        results = LLMClient.generate_many(
+            [{'system_prompt': 'Sys', 'messages': []} for _ in range(6)], max_concurrency=6,
+        )
+        llm_transport._backend_slots.clear()
+
+        self.assertEqual(results, [('ok', None)] * 6)
+        self.assertEqual(state['peak'], 2)
+
+    @patch('core.llm_client.LLMClient.generate')
+    def test_failing_item_does_not_fail_batch(self, mock_gen):
+        """Test that an exception in one call becomes that item's error."""
+        from core.llm_client import LLMClient
+
+        def flaky(system_prompt='', messages=None, **kwargs):
+            if messages:
+                raise RuntimeError('boom')
+            return 'ok', None
+
+        mock_gen.side_effect = flaky
+        results = LLMClient.generate_many([
+            {'system_prompt': 'Sys', 'messages': []},
+            {'system_prompt': 'Sys', 'messages': [{'role': 'user', 'content': 'x'}]},
+        ])
+
+        self.assertEqual(results[0], ('ok', None))
+        self.assertIsNone(results[1][0])
+        self.assertIsNotNone(results[1][1])
+
+    @override_settings(LLM_USER_CONCURRENCY=2)
+    @patch('core.llm_client.LLMClient.generate')
+    def test_user_slot_caps_calls_across_batches(self, mock_gen):
+        """Test that two batches of one user share LLM_USER_CONCURRENCY calls in flight."""
+        import threading
+        import time
+        from core import llm_transport
+        from core.llm_client import LLMClient
+
+        lock = threading.Lock()
+        state = {'now': 0, 'peak': 0}
+
+        def tracked(**kwargs):
+            with lock:
+                state['now'] += 1
+                state['peak'] = max(state['peak'], state['now'])
+            time.sleep(0.03)
+            with lock:
+                state['now'] -= 1
+            return 'ok', None
+
+        mock_gen.side_effect = tracked
+        requests = [{'system_prompt': 'Sys', 'messages': []} for _ in range(4)]
+        results = []
+
+        def batch():
+            slot = llm_transport.user_slot(42)
+            results.extend(result for _, result in LLMClient.generate_as_completed(requests, 4, slot))
+
+        threads = [threading.Thread(target=batch) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [('ok', None)] * 8)
+        self.assertEqual(state['peak'], 2)
+        self.assertIsNot(llm_transport.user_slot(42), llm_transport.user_slot(43))
+
+
+@override_settings(
+    WRITINGBOT_API_URL='https://api.test.com', WRITINGBOT_API_KEY='k', ANTHROPIC_API_KEY='',
+    LLM_CACHE_ENABLED=False, LLM_SINGLEFLIGHT_ENABLED=False,
+    LLM_BREAKER_MIN_CALLS=4, LLM_BREAKER_FAILURE_RATE=0.5, LLM_BREAKER_OPEN_SECONDS=30,
+)
+class CircuitBreakerTestCase(TestCase):
+    """Test circuit breakers, adaptive timeouts and failover."""
+
+    def _trip(self, backend):
+        from core.llm_breaker import CircuitBreaker
+        breaker = CircuitBreaker.get(backend)
+        for _ in range(4):
+            breaker.record(False, 0.1)
+        return breaker
+
+    @patch('core.llm_transport.post')
+    def test_breaker_opens_on_server_errors(self, mock_post):
+        """Test that repeated 5xx replies open the breaker and later calls fail fast."""
+        from core.llm_breaker import CircuitBreaker
+        from core.llm_client import LLMClient
+
+        mock_resp = MagicMock()
+        mock_resp.status_code = 503
+        mock_resp.headers = {}
+        mock_post.return_value = mock_resp
+
+        for _ in range(4):
+            LLMClient.generate('Sys', [{'role': 'user', 'content': 'Hi'}])
+        self.assertEqual(CircuitBreaker.get('open_source').state, CircuitBreaker.OPEN)
+
+        mock_post.reset_mock()
+        text, error = LLMClient.generate('Sys', [{'role': 'user', 'content': 'Hi'}])
+        self.assertIsNone(text)
+        self.assertIn('temporarily unavailable', error)
+        mock_post.assert_not_called()
+
+    @override_settings(ANTHROPIC_API_KEY='sk-test', USE_CLAUDE_FOR_PREMIUM=False)
+    @patch('core.llm_client.LLMClient._call_claude', return_value=('From Claude.', None))
+    @patch('core.llm_transport.post')
+    def test_premium_fails_over_to_claude(self, mock_post, mock_claude):
+        """Test that premium calls go to Claude while the open-source breaker is open."""
+        from core.llm_client import LLMClient
+
+        self._trip('open_source')
+
+        text, error = LLMClient.generate('Sys', [{'role': 'user', 'content': 'Hi'}], use_premium=True)
+        self.assertEqual(text, 'From Claude.')
+        mock_claude.assert_called_once()
+
+        text, error = LLMClient.generate('Sys', [{'role': 'user', 'content': 'Hi'}], use_premium=False)
+        self.assertIsNone(text)
+        self.assertIsNotNone(error)
+        mock_post.assert_not_called()
+
+    @patch('core.llm_transport.post')
+    def test_detection_falls_back_to_heuristics(self, mock_post):
+        """Test that an open detector breaker yields the heuristic result without a request."""
+        from ai_detector.services import AIDetectorService
+
+        self._trip('detector')
+        result, error = AIDetectorService.detect('This is a sentence. ' * 20)
+
+        self.assertIsNone(error)
+        self.assertIn('overall_score', result)
+        mock_post.assert_not_called()
+
+    @override_settings(LLM_BREAKER_OPEN_SECONDS=0)
+    def test_half_open_allows_one_probe_and_closes_on_success(self):
+        """Test the half-open state lets a single probe through."""
+        from core.llm_breaker import CircuitBreaker
+
+        breaker = self._trip('open_source')
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow())
+
+        breaker.record(True, 0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+    @override_settings(LLM_TIMEOUT_MIN=1, LLM_TIMEOUT_MIN_SAMPLES=10, LLM_TIMEOUT_MULTIPLIER=2.0)
+    @patch('core.llm_transport.post')
+    def test_timeout_adapts_to_p99_latency(self, mock_post):
+        """Test that the read timeout follows observed latency once warmed up."""
+        from core.llm_breaker import CircuitBreaker
+        from core.llm_client import LLMClient
+
+        breaker = CircuitBreaker.get('open_source')
+        self.assertEqual(breaker.timeout(), 120)
+        for _ in range(50):
+            breaker.record(True, 1.5)
+
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        mock_resp.json.return_value = {'text': 'ok'}
+        mock_post.return_value = mock_resp
+        LLMClient.generate('Sys', [{'role': 'user', 'content': 'Hi'}])
+
+        self.assertEqual(mock_post.call_args[1]['timeout'], (5, 3.0))
+
+
+@override_settings(
+    WRITINGBOT_API_URL='https://api.test.com', WRITINGBOT_API_KEY='k',
+    LLM_CACHE_ENABLED=False, LLM_SINGLEFLIGHT_ENABLED=False,
+    LLM_HEDGE_ENABLED=True, LLM_HEDGE_DEFAULT_DELAY=0.05, LLM_HEDGE_BUDGET=1.0,
+)
+class LLMHedgerTestCase(TestCase):
+    """Test hedged requests for short calls."""
+
+    def setUp(self):
+        self.calls = 0
+
+    def _slow_then_fast(self, *args, **kwargs):
+        import time
+        self.calls += 1
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        if self.calls == 1:
+            time.sleep(0.3)
+            mock_resp.json.return_value = {'text': 'slow'}
+        else:
+            mock_resp.json.return_value = {'text': 'fast'}
+        return mock_resp
+
+    @patch('core.llm_transport.post')
+    def test_slow_short_call_is_hedged(self, mock_post):
+        """Test that a duplicate is sent after the delay and the first reply wins."""
+        from core.llm_client import LLMClient
+        from core.llm_hedge import LLMHedger
+
+        mock_post.side_effect = self._slow_then_fast
+        text, error = LLMClient.generate('Sys', [{'role': 'user', 'content': 'Hi'}], max_tokens=64)
+
+        self.assertEqual(text, 'fast')
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(LLMHedger.stats()['hedge_wins'], 1)
+
+    def test_async_hedge_win_records_seconds_saved(self):
+        """Test that an async hedge win is timed against the primary it beat."""
+        import asyncio
+        from core.llm_hedge import LLMHedger
+
+        async def afn():
+            self.calls += 1
+            if self.calls == 1:
+                await asyncio.sleep(0.3)
+                return 'slow', None
+            return 'fast', None
+
+        async def run():
+            result = await LLMHedger.acall(afn)
+            await asyncio.sleep(0.4)  # Let the abandoned primary finish
+            return result
+
+        text, error = async_to_sync(run)()
+
+        self.assertEqual(text, 'fast')
+        stats = LLMHedger.stats()
+        self.assertEqual(stats['hedge_wins'], 1)
+        self.assertGreater(stats['seconds_saved'], 0.1)
+
+    @override_settings(LLM_HEDGE_BUDGET=0)
+    @patch('core.llm_transport.post')
+    def test_budget_caps_hedging(self, mock_post):
+        """Test that no hedge is sent once the budget is spent."""
+        from core.llm_client import LLMClient
+        from core.llm_hedge import LLMHedger
+
+        mock_post.side_effect = self._slow_then_fast
+        text, error = LLMClient.generate('Sys', [{'role': 'user', 'content': 'Hi'}], max_tokens=64)
+
+        self.assertEqual(text, 'slow')
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(LLMHedger.stats()['budget_exhausted'], 1)
+
+    @patch('core.llm_transport.post')
+    def test_long_calls_are_not_hedged(self, mock_post):
+        """Test that calls above LLM_HEDGE_MAX_TOKENS go out once."""
+        from core.llm_client import LLMClient
+        from core.llm_hedge import LLMHedger
+
+        mock_post.side_effect = self._slow_then_fast
+        LLMClient.generate('Sys', [{'role': 'user', 'content': 'Hi'}], max_tokens=4096)
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(LLMHedger.stats()['eligible'], 0)
+
+
+class TokenBudgetTestCase(TestCase):
+    """Test token estimation, max_tokens sizing and context trimming."""
+
+    def test_estimate_counts_words_and_punctuation(self):
+        """Test that short words cost one token and punctuation is counted."""
+        from core.llm_tokens import TokenBudget
+
+        self.assertEqual(TokenBudget.estimate('Hello, world!'), 4)
+        self.assertEqual(TokenBudget.estimate(''), 0)
+
+    @override_settings(LLM_TOKEN_CALIBRATION={'claude': 1.5})
+    def test_estimate_applies_backend_calibration(self):
+        """Test that the per-backend calibration scales the estimate."""
+        from core.llm_tokens import TokenBudget
+
+        self.assertEqual(TokenBudget.estimate('one two three four', 'claude'), 6)
+        self.assertEqual(TokenBudget.estimate('one two three four', 'open_source'), 4)
+
+    def test_observed_usage_replaces_static_calibration(self):
+        """Test that enough real usage samples override the static factor."""
+        from core.llm_tokens import TokenBudget
+
+        for _ in range(TokenBudget.OBSERVE_MIN_SAMPLES):
+            TokenBudget.observe('claude', 'one two', 4)
+
+        self.assertAlmostEqual(TokenBudget.calibration('claude'), 2.0)
+
+    @override_settings(LLM_MAX_TOKENS_HEADROOM=100)
+    def test_max_tokens_scales_with_input(self):
+        """Test that max_tokens follows the input size within floor and ceiling."""
+        from core.llm_tokens import TokenBudget
+
+        self.assertEqual(TokenBudget.max_tokens_for('Short.', 'rewrite', ceiling=4096), 256)
+        self.assertEqual(TokenBudget.max_tokens_for('word ' * 1000, 'rewrite', ceiling=4096), 1400)
+        self.assertEqual(TokenBudget.max_tokens_for('word ' * 10000, 'rewrite', ceiling=4096), 4096)
+
+    def test_truncate_to_budget(self):
+        """Test that truncation keeps a prefix within the token budget."""
+        from core.llm_tokens import TokenBudget
+
+        text = 'word ' * 100
+        truncated = TokenBudget.truncate(text, 10)
+
+        self.assertEqual(truncated, ' '.join(['word'] * 10))
+        self.assertEqual(TokenBudget.truncate('short text', 10), 'short text')
+
+    def test_trim_messages_keeps_newest_user_first(self):
+        """Test that trimming keeps the newest turns and opens with a user turn."""
+        from core.llm_tokens import TokenBudget
+
+        messages = [
+            {'role': 'user', 'content': 'word ' * 50},
+            {'role': 'assistant', 'content': 'word ' * 10},
+            {'role': 'user', 'content': 'word ' * 10},
+            {'role': 'assistant', 'content': 'word ' * 10},
+            {'role': 'user', 'content': 'last question'},
+        ]
+        trimmed = TokenBudget.trim_messages(messages, 40)
+
+        self.assertEqual(trimmed, messages[2:])
+        self.assertEqual(TokenBudget.trim_messages(messages[-1:], 1), messages[-1:])
+
+
+@override_settings(WRITINGBOT_API_URL='https://api.test.com', WRITINGBOT_API_KEY='test-key')
+class LLMMetricsTestCase(TestCase):
+    """Test per-call LLM metrics and the /metrics endpoint."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def _ok(self):
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        mock_resp.json.return_value = {'text': 'Generated text here.', 'model': 'mistral-7b'}
+        return mock_resp
+
+    @patch('core.llm_transport.post')
+    def test_successful_call_is_counted_per_tool(self, mock_post):
+        """Test that a call is counted under its tool, backend and reported model."""
+        from core.llm_client import LLMClient
+        from core.llm_metrics import LLMMetrics
+
+        mock_post.return_value = self._ok()
+        LLMClient.generate('Sys', [{'role': 'user', 'content': 'Hello there'}], tool='paraphraser')
+        output = LLMMetrics.render()
+
+        self.assertIn(
+            'llm_requests_total{tool="paraphraser",backend="open_source",model="mistral-7b",outcome="ok"} 1',
+            output,
+        )
+        self.assertIn('llm_output_tokens_count{tool="paraphraser",backend="open_source"} 1', output)
+        self.assertIn('llm_request_duration_seconds_bucket{tool="paraphraser",backend="open_source",le="+Inf"} 1', output)
+
+    @patch('core.llm_transport.post')
+    def test_error_class_is_recorded(self, mock_post):
+        """Test that a timeout is counted with its error class."""
+        import requests
+        from core.llm_client import LLMClient
+        from core.llm_metrics import LLMMetrics
+
+        mock_post.side_effect = requests.exceptions.Timeout()
+        LLMClient.generate('Sys', [{'role': 'user', 'content': 'Hi'}], tool='grammar')
+
+        self.assertIn(
+            'llm_errors_total{tool="grammar",backend="open_source",error_class="timeout"} 1',
+            LLMMetrics.render(),
+        )
+
+    @override_settings(LLM_CACHE_ENABLED=True)
+    @patch('core.llm_transport.post')
+    def test_cache_hit_is_recorded(self, mock_post):
+        """Test that a response served from cache is counted as a cache hit."""
+        from core.llm_client import LLMClient
+        from core.llm_metrics import LLMMetrics
+
+        mock_post.return_value = self._ok()
+        for _ in range(2):
+            LLMClient.generate('Sys', [{'role': 'user', 'content': 'Hi'}], tool='demo', cache=True)
+
+        self.assertIn('outcome="cache_hit"} 1', LLMMetrics.render())
+
+    def test_metrics_endpoint_requires_token(self):
+        """Test that /metrics is hidden without the configured bearer token."""
+        from django.http import Http404
+        from django.test import RequestFactory
+        from core.views import MetricsView
+
+        factory = RequestFactory()
+        with patch('config.LLM_METRICS_TOKEN', 'secret', create=True):
+            with self.assertRaises(Http404):
+                MetricsView.as_view()(factory.get('/metrics'))
+            allowed = MetricsView.as_view()(factory.get('/metrics', HTTP_AUTHORIZATION='Bearer secret'))
+
+        self.assertEqual(allowed.status_code, 200)
+        self.assertIn(b'# TYPE llm_requests_total counter', allowed.content)
+
+
+@override_settings(
+    WRITINGBOT_API_URL='https://api.test.com', WRITINGBOT_API_KEY='test-key', ANTHROPIC_API_KEY='',
+    LLM_MODEL_TIERS={
+        'small': {'model': 'tiny-1b', 'cost': (1.0, 2.0)},
+        'default': {'model': 'big-70b', 'cost': (10.0, 20.0)},
+    },
+)
+class ModelRouterTestCase(TestCase):
+    """Test routing calls to model tiers by tool and size."""
+
+    def _ok(self):
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        mock_resp.json.return_value = {'text': 'en'}
+        return mock_resp
+
+    @patch('core.llm_transport.post')
+    def test_classification_tool_uses_small_model(self, mock_post):
+        """Test that a routed tool asks the GPU server for the small model."""
+        from core.llm_client import LLMClient
+
+        mock_post.return_value = self._ok()
+        LLMClient.generate('Detect', [{'role': 'user', 'content': 'Hola'}], max_tokens=10, tool='translator_detect')
+        LLMClient.generate('Rewrite', [{'role': 'user', 'content': 'Hola'}], tool='paraphraser')
+
+        self.assertEqual(mock_post.call_args_list[0].kwargs['json']['model'], 'tiny-1b')
+        self.assertEqual(mock_post.call_args_list[1].kwargs['json']['model'], 'big-70b')
+
+    def test_rules_match_on_size_and_plan(self):
+        """Test that rules are checked in order and unmatched calls keep the plan default."""
+        from core.llm_routing import ModelRouter
+
+        rules = {'scorer': [{'premium': True, 'tier': 'premium'}, {'max_input_tokens': 50, 'tier': 'small'}]}
+        with self.settings(LLM_MODEL_ROUTES=rules, ANTHROPIC_API_KEY='sk-test'):
+            short = [{'role': 'user', 'content': 'Short text.'}]
+            long = [{'role': 'user', 'content': 'word ' * 400}]
+            self.assertEqual(ModelRouter.route('scorer', False, 256, 'Sys', short)[0], 'small')
+            self.assertEqual(ModelRouter.route('scorer', False, 256, 'Sys', long)[0], 'default')
+            self.assertEqual(ModelRouter.route('scorer', True, 256, 'Sys', short)[:2], ('premium', 'claude'))
+
+        # Without an API key the premium tier falls back to the default model
+        self.assertEqual(ModelRouter.route('paraphraser', True), ('default', 'open_source', 'big-70b'))
+
+    @patch('core.llm_transport.post')
+    def test_route_latency_and_cost_are_exported(self, mock_post):
+        """Test that per-route latency and estimated cost appear in the metrics."""
+        from core.llm_client import LLMClient
+        from core.llm_metrics import LLMMetrics
+
+        mock_post.return_value = self._ok()
+        LLMClient.generate('Detect', [{'role': 'user', 'content': 'Hola'}], max_tokens=10, tool='translator_detect')
+        output = LLMMetrics.render()
+
+        self.assertIn('llm_route_duration_seconds_count{tool="translator_detect",route="small"} 1', output)
+        cost = [line for line in output.splitlines() if line.startswith('llm_route_cost_usd_total{')]
+        self.assertEqual(len(cost), 1)
+        self.assertIn('route="small"', cost[0])
+        self.assertGreater(float(cost[0].split()[-1]), 0)
+
+
+class PromptCacheTestCase(TestCase):
+    """Test prompt-prefix caching on both backends."""
+
+    def test_long_static_prefix_becomes_cached_block(self):
+        """Test that a long static prefix is sent to Claude with cache_control."""
+        from core.llm_prompt_cache import CachedPrompt, PromptCache
+
+        document = 'The quarterly report covers revenue and costs. ' * 300
+        content = CachedPrompt(document, 'Question: what changed?')
+        system, messages = PromptCache.claude_params('Sys', [{'role': 'user', 'content': content}])
+
+        self.assertEqual(system, 'Sys')
+        self.assertEqual(messages[0]['content'], [
+            {'type': 'text', 'text': document, 'cache_control': {'type': 'ephemeral'}},
+            {'type': 'text', 'text': 'Question: what changed?'},
+        ])
+
+    def test_short_prefix_and_plain_prompts_pass_through(self):
+        """Test that prompts below the cacheable size are sent unchanged."""
+        from core.llm_prompt_cache import CachedPrompt, PromptCache
+
+        messages = [{'role': 'user', 'content': 'Hi'}]
+        system, converted = PromptCache.claude_params(CachedPrompt('Short static. ', 'Dynamic.'), messages)
+
+        self.assertEqual(system, 'Short static. Dynamic.')
+        self.assertEqual(converted, messages)
+
+    @override_settings(WRITINGBOT_API_URL='https://api.test.com', WRITINGBOT_API_KEY='test-key')
+    @patch('core.llm_transport.post')
+    def test_open_source_payload_carries_prefix_key(self, mock_post):
+        """Test that requests sharing a static prefix send the same prefix hint."""
+        from core.llm_client import LLMClient
+        from core.llm_prompt_cache import CachedPrompt
+
+        mock_post.return_value = MagicMock(status_code=200, json=MagicMock(return_value={'text': 'Ok.'}))
+        for dynamic in ('Language: fr', 'Language: de'):
+            LLMClient.generate(CachedPrompt('Rewrite the text. ', dynamic), [{'role': 'user', 'content': 'Hi'}])
+        LLMClient.generate('Plain prompt', [{'role': 'user', 'content': 'Hi'}])
+
+        payloads = [call.kwargs['json'] for call in mock_post.call_args_list]
+        self.assertEqual(payloads[0]['prefix_cache_key'], payloads[1]['prefix_cache_key'])
+        self.assertEqual(payloads[0]['system_prompt'], 'Rewrite the text. Language: fr')
+        self.assertNotIn('prefix_cache_key', payloads[2])
+
+    @override_settings(ANTHROPIC_API_KEY='sk-test')
+    @patch('core.llm_transport.get_anthropic')
+    def test_claude_cache_usage_is_reported(self, mock_anthropic):
+        """Test that Claude's cache reads and writes feed the hit ratio."""
+        from core.llm_client import LLMClient
+        from core.llm_metrics import LLMMetrics
+
+        response = MagicMock()
+        response.content = [MagicMock(text='Answer.')]
+        response.usage = MagicMock(
+            input_tokens=50, output_tokens=10, cache_read_input_tokens=900, cache_creation_input_tokens=50,
+        )
+        mock_anthropic.return_value.messages.create.return_value = response
+
+        text, error = LLMClient.generate('Sys', [{'role': 'user', 'content': 'Hi'}], use_premium=True, tool='chat_pdf')
+        output = LLMMetrics.render()
+
+        self.assertEqual(text, 'Answer.')
+        self.assertIn('llm_prompt_cache_tokens_total{tool="chat_pdf",backend="claude",kind="read"} 900', output)
+        self.assertIn('llm_prompt_cache_hit_ratio{tool="chat_pdf"} 0.9', output)
+
+
+@override_settings(
+    LLM_ADMISSION_ENABLED=True, LLM_ADMISSION_CAPACITY=2,
+    LLM_ADMISSION_LANES={'free_interactive': {'limit': 1, 'queue': 1, 'timeout': 5}},
+)
+class LLMAdmissionTestCase(TestCase):
+    """Test tiered admission control in front of upstream calls."""
+
+    def _wait_queued(self, lane, depth=1):
+        import time
+        from core.llm_admission import LLMAdmission
+        deadline = time.monotonic() + 2
+        while LLMAdmission.stats()[lane]['queued'] < depth and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def test_free_spike_is_shed_while_premium_is_admitted(self):
+        """Test that a full free lane sheds at once and premium still gets a slot."""
+        import threading
+        from core.llm_admission import ADMISSION_ERROR, LLMAdmission
+
+        holding = threading.Event()
+        release = threading.Event()
+        errors = []
+
+        def hold_free():
+            with LLMAdmission.admit(False) as error:
+                errors.append(error)
+                holding.set()
+                release.wait(2)
+
+        holders = [threading.Thread(target=hold_free) for _ in range(2)]
+        holders[0].start()  # Takes the free lane's only slot
+        holding.wait(2)
+        holders[1].start()  # Fills the free lane's queue
+        self._wait_queued('free_interactive')
+
+        with LLMAdmission.admit(False) as shed:
+            pass
+        with LLMAdmission.admit(True) as premium:
+            pass
+        release.set()
+        for holder in holders:
+            holder.join()
+
+        self.assertEqual(shed, ADMISSION_ERROR)
+        self.assertIsNone(premium)
+        self.assertEqual(errors, [None, None])
+        self.assertEqual(LLMAdmission.stats()['free_interactive']['shed'], 1)
+
+    @override_settings(LLM_ADMISSION_CAPACITY=1, LLM_ADMISSION_LANES={})
+    def test_premium_is_dequeued_first(self):
+        """Test that a freed slot goes to a queued premium call before an earlier free one."""
+        import threading
+        from core.llm_admission import LLMAdmission
+
+        order = []
+
+        def call(use_premium):
+            with LLMAdmission.admit(use_premium) as error:
+                order.append(('premium' if use_premium else 'free', error))
+
+        with LLMAdmission.admit(False):
+            free = threading.Thread(target=call, args=(False,))
+            free.start()
+            self._wait_queued('free_interactive')
+            premium = threading.Thread(target=call, args=(True,))
+            premium.start()
+            self._wait_queued('premium_interactive')
+        free.join()
+        premium.join()
+
+        self.assertEqual(order, [('premium', None), ('free', None)])
+
+    @override_settings(LLM_ADMISSION_CAPACITY=1, LLM_ADMISSION_LANES={})
+    def test_async_waiter_is_granted_on_release(self):
+        """Test that an async call queued behind a sync one is admitted when it ends."""
+        import asyncio
+        import threading
+        from core.llm_admission import LLMAdmission
+
+        async def queued_call():
+            async with LLMAdmission.aadmit(True) as error:
+                return error
+
+        with LLMAdmission.admit(False):
+            result = []
+            thread = threading.Thread(target=lambda: result.append(asyncio.run(queued_call())))
+            thread.start()
+            self._wait_queued('premium_interactive')
+        thread.join()
+
+        self.assertEqual(result, [None])
+        self.assertEqual(LLMAdmission.stats()['premium_interactive']['active'], 0)
+
+    @override_settings(
+        LLM_ADMISSION_CAPACITY=0, WRITINGBOT_API_URL='https://api.test.com', WRITINGBOT_API_KEY='k',
+        LLM_ADMISSION_LANES={'free_interactive': {'queue': 0}},
+    )
+    @patch('core.llm_transport.post')
+    def test_shed_call_becomes_429(self, mock_post):
+        """Test that a request whose LLM call was shed is answered with 429 and Retry-After."""
+        from django.http import JsonResponse
+        from django.test import RequestFactory
+        from core.llm_client import LLMClient
+        from core.middleware import LLMAdmissionMiddleware
+
+        def view(request):
+            text, error = LLMClient.generate('Sys', [{'role': 'user', 'content': 'Hi'}], tool='grammar')
+            return JsonResponse({'error': error}, status=500)
+
+        response = LLMAdmissionMiddleware(view)(RequestFactory().post('/api/grammar/check/'))
+
+        mock_post.assert_not_called()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+
+
+@override_settings(
+    WRITINGBOT_API_URL='https://api.test.com', WRITINGBOT_API_KEY='test-key',
+    LLM_RATE_LIMIT_ENABLED=True, LLM_RATE_LIMIT_MAX_WAIT=0.5,
+    LLM_RATE_LIMITS={'open_source': {'requests_per_sec': 10, 'burst': 2, 'tokens_per_min': 600}},
+)
+class LLMRateLimiterTestCase(TestCase):
+    """Test the outbound token-bucket rate limiter."""
+
+    @patch('core.llm_ratelimit.time.sleep')
+    def test_burst_is_smoothed_with_short_waits(self, mock_sleep):
+        """Test that calls beyond the burst wait for the request bucket to refill."""
+        from core.llm_ratelimit import LLMRateLimiter
+
+        for _ in range(3):
+            self.assertIsNone(LLMRateLimiter.acquire('open_source'))
+
+        mock_sleep.assert_called_once()
+        self.assertAlmostEqual(mock_sleep.call_args.args[0], 0.1, delta=0.02)
+        self.assertEqual(LLMRateLimiter.stats()['open_source']['waited'], 1)
+
+    @patch('core.llm_ratelimit.time.sleep')
+    def test_output_tokens_are_charged_after_the_call(self, mock_sleep):
+        """Test that output tokens drain the token bucket and a long wait is refused."""
+        from core.llm_ratelimit import LLMRateLimiter
+
+        self.assertIsNone(LLMRateLimiter.acquire('open_source', tokens=10))
+        LLMRateLimiter.consume('open_source', 590)
+
+        # 10 tokens/s refill: 50 tokens would take ~5 s, over the 0.5 s max wait
+        self.assertIsNotNone(LLMRateLimiter.acquire('open_source', tokens=50))
+        self.assertIsNone(LLMRateLimiter.acquire('open_source', tokens=2))
+        self.assertEqual(LLMRateLimiter.stats()['open_source']['rejected'], 1)
+
+    @override_settings(LLM_RATE_LIMITS={'open_source': {'requests_per_sec': 1, 'burst': 1}})
+    @patch('core.llm_transport.post')
+    def test_refused_call_never_reaches_upstream(self, mock_post):
+        """Test that a refused call fails fast and the bucket fill is exported."""
+        from core.llm_client import LLMClient
+        from core.llm_metrics import LLMMetrics
+
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        mock_resp.json.return_value = {'text': 'Done.'}
+        mock_post.return_value = mock_resp
+
+        first = LLMClient.generate('Sys', [{'role': 'user', 'content': 'One'}], tool='demo')
+        second = LLMClient.generate('Sys', [{'role': 'user', 'content': 'Two'}], tool='demo')
+
+        self.assertEqual(first, ('Done.', None))
+        self.assertIsNone(second[0])
+        self.assertIn('busy', second[1])
+        mock_post.assert_called_once()
+        output = LLMMetrics.render()
+        self.assertIn('error_class="rate_limited"} 1', output)
+        self.assertIn('llm_ratelimit_requests_available{backend="open_source"}', output)
+
+    @patch('core.llm_ratelimit.time.sleep')
+    def test_redis_buckets_are_shared_when_available(self, mock_sleep):
+        """Test that the Lua script decides the wait when Redis is available."""
+        from core.llm_ratelimit import LLMRateLimiter
+
+        client = MagicMock()
+        client.register_script.return_value = MagicMock(return_value=[b'0.25', b'0', b'590'])
+        with patch('core.llm_ratelimit.get_redis_connection', return_value=client):
+            self.assertIsNone(LLMRateLimiter.acquire('open_source', tokens=10))
+
+        keys = client.register_script.return_value.call_args.kwargs['keys']
+        self.assertTrue(all(key.startswith('llm_rl:{open_source:') for key in keys))
+        mock_sleep.assert_called_once_with(0.25)
+
+
+class LLMStandInTestCase(TestCase):
+    """Test the local GPU-server stand-in end to end through LLMClient."""
+
+    def _serve(self, standin):
+        import threading
+        from core.llm_standin import make_server
+
+        server = make_server(standin)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f'http://127.0.0.1:{server.server_address[1]}'
+
+    def test_synthetic_generate_stream_and_detect(self):
+        """Test that the synthetic stand-in answers generate, stream and detection calls."""
+        from core.llm_client import LLMClient
+        from core.llm_standin import LatencyModel, StandIn
+
+        url = self._serve(StandIn(latency=LatencyModel('fixed:0'), tokens_per_sec=0))
+        messages = [{'role': 'user', 'content': 'Paraphrase:\n"""\nThe cat sat on the mat.\n"""'}]
+        with self.settings(WRITINGBOT_API_URL=url, WRITINGBOT_API_KEY='k'):
+            text, error = LLMClient.generate('Sys', messages)
+            deltas = [delta for delta, _ in LLMClient.stream('Sys', messages)]
+            detection, detect_error = LLMClient.detect_ai_text('Some text to classify.')
+
+        self.assertIsNone(error)
+        self.assertEqual(text, 'The cat sat on the mat.')
+        self.assertEqual(''.join(deltas), 'The cat sat on the mat.')
+        self.assertIsNone(detect_error)
+        self.assertIn(detection['label'], ('ai', 'human'))
+
+    def test_error_injection(self):
+        """Test that injected errors surface as upstream failures."""
+        from core.llm_breaker import CircuitBreaker
+        from core.llm_client import LLMClient
+        from core.llm_standin import LatencyModel, StandIn
+
+        CircuitBreaker.reset()
+        url = self._serve(StandIn(latency=LatencyModel('fixed:0'), error_rate=1.0, error_status=503))
+        with self.settings(WRITINGBOT_API_URL=url, WRITINGBOT_API_KEY='k'):
+            text, error = LLMClient.generate('Sys', [{'role': 'user', 'content': 'Hi'}])
+        CircuitBreaker.reset()
+
+        self.assertIsNone(text)
+        self.assertIsNotNone(error)
+
+    def test_replay_matches_recorded_request(self):
+        """Test that replay serves the recorded reply for a matching request, else cycles."""
+        import tempfile
+        from core.llm_standin import GENERATE_PATH, StandIn, request_hash
+
+        payload = {'system_prompt': 'Sys', 'messages': [{'role': 'user', 'content': 'Hi'}]}
+        entries = [
+            {'path': GENERATE_PATH, 'hash': request_hash(GENERATE_PATH, payload),
+             'status': 200, 'body': {'text': 'Recorded.'}, 'latency': 0.5},
+            {'path': GENERATE_PATH, 'hash': 'other', 'status': 200, 'body': {'text': 'Other.'}, 'latency': 0.2},
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as capture:
+            capture.write('\n'.join(json.dumps(entry) for entry in entries))
+        standin = StandIn(replay_path=capture.name, latency_scale=2.0)
+
+        status, body, (ttfb, _) = standin.reply(GENERATE_PATH, {**payload, 'stream': True})
+        self.assertEqual((status, body, ttfb), (200, {'text': 'Recorded.'}, 1.0))
+        self.assertEqual(standin.reply(GENERATE_PATH, {'messages': []})[1], {'text': 'Recorded.'})
+        self.assertEqual(standin.reply(GENERATE_PATH, {'messages': []})[1], {'text': 'Other.'})
+
+
+@override_settings(LLM_NEARDUP_ENABLED=True, LLM_NEARDUP_TOOLS={'detector': 3, 'exact': 0})
+class NearDuplicateCacheTestCase(TestCase):
+    """Test the normalized / SimHash near-duplicate result cache."""
+
+    TEXT = (
+        'Remote work has changed how teams communicate and plan their days. Many companies now rely on '
+        'written updates instead of meetings, which gives people more time for focused work but also makes '
+        'clear writing a core skill. Managers report that projects move faster when decisions are documented.'
+    )
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_normalized_variants_share_an_entry(self):
+        """Test that whitespace and quote variants hit the same entry."""
+        from core.llm_neardup import NearDuplicateCache
+
+        NearDuplicateCache.set('exact', 'She said “hello”  there.', {'score': 12})
+        match = NearDuplicateCache.get('exact', 'She said "hello" there. \n')
+
+        self.assertEqual(match, ('She said “hello”  there.', {'score': 12}))
+        self.assertIsNone(NearDuplicateCache.get('exact', 'She said "goodbye" there.'))
+        self.assertEqual(NearDuplicateCache.stats()['exact'], {'exact_hits': 1, 'near_hits': 0, 'misses': 1})
+
+    def test_one_edited_word_is_a_near_match(self):
+        """Test that a small edit matches within the threshold and other texts and tools do not."""
+        from core.llm_neardup import NearDuplicateCache
+
+        NearDuplicateCache.set('detector', self.TEXT, {'score': 80})
+        NearDuplicateCache.set('exact', self.TEXT, {'score': 80})
+        edited = self.TEXT.replace('faster', 'quicker')
+
+        self.assertEqual(NearDuplicateCache.get('detector', edited), (self.TEXT, {'score': 80}))
+        self.assertIsNone(NearDuplicateCache.get('exact', edited))
+        self.assertIsNone(NearDuplicateCache.get('detector', 'The quarterly report covers revenue. ' * 8))
+        self.assertIsNone(NearDuplicateCache.get('detector', edited, namespace=('other',)))
+
+    def test_paragraph_reuse_maps_positions(self):
+        """Test that unchanged paragraphs map to the new text and edited ones are rechecked."""
+        from core.llm_neardup import ParagraphReuse
+
+        old = 'First paragraph here.\n\nSecond one.\n\nThird paragraph.'
+        new = 'First paragraph here.  \n\nSecond one, edited.\n\n\nThird paragraph.'
+        reuse = ParagraphReuse(old, new)
+
+        self.assertEqual(reuse.recheck_text, 'Second one, edited.')
+        third = old.index('Third')
+        self.assertEqual(reuse.map_cached(third, third + 5), (new.index('Third'), new.index('Third') + 5))
+        self.assertIsNone(reuse.map_cached(old.index('Second'), old.index('Second') + 6))
+        self.assertEqual(reuse.map_recheck(0, 6), (new.index('Second'), new.index('Second') + 6))
+
+
+@override_settings(LLM_INCREMENTAL_ENABLED=True, LLM_INCREMENTAL_CONTEXT=1, LLM_INCREMENTAL_MAX_CHANGED=0.5)
+class IncrementalRewriteTestCase(TestCase):
+    """Test sentence-aligned incremental rewrites of edited texts."""
+
+    TEXT = 'One fish swims. Two fish dive. Red fish rest.\n\nBlue fish sing. Old fish sleep.'
+    OUTPUT = 'A fish swims. A pair dives. The red one rests.\n\nBlue fish chant. Aged fish doze.'
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_align_pairs_sentences_or_falls_back_to_paragraphs(self):
+        """Test that sentences pair one to one only where the counts match."""
+        from core.llm_incremental import BREAK, align
+
+        sequence, units = align(self.TEXT, 'A fish swims and a pair dives. The red one rests.\n\nBlue fish chant. Aged fish doze.')
+        self.assertEqual(sequence[3], BREAK)
+        self.assertEqual(units[0], [0, 3, 'A fish swims and a pair dives. The red one rests.'])
+        self.assertEqual(units[1:], [[4, 5, 'Blue fish chant.'], [5, 6, 'Aged fish doze.']])
+
+        # Different paragraph counts: the whole text is one unit
+        self.assertEqual(align(self.TEXT, 'All merged.')[1], [[0, 6, 'All merged.']])
+
+    def test_only_edited_sentence_is_rewritten(self):
+        """Test that an edit re-runs one sentence with context and keeps the rest."""
+        from core.llm_incremental import IncrementalRewrite
+
+        IncrementalRewrite.record('paraphraser', 'u1:doc', ('standard',), self.TEXT, self.OUTPUT)
+        edited = self.TEXT.replace('Two fish dive.', 'Two fish jump.')
+        plan = IncrementalRewrite.load('paraphraser', 'u1:doc', ('standard',), edited)
+
+        self.assertEqual([region.text for region in plan.regions], ['Two fish jump.'])
+        self.assertEqual(plan.regions[0].before, ['One fish swims.'])
+        self.assertEqual(plan.regions[0].after, ['Red fish rest.'])
+        output = plan.stitch(['A pair leaps.'])
+        self.assertEqual(output, 'A fish swims. A pair leaps. The red one rests.\n\nBlue fish chant. Aged fish doze.')
+
+        # The stitched mapping is stored for the next run
+        again = IncrementalRewrite.load('paraphraser', 'u1:doc', ('standard',), edited + ' New fish arrive.')
+        self.assertEqual([region.text for region in again.regions], ['New fish arrive.'])
+        self.assertEqual(again.stitch(['Fresh fish come.']), output + ' Fresh fish come.')
+        self.assertEqual(IncrementalRewrite.stats()['paraphraser']['sentences_rewritten'], 2)
+
+    def test_large_edits_and_other_parameters_rewrite_whole_text(self):
+        """Test that a mostly rewritten text, another namespace or document gets no plan."""
+        from core.llm_incremental import IncrementalRewrite
+
+        IncrementalRewrite.record('paraphraser', 'u1:doc', ('standard',), self.TEXT, self.OUTPUT)
+        self.assertIsNone(IncrementalRewrite.load('paraphraser', 'u1:doc', ('formal',), self.TEXT))
+        self.assertIsNone(IncrementalRewrite.load('paraphraser', 'u2:doc', ('standard',), self.TEXT))
+        self.assertIsNone(IncrementalRewrite.load('paraphraser', 'u1:doc', ('standard',), 'Completely new text. Nothing shared.'))
+        unchanged = IncrementalRewrite.load('paraphraser', 'u1:doc', ('standard',), self.TEXT.replace('. ', '.  '))
+        self.assertEqual(unchanged.regions, [])
+        self.assertEqual(unchanged.stitch([]), self.OUTPUT.replace('. ', '.  '))
+
+
+class MapReduceTestCase(TestCase):
+    """Test long-document chunking and the translator's map-reduce path."""
+
+    def test_split_respects_budget_and_paragraphs(self):
+        """Test that chunks fit the budget, break at paragraphs and map back to the text."""
+        from core.llm_mapreduce import MapReduce
+        from core.llm_tokens import TokenBudget
+
+        paragraph = ' '.join(f'Sentence number {i} talks about the quarterly plan.' for i in range(12))
+        text = '\n' + '\n\n'.join([paragraph] * 5) + '\n'
+        chunks = MapReduce.split(text, 120)
+
+        self.assertGreater(len(chunks), 2)
+        for chunk in chunks:
+            self.assertLessEqual(TokenBudget.estimate(chunk.text), 120)
+            self.assertEqual(text[chunk.offset:chunk.offset + len(chunk.text)], chunk.text)
+            self.assertTrue(chunk.text.endswith('plan.'))
+        self.assertEqual(MapReduce.join(chunks, [chunk.text for chunk in chunks]), text.strip())
+
+    def test_overlong_sentence_is_split_at_spaces(self):
+        """Test that a sentence longer than the budget is cut between words."""
+        from core.llm_mapreduce import MapReduce
+
+        text = 'word ' * 300
+        chunks = MapReduce.split(text, 50)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunk.text.split() and set(chunk.text.split()) == {'word'} for chunk in chunks))
+
+    @override_settings(LLM_CACHE_ENABLED=False, LLM_SINGLEFLIGHT_ENABLED=False)
+    def test_stream_yields_in_chunk_order_as_ready(self):
+        """Test that stream() releases each result once the chunks before it are done."""
+        import time
+        from core.llm_mapreduce import Chunk, MapReduce
+
+        def slow_echo(system_prompt='', messages=None, **kwargs):
+            time.sleep(float(messages[0]['content']))
+            return messages[0]['content'], None
+
+        chunks = [Chunk(delay, 0) for delay in ('0.1', '0.0', '0.05')]
+        with patch('core.llm_client.LLMClient.generate', side_effect=slow_echo):
+            results = list(MapReduce.stream(
+                chunks, lambda chunk: {'system_prompt': 'Sys', 'messages': [{'role': 'user', 'content': chunk.text}]},
+            ))
+
+        self.assertEqual(results, [('0.1', None), ('0.0', None), ('0.05', None)])
+
+    @override_settings(LLM_MAPREDUCE_CHUNK_TOKENS={'translate': 30})
+    def test_long_translation_is_rejoined_in_order(self):
+        """Test that chunk translations are concatenated with the original paragraph breaks."""
+        from translator.services import TranslationService
+
+        paragraphs = [f'Paragraph {i} describes the plan for the next quarter in detail.' for i in range(4)]
+
+        def translate(system_prompt, messages, **kwargs):
+            return messages[0]['content'].replace('Paragraph', 'Párrafo'), None
+
+        with patch('core.llm_client.LLMClient.generate', side_effect=translate) as mock_gen:
+            result, error = TranslationService.translate('\n\n'.join(paragraphs), 'en', 'es')
+
+        self.assertIsNone(error)
+        self.assertGreater(mock_gen.call_count, 1)
+        self.assertEqual(result['translated_text'], '\n\n'.join(p.replace('Paragraph', 'Párrafo') for p in paragraphs))
+
+
+class ExtractJSONTestCase(TestCase):
+    """Test JSON extraction from raw LLM replies."""
+
+    def test_clean_fenced_and_wrapped_replies(self):
+        """Test that clean, fenced and commented replies parse to the same value."""
+        from core.llm_json import extract_json
+
+        body = '{"score": 72, "note": "uses {braces} and \\"quotes\\""}'
+        expected = {'score': 72, 'note': 'uses {braces} and "quotes"'}
+
+        self.assertEqual(extract_json(body), expected)
+        self.assertEqual(extract_json(f'```json\n{body}\n```'), expected)
+        self.assertEqual(extract_json(f'Here you go:\n{body}\nHope this helps!'), expected)
+        self.assertEqual(extract_json('72'), 72)
+
+    def test_brackets_in_preamble_are_skipped(self):
+        """Test that a bracketed aside before the document does not hide it."""
+        from core.llm_json import extract_json
+
+        self.assertEqual(extract_json('Scores use the {0-100} scale:\n{"score": 5}'), {'score': 5})
+
+    def test_no_json_raises(self):
+        """Test that replies without JSON raise ValueError."""
+        from core.llm_json import extract_json
+
+        with self.assertRaises(ValueError):
+            extract_json('I could not analyze this text.')
+        with self.assertRaises(ValueError):
+            extract_json('   ')
+
+
+class IncrementalJSONParserTestCase(TestCase):
+    """Test streaming extraction of array elements."""
+
+    def test_elements_are_emitted_as_they_close(self):
+        """Test that each correction is returned by the feed that completes it."""
+        from core.llm_json import IncrementalJSONParser
+
+        reply = '```json\n' + json.dumps({
+            'overall_score': 80,
+            'corrections': [
+                {'original': 'teh', 'suggestion': 'the', 'explanation': 'a "quoted" {brace}'},
+                {'original': 'recieve', 'suggestion': 'receive', 'position': {'start': 4, 'end': 11}},
+            ],
+            'corrected_text': 'The [fixed] text.',
+        }) + '\n```'
+        parser = IncrementalJSONParser('corrections')
+        emitted = []
+        for i in range(0, len(reply), 7):
+            emitted.extend(parser.feed(reply[i:i + 7]))
+
+        self.assertEqual([c['suggestion'] for c in emitted], ['the', 'receive'])
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.result()['corrected_text'], 'The [fixed] text.')
+
+    def test_other_arrays_are_ignored(self):
+        """Test that only the watched key's array is emitted."""
+        from core.llm_json import IncrementalJSONParser
+
+        parser = IncrementalJSONParser('corrections')
+        items = parser.feed('{"tags": [{"a": 1}], "corrections": [{"b": 2}, "skip", [3]]}')
+
+        self.assertEqual(items, [{'b': 2}, [3]])
+
+    def test_top_level_array(self):
+        """Test emitting the elements of a top-level array."""
+        from core.llm_json import IncrementalJSONParser
+
+        parser = IncrementalJSONParser()
+        items = parser.feed('Sure: [{"s": "one"}, {"s": "tw')
+        items += parser.feed('o"}]')
+
+        self.assertEqual(items, [{'s': 'one'}, {'s': 'two'}])
@@ -1,7 +1,7 @@
 """Tests for the paraphraser service."""
 from unittest.mock import patch
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from tests.conftest import mock_llm_generate, MOCK_PARAPHRASE_RESPONSE, MOCK_SYNONYMS_RESPONSE
 
@@ -61,9 +61,269 @@ class ParaphraseServiceTests(TestCase):
         self.assertIsNone(error)
         self.assertIsInstance(synonyms, list)
 
+    def test_variants_come_from_one_call(self, mock_gen):
+        from paraphraser.services import AIParaphraseService
+        variants, error = AIParaphraseService.paraphrase('Test text.', n_variants=3)
+        self.assertIsNone(error)
+        self.assertEqual(len(variants), 3)
+        self.assertEqual(variants[0], MOCK_PARAPHRASE_RESPONSE)
+        self.assertEqual(mock_gen.call_count, 1)
+        self.assertEqual(mock_gen.call_args.kwargs['n'], 3)
+
+    def test_empty_variants_reply_is_an_error(self, mock_gen):
+        from paraphraser.services import AIParaphraseService, NO_VARIANTS_ERROR
+        mock_gen.side_effect = None
+        mock_gen.return_value = ('["", "  "]', None)
+        variants, error = AIParaphraseService.paraphrase('Test text.', n_variants=3)
+        self.assertIsNone(variants)
+        self.assertEqual(error, NO_VARIANTS_ERROR)
+
+    def test_view_answers_empty_variants_with_error_response(self, mock_gen):
+        from unittest.mock import MagicMock
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from paraphraser.services import NO_VARIANTS_ERROR
+        from paraphraser.views import ParaphraseAPI
+
+        request = APIRequestFactory().post('/api/paraphrase/', {'text': 'Test text.', 'n_variants': 3}, format='json')
+        force_authenticate(request, user=MagicMock(pk=7, is_authenticated=True, is_plan_active=True))
+        with patch('paraphraser.services.AIParaphraseService.paraphrase', return_value=([], None)):
+            response = ParaphraseAPI.as_view()(request)
+        self.assertEqual(response.data, {'error': NO_VARIANTS_ERROR})
+
     def test_premium_flag_passed(self, mock_gen):
         from paraphraser.services import AIParaphraseService
         AIParaphraseService.paraphrase('Test text.', use_premium=True)
         # Check that the mock was called with use_premium=True
         call_kwargs = mock_gen.call_args[1]
         self.assertTrue(call_kwargs.get('use_premium', False))
+
+
+@override_settings(LLM_INCREMENTAL_ENABLED=True)
+class IncrementalParaphraseTests(TestCase):
+
+    TEXT = 'The cat sat on the mat. It was warm there. The dog watched.'
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    @patch('core.llm_client.LLMClient.generate_many')
+    @patch('core.llm_client.LLMClient.generate')
+    def test_rerun_only_paraphrases_edited_sentence(self, mock_gen, mock_many):
+        from paraphraser.services import AIParaphraseService
+        mock_gen.return_value = ('A cat rested on the rug. The spot was cosy. A dog looked on.', None)
+        mock_many.return_value = [('"The spot was hot."', None)]
+
+        first, error = AIParaphraseService.paraphrase(self.TEXT, document='7:essay')
+        self.assertIsNone(error)
+        text, error = AIParaphraseService.paraphrase(self.TEXT.replace('warm', 'hot'), document='7:essay')
+
+        self.assertIsNone(error)
+        self.assertEqual(text, 'A cat rested on the rug. The spot was hot. A dog looked on.')
+        self.assertEqual(mock_gen.call_count, 1)
+        request = mock_many.call_args.args[0][0]
+        self.assertIn('"""\nIt was hot there.\n"""', request['messages'][0]['content'])
+        self.assertIn('Preceding text (context only', request['messages'][0]['content'])
+
+    @patch('core.llm_client.LLMClient.generate')
+    def test_without_document_paraphrases_whole_text(self, mock_gen):
+        from paraphraser.services import AIParaphraseService
+        mock_gen.return_value = ('Rewritten.', None)
+        AIParaphraseService.paraphrase(self.TEXT)
+        AIParaphraseService.paraphrase(self.TEXT.replace('warm', 'hot'))
+        self.assertEqual(mock_gen.call_count, 2)
+
+
+class SynonymEngineTests(TestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    @patch('core.llm_client.LLMClient.generate', side_effect=mock_llm_generate)
+    def test_one_batch_call_serves_every_word_of_the_sentence(self, mock_gen):
+        from paraphraser.services import AIParaphraseService
+        from paraphraser.synonyms import SynonymEngine
+        sentence = 'The quick brown fox jumps over the lazy dog.'
+
+        synonyms, error = AIParaphraseService.get_synonyms('quick', sentence)
+        self.assertIsNone(error)
+        self.assertEqual(synonyms, ['quick', 'fast', 'rapid', 'swift', 'speedy'])
+        content = mock_gen.call_args.kwargs['messages'][0]['content']
+        self.assertIn('"lazy"', content)
+        self.assertNotIn('"the"', content)
+
+        for word in ('brown', 'jumps', 'lazy', 'dog'):
+            synonyms, error = AIParaphraseService.get_synonyms(word, sentence)
+            self.assertTrue(synonyms)
+        self.assertEqual(mock_gen.call_count, 1)
+        self.assertEqual(SynonymEngine.stats()['local_hits'], 4)
+
+    @patch('core.llm_client.LLMClient.generate', side_effect=mock_llm_generate)
+    def test_whole_text_context_is_narrowed_to_the_word_sentence(self, mock_gen):
+        from paraphraser.synonyms import SynonymEngine
+        text = ' '.join(f'Sentence {n} covers quarterly planning details thoroughly.' for n in range(5))
+        text += ' Finally, the committee approved every ambitious budget proposal.'
+
+        for word in ('committee', 'approved', 'ambitious', 'budget', 'proposal'):
+            synonyms, error = SynonymEngine.lookup(word, text)
+            self.assertIsNone(error)
+            self.assertTrue(synonyms)
+        self.assertEqual(mock_gen.call_count, 1)
+        content = mock_gen.call_args.kwargs['messages'][0]['content']
+        self.assertIn('Sentence: "Finally, the committee approved every ambitious budget proposal."', content)
+        self.assertNotIn('quarterly', content)
+
+    @patch('core.llm_client.LLMClient.generate', side_effect=mock_llm_generate)
+    def test_shared_tier_and_context_window_keying(self, mock_gen):
+        from paraphraser.synonyms import SynonymEngine
+        SynonymEngine.batch('Results were remarkably consistent across trials.')
+        SynonymEngine.clear()  # New process: local tier empty, Redis tier kept
+
+        synonyms, _ = SynonymEngine.lookup('consistent', 'Overall, results were remarkably consistent across trials again.')
+        self.assertTrue(synonyms)
+        self.assertEqual(SynonymEngine.stats()['redis_hits'], 1)
+        self.assertEqual(mock_gen.call_count, 1)
+
+        # Same word in another context is a different entry
+        SynonymEngine.lookup('consistent', 'She was never consistent with her training.')
+        self.assertEqual(mock_gen.call_count, 2)
+
+    @patch('core.llm_client.LLMClient.generate', side_effect=mock_llm_generate)
+    def test_warm_fetches_frequent_pairs_once(self, mock_gen):
+        from paraphraser.synonyms import SynonymEngine
+        texts = ['The results suggest a strong effect. Further work is needed.'] * 3
+
+        first = SynonymEngine.warm(texts, top=10)
+        second = SynonymEngine.warm(texts, top=10)
+
+        self.assertEqual(first['calls'], 2)
+        self.assertEqual(second, {'frequent': first['frequent'], 'already_cached': first['frequent'], 'calls': 0})
+        self.assertEqual(mock_gen.call_count, 2)
+
+    @patch('core.llm_client.LLMClient.generate', return_value=(None, 'LLM service error'))
+    def test_errors_are_not_cached(self, mock_gen):
+        from paraphraser.synonyms import SynonymEngine
+        synonyms, error = SynonymEngine.lookup('fast', 'The car was fast.')
+        self.assertIsNone(synonyms)
+        self.assertEqual(error, 'LLM service error')
+        SynonymEngine.lookup('fast', 'The car was fast.')
+        self.assertEqual(mock_gen.call_count, 2)
+
+
+class FrozenTermsTests(TestCase):
+
+    def test_mask_and_restore_round_trip(self):
+        from paraphraser.frozen import FrozenTerms
+        frozen = FrozenTerms.get(['WritingBot', 'machine learning', 'AI'])
+        masked, counts = frozen.mask('Machine learning helps writingbot. AI aids AI-based tools, not FAIR ones.')
+
+        self.assertEqual(masked, '[[F1]] helps [[F2]]. [[F3]] aids [[F3]]-based tools, not FAIR ones.')
+        self.assertEqual(counts, {1: 1, 2: 1, 3: 2})
+        text, missing = frozen.restore('With [[F3]] and [[F3]] tools, [[F2]] uses [[F1]].', counts)
+        self.assertEqual(text, 'With AI and AI tools, WritingBot uses machine learning.')
+        self.assertEqual(missing, [])
+        self.assertEqual(frozen.restore('[[F2]] uses it.', counts)[1], ['machine learning', 'AI'])
+
+    def test_compiled_once_per_term_set(self):
+        from paraphraser.frozen import FrozenTerms
+        self.assertIs(FrozenTerms.get(['b', 'a ']), FrozenTerms.get(['a', 'b']))
+        self.assertIsNot(FrozenTerms.get(['a']), FrozenTerms.get(['a', 'b']))
+        self.assertEqual(FrozenTerms.get([]).mask('Nothing frozen.'), ('Nothing frozen.', {}))
+
+    def test_restore_stream_handles_split_placeholders(self):
+        from paraphraser.frozen import FrozenTerms
+        frozen = FrozenTerms.get(['WritingBot'])
+        deltas = [('Try [', None), ('[F', None), ('1]', None), ('] now [sic].', None)]
+        self.assertEqual(''.join(delta for delta, _ in frozen.restore_stream(deltas)), 'Try WritingBot now [sic].')
+
+    @patch('core.llm_client.LLMClient.generate', return_value=('[[F1]] is a great platform.', None))
+    def test_paraphrase_masks_frozen_words(self, mock_gen):
+        from paraphraser.services import AIParaphraseService
+        text, error = AIParaphraseService.paraphrase('The writingbot platform is great.', frozen_words=['WritingBot'])
+
+        self.assertIsNone(error)
+        self.assertEqual(text, 'WritingBot is a great platform.')
+        request = mock_gen.call_args.kwargs
+        self.assertIn('[[F1]] platform', request['messages'][0]['content'])
+        self.assertNotIn('writingbot', request['messages'][0]['content'].lower())
+        self.assertIn('[[F1]]', str(request['system_prompt']))
+
+    @patch('core.llm_client.LLMClient.generate')
+    def test_variants_restore_frozen_words_in_each(self, mock_gen):
+        from paraphraser.services import AIParaphraseService
+        mock_gen.return_value = ('["[[F1]] is great.", "\\"[[F1]] rocks.\\"", "[[F1]] is great."]', None)
+        variants, error = AIParaphraseService.paraphrase(
+            'WritingBot is great.', frozen_words=['WritingBot'], n_variants=3,
+        )
+
+        self.assertIsNone(error)
+        self.assertEqual(variants, ['WritingBot is great.', 'WritingBot rocks.'])
+
+
+@override_settings(LLM_MAPREDUCE_CHUNK_TOKENS={'paraphrase': 20})
+class LongParaphraseTests(TestCase):
+
+    PARAGRAPHS = [f'Paragraph {i} explains how WritingBot plans the next quarter in detail.' for i in range(4)]
+
+    @staticmethod
+    def rewrite(system_prompt, messages, **kwargs):
+        return messages[0]['content'].strip('"\n').replace('explains', 'describes'), None
+
+    @patch('core.llm_client.LLMClient.generate')
+    def test_premium_long_input_is_paraphrased_per_paragraph(self, mock_gen):
+        from paraphraser.services import AIParaphraseService
+        mock_gen.side_effect = self.rewrite
+        text, error = AIParaphraseService.paraphrase(
+            '\n\n'.join(self.PARAGRAPHS), mode='formal', frozen_words=['WritingBot'], use_premium=True, owner=7,
+        )
+
+        self.assertIsNone(error)
+        self.assertEqual(text, '\n\n'.join(p.replace('explains', 'describes') for p in self.PARAGRAPHS))
+        self.assertEqual(mock_gen.call_count, 4)
+        prompts = {str(call.kwargs['system_prompt']) for call in mock_gen.call_args_list}
+        self.assertEqual(len(prompts), 1)
+        self.assertIn('formal', prompts.pop())
+        for call in mock_gen.call_args_list:
+            self.assertIn('[[F1]]', call.kwargs['messages'][0]['content'])
+
+    @patch('core.llm_client.LLMClient.generate')
+    def test_free_long_input_is_one_call(self, mock_gen):
+        from paraphraser.services import AIParaphraseService
+        mock_gen.return_value = ('Rewritten.', None)
+        AIParaphraseService.paraphrase('\n\n'.join(self.PARAGRAPHS))
+        self.assertEqual(mock_gen.call_count, 1)
+
+    @patch('core.llm_client.LLMClient.generate')
+    def test_stream_yields_paragraphs_in_order(self, mock_gen):
+        from paraphraser.services import AIParaphraseService
+        mock_gen.side_effect = self.rewrite
+        deltas = list(AIParaphraseService.paraphrase_stream('\n\n'.join(self.PARAGRAPHS), use_premium=True))
+
+        self.assertEqual(len(deltas), 4)
+        self.assertTrue(all(error is None for _, error in deltas))
+        self.assertEqual(''.join(delta for delta, _ in deltas),
+                         '\n\n'.join(p.replace('explains', 'describes') for p in self.PARAGRAPHS))
+
+    @patch('core.llm_client.LLMClient.generate')
+    def test_stream_view_done_text_matches_split_deltas(self, mock_gen):
+        import json
+        from unittest.mock import MagicMock
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from paraphraser.views import ParaphraseStreamAPI
+
+        # Quotes that open the first paragraph and close the last one are
+        # kept per chunk, but _post_process would strip them from the whole text
+        paragraphs = ['"' + self.PARAGRAPHS[0]] + self.PARAGRAPHS[1:-1] + [self.PARAGRAPHS[-1] + '"']
+        mock_gen.side_effect = lambda system_prompt, messages, **kwargs: (messages[0]['content'][4:-4], None)
+        request = APIRequestFactory().post('/api/paraphrase/stream/', {'text': '\n\n'.join(paragraphs)}, format='json')
+        force_authenticate(request, user=MagicMock(pk=7, is_authenticated=True, is_plan_active=True))
+        with patch('paraphraser.views.ParaphraseAPI.save_history'):
+            response = ParaphraseStreamAPI.as_view()(request)
+            events = b''.join(response.streaming_content).decode()
+
+        payloads = [json.loads(line[len('data: '):]) for line in events.splitlines() if line.startswith('data: ')]
+        deltas = ''.join(payload['delta'] for payload in payloads if 'delta' in payload)
+        self.assertEqual(mock_gen.call_count, 4)
+        self.assertTrue(deltas.startswith('"') and deltas.endswith('"'))
+        self.assertEqual(payloads[-1]['output_text'], deltas)
@@ -1,7 +1,8 @@
 """Tests for the summarizer service."""
+import json
 from unittest.mock import patch
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from tests.conftest import mock_llm_generate
 
@@ -39,3 +40,24 @@ class SummarizerServiceTests(TestCase):
         for length in range(1, 6):
             result, error = service.summarize(text, length=length)
             self.assertIsNone(error, f'Length {length} failed')
+
+
+@override_settings(LLM_MAPREDUCE_CHUNK_TOKENS={'summarize': 60})
+class SummarizerMapReduceTests(TestCase):
+
+    def test_long_text_is_condensed_in_chunks(self):
+        from summarizer.services import AISummarizerService
+        paragraph = 'Remote teams rely on written updates to coordinate their work across time zones. ' * 3
+        text = '\n\n'.join([paragraph] * 6)
+
+        with patch('core.llm_client.LLMClient.generate',
+                   return_value=(json.dumps({'paragraph': 'Teams coordinate in writing.'}), None)) as mock_gen:
+            result, error = AISummarizerService().summarize(text, mode='paragraph', length=3)
+
+        self.assertIsNone(error)
+        # One call per chunk, then the final pass over the condensed text
+        self.assertGreater(mock_gen.call_count, 2)
+        final_prompt = mock_gen.call_args[1]['messages'][0]['content']
+        self.assertIn('Teams coordinate in writing.', final_prompt)
+        self.assertNotIn('time zones', final_prompt)
+        self.assertEqual(result['stats']['original_words'], len(text.split()))
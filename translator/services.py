@@ -2,6 +2,8 @@ import json
 import logging
 
 from core.llm_client import LLMClient
+from core.llm_mapreduce import MapReduce
+from core.llm_tokens import TokenBudget
 
 logger = logging.getLogger('app')
 
@@ -91,20 +93,35 @@ class TranslationService:
         Returns:
             tuple: (language_code, error_string)
         """
+        result, error = LLMClient.generate(**TranslationService._detect_language_request(text))
+        return TranslationService._parse_language(result, error)
+
+    @staticmethod
+    async def adetect_language(text):
+        """Async counterpart of detect_language()."""
+        result, error = await LLMClient.agenerate(**TranslationService._detect_language_request(text))
+        return TranslationService._parse_language(result, error)
+
+    @staticmethod
+    def _detect_language_request(text):
+        """Build the LLMClient keyword arguments for language detection."""
         system_prompt = (
             'You are a language detection tool. Identify the language of the given text. '
             'Respond with ONLY the ISO 639-1 two-letter language code (e.g., "en", "es", "fr", "de", "zh"). '
             'Do not include any other text, explanation, or punctuation.'
         )
-        messages = [{'role': 'user', 'content': text[:500]}]
-
-        result, error = LLMClient.generate(
-            system_prompt=system_prompt,
-            messages=messages,
-            max_tokens=10,
-            temperature=0.1,
-        )
+        return {
+            'system_prompt': system_prompt,
+            'messages': [{'role': 'user', 'content': text[:500]}],
+            'max_tokens': 10,
+            'temperature': 0.1,
+            'tool': 'translator_detect',
+            'cache': True,
+        }
 
+    @staticmethod
+    def _parse_language(result, error):
+        """Map the detection reply to a supported code, defaulting to English."""
         if error or not result:
             logger.error(f'Language detection failed: {error}')
             return 'en', None  # Default to English on error
@@ -148,6 +165,54 @@ class TranslationService:
                 'target_lang': target_lang,
             }, None
 
+        if MapReduce.needs_split(text, 'translate'):
+            # Long documents are translated in parallel chunks and rejoined
+            chunks = MapReduce.split(text, MapReduce.chunk_tokens('translate'))
+            results = MapReduce.map(chunks, lambda chunk: TranslationService._translate_request(
+                chunk.text, detected_lang, target_lang, use_premium,
+            ))
+            result, error = TranslationService._join_translations(chunks, results)
+        else:
+            result, error = LLMClient.generate(
+                **TranslationService._translate_request(text, detected_lang, target_lang, use_premium)
+            )
+        return TranslationService._parse_translation(result, error, detected_lang, target_lang)
+
+    @staticmethod
+    async def atranslate(text, source_lang, target_lang, use_premium=False):
+        """Async counterpart of translate() for ASGI views."""
+        if not text or not text.strip():
+            return None, 'Please provide text to translate.'
+
+        if not target_lang:
+            return None, 'Please select a target language.'
+
+        detected_lang = source_lang
+        if source_lang == 'auto' or not source_lang:
+            detected_lang, _ = await TranslationService.adetect_language(text)
+
+        if detected_lang == target_lang:
+            return {
+                'translated_text': text,
+                'source_lang': detected_lang,
+                'target_lang': target_lang,
+            }, None
+
+        if MapReduce.needs_split(text, 'translate'):
+            chunks = MapReduce.split(text, MapReduce.chunk_tokens('translate'))
+            results = await MapReduce.amap(chunks, lambda chunk: TranslationService._translate_request(
+                chunk.text, detected_lang, target_lang, use_premium,
+            ))
+            result, error = TranslationService._join_translations(chunks, results)
+        else:
+            result, error = await LLMClient.agenerate(
+                **TranslationService._translate_request(text, detected_lang, target_lang, use_premium)
+            )
+        return TranslationService._parse_translation(result, error, detected_lang, target_lang)
+
+    @staticmethod
+    def _translate_request(text, detected_lang, target_lang, use_premium):
+        """Build the LLMClient keyword arguments for a translation."""
         source_name = LANGUAGES.get(detected_lang, detected_lang)
         target_name = LANGUAGES.get(target_lang, target_lang)
 
@@ -156,16 +221,26 @@ class TranslationService:
             f'Provide ONLY the translated text. Do not include any explanations, notes, or the original text. '
             f'Preserve the original formatting, paragraph breaks, and punctuation style.'
         )
-        messages = [{'role': 'user', 'content': text}]
-
-        result, error = LLMClient.generate(
-            system_prompt=system_prompt,
-            messages=messages,
-            max_tokens=min(len(text) * 3, 8192),
-            temperature=0.3,
-            use_premium=use_premium,
-        )
+        return {
+            'system_prompt': system_prompt,
+            'messages': [{'role': 'user', 'content': text}],
+            'max_tokens': TokenBudget.max_tokens_for(text, 'translate', ceiling=8192),
+            'temperature': 0.3,
+            'use_premium': use_premium,
+            'tool': 'translator',
+        }
+
+    @staticmethod
+    def _join_translations(chunks, results):
+        """Concatenate per-chunk translations; any failed chunk fails the document."""
+        for result, error in results:
+            if error or not result or not result.strip():
+                return None, error or 'Empty chunk translation'
+        return MapReduce.join(chunks, [result for result, _ in results]), None
 
+    @staticmethod
+    def _parse_translation(result, error, detected_lang, target_lang):
+        """Validate the translation reply. Returns (result_dict, error_string)."""
         if error:
             logger.error(f'Translation LLM error: {error}')
             return None, 'Translation service is temporarily unavailable. Please try again.'
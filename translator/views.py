@@ -9,6 +9,7 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from accounts.views import GlobalVars
+from core.llm_views import LLMAPIView
 from translator.models import TranslationHistory
 from translator.services import TranslationService, LANGUAGES
 import config
@@ -238,21 +239,21 @@ class TranslationLanguagePage(View):
         )
 
 
-class TranslateAPI(APIView):
-    def post(self, request):
+class TranslateAPI(LLMAPIView):
+    def validate(self, request):
         data = request.data
         text = data.get('text', '').strip()
         source_lang = data.get('source_lang', 'auto')
         target_lang = data.get('target_lang', '')
 
         if not text:
-            return Response(
+            return None, Response(
                 {'error': 'Please provide text to translate.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         if not target_lang:
-            return Response(
+            return None, Response(
                 {'error': 'Please select a target language.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
@@ -265,7 +266,7 @@ class TranslateAPI(APIView):
 
         # Character limit for free users
         if not is_premium and char_count > 5000:
-            return Response(
+            return None, Response(
                 {
                     'error': 'Free users are limited to 5,000 characters. Upgrade to Premium for unlimited translations.',
                     'limit_exceeded': True,
@@ -273,26 +274,36 @@ class TranslateAPI(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Run translation
-        result, error = TranslationService.translate(
-            text, source_lang, target_lang, use_premium=is_premium
+        return {
+            'text': text,
+            'source_lang': source_lang,
+            'target_lang': target_lang,
+            'char_count': char_count,
+            'use_premium': is_premium,
+        }, None
+
+    def call(self, params):
+        return TranslationService.translate(
+            params['text'], params['source_lang'], params['target_lang'],
+            use_premium=params['use_premium']
         )
 
-        if error:
-            return Response(
-                {'error': error},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+    async def acall(self, params):
+        return await TranslationService.atranslate(
+            params['text'], params['source_lang'], params['target_lang'],
+            use_premium=params['use_premium']
+        )
 
+    def respond(self, request, params, result):
         # Save history
         try:
             TranslationHistory.objects.create(
                 user=request.user if request.user.is_authenticated else None,
-                input_text=text,
+                input_text=params['text'],
                 output_text=result['translated_text'],
                 source_lang=result['source_lang'],
                 target_lang=result['target_lang'],
-                char_count=char_count,
+                char_count=params['char_count'],
             )
         except Exception as e:
             logger.error(f'Failed to save translation history: {str(e)}')
@@ -301,7 +312,7 @@ class TranslateAPI(APIView):
             'translated_text': result['translated_text'],
             'source_lang': result['source_lang'],
             'target_lang': result['target_lang'],
-            'char_count': char_count,
+            'char_count': params['char_count'],
         })
 
 